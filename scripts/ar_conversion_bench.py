@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Created on 17 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# This script measures the speed of the conversion of angle-resolved images to
+# the polar and equirectangular projections. It reports the time for the first
+# conversion (which computes the resampling operator), for the next conversions
+# of images with the same geometry, and for the conversion of a whole AR map at
+# once.
+#
+# Example:
+# ./scripts/ar_conversion_bench.py --size 1024 --map 10
+
+from __future__ import division, print_function
+
+import argparse
+import logging
+import numpy
+from odemis import model
+from odemis.util import angleres
+import sys
+import time
+
+
+def generate_data(size):
+    """
+    Generates an AR image, with the metadata of a typical SPARC
+    size (int): number of pixels along X and Y
+    return (DataArray of shape size, size): the image
+    """
+    data = model.DataArray(numpy.random.randint(200, 300, (size, size), dtype=numpy.uint16))
+    # Same pixel size as a 1024x1024 image acquired with binning 2
+    pxs = 13e-6 * 2 * 1024 / size / 0.4917
+    data.metadata[model.MD_PIXEL_SIZE] = (pxs, pxs)
+    data.metadata[model.MD_AR_POLE] = (283 * size / 1024, 259 * size / 1024)
+    data.metadata[model.MD_AR_XMAX] = 13.25e-3
+    data.metadata[model.MD_AR_HOLE_DIAMETER] = 0.6e-3
+    data.metadata[model.MD_AR_FOCUS_DISTANCE] = 0.5e-3
+    data.metadata[model.MD_AR_PARABOLA_F] = 2.5e-3
+    return data
+
+
+def bench_conversion(convert, convert_map, data, output_size, nimages):
+    """
+    Converts the data one image at a time, and then as a map
+    convert (callable): the AngleResolved2* function
+    convert_map (callable): the AngleResolvedMap2* function
+    data (DataArray): the AR image
+    output_size (int or (int, int)): the size of the output
+    nimages (int): number of images to convert (after the first one)
+    return (float, float, float): duration (s) of the first conversion, of
+      the next conversions, and of the conversion of an image as part of a map
+    """
+    angleres._operator_cache.clear()
+    tstart = time.time()
+    convert(data, output_size)
+    dur_first = time.time() - tstart
+
+    tstart = time.time()
+    for i in range(nimages):
+        convert(data, output_size)
+    dur_next = (time.time() - tstart) / nimages
+
+    ar_map = model.DataArray(numpy.empty((nimages,) + data.shape, dtype=data.dtype), data.metadata)
+    ar_map[...] = data
+    tstart = time.time()
+    convert_map(ar_map, output_size)
+    dur_map = (time.time() - tstart) / nimages
+
+    return dur_first, dur_next, dur_map
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    parser = argparse.ArgumentParser(description="Measures the speed of the AR projections")
+    parser.add_argument("--size", dest="size", type=int, default=1024,
+                        help="Size of the AR images (in px)")
+    parser.add_argument("--map", dest="nimages", type=int, default=10,
+                        help="Number of images in the AR map")
+    parser.add_argument("--log-level", dest="loglev", metavar="<level>", type=int,
+                        default=1, help="set verbosity level (0-2, default = 1)")
+    options = parser.parse_args(args[1:])
+
+    loglev_names = [logging.WARNING, logging.INFO, logging.DEBUG]
+    loglev = loglev_names[min(len(loglev_names) - 1, options.loglev)]
+    logging.getLogger().setLevel(loglev)
+
+    data = generate_data(options.size)
+    projections = (("polar", angleres.AngleResolved2Polar, angleres.AngleResolvedMap2Polar, 1001),
+                   ("rectangular", angleres.AngleResolved2Rectangular, angleres.AngleResolvedMap2Rectangular, (400, 600)))
+    try:
+        for name, convert, convert_map, output_size in projections:
+            dur_first, dur_next, dur_map = bench_conversion(convert, convert_map, data,
+                                                            output_size, options.nimages)
+            print("%s projection: first image = %g s, next images = %g s, image of a map = %g s" %
+                  (name, dur_first, dur_next, dur_map))
+    except KeyboardInterrupt:
+        logging.info("Interrupted before the end of the execution")
+        return 1
+    except Exception:
+        logging.exception("Unexpected error while performing action.")
+        return 127
+
+    return 0
+
+
+if __name__ == '__main__':
+    ret = main(sys.argv)
+    exit(ret)
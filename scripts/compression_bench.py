@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Created on 16 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# This script compares the compressions available to save the data in HDF5 and
+# TIFF. It generates data looking like typical acquisitions (SEM image, CCD
+# image, and spectrum cube), and for each compression, it reports the
+# compression ratio, and the speed of writing and reading the file.
+#
+# Example:
+# ./scripts/compression_bench.py --format HDF5 --output compression.csv
+
+from __future__ import division, print_function
+
+import argparse
+import csv
+import logging
+import numpy
+from odemis import model
+from odemis.dataio import hdf5, tiff
+import os
+import sys
+import tempfile
+import time
+
+
+CSV_FIELDS = ("format", "data", "compression", "ratio", "write MB/s", "read MB/s")
+
+
+def generate_data():
+    """
+    Generates images looking like typical acquisitions
+    return (list of (str, DataArray)): name of the type of data, and the data
+    """
+    # SEM image: smooth signal, with a bit of noise, using 12 bits out of 16
+    y, x = numpy.mgrid[0:2048, 0:2048]
+    sem = 2000 + 1000 * numpy.sin(x / 50) * numpy.cos(y / 80)
+    sem = numpy.random.poisson(sem).astype(numpy.uint16)
+    # CCD image: low signal on a dark background
+    ccd = 100 + 50 * numpy.exp(-((x - 1024) ** 2 + (y - 1024) ** 2) / 300 ** 2)
+    ccd = numpy.random.poisson(ccd).astype(numpy.uint16)
+    # Spectrum cube (CTZYX): a peak whose intensity varies over the sample
+    wl = numpy.arange(1024).reshape(1024, 1, 1, 1, 1)
+    spec = 300 * numpy.exp(-(wl - 500) ** 2 / 100 ** 2) * (1 + numpy.sin(x[:64, :64] / 10))
+    spec = numpy.random.poisson(10 + spec).astype(numpy.uint16)
+    md = {model.MD_PIXEL_SIZE: (1e-6, 1e-6), model.MD_POS: (1e-3, -30e-3)}
+    return [("SEM", model.DataArray(sem, md.copy())),
+            ("CCD", model.DataArray(ccd, md.copy())),
+            ("spectrum", model.DataArray(spec, md.copy()))]
+
+
+def bench_compression(exporter, data, compression, filename):
+    """
+    Saves and reads back the data with the given compression
+    exporter (module): the dataio module of the format
+    data (DataArray): the data to save
+    compression (str or None): the compression, or None for no compression
+    filename (str): the file to write
+    return (float, float, float): compression ratio, writing speed (MB/s),
+      reading speed (MB/s)
+    """
+    tstart = time.time()
+    exporter.export(filename, data, compressed=compression is not None,
+                    compression=compression)
+    wdur = time.time() - tstart
+    ratio = data.nbytes / os.stat(filename).st_size
+
+    tstart = time.time()
+    exporter.read_data(filename)
+    rdur = time.time() - tstart
+    return ratio, data.nbytes / wdur / 1e6, data.nbytes / rdur / 1e6
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    parser = argparse.ArgumentParser(description="Compares the compressions of the HDF5 and TIFF formats")
+    parser.add_argument("--format", dest="formats", nargs="+", choices=("HDF5", "TIFF"),
+                        default=["HDF5", "TIFF"], help="File formats to test")
+    parser.add_argument("--output", "-o", dest="output",
+                        help="CSV file where to save the results")
+    parser.add_argument("--log-level", dest="loglev", metavar="<level>", type=int,
+                        default=1, help="set verbosity level (0-2, default = 1)")
+    options = parser.parse_args(args[1:])
+
+    loglev_names = [logging.WARNING, logging.INFO, logging.DEBUG]
+    loglev = loglev_names[min(len(loglev_names) - 1, options.loglev)]
+    logging.getLogger().setLevel(loglev)
+
+    exporters = {"HDF5": (hdf5, [None] + sorted(hdf5.COMPRESSIONS.keys())),
+                 "TIFF": (tiff, [None] + tiff.COMPRESSIONS)}
+
+    results = []
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for name, data in generate_data():
+            for fmt in options.formats:
+                exporter, compressions = exporters[fmt]
+                fn = os.path.join(tmpdir, "bench" + exporter.EXTENSIONS[0])
+                for compression in compressions:
+                    ratio, wspeed, rspeed = bench_compression(exporter, data, compression, fn)
+                    print("%s %s data with %s compression: ratio = %.2f, writing = %.1f MB/s, reading = %.1f MB/s" %
+                          (fmt, name, compression, ratio, wspeed, rspeed))
+                    results.append((fmt, name, compression, ratio, wspeed, rspeed))
+                os.remove(fn)
+    except KeyboardInterrupt:
+        logging.info("Interrupted before the end of the execution")
+        return 1
+    except Exception:
+        logging.exception("Unexpected error while performing action.")
+        return 127
+    finally:
+        try:
+            os.rmdir(tmpdir)
+        except OSError:
+            logging.warning("Failed to delete temporary directory %s", tmpdir)
+
+    if options.output:
+        with open(options.output, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDS)
+            writer.writerows(results)
+
+    return 0
+
+
+if __name__ == '__main__':
+    ret = main(sys.argv)
+    exit(ret)
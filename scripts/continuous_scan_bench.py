@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Created on 17 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# This script compares the overhead per pixel of a SEM + spectrum acquisition
+# with the e-beam scanning pixel per pixel, and with the continuous scan.
+# It must be run with a SPARC backend running, whose e-beam provides the
+# .newPosition event (for instance, with simsem: sim/sparc2-focus-test.odm.yaml).
+#
+# Example:
+# ./scripts/continuous_scan_bench.py --exp 0.005 --rep 20 10
+
+from __future__ import division, print_function
+
+import argparse
+import logging
+import numpy
+from odemis import model
+from odemis.acq import stream
+import sys
+import time
+
+
+def create_streams(spec, ebeam, sed, exp, rep, continuous):
+    """
+    Creates a SEM + spectrum acquisition stream
+    exp (float): exposure time of the spectrometer (in s)
+    rep (int, int): number of pixels along X and Y
+    continuous (bool): whether to use the continuous scan
+    return (SEMSpectrumMDStream): the stream ready to acquire
+    """
+    sems = stream.SEMStream("bench sem", sed, sed.data, ebeam)
+    specs = stream.SpectrumSettingsStream("bench spec", spec, spec.data, ebeam,
+                                          detvas={"exposureTime"})
+    sps = stream.SEMSpectrumMDStream("bench sem-spec", [sems, specs])
+
+    specs.roi.value = (0.15, 0.6, 0.8, 0.8)
+    specs.detExposureTime.value = exp
+    specs.repetition.value = rep
+    sps.continuousScan.value = continuous
+    return sps
+
+
+def bench_acquisition(sps):
+    """
+    Acquires the data of the stream
+    return (float): duration of the acquisition (in s)
+    """
+    timeout = 5 + 1.5 * sps.estimateAcquisitionTime()
+    start = time.time()
+    f = sps.acquire()
+    data = f.result(timeout)
+    dur = time.time() - start
+    logging.debug("Acquired data of shape %s", [d.shape for d in data])
+    return dur
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    parser = argparse.ArgumentParser(description="Measures the overhead per pixel "
+                                     "of the SEM + spectrum acquisition")
+    parser.add_argument("--exp", dest="exp", type=float, default=0.005,
+                        help="Exposure time of the spectrometer (in s)")
+    parser.add_argument("--rep", dest="rep", type=int, nargs=2, default=(20, 10),
+                        metavar=("X", "Y"), help="Number of pixels of the acquisition")
+    parser.add_argument("--log-level", dest="loglev", metavar="<level>", type=int,
+                        default=1, help="set verbosity level (0-2, default = 1)")
+    options = parser.parse_args(args[1:])
+
+    loglev_names = [logging.WARNING, logging.INFO, logging.DEBUG]
+    loglev = loglev_names[min(len(loglev_names) - 1, options.loglev)]
+    logging.getLogger().setLevel(loglev)
+
+    rep = tuple(options.rep)
+    npx = numpy.prod(rep)
+    try:
+        spec = model.getComponent(role="spectrometer-integrated")
+        ebeam = model.getComponent(role="e-beam")
+        sed = model.getComponent(role="se-detector")
+
+        for continuous in (False, True):
+            sps = create_streams(spec, ebeam, sed, options.exp, rep, continuous)
+            dur = bench_acquisition(sps)
+            print("%s: acquisition of %d pixels of %g s took %g s, so overhead = %g ms/px" %
+                  ("continuous scan" if continuous else "scan per pixel",
+                   npx, options.exp, dur, (dur / npx - options.exp) * 1e3))
+    except KeyboardInterrupt:
+        logging.info("Interrupted before the end of the execution")
+        return 1
+    except Exception:
+        logging.exception("Unexpected error while performing action.")
+        return 127
+
+    return 0
+
+
+if __name__ == '__main__':
+    ret = main(sys.argv)
+    exit(ret)
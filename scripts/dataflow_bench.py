@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Created on 16 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# This script measures the performance of the transport of the DataFlows and
+# VigilantAttributes between containers (ie, between the back-end and a client).
+# A synthetic producer is started in a separate container (process), and
+# generates frames as fast as possible. For each combination of frame shape,
+# dtype, number of subscribers and max_discard, it reports the frames per
+# second, the throughput, the latency (between the notification in the producer
+# and the reception by the subscriber), and the number of dropped frames.
+# It also measures the round-trip time of reading and writing a VA, and the
+# latency of the notification of a VA change.
+#
+# It doesn't need a back-end running, only the right to create containers
+# (ie, to write in /var/run/odemisd/).
+#
+# Example:
+# ./scripts/dataflow_bench.py --shape 256x256 2048x2048 --dtype uint16 float64 --subscribers 1 4 --max-discard 0 100 --output df-bench.csv
+
+from __future__ import division, print_function
+
+import argparse
+import csv
+import logging
+import numpy
+from odemis import model
+from odemis.model import oneway
+import sys
+import threading
+import time
+
+
+# Metadata key to pass the index of the frame
+MD_BENCH_INDEX = "Benchmark frame index"
+
+# Number of different frames generated in advance, to not measure the time to
+# create the data.
+NUM_FRAMES = 4
+
+CSV_FIELDS = ("test", "shape", "dtype", "shared_mem", "max_discard", "subscribers",
+              "fps", "MB/s", "lat_p50", "lat_p90", "lat_p99", "lat_max", "dropped", "sent")
+
+
+class BenchDataFlow(model.DataFlow):
+    """
+    DataFlow generating frames as fast as possible (or at the period requested
+    by the component). The time of notification is stored in the MD_ACQ_DATE
+    and the frame number in MD_BENCH_INDEX.
+    """
+
+    def __init__(self, comp, max_discard=100, shared_mem=False):
+        model.DataFlow.__init__(self, max_discard=max_discard, shared_mem=shared_mem)
+        self._comp = comp
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start_generate(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._generate, name="Benchmark generator")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop_generate(self):
+        self._stop.set()
+        # Not possible to join if called from the callback
+        if threading.current_thread() != self._thread:
+            self._thread.join()
+        self._thread = None
+
+    def _generate(self):
+        comp = self._comp
+        frames = [model.DataArray(numpy.full(comp.shape, i, dtype=comp.dtype))
+                  for i in range(NUM_FRAMES)]
+        tnext = time.time()
+        while not self._stop.is_set():
+            period = comp.period.value
+            if period:
+                tnext += period
+                time.sleep(max(0, tnext - time.time()))
+
+            i = comp.framesSent
+            da = frames[i % NUM_FRAMES]
+            da.metadata = {MD_BENCH_INDEX: i, model.MD_ACQ_DATE: time.time()}
+            self.notify(da)
+            comp.framesSent = i + 1
+
+
+class BenchProducer(model.Component):
+    """
+    Synthetic component used to measure the performance of the remote access.
+    It has a DataFlow generating frames of a fixed shape and dtype, and a VA,
+    which can be changed from the component itself.
+    """
+
+    def __init__(self, name, shape, dtype, max_discard=100, shared_mem=False, **kwargs):
+        """
+        shape (tuple of int): shape of the frames generated
+        dtype (str): numpy dtype of the frames generated
+        max_discard (int): passed to the DataFlow
+        shared_mem (bool): passed to the DataFlow
+        """
+        model.Component.__init__(self, name, **kwargs)
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        self.framesSent = 0
+
+        # Minimum time between each frame (0 = as fast as possible)
+        self.period = model.FloatContinuous(0, (0, 10), unit="s")
+        # Used to measure the VAs. Its value is a time (since epoch)
+        self.stamp = model.FloatVA(0, unit="s")
+        self.data = BenchDataFlow(self, max_discard, shared_mem)
+
+    def getFramesSent(self):
+        """
+        return (int): number of frames generated since the creation
+        """
+        return self.framesSent
+
+    @oneway
+    def updateStamp(self):
+        """
+        Sets .stamp to the current time, from within the component
+        """
+        self.stamp.value = time.time()
+
+
+class FrameCounter(object):
+    """
+    Subscriber to a DataFlow recording the latency and index of each frame
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.indices = []
+        self.nbytes = 0
+
+    def on_data(self, df, data):
+        self.latencies.append(time.time() - data.metadata[model.MD_ACQ_DATE])
+        self.indices.append(data.metadata[MD_BENCH_INDEX])
+        self.nbytes += data.nbytes
+
+    @property
+    def dropped(self):
+        """
+        Number of frames missed between the first and last frame received
+        """
+        if not self.indices:
+            return 0
+        return self.indices[-1] - self.indices[0] + 1 - len(self.indices)
+
+
+def _latency_stats(latencies):
+    """
+    latencies (list of float): in s
+    return (dict str -> float): percentiles and max in ms
+    """
+    if not latencies:
+        return {"lat_p50": None, "lat_p90": None, "lat_p99": None, "lat_max": None}
+    p50, p90, p99 = numpy.percentile(latencies, [50, 90, 99]) * 1e3
+    return {"lat_p50": p50, "lat_p90": p90, "lat_p99": p99, "lat_max": max(latencies) * 1e3}
+
+
+_container_count = 0
+
+
+def start_producer(shape, dtype, max_discard, shared_mem):
+    """
+    Creates a producer in a new container
+    return (str, Container, Component): name of the container, the container,
+      and the producer
+    """
+    global _container_count
+    _container_count += 1
+    cname = "dfbench%d" % _container_count
+    kwargs = {"name": "producer", "shape": shape, "dtype": dtype,
+              "max_discard": max_discard, "shared_mem": shared_mem}
+    container, comp = model.createInNewContainer(cname, BenchProducer, kwargs)
+    return cname, container, comp
+
+
+def bench_dataflow(cname, comp, subscribers, duration):
+    """
+    Measures the transfer of the frames to multiple subscribers, each with its
+    own connection (as if they were in different processes).
+    cname (str): name of the container of the producer
+    comp (BenchProducer): the producer
+    subscribers (int > 0): number of subscribers
+    duration (float): time of the measurement (s)
+    return (dict str -> value): results, with the CSV_FIELDS as keys
+    """
+    comps = [comp] + [model.getObject(cname, comp.name) for i in range(subscribers - 1)]
+    counters = [FrameCounter() for c in comps]
+
+    sent_start = comp.getFramesSent()
+    tstart = time.time()
+    for c, fc in zip(comps, counters):
+        c.data.subscribe(fc.on_data)
+    time.sleep(duration)
+    for c, fc in zip(comps, counters):
+        c.data.unsubscribe(fc.on_data)
+    dur = time.time() - tstart
+    sent = comp.getFramesSent() - sent_start
+
+    latencies = []
+    for fc in counters:
+        latencies.extend(fc.latencies)
+    res = {"test": "dataflow",
+           "subscribers": subscribers,
+           "fps": sum(len(fc.indices) for fc in counters) / subscribers / dur,
+           "MB/s": sum(fc.nbytes for fc in counters) / subscribers / dur / 2 ** 20,
+           "dropped": sum(fc.dropped for fc in counters) / subscribers,
+           "sent": sent,
+           }
+    res.update(_latency_stats(latencies))
+    return res
+
+
+def bench_va(comp, repetitions):
+    """
+    Measures the round-trip time to read and write a VA, and the latency of
+    the notifications of change
+    repetitions (int): number of measurements of each type
+    return (list of dict str -> value): results, with the CSV_FIELDS as keys
+    """
+    results = []
+    va = comp.stamp
+
+    for test in ("va_get", "va_set"):
+        latencies = []
+        for i in range(repetitions):
+            tstart = time.time()
+            if test == "va_get":
+                va.value
+            else:
+                va.value = tstart
+            latencies.append(time.time() - tstart)
+        res = {"test": test, "fps": repetitions / sum(latencies)}
+        res.update(_latency_stats(latencies))
+        results.append(res)
+
+    # Notification latency: the component sets the VA to the current time
+    latencies = []
+    received = threading.Event()
+
+    def on_stamp(v):
+        latencies.append(time.time() - v)
+        received.set()
+
+    va.subscribe(on_stamp)
+    try:
+        for i in range(repetitions):
+            received.clear()
+            comp.updateStamp()
+            if not received.wait(5):
+                logging.warning("No VA notification received after 5 s")
+            # Notifications less than REMOTE_NOTIFY_PERIOD apart are coalesced,
+            # so wait a bit to measure each one independently.
+            time.sleep(0.05)
+    finally:
+        va.unsubscribe(on_stamp)
+    res = {"test": "va_notify", "fps": None}
+    res.update(_latency_stats(latencies))
+    results.append(res)
+
+    return results
+
+
+def print_result(res):
+    """
+    Display the main results in a human-readable way
+    res (dict str -> value)
+    """
+    lat = ("latency (ms): p50=%.3f p90=%.3f p99=%.3f max=%.3f" %
+           (res["lat_p50"], res["lat_p90"], res["lat_p99"], res["lat_max"])
+           if res["lat_p50"] is not None else "no data received")
+    if res["test"] == "dataflow":
+        print("%s %s shm=%s max_discard=%d subs=%d: %.1f fps, %.1f MB/s, %s, dropped %.1f/%d" %
+              (res["shape"], res["dtype"], res["shared_mem"], res["max_discard"],
+               res["subscribers"], res["fps"], res["MB/s"], lat, res["dropped"], res["sent"]))
+    else:
+        print("%s: %s" % (res["test"], lat))
+
+
+def parse_shape(s):
+    return tuple(int(v) for v in s.split("x"))
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    parser = argparse.ArgumentParser(description="Measure the DataFlow and VA remote performance")
+    parser.add_argument("--shape", dest="shapes", type=parse_shape, nargs="+",
+                        default=[(256, 256), (1024, 1024), (2048, 2048)],
+                        help="Shape of the frames, as WxH (or more dimensions)")
+    parser.add_argument("--dtype", dest="dtypes", nargs="+", default=["uint16"],
+                        help="Numpy dtype of the frames")
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1, 2, 4],
+                        help="Number of subscribers to the DataFlow")
+    parser.add_argument("--max-discard", dest="max_discards", type=int, nargs="+",
+                        default=[0, 100], help="max_discard of the DataFlow")
+    parser.add_argument("--shared-mem", dest="shared_mems", type=int, nargs="+",
+                        default=[0], choices=[0, 1],
+                        help="Whether to pass the data via shared memory (1) or not (0)")
+    parser.add_argument("--period", type=float, default=0,
+                        help="Minimum time between frames (s), 0 for as fast as possible")
+    parser.add_argument("--duration", type=float, default=3,
+                        help="Duration of each DataFlow measurement (s)")
+    parser.add_argument("--va-repetitions", dest="va_reps", type=int, default=200,
+                        help="Number of measurements for each VA test")
+    parser.add_argument("--output", "-o", help="CSV file where to save the results")
+    parser.add_argument("--log-level", dest="loglev", metavar="<level>", type=int,
+                        default=0, help="set verbosity level (0-2, default = 0)")
+    options = parser.parse_args(args[1:])
+
+    loglev_names = (logging.WARNING, logging.INFO, logging.DEBUG)
+    loglev = loglev_names[min(len(loglev_names) - 1, options.loglev)]
+    logging.getLogger().setLevel(loglev)
+
+    results = []
+    try:
+        first = True
+        for shape in options.shapes:
+            for dtype in options.dtypes:
+                for shm in options.shared_mems:
+                    for max_discard in options.max_discards:
+                        cname, container, comp = start_producer(shape, dtype, max_discard, bool(shm))
+                        try:
+                            comp.period.value = options.period
+                            if first:
+                                for res in bench_va(comp, options.va_reps):
+                                    print_result(res)
+                                    results.append(res)
+                                first = False
+
+                            for subs in options.subscribers:
+                                res = bench_dataflow(cname, comp, subs, options.duration)
+                                res.update({"shape": "x".join(str(v) for v in shape),
+                                            "dtype": dtype, "shared_mem": bool(shm),
+                                            "max_discard": max_discard})
+                                print_result(res)
+                                results.append(res)
+                        finally:
+                            comp.terminate()
+                            container.terminate()
+    except KeyboardInterrupt:
+        logging.info("Interrupted before the end of the execution")
+    except Exception:
+        logging.exception("Unexpected error while performing action.")
+        return 127
+    finally:
+        if options.output and results:
+            with open(options.output, "w") as f:
+                writer = csv.DictWriter(f, CSV_FIELDS)
+                writer.writeheader()
+                writer.writerows(results)
+
+    return 0
+
+
+if __name__ == '__main__':
+    ret = main(sys.argv)
+    exit(ret)
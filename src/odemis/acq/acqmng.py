@@ -467,14 +467,14 @@ class SettingsObserver(object):
 
         for comp in components:
             self._all_settings[comp.name] = {}
-            vas = model.getVAs(comp).items()
+            vas = [(n, va) for n, va in model.getVAs(comp).items() if n not in HIDDEN_VAS]
             prepare_to_listen_to_more_vas(len(vas))
 
+            # Store current value of all the VAs (in a single call, as calling
+            # .value on each VA might take some time)
+            values = comp.getVAValues([n for n, va in vas])
             for va_name, va in vas:
-                if va_name in HIDDEN_VAS:
-                    continue
-                # Store current value of VA (calling .value might take some time)
-                self._all_settings[comp.name][va_name] = [va.value, va.unit]
+                self._all_settings[comp.name][va_name] = [values[va_name], va.unit]
                 # Subscribe to VA, update dictionary on callback
                 def update_settings(value, comp_name=comp.name, va_name=va_name):
                     self._all_settings[comp_name][va_name][0] = value
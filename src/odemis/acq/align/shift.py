@@ -29,6 +29,57 @@ import math
 from numpy import arange
 from numpy import fft
 
+try:
+    # Supports float32 and multi-threading
+    import scipy.fft as scipy_fft
+except ImportError:  # scipy < 1.4
+    scipy_fft = None
+
+
+def _fft2(data, dtype=numpy.float64):
+    """
+    Compute the 2D FFT over the last two dimensions.
+    data (numpy.array of shape ...YX): real or complex data
+    dtype (numpy.float32 or numpy.float64): precision of the computation
+    return (numpy.array of complex64 or complex128): same shape as the data
+    """
+    cdtype = numpy.result_type(dtype, numpy.complex64)
+    if numpy.iscomplexobj(data):
+        data = numpy.asarray(data, dtype=cdtype)
+    else:
+        data = numpy.asarray(data, dtype=dtype)
+    if scipy_fft is not None:
+        # scipy.fft keeps the plans in cache, and uses all the CPUs
+        return scipy_fft.fft2(data, workers=-1)
+    else:
+        return fft.fft2(data).astype(cdtype, copy=False)
+
+
+def _ifft2(data):
+    """
+    Compute the inverse 2D FFT, in the same precision as the data
+    data (numpy.array of complex64 or complex128)
+    return (numpy.array of complex64 or complex128): same shape and dtype as the data
+    """
+    if scipy_fft is not None:
+        return scipy_fft.ifft2(data, workers=-1)
+    else:
+        return fft.ifft2(data).astype(data.dtype, copy=False)
+
+
+def _FindPeak(CC):
+    """
+    Locate the maximum of the absolute values of a 2D array
+    CC (numpy.array): 2d array
+    return (int, int): row, column of the peak
+    """
+    ACC = abs(CC)
+    loc1 = ACC.argmax(0)
+    max1 = ACC[(loc1, range(ACC.shape[1]))]
+    loc2 = max1.argmax(0)
+    return loc1[loc2], loc2
+
+
 def MeasureShift(previous_img, current_img, precision=1):
     """
     Given two images, it calculates the shift in x and y axis. It first computes
@@ -38,6 +89,7 @@ def MeasureShift(previous_img, current_img, precision=1):
     cross-correlation" by Manuel Guizar, for the corresponding matlab code see
     http://www.mathworks.com/matlabcentral/fileexchange/
     18401-efficient-subpixel-image-registration-by-cross-correlation.
+    To measure repeatedly the shift compared to the same image, use ShiftMeasurer.
 
     previous_img (numpy.array): 2d array with the previous frame
     current_img (numpy.array): 2d array with the last frame, must be of same
@@ -49,22 +101,37 @@ def MeasureShift(previous_img, current_img, precision=1):
         raise ValueError("Precision cannot be less than 1, got %s." % (precision,))
     assert previous_img.shape == current_img.shape, "Prev shape %s != new shape %s" % (previous_img.shape, current_img.shape)
 
-    previous_fft = fft.fft2(previous_img)
-    current_fft = fft.fft2(current_img)
+    previous_fft = _fft2(previous_img)
+    current_fft = _fft2(current_img)
+    if precision == 1:
+        return _MeasureShiftFFT(previous_fft, current_fft, precision)
+    else:
+        return _MeasureShiftFFT(previous_fft, current_fft, precision,
+                                fft.fftshift(previous_fft))
+
+
+def _MeasureShiftFFT(previous_fft, current_fft, precision=1,
+                     previous_fft_shifted=None, cc_buffer=None):
+    """
+    Same as MeasureShift(), but based on the FFT of the images.
+    previous_fft (numpy.array of complex): 2D FFT of the previous frame
+    current_fft (numpy.array of complex): 2D FFT of the last frame
+    precision (1<=int): Calculate drift within 1/precision of a pixel
+    previous_fft_shifted (None or numpy.array of complex): fftshift() of
+      previous_fft. Must be provided if precision > 1.
+    cc_buffer (None or numpy.array of complex): array of shape 2x the shape of
+      the images, filled with zeros except for the center, used for the
+      upsampling. If None, a new one is allocated.
+    returns (tuple of floats): Drift in pixels
+    """
     m, n = previous_fft.shape
 
     if precision == 1:
         # Cross-correlation computation
-        CC = fft.ifft2(previous_fft * current_fft.conj())
+        CC = _ifft2(previous_fft * current_fft.conj())
 
         # Locate the peak
-        ACC = abs(CC)
-        loc1 = ACC.argmax(0)
-        max1 = ACC[(loc1, range(ACC.shape[1]))]
-        loc2 = max1.argmax(0)
-
-        rloc = loc1[loc2]
-        cloc = loc2
+        rloc, cloc = _FindPeak(CC)
 
         # Calculate shift from the peak
         md2 = m // 2
@@ -84,23 +151,17 @@ def MeasureShift(previous_img, current_img, precision=1):
 
         # Upsample by factor of 2 to obtain initial estimation and
         # embed Fourier data in a 2x larger array
-        CC = numpy.zeros((mlarge, nlarge), dtype=numpy.complex)
-        CC[m - m // 2:m + 1 + (m - 1) // 2,
-           n - n // 2:n + 1 + (n - 1) // 2] = (fft.fftshift(previous_fft) *
-                                               fft.fftshift(current_fft).conj()
-                                              )
+        if cc_buffer is None:
+            cc_buffer = numpy.zeros((mlarge, nlarge), dtype=previous_fft.dtype)
+        numpy.multiply(previous_fft_shifted, fft.fftshift(current_fft).conj(),
+                       out=cc_buffer[m - m // 2:m + 1 + (m - 1) // 2,
+                                     n - n // 2:n + 1 + (n - 1) // 2])
 
         # Cross-correlation computation
-        CC = fft.ifft2(fft.ifftshift(CC))
+        CC = _ifft2(fft.ifftshift(cc_buffer))
 
         # Locate the peak
-        ACC = abs(CC)
-        loc1 = ACC.argmax(0)
-        max1 = ACC[(loc1, range(ACC.shape[1]))]
-        loc2 = max1.argmax(0)
-
-        rloc = loc1[loc2]
-        cloc = loc2
+        rloc, cloc = _FindPeak(CC)
 
         # Calculate shift in previous pixel grid from the position of the peak
         (m, n) = CC.shape
@@ -137,13 +198,7 @@ def MeasureShift(previous_img, current_img, precision=1):
         # was .conj(), but as we just need the abs(), it's not needed
 
         # Locate maximum and map back to original pixel grid
-        ACC = abs(CC)
-        loc1 = ACC.argmax(0)
-        max1 = ACC[(loc1, range(ACC.shape[1]))]
-        loc2 = max1.argmax(0)
-
-        rloc = loc1[loc2]
-        cloc = loc2
+        rloc, cloc = _FindPeak(CC)
 
         rloc -= dft_shift
         cloc -= dft_shift
@@ -159,6 +214,106 @@ def MeasureShift(previous_img, current_img, precision=1):
     return col_shift, row_shift
 
 
+class ShiftMeasurer(object):
+    """
+    Measures the shift of images compared to a reference image (eg, for drift
+    correction), as MeasureShift(). The FFT of the reference image is computed
+    only once, and the buffers are reused between calls, which makes it faster
+    than MeasureShift() when comparing many images to the same reference.
+    """
+
+    def __init__(self, reference=None, precision=1, dtype=numpy.float64):
+        """
+        reference (None or numpy.array): 2d array with the reference image.
+          If None, it must be set with setReference() before measuring.
+        precision (1<=int): Calculate drift within 1/precision of a pixel
+        dtype (numpy.float32 or numpy.float64): precision of the computation.
+          float32 is faster, and sufficient for most images.
+        """
+        if precision < 1:
+            raise ValueError("Precision cannot be less than 1, got %s." % (precision,))
+        self._precision = precision
+        self._dtype = numpy.dtype(dtype)
+        if self._dtype not in (numpy.float32, numpy.float64):
+            raise ValueError("dtype must be float32 or float64, got %s" % (dtype,))
+
+        self._ref_fft = None
+        self._ref_fft_shifted = None
+        self._cc_buffer = None
+        if reference is not None:
+            self.setReference(reference)
+
+    @property
+    def shape(self):
+        """
+        (None or tuple of 2 ints): shape of the reference image
+        """
+        if self._ref_fft is None:
+            return None
+        return self._ref_fft.shape
+
+    def setReference(self, image):
+        """
+        Change the reference image
+        image (numpy.array): 2d array
+        """
+        if image.ndim != 2:
+            raise ValueError("Reference image should be 2D, but got shape %s" % (image.shape,))
+        self._setReferenceFFT(_fft2(image, self._dtype))
+
+    def _setReferenceFFT(self, ref_fft):
+        if self._ref_fft is None or self._ref_fft.shape != ref_fft.shape:
+            self._cc_buffer = None  # Different shape => need a new buffer
+
+        self._ref_fft = ref_fft
+        if self._precision > 1:
+            self._ref_fft_shifted = fft.fftshift(ref_fft)
+            if self._cc_buffer is None:
+                m, n = ref_fft.shape
+                self._cc_buffer = numpy.zeros((m * 2, n * 2), dtype=ref_fft.dtype)
+
+    def _measureFFT(self, image_fft):
+        return _MeasureShiftFFT(self._ref_fft, image_fft, self._precision,
+                                self._ref_fft_shifted, self._cc_buffer)
+
+    def measure(self, image, update_reference=False):
+        """
+        Measure the shift of an image compared to the reference image.
+        image (numpy.array): 2d array, of the same shape as the reference
+        update_reference (bool): if True, the image becomes the new reference
+          (without any extra computation).
+        returns (tuple of floats): Drift in pixels, as MeasureShift(reference, image)
+        """
+        if self._ref_fft is None:
+            raise ValueError("No reference image set")
+        if image.shape != self._ref_fft.shape:
+            raise ValueError("Image shape %s != reference shape %s" % (image.shape, self._ref_fft.shape))
+
+        image_fft = _fft2(image, self._dtype)
+        shift = self._measureFFT(image_fft)
+        if update_reference:
+            self._setReferenceFFT(image_fft)
+        return shift
+
+    def measureMany(self, images):
+        """
+        Measure the shift of multiple images compared to the reference image.
+        The FFTs of all the images are computed together, which is more
+        efficient than calling measure() for each image.
+        images (numpy.array of shape NYX, or list of 2d arrays): the images,
+          each of the same shape as the reference
+        returns (list of tuple of floats): Drift in pixels, for each image
+        """
+        if self._ref_fft is None:
+            raise ValueError("No reference image set")
+        images = numpy.asarray(images)
+        if images.ndim != 3 or images.shape[1:] != self._ref_fft.shape:
+            raise ValueError("Images shape %s != N x reference shape %s" % (images.shape, self._ref_fft.shape))
+
+        images_fft = _fft2(images, self._dtype)
+        return [self._measureFFT(f) for f in images_fft]
+
+
 def _UpsampledDFT(data, nor, noc, precision=1, roff=0, coff=0):
     """
     Upsampled DFT by matrix multiplies.
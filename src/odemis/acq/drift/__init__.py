@@ -30,7 +30,7 @@ from scipy import misc
 import threading
 import cv2
 
-from odemis.acq.align.shift import MeasureShift
+from odemis.acq.align.shift import MeasureShift, ShiftMeasurer
 
 MIN_RESOLUTION = (20, 20) # seems 10x10 sometimes work, but let's not tent it
 MAX_PIXELS = 128 ** 2  # px
@@ -65,6 +65,12 @@ class AnchoredEstimator(object):
         self.max_drift = (0, 0) # in sem px
 
         self.raw = []  # first 2 and last 2 anchor areas acquired (in order)
+        # To measure the drift compared to the first and the previous anchor
+        # areas. They keep the FFT of the reference image, so that each
+        # estimation only needs to compute the FFT of the latest image.
+        self._orig_measurer = ShiftMeasurer(precision=10)
+        self._prev_measurer = ShiftMeasurer(precision=10)
+        self._prev_ref = None  # image currently used as reference by _prev_measurer
         self._acq_sem_complete = threading.Event()
 
         # Calculate initial translation for anchor region acquisition
@@ -168,11 +174,17 @@ class AnchoredEstimator(object):
             # include also the drift of the previous image.
             # Also, MeasureShift return the shift in image pixels, which is
             # different (usually bigger) from the SEM px.
-            prev_drift = MeasureShift(self.raw[-2], self.raw[-1], 10)
+            if self._orig_measurer.shape is None:
+                self._orig_measurer.setReference(self.raw[0])
+            if self._prev_ref is not self.raw[-2]:
+                # estimate() wasn't called after the previous acquisition
+                self._prev_measurer.setReference(self.raw[-2])
+            prev_drift = self._prev_measurer.measure(self.raw[-1], update_reference=True)
+            self._prev_ref = self.raw[-1]
             prev_drift = (prev_drift[0] * self._scale[0] + self.drift[0],
                           prev_drift[1] * self._scale[1] + self.drift[1])
 
-            orig_drift = MeasureShift(self.raw[0], self.raw[-1], 10)
+            orig_drift = self._orig_measurer.measure(self.raw[-1])
             self.drift = (orig_drift[0] * self._scale[0],
                           orig_drift[1] * self._scale[1])
 
@@ -26,9 +26,10 @@ import math
 from numpy import fft
 from numpy import random
 import numpy
-from odemis.acq.align.shift import MeasureShift
+from odemis.acq.align.shift import MeasureShift, ShiftMeasurer
 from odemis.dataio import hdf5
 import os
+import time
 import unittest
 
 
@@ -207,5 +208,83 @@ class TestShiftCalculation(unittest.TestCase):
         drift = MeasureShift(self.small_data, self.small_data_random_drifted_noisy, 10)
         numpy.testing.assert_almost_equal(drift, (self.small_deltac, self.small_deltar), 0)
 
+
+class TestShiftMeasurer(unittest.TestCase):
+    """
+    Test ShiftMeasurer
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        data = hdf5.read_data(os.path.join(DATA_DIR, "example_input.h5"))[0]
+        cls.image = data.reshape(data.shape[-2:]).astype(numpy.float64)
+        # Sub-images shifted (circularly) by a known integer amount
+        cls.ref = cls.image[100:356, 100:356]
+        cls.shifts = [(0, 0), (3, -2), (-7, 5), (12, 9)]  # X, Y
+        cls.shifted = [numpy.roll(numpy.roll(cls.ref, dy, axis=0), dx, axis=1)
+                       for dx, dy in cls.shifts]
+
+    def test_same_as_measureshift(self):
+        """
+        Same results as MeasureShift()
+        """
+        for precision in (1, 10):
+            sm = ShiftMeasurer(self.ref, precision)
+            for im in self.shifted:
+                exp = MeasureShift(self.ref, im, precision)
+                numpy.testing.assert_almost_equal(sm.measure(im), exp)
+
+    def test_known_shift(self):
+        for dtype in (numpy.float64, numpy.float32):
+            sm = ShiftMeasurer(self.ref, 10, dtype=dtype)
+            for (dx, dy), im in zip(self.shifts, self.shifted):
+                numpy.testing.assert_almost_equal(sm.measure(im), (-dx, -dy), 1)
+
+    def test_many(self):
+        sm = ShiftMeasurer(self.ref, 10)
+        shifts = sm.measureMany(numpy.array(self.shifted))
+        self.assertEqual(len(shifts), len(self.shifted))
+        for s, im in zip(shifts, self.shifted):
+            numpy.testing.assert_almost_equal(s, sm.measure(im))
+
+    def test_update_reference(self):
+        sm = ShiftMeasurer(precision=10)
+        self.assertIsNone(sm.shape)
+        with self.assertRaises(ValueError):
+            sm.measure(self.ref)
+
+        sm.setReference(self.shifted[0])
+        prev = self.shifted[0]
+        for im in self.shifted[1:]:
+            exp = MeasureShift(prev, im, 10)
+            numpy.testing.assert_almost_equal(sm.measure(im, update_reference=True), exp)
+            prev = im
+
+        # Different shape => error
+        with self.assertRaises(ValueError):
+            sm.measure(self.image)
+
+    def test_speed(self):
+        """
+        Compare with MeasureShift(), as used for drift correction
+        """
+        n = 20
+        for precision in (1, 10):
+            tstart = time.time()
+            for i in range(n):
+                MeasureShift(self.ref, self.shifted[i % len(self.shifted)], precision)
+            dur_ms = (time.time() - tstart) / n
+
+            for dtype in (numpy.float64, numpy.float32):
+                sm = ShiftMeasurer(self.ref, precision, dtype=dtype)
+                tstart = time.time()
+                for i in range(n):
+                    sm.measure(self.shifted[i % len(self.shifted)])
+                dur_sm = (time.time() - tstart) / n
+                logging.info("Measuring shift with precision %d took %g ms, "
+                             "and %g ms with cached reference in %s",
+                             precision, dur_ms * 1e3, dur_sm * 1e3, numpy.dtype(dtype).name)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -36,29 +36,63 @@ def register(tiles, method=REGISTER_GLOBAL_SHIFT):
         tiles (list of DataArray of shape YX or tuples of DataArrays): The tiles as passed, but with updated 
         MD_POS metadata
     """
+    registrar = create_registrar(method)
 
+    # Register tiles
+    for ts in tiles:
+        add_registrar_tile(registrar, ts)
+
+    return apply_registration(tiles, registrar)
+
+
+def create_registrar(method=REGISTER_GLOBAL_SHIFT):
+    """
+    method (REGISTER_*): REGISTER_SHIFT → ShiftRegistrar, REGISTER_IDENTITY → IdentityRegistrar,
+      REGISTER_GLOBAL_SHIFT → GlobalShiftRegistrar
+    returns (Registrar): a new registrar, to which tiles can be added one at a
+      time, with add_registrar_tile()
+    """
     if method == REGISTER_SHIFT:
-        registrar = ShiftRegistrar()
+        return ShiftRegistrar()
     elif method == REGISTER_IDENTITY:
-        registrar = IdentityRegistrar()
+        return IdentityRegistrar()
     elif method == REGISTER_GLOBAL_SHIFT:
-        registrar = GlobalShiftRegistrar()
+        return GlobalShiftRegistrar()
     else:
         raise ValueError("Invalid registrar %s" % (method,))
 
-    # Register tiles
-    updatedTiles = []
-    for ts in tiles:
-        # Separate tile and dependent_tiles
-        if isinstance(ts, tuple):
-            tile = ts[0]
-            dep_tiles = ts[1:]
-        else:
-            tile = ts
-            dep_tiles = None
-        registrar.addTile(tile, dep_tiles)
 
-    # Update positions
+def add_registrar_tile(registrar, ts):
+    """
+    Add one tile to the registrar. The registration with the tiles previously
+      added is done immediately.
+    registrar (Registrar): as returned by create_registrar()
+    ts (DataArray of shape YX or tuple of DataArrays): The tile. If it's a
+      tuple, the first tile is the “main tile”, and the following ones are
+      dependent tiles.
+    """
+    # Separate tile and dependent_tiles
+    if isinstance(ts, tuple):
+        tile = ts[0]
+        dep_tiles = ts[1:]
+    else:
+        tile = ts
+        dep_tiles = None
+    registrar.addTile(tile, dep_tiles)
+
+
+def apply_registration(tiles, registrar):
+    """
+    tiles (list of DataArray of shape YX or tuples of DataArrays): The tiles,
+      as passed to the registrar, in the same order.
+    registrar (Registrar): registrar to which all the tiles have been added.
+    returns:
+        tiles (list of DataArray of shape YX or tuples of DataArrays): The tiles as passed, but with updated
+        MD_POS metadata
+    """
+    # Update positions (computed only once, as the global optimization is slow)
+    positions, dep_positions = registrar.getPositions()
+    updatedTiles = []
     for i, ts in enumerate(tiles):
         # Return tuple of positions if dependent tiles are present
         if isinstance(ts, tuple):
@@ -67,20 +101,20 @@ def register(tiles, method=REGISTER_GLOBAL_SHIFT):
 
             # Update main tile
             md = copy.deepcopy(tile.metadata)
-            md[model.MD_POS] = registrar.getPositions()[0][i]
+            md[model.MD_POS] = positions[i]
             tileUpd = model.DataArray(tile, md)
 
             # Update dependent tiles
             tilesNew = [tileUpd]
             for j, dt in enumerate(dep_tiles):
                 md = copy.deepcopy(dt.metadata)
-                md[model.MD_POS] = registrar.getPositions()[1][i][j]
+                md[model.MD_POS] = dep_positions[i][j]
                 tilesNew.append(model.DataArray(dt, md))
             tileUpd = tuple(tilesNew)
 
         else:
             md = copy.deepcopy(ts.metadata)
-            md[model.MD_POS] = registrar.getPositions()[0][i]
+            md[model.MD_POS] = positions[i]
             tileUpd = model.DataArray(ts, md)
 
         updatedTiles.append(tileUpd)
@@ -88,16 +122,22 @@ def register(tiles, method=REGISTER_GLOBAL_SHIFT):
     return updatedTiles
 
 
-def weave(tiles, method=WEAVER_MEAN):
+def weave(tiles, method=WEAVER_MEAN, on_disk=False):
     """
-    tiles (list of DataArray of shape YX or tuples of DataArrays): The tiles to compute the registration. 
+    tiles (iterable of DataArray of shape YX or tuples of DataArrays): The tiles to compute the registration. 
     If it's tuples, the first tile of each tuple is the “main tile”, and the following ones are dependent tiles.
     method (WEAVER_*): WEAVER_MEAN → MeanWeaver, WEAVER_COLLAGE → CollageWeaver
+    on_disk (bool): if True, the global image is built in a (temporary) file
+      instead of in memory (see DiskWeaver). To be used for very large images.
+      In such case, the tiles can also be DataArrayShadows, and they can be
+      passed as a generator, so that they are never all in memory at the same time.
     return:
         tiles (list of DataArray of shape YX or tuples of DataArrays): The tiles as passed, but with updated MD_POS metadata
     """
 
-    if method == WEAVER_MEAN:
+    if on_disk:
+        weaver = DiskWeaver(method)
+    elif method == WEAVER_MEAN:
         weaver = MeanWeaver()
     elif method == WEAVER_COLLAGE:
         weaver = CollageWeaver()
@@ -22,8 +22,10 @@ from __future__ import division
 import logging
 import math
 import os
+import tempfile
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from concurrent.futures._base import RUNNING, FINISHED, CANCELLED, CancelledError
 
 import numpy
@@ -33,7 +35,7 @@ from odemis import model, dataio
 from odemis.acq import acqmng
 from odemis.acq import stitching
 from odemis.acq.align.autofocus import MeasureOpticalFocus, AutoFocus, MTD_EXHAUSTIVE
-from odemis.acq.stitching._constants import WEAVER_COLLAGE_REVERSE
+from odemis.acq.stitching._constants import WEAVER_COLLAGE_REVERSE, REGISTER_GLOBAL_SHIFT
 from odemis.acq.stream import Stream, SEMStream, CameraStream, RepetitionStream, EMStream, ARStream, \
     SpectrumStream, FluoStream, MultipleDetectorStream, util, executeAsyncTask, \
     CLStream
@@ -105,6 +107,18 @@ class TiledAcquisitionTask(object):
         # TODO: allow to change the stage movement pattern
         self._settings_obs = settings_obs
 
+        # The registration is run in a separate thread, while acquiring the next
+        # tiles. The thread is only created when actually acquiring (see run()).
+        self._registrar = None
+        self._registration_futures = []
+        self._stitch_time = 0  # s, time spent registering the tiles
+        self._stitch_executor = None
+
+        # If the tiles don't fit easily in memory, they are written to a
+        # temporary file as soon as they are acquired (see _acquireTiles())
+        self._on_disk = False
+        self._spool = None
+
         self._log_path = log_path
         if self._log_path:
             filename = os.path.basename(self._log_path)
@@ -433,9 +447,34 @@ class TiledAcquisitionTask(object):
             raise CancelledError()
         return das
 
+    def _spoolTile(self, das):
+        """
+        Write the data of a tile to the temporary file, so that it doesn't stay
+        in memory.
+        :param das: (tuple of DataArrays) the data of one tile
+        :return: (tuple of DataArrays) same data, but memory-mapped on the file
+        """
+        if self._spool is None:
+            self._spool = tempfile.TemporaryFile()
+
+        mdas = []
+        for da in das:
+            a = numpy.ascontiguousarray(da)
+            self._spool.seek(0, 2)  # append at the end
+            offset = self._spool.tell()
+            a.tofile(self._spool)
+            self._spool.flush()
+            mda = numpy.memmap(self._spool, dtype=a.dtype, mode="r",
+                               offset=offset, shape=a.shape)
+            mdas.append(model.DataArray(mda, da.metadata))
+        return tuple(mdas)
+
     def _acquireTiles(self):
         """
          Acquire needed tiles by moving the stage to the tile position then calling acqmng.acquire
+         Each tile is registered (in a separate thread) as soon as it's acquired.
+         If all the tiles would not fit easily in memory, they are written to a
+         temporary file as soon as they are acquired.
         :return: (list of list of DataArrays): list of acquired data for each stream on each tile
         """
         da_list = []  # for each position, a list of DataArrays
@@ -461,11 +500,38 @@ class TiledAcquisitionTask(object):
                 self._save_tiles(ix, iy, das)
 
             # Sort tiles (largest sem on first position)
-            da_list.append(self._sortDAs(das, self._streams))
+            das = self._sortDAs(das, self._streams)
+
+            if i == 0 and das:
+                # The global images (+ their mask) take about as much memory as
+                # all the tiles. If that doesn't fit easily in the memory, all
+                # the stitching is done on disk.
+                tiles_bytes = sum(da.nbytes + da.size for da in das) * self._nx * self._ny
+                self._on_disk = tiles_bytes > psutil.virtual_memory().available / 2
+                if self._on_disk:
+                    logging.info("Storing %g MB of tiles on disk", tiles_bytes / 1024 ** 2)
+            if self._on_disk:
+                das = self._spoolTile(das)
+            da_list.append(das)
+
+            # Register the tile while the next one is acquired
+            if das:
+                self._registration_futures.append(self._stitch_executor.submit(self._registerTile, das))
 
             i += 1
         return da_list
 
+    def _registerTile(self, das):
+        """
+        Register one tile with the ones previously acquired. Run in the stitching thread.
+        :param das: (tuple of DataArrays) the data of one tile, as returned by _sortDAs()
+        """
+        if self._future and self._future._task_state == CANCELLED:
+            return
+        tstart = time.time()
+        stitching.add_registrar_tile(self._registrar, das)
+        self._stitch_time += time.time() - tstart
+
     def _adjustFocus(self, das, i, ix, iy):
         if i % SKIP_TILES != 0:
             logging.debug("Skipping focus adjustment..")
@@ -503,26 +569,54 @@ class TiledAcquisitionTask(object):
     def _stitchTiles(self, da_list):
         """
         Stitch the acquired tiles to create a complete view of the required total area
+        The tiles must have already been passed to the registrar (see _acquireTiles()).
         :return: (list of DataArrays): a stitched data for each stream acquisition
         """
-        st_data = []
         logging.info("Computing big image out of %d images", len(da_list))
-        # TODO: Do this registration step in a separate thread while acquiring
-        das_registered = stitching.register(da_list)
+        # Wait for the registration of all the tiles (and raise any exception
+        # which happened during it)
+        twait = time.time()
+        for f in self._registration_futures:
+            f.result()
+        twait = time.time() - twait
+        tstart = time.time()
+        das_registered = stitching.apply_registration([das for das in da_list if das],
+                                                      self._registrar)
 
         weaving_method = WEAVER_COLLAGE_REVERSE  # Method used for SECOM
         logging.info("Using weaving method WEAVER_COLLAGE_REVERSE.")
+
         # Weave every stream
         if isinstance(das_registered[0], tuple):
+            stream_tiles = []
             for s in range(len(das_registered[0])):
                 streams = []
                 for da in das_registered:
                     streams.append(da[s])
-                da = stitching.weave(streams, weaving_method)
-                st_data.append(da)
+                stream_tiles.append(streams)
+        else:
+            stream_tiles = [das_registered]
+
+        if self._on_disk:
+            # One stream at a time, to only read one set of tiles at a time
+            logging.info("Weaving the tiles on disk")
+            st_data = [stitching.weave(t, weaving_method, on_disk=True) for t in stream_tiles]
         else:
-            da = stitching.weave(das_registered, weaving_method)
-            st_data.append(da)
+            # In parallel (they are independent), as long as the temporary
+            # data (global image + mask) of each stream fits in memory.
+            stream_bytes = max(sum(da.nbytes + da.size for da in t) for t in stream_tiles)
+            mem_avail = psutil.virtual_memory().available / 2
+            workers = int(max(1, min(len(stream_tiles), mem_avail // max(1, stream_bytes))))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                st_data = list(executor.map(lambda t: stitching.weave(t, weaving_method),
+                                            stream_tiles))
+
+        # Report how much of the stitching could be done during the acquisition
+        reg_time = self._stitch_time
+        end_time = time.time() - tstart
+        logging.info("Stitching took %g s, of which %g s overlapped with the acquisition "
+                     "(registration: %g s, waited for it %g s, final assembly: %g s)",
+                     reg_time + end_time, max(0, reg_time - twait), reg_time, twait, end_time)
         return st_data
 
     def run(self):
@@ -538,6 +632,8 @@ class TiledAcquisitionTask(object):
             return
         self._future._task_state = RUNNING
         st_data = []
+        self._registrar = stitching.create_registrar(REGISTER_GLOBAL_SHIFT)
+        self._stitch_executor = ThreadPoolExecutor(max_workers=1)
         try:
             # Acquire the needed tiles
             da_list = self._acquireTiles()
@@ -562,6 +658,13 @@ class TiledAcquisitionTask(object):
             self._future.running_subf.cancel()
         finally:
             logging.info("Tiled acquisition ended")
+            # Don't wait for the registration, if cancelled, it stops immediately
+            self._stitch_executor.shutdown(wait=False)
+            if self._spool is not None:
+                # The tiles already memory-mapped stay available, and the file
+                # is deleted as soon as they are not used anymore.
+                self._spool.close()
+                self._spool = None
             self._stage.moveAbs(self._starting_pos)
             with self._future._task_lock:
                 self._future._task_state = FINISHED
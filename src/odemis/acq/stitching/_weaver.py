@@ -16,10 +16,14 @@ You should have received a copy of the GNU General Public License along with Ode
 '''
 from __future__ import division
 
+import copy
 import logging
+import mmap
 import numpy
 from odemis import model, util
+from odemis.acq.stitching._constants import WEAVER_MEAN, WEAVER_COLLAGE, WEAVER_COLLAGE_REVERSE
 from odemis.util import img
+import tempfile
 
 
 # This is a series of classes which use different methods to generate a large
@@ -30,6 +34,176 @@ from odemis.util import img
 # directly copy the image already transformed.
 # TODO: handle higher dimensions by just copying them as-is
 
+def _getBoundingBoxes(tiles):
+    """
+    Computes the position of each tile in the global image.
+    tiles (list of 2D DataArray): each image must have at least MD_POS and
+      MD_PIXEL_SIZE metadata. Only the shape and metadata are used.
+    return:
+      tbbx_px (list of 4 ints): the ltrb bounding box of each tile, in px of
+        the global image
+      gbbx_px (4 ints): the ltrb bounding box of the global image, in px
+      gbbx_phy (4 floats): the ltrb bounding box of the global image, in m
+    """
+    # Get a fixed pixel size by using the first one
+    # TODO: use the mean, in case they are all slightly different due to
+    # correction?
+    pxs = tiles[0].metadata[model.MD_PIXEL_SIZE]
+
+    tbbx_phy = []  # tuples of ltrb in physical coordinates
+    for t in tiles:
+        c = t.metadata[model.MD_POS]
+        w = t.shape[-1], t.shape[-2]
+        if not util.almost_equal(pxs[0], t.metadata[model.MD_PIXEL_SIZE][0], rtol=0.01):
+            logging.warning("Tile @ %s has a unexpected pixel size (%g vs %g)",
+                            c, t.metadata[model.MD_PIXEL_SIZE][0], pxs[0])
+        bbx = (c[0] - (w[0] * pxs[0] / 2), c[1] - (w[1] * pxs[1] / 2),
+               c[0] + (w[0] * pxs[0] / 2), c[1] + (w[1] * pxs[1] / 2))
+
+        tbbx_phy.append(bbx)
+
+    gbbx_phy = (min(b[0] for b in tbbx_phy), min(b[1] for b in tbbx_phy),
+                max(b[2] for b in tbbx_phy), max(b[3] for b in tbbx_phy))
+
+    # Compute the bounding-boxes in pixel coordinates
+    tbbx_px = []
+
+    # that's the origin (Y is max as Y is inverted)
+    glt = gbbx_phy[0], gbbx_phy[3]
+    for bp, t in zip(tbbx_phy, tiles):
+        lt = (int(round((bp[0] - glt[0]) / pxs[0])),
+              int(round(-(bp[3] - glt[1]) / pxs[1])))
+        w = t.shape[-1], t.shape[-2]
+        bbx = (lt[0], lt[1],
+               lt[0] + w[0], lt[1] + w[1])
+        tbbx_px.append(bbx)
+
+    gbbx_px = (min(b[0] for b in tbbx_px), min(b[1] for b in tbbx_px),
+               max(b[2] for b in tbbx_px), max(b[3] for b in tbbx_px))
+
+    assert gbbx_px[0] == gbbx_px[1] == 0
+    if numpy.greater(gbbx_px[-2:], 4 * numpy.sum(tbbx_px[-2:])).any():
+        # Overlap > 50% or missing tiles
+        logging.warning("Global area much bigger than sum of tile areas")
+
+    return tbbx_px, gbbx_px, gbbx_phy
+
+
+def _isMemoryMapped(a):
+    """
+    return (bool): True if the data of the array is memory-mapped on a file
+    """
+    while a is not None:
+        if isinstance(a, (numpy.memmap, mmap.mmap)):
+            return True
+        a = getattr(a, "base", None)
+    return False
+
+
+def _getFullMetadata(tiles, gbbx_phy):
+    """
+    return (dict): the metadata of the global image
+    """
+    # TODO: check this is also correct based on lt + half shape * pxs
+    c_phy = ((gbbx_phy[0] + gbbx_phy[2]) / 2,
+             (gbbx_phy[1] + gbbx_phy[3]) / 2)
+    md = tiles[0].metadata.copy()
+    md[model.MD_POS] = c_phy
+    md[model.MD_DIMS] = "YX"
+    return md
+
+
+def _pasteCollage(im, mask, b, t):
+    """
+    Paste the tile over the global image
+    im (2D array): the global image, updated
+    mask (None or 2D array of bool): not used
+    b (4 ints): ltrb bounding box of the tile in the global image
+    t (2D array): the tile
+    """
+    im[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]] = t
+    # TODO: border
+
+
+def _pasteCollageReverse(im, mask, b, t):
+    """
+    Paste the tile only on the parts of the global image which are still empty
+    im (2D array): the global image, updated
+    mask (2D array of bool): True where the global image already has data, updated
+    b (4 ints): ltrb bounding box of the tile in the global image
+    t (2D array): the tile
+    """
+    # Part of image overlapping with tile
+    roi = im[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]]
+    moi = mask[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]]
+
+    # Insert image at positions that are still empty
+    roi[~moi] = t[~moi]
+
+    # Update mask
+    mask[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]] = True
+
+
+def _pasteMean(im, mask, b, t):
+    """
+    Paste the tile on the empty parts of the global image, and merge it with a
+    gradient on the parts which already have data.
+    im (2D array): the global image, updated
+    mask (2D array of bool): True where the global image already has data, updated
+    b (4 ints): ltrb bounding box of the tile in the global image
+    t (2D array): the tile
+    """
+    # Weave tiles by using a smooth gradient. The part of the tile that does not overlap
+    # with any previous tiles is inserted into the part of the
+    # ovv image that is still empty. This part is determined by a mask, which indicates
+    # the parts of the image that already contain image data (True) and the ones that are still
+    # empty (False). For the overlapping parts, the tile is multiplied with weights corresponding
+    # to a gradient that has its maximum at the center of the tile and
+    # smoothly decreases toward the edges. The function for creating the weights is
+    # a distance measure resembling the maximum-norm, i.e. equidistant points lie
+    # on a rectangle (instead of a circle like for the euclidean norm). Additionally,
+    # the x and y values generating this norm are raised to the power of 6 to
+    # create a steeper gradient. The value 6 is quite arbitrary and was found to give
+    # good results during experimentation.
+    # The part of the overview image that overlaps with the new tile is multiplied with the
+    # complementary weights (1 -  weights) and the weighted overlapping parts of the new tile and
+    # the ovv image are added, so the resulting image contains a gradient in the overlapping regions
+    # between all the tiles that have been inserted before and the newly inserted tile.
+
+    # Part of image overlapping with tile
+    roi = im[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]]
+    moi = mask[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]]
+
+    # Insert image at positions that are still empty
+    roi[~moi] = t[~moi]
+
+    # Create gradient in overlapping region. Ratio between old image and new tile values determined by
+    # distance to the center of the tile
+
+    # Create weight matrix with decreasing values from its center that
+    # has the same size as the tile.
+    sz = numpy.array(roi.shape)
+    hh, hw = sz / 2  # half-height, half-width
+    x = numpy.linspace(-hw, hw, sz[1])
+    y = numpy.linspace(-hh, hh, sz[0])
+    xx, yy = numpy.meshgrid((x / hw) ** 6, (y / hh) ** 6)
+    w = numpy.maximum(xx, yy)
+    # Hardcoding a weight function is quite arbitrary and might result in
+    # suboptimal solutions in some cases.
+    # Alternatively, different weights might be used. One option would be to select
+    # a fixed region on the sides of the image, e.g. 20% (expected overlap), and
+    # only apply a (linear) gradient to these parts, while keeping the new tile for the
+    # rest of the region. However, this approach does not solve the hardcoding problem
+    # since the overlap region is still arbitrary. Future solutions might adaptively
+    # select the this region.
+
+    # Use weights to create gradient in overlapping region
+    roi[moi] = (t * (1 - w))[moi] + (roi * w)[moi]
+
+    # Update mask
+    mask[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]] = True
+
+
 class CollageWeaver(object):
     """
     Very straight-forward version, which just paste the images where their center
@@ -61,52 +235,10 @@ class CollageWeaver(object):
         """
         return (2D DataArray): same dtype as the tiles, with shape corresponding to the bounding box. 
         """
-
         tiles = self.tiles
 
         # Compute the bounding box of each tile and the global bounding box
-
-        # Get a fixed pixel size by using the first one
-        # TODO: use the mean, in case they are all slightly different due to
-        # correction?
-        pxs = tiles[0].metadata[model.MD_PIXEL_SIZE]
-
-        tbbx_phy = []  # tuples of ltrb in physical coordinates
-        for t in tiles:
-            c = t.metadata[model.MD_POS]
-            w = t.shape[-1], t.shape[-2]
-            if not util.almost_equal(pxs[0], t.metadata[model.MD_PIXEL_SIZE][0], rtol=0.01):
-                logging.warning("Tile @ %s has a unexpected pixel size (%g vs %g)",
-                                c, t.metadata[model.MD_PIXEL_SIZE][0], pxs[0])
-            bbx = (c[0] - (w[0] * pxs[0] / 2), c[1] - (w[1] * pxs[1] / 2),
-                   c[0] + (w[0] * pxs[0] / 2), c[1] + (w[1] * pxs[1] / 2))
-
-            tbbx_phy.append(bbx)
-
-        gbbx_phy = (min(b[0] for b in tbbx_phy), min(b[1] for b in tbbx_phy),
-                    max(b[2] for b in tbbx_phy), max(b[3] for b in tbbx_phy))
-
-        # Compute the bounding-boxes in pixel coordinates
-        tbbx_px = []
-
-        # that's the origin (Y is max as Y is inverted)
-        glt = gbbx_phy[0], gbbx_phy[3]
-        for bp, t in zip(tbbx_phy, tiles):
-            lt = (int(round((bp[0] - glt[0]) / pxs[0])),
-                  int(round(-(bp[3] - glt[1]) / pxs[1])))
-            w = t.shape[-1], t.shape[-2]
-            bbx = (lt[0], lt[1],
-                   lt[0] + w[0], lt[1] + w[1])
-            tbbx_px.append(bbx)
-
-        gbbx_px = (min(b[0] for b in tbbx_px), min(b[1] for b in tbbx_px),
-                   max(b[2] for b in tbbx_px), max(b[3] for b in tbbx_px))
-
-        assert gbbx_px[0] == gbbx_px[1] == 0
-
-        if numpy.greater(gbbx_px[-2:], 4 * numpy.sum(tbbx_px[-2:])).any():
-            # Overlap > 50% or missing tiles
-            logging.warning("Global area much bigger than sum of tile areas")
+        tbbx_px, gbbx_px, gbbx_phy = _getBoundingBoxes(tiles)
 
         # Paste each tile
         logging.debug("Generating global image of size %dx%d px",
@@ -115,16 +247,10 @@ class CollageWeaver(object):
         # Use minimum of the values in the tiles for background
         im[:] = numpy.amin(tiles)
         for b, t in zip(tbbx_px, tiles):
-            im[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]] = t
-            # TODO: border
+            _pasteCollage(im, None, b, t)
 
         # Update metadata
-        # TODO: check this is also correct based on lt + half shape * pxs
-        c_phy = ((gbbx_phy[0] + gbbx_phy[2]) / 2,
-                 (gbbx_phy[1] + gbbx_phy[3]) / 2)
-        md = tiles[0].metadata.copy()
-        md[model.MD_POS] = c_phy
-        md[model.MD_DIMS] = "YX"
+        md = _getFullMetadata(tiles, gbbx_phy)
         return model.DataArray(im, md)
 
 
@@ -153,47 +279,7 @@ class CollageWeaverReverse(object):
         tiles = self.tiles
 
         # Compute the bounding box of each tile and the global bounding box
-
-        # Get a fixed pixel size by using the first one
-        # TODO: use the mean, in case they are all slightly different due to
-        # correction?
-        pxs = tiles[0].metadata[model.MD_PIXEL_SIZE]
-
-        tbbx_phy = []  # tuples of ltrb in physical coordinates
-        for t in tiles:
-            c = t.metadata[model.MD_POS]
-            w = t.shape[-1], t.shape[-2]
-            if not util.almost_equal(pxs[0], t.metadata[model.MD_PIXEL_SIZE][0], rtol=0.01):
-                logging.warning("Tile @ %s has a unexpected pixel size (%g vs %g)",
-                                c, t.metadata[model.MD_PIXEL_SIZE][0], pxs[0])
-            bbx = (c[0] - (w[0] * pxs[0] / 2), c[1] - (w[1] * pxs[1] / 2),
-                   c[0] + (w[0] * pxs[0] / 2), c[1] + (w[1] * pxs[1] / 2))
-
-            tbbx_phy.append(bbx)
-
-        gbbx_phy = (min(b[0] for b in tbbx_phy), min(b[1] for b in tbbx_phy),
-                    max(b[2] for b in tbbx_phy), max(b[3] for b in tbbx_phy))
-
-        # Compute the bounding-boxes in pixel coordinates
-        tbbx_px = []
-
-        # that's the origin (Y is max as Y is inverted)
-        glt = gbbx_phy[0], gbbx_phy[3]
-        for bp, t in zip(tbbx_phy, tiles):
-            lt = (int(round((bp[0] - glt[0]) / pxs[0])),
-                  int(round(-(bp[3] - glt[1]) / pxs[1])))
-            w = t.shape[-1], t.shape[-2]
-            bbx = (lt[0], lt[1],
-                   lt[0] + w[0], lt[1] + w[1])
-            tbbx_px.append(bbx)
-
-        gbbx_px = (min(b[0] for b in tbbx_px), min(b[1] for b in tbbx_px),
-                   max(b[2] for b in tbbx_px), max(b[3] for b in tbbx_px))
-
-        assert gbbx_px[0] == gbbx_px[1] == 0
-        if numpy.greater(gbbx_px[-2:], 4 * numpy.sum(tbbx_px[-2:])).any():
-            # Overlap > 50% or missing tiles
-            logging.warning("Global area much bigger than sum of tile areas")
+        tbbx_px, gbbx_px, gbbx_phy = _getBoundingBoxes(tiles)
 
         # Paste each tile
         logging.debug("Generating global image of size %dx%d px",
@@ -202,27 +288,14 @@ class CollageWeaverReverse(object):
         # Use minimum of the values in the tiles for background
         im[:] = numpy.amin(tiles)
 
-        # The mask is multiplied with the tile, thereby creating a tile with a gradient
-        mask = numpy.zeros((gbbx_px[-1], gbbx_px[-2]), dtype=numpy.bool)
+        # The mask indicates the parts of the image which already contain data
+        mask = numpy.zeros((gbbx_px[-1], gbbx_px[-2]), dtype=bool)
 
         for b, t in zip(tbbx_px, tiles):
-            # Part of image overlapping with tile
-            roi = im[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]]
-            moi = mask[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]]
-
-            # Insert image at positions that are still empty
-            roi[~moi] = t[~moi]
-
-            # Update mask
-            mask[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]] = True
+            _pasteCollageReverse(im, mask, b, t)
 
         # Update metadata
-        # TODO: check this is also correct based on lt + half shape * pxs
-        c_phy = ((gbbx_phy[0] + gbbx_phy[2]) / 2,
-                 (gbbx_phy[1] + gbbx_phy[3]) / 2)
-        md = tiles[0].metadata.copy()
-        md[model.MD_POS] = c_phy
-        md[model.MD_DIMS] = "YX"
+        md = _getFullMetadata(tiles, gbbx_phy)
         return model.DataArray(im, md)
 
 
@@ -249,64 +322,7 @@ class MeanWeaver(object):
         tiles = self.tiles
 
         # Compute the bounding box of each tile and the global bounding box
-
-        # Get a fixed pixel size by using the first one
-        # TODO: use the mean, in case they are all slightly different due to
-        # correction?
-        pxs = tiles[0].metadata[model.MD_PIXEL_SIZE]
-
-        tbbx_phy = []  # tuples of ltrb in physical coordinates
-        for t in tiles:
-            c = t.metadata[model.MD_POS]
-            w = t.shape[-1], t.shape[-2]
-            if not util.almost_equal(pxs[0], t.metadata[model.MD_PIXEL_SIZE][0], rtol=0.01):
-                logging.warning("Tile @ %s has a unexpected pixel size (%g vs %g)",
-                                c, t.metadata[model.MD_PIXEL_SIZE][0], pxs[0])
-            bbx = (c[0] - (w[0] * pxs[0] / 2), c[1] - (w[1] * pxs[1] / 2),
-                   c[0] + (w[0] * pxs[0] / 2), c[1] + (w[1] * pxs[1] / 2))
-
-            tbbx_phy.append(bbx)
-
-        gbbx_phy = (min(b[0] for b in tbbx_phy), min(b[1] for b in tbbx_phy),
-                    max(b[2] for b in tbbx_phy), max(b[3] for b in tbbx_phy))
-
-        # Compute the bounding-boxes in pixel coordinates
-        tbbx_px = []
-
-        # that's the origin (Y is max as Y is inverted)
-        glt = gbbx_phy[0], gbbx_phy[3]
-        for bp, t in zip(tbbx_phy, tiles):
-            lt = (int(round((bp[0] - glt[0]) / pxs[0])),
-                  int(round(-(bp[3] - glt[1]) / pxs[1])))
-            w = t.shape[-1], t.shape[-2]
-            bbx = (lt[0], lt[1],
-                   lt[0] + w[0], lt[1] + w[1])
-            tbbx_px.append(bbx)
-
-        gbbx_px = (min(b[0] for b in tbbx_px), min(b[1] for b in tbbx_px),
-                   max(b[2] for b in tbbx_px), max(b[3] for b in tbbx_px))
-
-        assert gbbx_px[0] == gbbx_px[1] == 0
-        if numpy.greater(gbbx_px[-2:], 4 * numpy.sum(tbbx_px[-2:])).any():
-            # Overlap > 50% or missing tiles
-            logging.warning("Global area much bigger than sum of tile areas")
-
-        # Weave tiles by using a smooth gradient. The part of the tile that does not overlap
-        # with any previous tiles is inserted into the part of the
-        # ovv image that is still empty. This part is determined by a mask, which indicates
-        # the parts of the image that already contain image data (True) and the ones that are still
-        # empty (False). For the overlapping parts, the tile is multiplied with weights corresponding
-        # to a gradient that has its maximum at the center of the tile and
-        # smoothly decreases toward the edges. The function for creating the weights is
-        # a distance measure resembling the maximum-norm, i.e. equidistant points lie
-        # on a rectangle (instead of a circle like for the euclidean norm). Additionally,
-        # the x and y values generating this norm are raised to the power of 6 to
-        # create a steeper gradient. The value 6 is quite arbitrary and was found to give
-        # good results during experimentation.
-        # The part of the overview image that overlaps with the new tile is multiplied with the
-        # complementary weights (1 -  weights) and the weighted overlapping parts of the new tile and
-        # the ovv image are added, so the resulting image contains a gradient in the overlapping regions
-        # between all the tiles that have been inserted before and the newly inserted tile.
+        tbbx_px, gbbx_px, gbbx_phy = _getBoundingBoxes(tiles)
 
         # Paste each tile
         logging.debug("Generating global image of size %dx%d px",
@@ -315,48 +331,150 @@ class MeanWeaver(object):
         # Use minimum of the values in the tiles for background
         im[:] = numpy.amin(tiles)
 
-        # The mask is multiplied with the tile, thereby creating a tile with a gradient
-        mask = numpy.zeros((gbbx_px[-1], gbbx_px[-2]), dtype=numpy.bool)
+        # The mask indicates the parts of the image which already contain data
+        mask = numpy.zeros((gbbx_px[-1], gbbx_px[-2]), dtype=bool)
+
+        for b, t in zip(tbbx_px, tiles):
+            _pasteMean(im, mask, b, t)
+
+        # Update metadata
+        md = _getFullMetadata(tiles, gbbx_phy)
+        return model.DataArray(im, md)
+
+
+class DiskWeaver(object):
+    """
+    Weaves the tiles like the other weavers, but without keeping them, or the
+    global image, in memory. This allows to stitch very large tiled acquisitions.
+    The tiles are copied to a temporary file as soon as they are added, and the
+    global image is written into a memory-mapped file. So only one tile at a
+    time is loaded in memory, and the operating system takes care of keeping
+    in memory the parts of the global image currently used.
+    Tiles which are already on disk (memory-mapped DataArrays, or
+    DataArrayShadows, as returned by dataio.*.open_data()) are not copied, but
+    only read when the global image is computed. So the tiles can be passed
+    as a stream (eg, a generator reading them back from files).
+    """
+
+    def __init__(self, method=WEAVER_COLLAGE_REVERSE, filename=None, tmpdir=None):
+        """
+        method (WEAVER_*): the way the tiles are merged, as in weave()
+        filename (None or str): file where to write the global image, as raw
+          data (see numpy.memmap). If None, a temporary file is used, which is
+          automatically deleted when the global image is not used anymore.
+        tmpdir (None or str): directory where to store the temporary files.
+          If None, the default temporary directory is used.
+        """
+        if method == WEAVER_MEAN:
+            self._paste = _pasteMean
+        elif method == WEAVER_COLLAGE:
+            self._paste = _pasteCollage
+        elif method == WEAVER_COLLAGE_REVERSE:
+            self._paste = _pasteCollageReverse
+        else:
+            raise ValueError("Invalid weaver %s" % (method,))
+        self._method = method
+        self._filename = filename
+        self._tmpdir = tmpdir
+
+        # Temporary file with the data of all the tiles, one after another
+        self._spool = tempfile.TemporaryFile(dir=tmpdir)
+        # DataArrays memory-mapped (on the spool file, or the original file),
+        # or DataArrayShadows
+        self.tiles = []
+        self._bg = None  # minimum value of all the tiles read so far
+        self._unread = []  # DataArrayShadows whose minimum is not yet known
+
+    def addTile(self, tile):
+        """
+        tile (2D DataArray or DataArrayShadow): the image must have at least
+          MD_POS and MD_PIXEL_SIZE metadata. All provided tiles should have the
+          same dtype. If the data is already on disk, it must not be modified
+          until the global image is computed.
+        """
+        md = tile.metadata.copy()
+        # Merge the correction metadata inside each image (to keep the rest of the
+        # code simple)
+        img.mergeMetadata(md)
+
+        if isinstance(tile, model.DataArrayShadow):
+            # Only the shape and metadata are needed for now => don't read it
+            stile = copy.copy(tile)
+            stile.metadata = md
+            self.tiles.append(stile)
+            self._unread.append(stile)
+            return
+
+        if not _isMemoryMapped(tile):
+            tile = numpy.ascontiguousarray(tile)
+            self._spool.seek(0, 2)  # append at the end
+            offset = self._spool.tell()
+            tile.tofile(self._spool)
+            self._spool.flush()
+            mtile = numpy.memmap(self._spool, dtype=tile.dtype, mode="r",
+                                 offset=offset, shape=tile.shape)
+        else:
+            mtile = tile
+        self.tiles.append(model.DataArray(mtile, md))
+        self._updateBackground(tile)
+
+    def _updateBackground(self, tile):
+        tmin = tile.min()
+        if self._bg is None or tmin < self._bg:
+            self._bg = tmin
+
+    def getFullImage(self):
+        """
+        return (2D DataArray): same dtype as the tiles, with shape corresponding
+          to the bounding box. The data is memory-mapped on the file.
+        """
+        tiles = self.tiles
+
+        # The background is needed before pasting anything, so the tiles not
+        # yet read have to be read twice.
+        for t in self._unread:
+            self._updateBackground(t.getData())
+        self._unread = []
+
+        # Compute the bounding box of each tile and the global bounding box
+        tbbx_px, gbbx_px, gbbx_phy = _getBoundingBoxes(tiles)
+
+        # Paste each tile
+        shape = gbbx_px[-1], gbbx_px[-2]
+        logging.debug("Generating global image of size %dx%d px on disk",
+                      shape[1], shape[0])
+        if self._filename is None:
+            f = tempfile.TemporaryFile(dir=self._tmpdir)
+        else:
+            f = self._filename
+        im = numpy.memmap(f, dtype=tiles[0].dtype, mode="w+", shape=shape)
+        # Use minimum of the values in the tiles for background
+        im[:] = self._bg
+
+        if self._method == WEAVER_COLLAGE:
+            mask = None
+        else:
+            # The mask indicates the parts of the image which already contain data
+            mf = tempfile.TemporaryFile(dir=self._tmpdir)
+            mask = numpy.memmap(mf, dtype=bool, mode="w+", shape=shape)
 
         for b, t in zip(tbbx_px, tiles):
-            # Part of image overlapping with tile
-            roi = im[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]]
-            moi = mask[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]]
-
-            # Insert image at positions that are still empty
-            roi[~moi] = t[~moi]
-
-            # Create gradient in overlapping region. Ratio between old image and new tile values determined by
-            # distance to the center of the tile
-
-            # Create weight matrix with decreasing values from its center that
-            # has the same size as the tile.
-            sz = numpy.array(roi.shape)
-            hh, hw = sz / 2  # half-height, half-width
-            x = numpy.linspace(-hw, hw, sz[1])
-            y = numpy.linspace(-hh, hh, sz[0])
-            xx, yy = numpy.meshgrid((x / hw) ** 6, (y / hh) ** 6)
-            w = numpy.maximum(xx, yy)
-            # Hardcoding a weight function is quite arbitrary and might result in
-            # suboptimal solutions in some cases.
-            # Alternatively, different weights might be used. One option would be to select
-            # a fixed region on the sides of the image, e.g. 20% (expected overlap), and
-            # only apply a (linear) gradient to these parts, while keeping the new tile for the
-            # rest of the region. However, this approach does not solve the hardcoding problem
-            # since the overlap region is still arbitrary. Future solutions might adaptively
-            # select the this region.
-
-            # Use weights to create gradient in overlapping region
-            roi[moi] = (t * (1 - w))[moi] + (roi * w)[moi]
-
-            # Update mask
-            mask[b[1]:b[1] + t.shape[0], b[0]:b[0] + t.shape[1]] = True
+            # Load the whole tile in memory, as it's accessed multiple times
+            if isinstance(t, model.DataArrayShadow):
+                # Files often store images with extra (empty) dimensions
+                t = img.ensure2DImage(t.getData())
+            self._paste(im, mask, b, numpy.array(t))
+        im.flush()
 
         # Update metadata
-        # TODO: check this is also correct based on lt + half shape * pxs
-        c_phy = ((gbbx_phy[0] + gbbx_phy[2]) / 2,
-                 (gbbx_phy[1] + gbbx_phy[3]) / 2)
-        md = tiles[0].metadata.copy()
-        md[model.MD_POS] = c_phy
-        md[model.MD_DIMS] = "YX"
+        md = _getFullMetadata(tiles, gbbx_phy)
         return model.DataArray(im, md)
+
+    def close(self):
+        """
+        Delete the temporary data of the tiles. After this call, no tile can be
+        added, and the global image cannot be computed anymore.
+        """
+        self.tiles = []
+        self._unread = []
+        self._spool.close()
@@ -26,7 +26,8 @@ import copy
 import numpy
 from odemis import model
 import odemis
-from odemis.acq.stitching import register, weave, REGISTER_IDENTITY, REGISTER_SHIFT, WEAVER_COLLAGE, WEAVER_MEAN
+from odemis.acq.stitching import register, weave, REGISTER_IDENTITY, REGISTER_SHIFT, WEAVER_COLLAGE, WEAVER_MEAN, \
+    REGISTER_GLOBAL_SHIFT, create_registrar, add_registrar_tile, apply_registration
 from odemis.dataio import find_fittest_converter
 from odemis.util.img import ensure2DImage
 import os
@@ -82,6 +83,31 @@ class TestRegister(unittest.TestCase):
                 self.assertAlmostEqual(calculatedPosition[0], pos[i][0], places=1)
                 self.assertAlmostEqual(calculatedPosition[1], pos[i][1], places=1)
 
+    def test_incremental(self):
+        """
+        Test adding the tiles one at a time to the registrar gives the same
+        result as register()
+        """
+        for img in IMGS:
+            conv = find_fittest_converter(img)
+            data = conv.read_data(img)[0]
+            img = ensure2DImage(data)
+            [tiles, pos] = decompose_image(img, 0.2, 3, "horizontalZigzag")
+            all_tiles = [(t, t) for t in tiles]
+
+            exp_tiles = register(all_tiles, method=REGISTER_GLOBAL_SHIFT)
+
+            registrar = create_registrar(REGISTER_GLOBAL_SHIFT)
+            for ts in all_tiles:
+                add_registrar_tile(registrar, ts)
+            upd_tiles = apply_registration(all_tiles, registrar)
+
+            self.assertEqual(len(upd_tiles), len(exp_tiles))
+            for ts, ets in zip(upd_tiles, exp_tiles):
+                for t, et in zip(ts, ets):
+                    numpy.testing.assert_array_equal(t, et)
+                    self.assertEqual(t.metadata[model.MD_POS], et.metadata[model.MD_POS])
+
     # @unittest.skip("skip")
     def test_dep_tiles(self):
         """
@@ -26,12 +26,15 @@ import logging
 import numpy
 from odemis import model
 import odemis
-from odemis.acq.stitching import CollageWeaver, MeanWeaver, CollageWeaverReverse
+from odemis.acq.stitching import CollageWeaver, MeanWeaver, CollageWeaverReverse, DiskWeaver, \
+    WEAVER_MEAN, WEAVER_COLLAGE, WEAVER_COLLAGE_REVERSE, weave
 from odemis.dataio import find_fittest_converter
 from odemis.util.img import ensure2DImage
 import os
 import random
+import tempfile
 import time
+import tracemalloc
 import unittest
 
 from stitching_test import decompose_image
@@ -475,5 +478,116 @@ class TestCollageWeaverReverse(unittest.TestCase):
         numpy.testing.assert_equal(o, 256 * numpy.ones((80, 30)))
 
 
+class TestDiskWeaver(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)  # for reproducibility
+        # Random image, decomposed into tiles
+        rng = numpy.random.RandomState(1)
+        self.img = rng.randint(0, 4096, (800, 900)).astype(numpy.uint16)
+        self.tiles, _ = decompose_image(self.img, 0.2, 4, "horizontalZigzag", False)
+
+    def test_same_as_memory(self):
+        """
+        Same result as the standard (in-memory) weavers
+        """
+        for method, weaver_cls in ((WEAVER_MEAN, MeanWeaver),
+                                   (WEAVER_COLLAGE, CollageWeaver),
+                                   (WEAVER_COLLAGE_REVERSE, CollageWeaverReverse)):
+            weaver = weaver_cls()
+            dweaver = DiskWeaver(method)
+            for t in self.tiles:
+                weaver.addTile(t)
+                dweaver.addTile(t)
+
+            exp = weaver.getFullImage()
+            outd = dweaver.getFullImage()
+            self.assertEqual(outd.shape, exp.shape)
+            self.assertEqual(outd.dtype, exp.dtype)
+            numpy.testing.assert_array_equal(outd, exp)
+            self.assertEqual(outd.metadata, exp.metadata)
+            dweaver.close()
+
+    def test_filename(self):
+        """
+        The global image is written in the given file
+        """
+        fd, fn = tempfile.mkstemp(suffix=".raw")
+        os.close(fd)
+        try:
+            weaver = DiskWeaver(WEAVER_COLLAGE, filename=fn)
+            for t in self.tiles:
+                weaver.addTile(t)
+            outd = weaver.getFullImage()
+            weaver.close()
+            # After closing the weaver, the global image is still available
+            sz = outd.shape
+            numpy.testing.assert_array_equal(outd, self.img[:sz[0], :sz[1]])
+
+            raw = numpy.fromfile(fn, dtype=outd.dtype).reshape(sz)
+            numpy.testing.assert_array_equal(raw, outd)
+            del outd
+        finally:
+            os.remove(fn)
+
+    def test_shadows(self):
+        """
+        Tiles read back from files are only read when computing the global image
+        """
+        exporter = find_fittest_converter("tile.h5")
+        tmpdir = tempfile.mkdtemp()
+        fns = []
+        try:
+            for i, t in enumerate(self.tiles):
+                fn = os.path.join(tmpdir, "tile%d.h5" % i)
+                exporter.export(fn, t)
+                fns.append(fn)
+
+            def read_tiles():
+                for fn in fns:
+                    yield exporter.open_data(fn).content[0]
+
+            exp = weave(self.tiles, WEAVER_COLLAGE_REVERSE)
+            outd = weave(read_tiles(), WEAVER_COLLAGE_REVERSE, on_disk=True)
+            numpy.testing.assert_array_equal(outd, exp)
+            self.assertEqual(outd.metadata[model.MD_POS], exp.metadata[model.MD_POS])
+            del outd
+        finally:
+            for fn in fns:
+                os.remove(fn)
+            os.rmdir(tmpdir)
+
+    def test_memory_bounded(self):
+        """
+        When the tiles are passed as a generator, they are not all kept in memory
+        """
+        tshape = (512, 512)
+        ntiles = 8
+        tile_bytes = numpy.prod(tshape) * 2
+        pxs = (1e-6, 1e-6)
+
+        def gen_tiles():
+            for i in range(ntiles):
+                for j in range(ntiles):
+                    md = {model.MD_PIXEL_SIZE: pxs,
+                          model.MD_POS: (j * 400 * pxs[0], -i * 400 * pxs[1])}
+                    yield model.DataArray(numpy.full(tshape, i * ntiles + j, dtype=numpy.uint16), md)
+
+        tracemalloc.start()
+        try:
+            outd = weave(gen_tiles(), WEAVER_COLLAGE_REVERSE, on_disk=True)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        logging.debug("Peak memory: %g MB, for %g MB of tiles", peak / 1024 ** 2,
+                      ntiles ** 2 * tile_bytes / 1024 ** 2)
+
+        self.assertEqual(outd.shape, (512 + 400 * (ntiles - 1),) * 2)
+        self.assertEqual(outd[-1, -1], ntiles ** 2 - 1)
+        # Only a few tiles at a time are in memory (instead of the 64 tiles)
+        self.assertLess(peak, 8 * tile_bytes)
+        del outd
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -108,6 +108,10 @@ class Stream(object):
     # Minimum overhead time in seconds when acquiring an image
     SETUP_OVERHEAD = 0.1
 
+    # Maximum number of pixels used to compute the histogram. Bigger images are
+    # subsampled. None means all the pixels are always used.
+    HISTOGRAM_MAX_PIXELS = None
+
     def __init__(self, name, detector, dataflow, emitter, focuser=None, opm=None,
                  hwdetvas=None, hwemtvas=None, detvas=None, emtvas=None, axis_map={},
                  raw=None, acq_type=None):
@@ -1146,6 +1150,27 @@ class Stream(object):
     def _onIntensityRange(self, irange):
         self._shouldUpdateImage()
 
+    def _getHistogramSubsample(self, data):
+        """
+        Find the subsampling to use to compute the histogram of the given data,
+        based on HISTOGRAM_MAX_PIXELS.
+        data (ndarray): the raw data
+        return (1<=int): only every N pixel along each dimension should be used
+        """
+        if self.HISTOGRAM_MAX_PIXELS is None or data.size <= self.HISTOGRAM_MAX_PIXELS:
+            return 1
+        ndims = sum(1 for l in data.shape if l > 1)
+        return int(math.ceil((data.size / self.HISTOGRAM_MAX_PIXELS) ** (1 / ndims)))
+
+    def _computeHistogram(self, data):
+        """
+        Compute the histogram of the given data, within the current ._drange.
+        data (DataArray): the raw data
+        return hist, edges: see img.histogram()
+        """
+        return img.histogram(data, irange=self._drange,
+                             subsample=self._getHistogramSubsample(data))
+
     def _updateHistogram(self, data=None):
         """
         data (DataArray): the raw data to use, default to .raw[0] - background
@@ -1175,7 +1200,7 @@ class Stream(object):
         self._updateDRange(data)
 
         # Initially, _drange might be None, in which case it will be guessed
-        hist, edges = img.histogram(data, irange=self._drange)
+        hist, edges = self._computeHistogram(data)
         if hist.size > 256:
             chist = img.compactHistogram(hist, 256)
         else:
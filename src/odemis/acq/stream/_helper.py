@@ -235,7 +235,7 @@ class RepetitionStream(LiveStream):
         self._updateDRange(data)
 
         # Initially, _drange might be None, in which case it will be guessed
-        hist, edges = img.histogram(data, irange=self._drange)
+        hist, edges = self._computeHistogram(data)
         if hist.size > 256:
             chist = img.compactHistogram(hist, 256)
         else:
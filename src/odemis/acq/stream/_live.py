@@ -41,11 +41,20 @@ class LiveStream(Stream):
     Abstract class for any stream that can do continuous acquisition.
     """
 
+    # The histogram is only for display, so an approximation is good enough
+    HISTOGRAM_MAX_PIXELS = 1024 * 1024
+    # The histogram is accumulated over the successive frames (cf RunningHistogram)
+    HISTOGRAM_DECAY = 0.5
+    HISTOGRAM_INTERLEAVE = 2
+
     def __init__(self, name, detector, dataflow, emitter, forcemd=None, **kwargs):
         """
         forcemd (None or dict of MD_* -> value): force the metadata of the
           .image DataArray to be overridden by this metadata.
         """
+        # Needed before the init, as the histogram might be computed already
+        self._running_hist = img.RunningHistogram(self.HISTOGRAM_DECAY,
+                                                  self.HISTOGRAM_INTERLEAVE)
         super(LiveStream, self).__init__(name, detector, dataflow, emitter, **kwargs)
 
         self._forcemd = forcemd
@@ -83,6 +92,8 @@ class LiveStream(Stream):
         """
         # Make sure the stream is prepared before really activate it
         if active:
+            # The previous frames might be very different from the new ones
+            self._running_hist.reset()
             if not self._prepared:
                 logging.debug("Preparing stream before activating it as it wasn't prepared")
                 self._prep_future = self._prepare()
@@ -96,6 +107,21 @@ class LiveStream(Stream):
             logging.debug(msg, self._detector.name)
             self._dataflow.unsubscribe(self._onNewData)
 
+    def _computeHistogram(self, data):
+        # Consecutive frames are usually similar, so update the histogram
+        # incrementally, which allows to only look at part of each frame.
+        return self._running_hist.update(data, irange=self._drange,
+                                         subsample=self._getHistogramSubsample(data))
+
+    def _recomputeIntensityRange(self):
+        try:
+            irange = self._running_hist.findOptimalRange(self.auto_bc_outliers.value / 100)
+        except LookupError:  # No histogram yet
+            return
+        # clip is needed for some corner cases with floats
+        irange = self.intensityRange.clip(irange)
+        self.intensityRange.value = irange
+
     def _startAcquisition(self, future=None):
         if not self.is_active.value or (future and future.cancelled()):
             logging.info("Not activating %s, as it was stopped before the preparation finished",
@@ -22,11 +22,13 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 
 from __future__ import division
 
+from concurrent.futures import ThreadPoolExecutor
 import threading
 import weakref
 import logging
 import time
 import math
+import multiprocessing
 import gc
 import numpy
 
@@ -37,14 +39,28 @@ try:
 except ImportError:
     pass  # The projection using this module should never be instantiated then.
 
-from odemis import model
-from odemis.util import img, angleres
-from scipy import ndimage
+from odemis import model, util
+from odemis.util import img, angleres, spectrum
 from odemis.model import MD_PIXEL_SIZE, MD_POL_EPHI, MD_POL_EX, MD_POL_EY, MD_POL_EZ, MD_POL_ETHETA, MD_POL_DS0, \
     MD_POL_S0, MD_POL_DOP, MD_POL_DOLP, MD_POL_UP
 from odemis.acq.stream._static import StaticSpectrumStream
 from abc import abstractmethod
 
+# Executor shared by all the projections to read and project the tiles in parallel
+_tile_executor = None
+_tile_executor_lock = threading.Lock()
+
+
+def _get_tile_executor():
+    """
+    return (ThreadPoolExecutor): the executor to read and project the tiles
+    """
+    global _tile_executor
+    with _tile_executor_lock:
+        if _tile_executor is None:
+            _tile_executor = ThreadPoolExecutor(max_workers=min(4, multiprocessing.cpu_count()))
+        return _tile_executor
+
 
 class DataProjection(object):
 
@@ -344,6 +360,31 @@ class ARProjection(RGBProjection):
 
         return image_resized
 
+    def _convertImages(self, images, convert, output_size):
+        """
+        Converts multiple images to a projection in one go, which is faster than
+        one at a time.
+        :param images: (list of 2D DataArrays) The (background corrected) images. They must
+                       have the same shape and be acquired with the same settings (eg, all the
+                       polarization positions at one ebeam position).
+        :param convert: (callable) angleres.AngleResolvedMap2Polar or AngleResolvedMap2Rectangular.
+        :param output_size: (int or (int, int)) The size of the output images.
+        :returns: (list of DataArrays) The converted images, with the metadata of each image.
+        """
+        ar_map = model.DataArray(numpy.array(images), images[0].metadata)
+        converted = convert(ar_map, output_size, hole=False)
+
+        converted_das = []
+        for im, c in zip(images, converted):
+            md = im.metadata.copy()
+            # The mirror metadata is updated by the conversion, in case of a flipped mirror
+            for k in (model.MD_AR_FOCUS_DISTANCE, model.MD_AR_POLE):
+                if k in converted.metadata:
+                    md[k] = converted.metadata[k]
+            converted_das.append(model.DataArray(c, md))
+
+        return converted_das
+
 
 class ARRawProjection(ARProjection):
     """
@@ -416,6 +457,37 @@ class ARRawProjection(ARProjection):
 
         return polar_data
 
+    def _project2PolarAll(self, ebeam_pos, pol_positions):
+        """
+        Computes the polar projections of the images at the given position for all the
+        polarization positions, in one go, and stores them in the cache.
+        :param ebeam_pos: (float, float) Ebeam position (must be part of the .stream._pos).
+        :param pol_positions: (list of str) Polarization positions (must be part of the .stream._pos).
+        """
+        polar_cache = self._polar_cache
+        pol_todo = [p for p in pol_positions if p not in polar_cache.get(ebeam_pos, {})]
+        if len(pol_todo) < 2:
+            return  # Nothing to gain, _project2Polar() will do the job
+
+        try:
+            calibrated = []
+            for pol_pos in pol_todo:
+                data = self.stream._pos[ebeam_pos + (pol_pos,)]
+                # Correct image for background. It must match the polarization (defaulting to MD_POL_NONE).
+                cal = self._processBackground(data, data.metadata.get(model.MD_POL_MODE, model.MD_POL_NONE))
+                if numpy.prod(cal.shape) > (1280 * 1080):
+                    cal = self._resizeImage(cal, size=1024)
+                calibrated.append(cal)
+
+            # Same size as in _project2Polar()
+            output_size = min(min(calibrated[0].shape) * 2, 1134)
+            polar_das = self._convertImages(calibrated, angleres.AngleResolvedMap2Polar, output_size)
+        except Exception:
+            logging.exception("Failed to convert to azimuthal projection all the polarization positions")
+            return
+
+        polar_cache.setdefault(ebeam_pos, {}).update(zip(pol_todo, polar_das))
+
     def _updateImage(self):
         """
         Recomputes the image for the current ebeam position and polarization position requested.
@@ -489,22 +561,24 @@ class ARRawProjection(ARProjection):
         else:
             pol_positions = [None]
 
+        calibrated = []
         for pol_pos in pol_positions:
             data = pos[ebeam_pos + (pol_pos,)]
 
             # Correct image for background. It must match the polarization (defaulting to MD_POL_NONE).
-            calibrated = self._processBackground(data, data.metadata.get(model.MD_POL_MODE, model.MD_POL_NONE),
-                                                 clip_data=False)
+            cal = self._processBackground(data, data.metadata.get(model.MD_POL_MODE, model.MD_POL_NONE),
+                                          clip_data=False)
 
             # resize if too large to not run into memory problems
-            if numpy.prod(calibrated.shape) > (800 * 800):
-                calibrated = self._resizeImage(calibrated, size=768)
+            if numpy.prod(cal.shape) > (800 * 800):
+                cal = self._resizeImage(cal, size=768)
+            calibrated.append(cal)
 
-            output_size = (90, 360)  # Note: increase if data is high def
-
-            # calculate raw theta/phi representation
-            data = angleres.AngleResolved2Rectangular(calibrated, output_size, hole=False)
+        output_size = (90, 360)  # Note: increase if data is high def
 
+        # calculate raw theta/phi representation, of all the polarization positions at once
+        for pol_pos, data in zip(pol_positions,
+                                 self._convertImages(calibrated, angleres.AngleResolvedMap2Rectangular, output_size)):
             data.metadata[model.MD_ACQ_TYPE] = model.MD_AT_AR
             data_dict[pol_pos] = data
 
@@ -525,6 +599,7 @@ class ARRawProjection(ARProjection):
         data_dict = {}
 
         if hasattr(self, "polarization"):
+            self._project2PolarAll(ebeam_pos, self.polarization.choices)
             for pol_pos in self.polarization.choices:
                 data = self._project2Polar(ebeam_pos, pol_pos)
                 data = self._project2RGB(data, self.stream.tint.value)
@@ -609,27 +684,31 @@ class ARPolarimetryProjection(ARProjection):
             try:
                 # Convert data into rectangular format (theta-phi-representation).
                 # Check if rectangular converted representation already was calculated for requested ebeam pos.
-                # Note: This calc is very time consuming. Takes about 3.6 sec for one ebeam pos (conversion of 6 images)
-                # and tested on an image of size (256, 1024).
+                # Note: Only the first conversion is slow (~1 s), as it computes the resampling operator, which is
+                # then reused for all the images with the same geometry (see angleres._GetResamplingOperator()).
 
                 # TODO get the raw/bg processed data from polar_cache, as now we do bg subtraction twice
-                calibrated_raw = {}
+                calibrated = []
 
                 # TODO allow variable input size? Calc based on raw data? E.g. with binning
                 # The number of pixels (theta, phi) of the output image.
                 output_size = (400, 600)  # defines the resolution of the displayed image
 
-                for pol, raw in data_raw.items():
-
+                pols = list(data_raw.keys())
+                for pol in pols:
+                    raw = data_raw[pol]
                     # Correct image for background. It must match the polarization (defaulting to MD_POL_NONE).
-                    calibrated = self._processBackground(raw, raw.metadata.get(model.MD_POL_MODE, model.MD_POL_NONE))
+                    cal = self._processBackground(raw, raw.metadata.get(model.MD_POL_MODE, model.MD_POL_NONE))
 
                     # check if image is too large and we might run into memory trouble -> resize
-                    if numpy.prod(calibrated.shape) > (1280 * 1080):
-                        calibrated = self._resizeImage(calibrated, size=1024)
+                    if numpy.prod(cal.shape) > (1280 * 1080):
+                        cal = self._resizeImage(cal, size=1024)
+                    calibrated.append(cal)
 
-                    # calculate the rectangular representation (phi/theta) of the background corrected raw images
-                    calibrated_raw[pol] = angleres.AngleResolved2Rectangular(calibrated, output_size, hole=False)
+                # calculate the rectangular representation (phi/theta) of the background corrected raw images,
+                # all at once, as they share the same geometry
+                calibrated_raw = dict(zip(pols, self._convertImages(calibrated, angleres.AngleResolvedMap2Rectangular,
+                                                                    output_size)))
 
                 # Get the center wavelength of the filter used (no filter aka "pass-through" use fallback)
                 # Does not matter from which of the 6 images as they all were recorded with the same filter
@@ -819,8 +898,18 @@ class RGBSpatialProjection(RGBProjection):
     Depending on which type of stream is passed at creation, a more suitable subclass of
     RGBSpatialProjection might be created (via the use of the __new__ operator).
     That is the recommended way to create a RGBSpatialProjection.
+
+    When the raw data is tiled (DataArrayShadow), each projection keeps its own
+    cache of the projected tiles, of up to TILES_CACHE_SIZE (128 MB). So the
+    memory used grows with the number of projections (ie, views) of the
+    streams. The raw tiles are cached by the DataArrayShadow.
     """
 
+    # Maximum memory used to keep the projected tiles (per projection)
+    TILES_CACHE_SIZE = 128 * 1024 ** 2  # bytes
+    # Whether to read in advance the tiles around the ones displayed
+    PREFETCH_TILES = True
+
     def __new__(cls, stream):
 
         if isinstance(stream, StaticSpectrumStream):
@@ -856,12 +945,16 @@ class RGBSpatialProjection(RGBProjection):
             self.rect = model.TupleContinuous(full_rect, rect_range)
             self.mpp.subscribe(self._onMpp)
             self.rect.subscribe(self._onRect)
-            # initialize the projected tiles cache
-            self._projectedTilesCache = {}
-            # initialize the raw tiles cache
-            self._rawTilesCache = {}
+            # initialize the projected tiles cache: (x, y, z, generation) -> DataArray
+            # (The raw tiles are cached by the DataArrayShadow)
+            self._projectedTilesCache = util.LRUCache(self.TILES_CACHE_SIZE,
+                                                      sizeof=lambda t: t.nbytes)
+            # Incremented every time the projected tiles cache is invalidated
+            self._projectedTilesGen = 0
             # When True, the projected tiles cache should be invalidated
             self._projectedTilesInvalid = True
+            # Futures of the tiles read in advance
+            self._prefetchFutures = []
 
         self._shouldUpdateImage()
 
@@ -987,45 +1080,80 @@ class RGBSpatialProjection(RGBProjection):
             int(round(rect[1] / (-ps[1]) + img_shape[1] / 2)) - 1,
         )
 
-    def _getTile(self, x, y, z, prev_raw_cache, prev_proj_cache):
+    def _getTile(self, x, y, z, gen):
         """
         Get a tile from a DataArrayShadow. Uses cache.
-        The cache for projected tiles and the cache for raw tiles has always the same tiles
+        Can be called from any thread.
         x (int): X coordinate of the tile
         y (int): Y coordinate of the tile
         z (int): zoom level where the tile is
-        prev_raw_cache (dictionary): raw tiles cache from the
-            last execution of _updateImage
-        prev_proj_cache (dictionary): projected tiles cache from the
-            last execution of _updateImage
+        gen (int): generation of the projected tiles cache, to avoid caching
+          a tile projected with settings which have changed in the meantime
         return (DataArray, DataArray): raw tile and projected tile
         """
-        # the key of the tile on the cache
-        tile_key = "%d-%d-%d" % (x, y, z)
+        raw_tile = self.stream.raw[0].getTile(x, y, z)
 
-        # if the raw tile has been already cached, read it from the cache
-        if tile_key in prev_raw_cache:
-            raw_tile = prev_raw_cache[tile_key]
-        elif tile_key in self._rawTilesCache:
-            raw_tile = self._rawTilesCache[tile_key]
-        else:
-            # The tile was not cached, so it must be read from the file
-            raw_tile = self.stream.raw[0].getTile(x, y, z)
-
-        # if the projected tile has been already cached, read it from the cache
-        if tile_key in prev_proj_cache:
-            proj_tile = prev_proj_cache[tile_key]
-        elif tile_key in self._projectedTilesCache:
-            proj_tile = self._projectedTilesCache[tile_key]
-        else:
+        # the key of the tile on the cache
+        tile_key = (x, y, z, gen)
+        proj_tile = self._projectedTilesCache.get(tile_key)
+        if proj_tile is None:
             # The tile was not cached, so it must be projected again
             proj_tile = self._projectTile(raw_tile)
+            if gen == self._projectedTilesGen:
+                self._projectedTilesCache[tile_key] = proj_tile
 
-        # cache raw and projected tiles
-        self._rawTilesCache[tile_key] = raw_tile
-        self._projectedTilesCache[tile_key] = proj_tile
         return raw_tile, proj_tile
 
+    def _getTileRange(self, z):
+        """
+        z (int): zoom level
+        return (int, int): number of tiles in X and Y at the given zoom level
+        """
+        das = self.stream.raw[0]
+        dims = das.metadata.get(model.MD_DIMS, "CTZYX"[-das.ndim::])
+        img_shape = (das.shape[dims.index('X')], das.shape[dims.index('Y')])
+        return tuple(int(math.ceil(s / 2 ** z / ts)) for s, ts in zip(img_shape, das.tile_shape))
+
+    def _prefetchTile(self, x, y, z, gen):
+        """
+        Read and project a tile, so that it is in the cache when needed
+        """
+        try:
+            self._getTile(x, y, z, gen)
+        except Exception as ex:
+            logging.debug("Failed to prefetch tile %d,%d,%d: %s", x, y, z, ex)
+
+    def _prefetchTiles(self, x1, y1, x2, y2, z):
+        """
+        Read in advance the tiles around the given area, and the ones of the
+          next zoom level (more detailed), in the background.
+        x1, y1, x2, y2 (int): the tiles currently visible (inclusive)
+        z (int): the zoom level of the visible tiles
+        """
+        if not self.PREFETCH_TILES:
+            return
+
+        executor = _get_tile_executor()
+        gen = self._projectedTilesGen
+
+        # Neighbouring tiles at the same zoom level, as it's common to pan
+        tiles = []
+        nx, ny = self._getTileRange(z)
+        for x in range(max(0, x1 - 1), min(nx, x2 + 2)):
+            for y in range(max(0, y1 - 1), min(ny, y2 + 2)):
+                if not (x1 <= x <= x2 and y1 <= y <= y2):
+                    tiles.append((x, y, z))
+
+        # Same area at the next zoom level
+        if z > 0:
+            nx, ny = self._getTileRange(z - 1)
+            for x in range(max(0, 2 * x1), min(nx, 2 * x2 + 2)):
+                for y in range(max(0, 2 * y1), min(ny, 2 * y2 + 2)):
+                    tiles.append((x, y, z - 1))
+
+        self._prefetchFutures = [executor.submit(self._prefetchTile, x, y, z, gen)
+                                 for x, y, z in tiles]
+
     def _projectTile(self, tile):
         """
         Project the tile
@@ -1068,10 +1196,12 @@ class RGBSpatialProjection(RGBProjection):
             pass
 
         das = self.stream.raw[0]
+        executor = _get_tile_executor()
+
+        # The tiles to be displayed are more important than the ones read in advance
+        for f in self._prefetchFutures:
+            f.cancel()
 
-        # store the previous cache to use in this execution
-        prev_raw_cache = self._rawTilesCache
-        prev_proj_cache = self._projectedTilesCache
         # Execute at least once. If mpp and rect changed in
         # the last execution of the loops, execute again
         need_recompute = True
@@ -1082,28 +1212,29 @@ class RGBSpatialProjection(RGBProjection):
             rect = [l / (2 ** z) for l in rect]
             rect = [int(math.floor(l / das.tile_shape[0])) for l in rect]
             x1, y1, x2, y2 = rect
-            # the 4 lines below avoids that lots of old tiles
-            # stays in instance caches
-            prev_raw_cache.update(self._rawTilesCache)
-            prev_proj_cache.update(self._projectedTilesCache)
-            # empty current caches
-            self._rawTilesCache = {}
-            self._projectedTilesCache = {}
+
+            # the projected tiles cache is invalid
+            if self._projectedTilesInvalid:
+                self._projectedTilesInvalid = False
+                self._projectedTilesGen += 1
+                self._projectedTilesCache.clear()
+            gen = self._projectedTilesGen
+
+            # Read and project all the tiles in parallel
+            futures = [[executor.submit(self._getTile, x, y, z, gen) for y in range(y1, y2 + 1)]
+                       for x in range(x1, x2 + 1)]
 
             raw_tiles = []
             projected_tiles = []
             need_recompute = False
             try:
-                for x in range(x1, x2 + 1):
+                for ft_column in futures:
                     rt_column = []
                     pt_column = []
 
-                    for y in range(y1, y2 + 1):
+                    for f in ft_column:
                         # the projected tiles cache is invalid
                         if self._projectedTilesInvalid:
-                            self._projectedTilesCache = {}
-                            prev_proj_cache = {}
-                            self._projectedTilesInvalid = False
                             raise NeedRecomputeException()
 
                         # check if the image changed in the middle of the process
@@ -1113,8 +1244,7 @@ class RGBSpatialProjection(RGBProjection):
                             # but using the cache from the last execution
                             raise NeedRecomputeException()
 
-                        raw_tile, proj_tile = \
-                            self._getTile(x, y, z, prev_raw_cache, prev_proj_cache)
+                        raw_tile, proj_tile = f.result()
                         rt_column.append(raw_tile)
                         pt_column.append(proj_tile)
 
@@ -1124,6 +1254,11 @@ class RGBSpatialProjection(RGBProjection):
             except NeedRecomputeException:
                 # image changed
                 need_recompute = True
+                for ft_column in futures:
+                    for f in ft_column:
+                        f.cancel()
+
+        self._prefetchTiles(x1, y1, x2, y2, z)
 
         return tuple(raw_tiles), tuple(projected_tiles)
 
@@ -1184,6 +1319,22 @@ class RGBSpatialSpectrumProjection(RGBSpatialProjection):
     def _on_new_spec_data(self, _):
         self._shouldUpdateImage()
 
+    def _getBandAverages(self, calibrated, bands):
+        """
+        Computes the average intensity over the given bands
+        calibrated (DataArray of shape CTZYX): the calibrated data
+        bands (list of (int, int)): first and last (included) index of the channels
+          of each band
+        return (list of ndarrays of shape YX): the average for each band
+        """
+        cumsum = self.stream._getSpectrumIndex(calibrated)
+        if cumsum is not None:
+            return [(cumsum[b[1] + 1] - cumsum[b[0]]) / (b[1] - b[0] + 1) for b in bands]
+
+        # Index not (yet) available => compute from the whole cube
+        data = self.stream._getSpectrumCube(calibrated)
+        return [numpy.mean(data[b[0]:b[1] + 1], axis=0) for b in bands]
+
     def _on_selected_pixel(self, _):
         self._shouldUpdateImage()
 
@@ -1196,21 +1347,15 @@ class RGBSpatialSpectrumProjection(RGBSpatialProjection):
             raw_md = self.stream.calibrated.value.metadata
             md = {k: raw_md[k] for k in (model.MD_PIXEL_SIZE, model.MD_POS) if k in raw_md}
 
-            # Average time values if they exist.
-            if data.shape[1] > 1:
-                t = data.shape[1] - 1
-                data = numpy.mean(data[0:t], axis=1)
-                data = data[:, 0, :, :]
-            else:
-                data = data[:, 0, 0, :, :]
-
             # pick only the data inside the bandwidth
             spec_range = self.stream._get_bandwidth_in_pixel()
 
             logging.debug("Spectrum range picked: %s px", spec_range)
 
-            av_data = numpy.mean(data[spec_range[0]:spec_range[1] + 1], axis=0)
-            av_data = img.ensure2DImage(av_data).astype(data.dtype)
+            av_data, = self._getBandAverages(data, [spec_range])
+            # Same type as the spectrum cube (which is float if averaged over time)
+            dtype = data.dtype if data.shape[1] <= 1 else numpy.float64
+            av_data = img.ensure2DImage(av_data).astype(dtype)
             return model.DataArray(av_data, md)
 
         except Exception:
@@ -1275,14 +1420,6 @@ class RGBSpatialSpectrumProjection(RGBSpatialProjection):
             data = self.stream.calibrated.value
             raw_md = self.stream.calibrated.value.metadata
 
-            # Average time values if they exist.
-            if data.shape[1] > 1:
-                t = data.shape[1] - 1
-                data = numpy.mean(data[0:t], axis=1)
-                data = data[:, 0, :, :]
-            else:
-                data = data[:, 0, 0, :, :]
-
             # pick only the data inside the bandwidth
             spec_range = self.stream._get_bandwidth_in_pixel()
 
@@ -1292,7 +1429,7 @@ class RGBSpatialSpectrumProjection(RGBSpatialProjection):
 
             if not hasattr(self.stream, "fitToRGB") or not self.stream.fitToRGB.value:
                 # TODO: use better intermediary type if possible?, cf semcomedi
-                av_data = numpy.mean(data[spec_range[0]:spec_range[1] + 1], axis=0)
+                av_data, = self._getBandAverages(data, [spec_range])
                 av_data = img.ensure2DImage(av_data)
                 rgbim = img.DataArray2RGB(av_data, irange)
 
@@ -1313,17 +1450,11 @@ class RGBSpatialSpectrumProjection(RGBSpatialProjection):
                 grange[1] = max(grange)
                 rrange[1] = max(rrange)
 
-                # FIXME: unoptimized, as each channel is duplicated 3 times, and discarded
-                av_data = numpy.mean(data[rrange[0]:rrange[1] + 1], axis=0)
-                av_data = img.ensure2DImage(av_data)
-                rgbim = img.DataArray2RGB(av_data, irange)
-                av_data = numpy.mean(data[grange[0]:grange[1] + 1], axis=0)
-                av_data = img.ensure2DImage(av_data)
-                gim = img.DataArray2RGB(av_data, irange)
+                av_r, av_g, av_b = self._getBandAverages(data, [rrange, grange, brange])
+                rgbim = img.DataArray2RGB(img.ensure2DImage(av_r), irange)
+                gim = img.DataArray2RGB(img.ensure2DImage(av_g), irange)
                 rgbim[:, :, 1] = gim[:, :, 0]
-                av_data = numpy.mean(data[brange[0]:brange[1] + 1], axis=0)
-                av_data = img.ensure2DImage(av_data)
-                bim = img.DataArray2RGB(av_data, irange)
+                bim = img.DataArray2RGB(img.ensure2DImage(av_b), irange)
                 rgbim[:, :, 2] = bim[:, :, 0]
 
             rgbim.flags.writeable = False
@@ -1396,41 +1527,17 @@ class LineSpectrumProjection(RGBProjection):
         if l < 1:  # a line of just one pixel is considered not valid
             return None
 
-        # FIXME: if the data has a width of 1 (ie, just a line), and the
-        # requested width is an even number, the output is empty (because all
-        # the interpolated points are outside of the data.
-
-        # Coordinates of each point: ndim of data (5-2), pos on line (Y), spectrum (X)
         # The line is scanned from the end till the start so that the spectra
         # closest to the origin of the line are at the bottom.
-        coord = numpy.empty((3, width, n, spec2d.shape[0]))
-        coord[0] = numpy.arange(spec2d.shape[0])  # spectra = all
-        coord_spc = coord.swapaxes(2, 3)  # just a view to have (line) space as last dim
-        coord_spc[-1] = numpy.linspace(start[0], end[0], n)  # X axis
-        coord_spc[-2] = numpy.linspace(start[1], end[1], n)  # Y axis
-
-        # Spread over the width
-        # perpendicular unit vector
-        pv = (-v[1] / l, v[0] / l)
-        width_coord = numpy.empty((2, width))
-        spread = (width - 1) / 2
-        width_coord[-1] = numpy.linspace(pv[0] * -spread, pv[0] * spread, width)  # X axis
-        width_coord[-2] = numpy.linspace(pv[1] * -spread, pv[1] * spread, width)  # Y axis
-
-        coord_cw = coord[1:].swapaxes(0, 2).swapaxes(1, 3)  # view with coordinates and width as last dims
-        coord_cw += width_coord
-
-        # Interpolate the values based on the data
+        # The interpolation weights are cached, so moving the line back to a
+        # previous position, or changing the data, is fast.
+        sampling = spectrum.get_line_sampling(spec2d.shape, start, end, width)
+        spec1d, = spectrum.extract_samples(spec2d, [sampling])
         if width == 1:
-            # simple version for the most usual case
-            spec1d = ndimage.map_coordinates(spec2d, coord[:, 0, :, :], order=1)
-        else:
-            # FIXME: the mean should be dependent on how many pixels inside the
-            # original data were pick on each line. Currently if some pixels fall
-            # out of the original data, the outside pixels count as 0.
-            # force the intermediate values to float, as mean() still needs to run
-            spec1d_w = ndimage.map_coordinates(spec2d, coord, output=numpy.float, order=1)
-            spec1d = spec1d_w.mean(axis=0)
+            # Keep the same type as the data for the most usual case
+            if numpy.issubdtype(spec2d.dtype, numpy.integer):
+                spec1d = numpy.round(spec1d)
+            spec1d = spec1d.astype(spec2d.dtype)
         assert spec1d.shape == (n, spec2d.shape[0])
 
         # Use metadata to indicate spatial distance between pixel
@@ -1552,25 +1659,10 @@ class PixelTemporalSpectrumProjection(RGBProjection):
             data = numpy.swapaxes(data, 0, 1)
             return model.DataArray(data, md)
 
-        # There are various ways to do it with numpy. As typically the spectrum
-        # dimension is big, and the number of pixels to sum is small, it seems
-        # the easiest way is to just do some kind of "clever" mean. Using a
-        # masked array would also work, but that'd imply having a huge mask.
-        radius = width / 2
-        n = 0
-        # TODO: use same cleverness as mean() for dtype?
-        datasum = numpy.zeros((spec2d.shape[0], spec2d.shape[1]), dtype=numpy.float64)
-        # Scan the square around the point, and only pick the points in the circle
-        for px in range(max(0, int(x - radius)),
-                        min(int(x + radius) + 1, spec2d.shape[-1])):
-            for py in range(max(0, int(y - radius)),
-                            min(int(y + radius) + 1, spec2d.shape[-2])):
-                if math.hypot(x - px, y - py) <= radius:
-                    n += 1
-                    datasum += spec2d[:, :, py, px]
-
-        mean = datasum / n
-        mean = numpy.swapaxes(mean, 0, 1)
+        # Only the pixels in the circle are read, and averaged
+        sampling = spectrum.get_point_sampling(spec2d.shape, (x, y), width)
+        mean, = spectrum.extract_samples(spec2d, [sampling])
+        mean = numpy.swapaxes(mean[0], 0, 1)
         return model.DataArray(mean.astype(spec2d.dtype), md)
 
     def projectAsRaw(self):
@@ -1686,24 +1778,10 @@ class SinglePointSpectrumProjection(DataProjection):
             data = spec2d[:, y, x]
             return model.DataArray(data, md)
 
-        # There are various ways to do it with numpy. As typically the spectrum
-        # dimension is big, and the number of pixels to sum is small, it seems
-        # the easiest way is to just do some kind of "clever" mean. Using a
-        # masked array would also work, but that'd imply having a huge mask.
-        radius = width / 2
-        n = 0
-        # TODO: use same cleverness as mean() for dtype?
-        datasum = numpy.zeros(spec2d.shape[0], dtype=numpy.float64)
-        # Scan the square around the point, and only pick the points in the circle
-        for px in range(max(0, int(x - radius)),
-                        min(int(x + radius) + 1, spec2d.shape[-1])):
-            for py in range(max(0, int(y - radius)),
-                            min(int(y + radius) + 1, spec2d.shape[-2])):
-                if math.hypot(x - px, y - py) <= radius:
-                    n += 1
-                    datasum += spec2d[:, py, px]
-
-        mean = datasum / n
+        # Only the pixels in the circle are read, and averaged
+        sampling = spectrum.get_point_sampling(spec2d.shape, (x, y), width)
+        mean, = spectrum.extract_samples(spec2d, [sampling])
+        mean = mean[0]
 
         return model.DataArray(mean, md)
 
@@ -1773,24 +1851,10 @@ class SinglePointTemporalProjection(DataProjection):
             data = chrono2d[:, y, x]
             return model.DataArray(data, md)
 
-        # There are various ways to do it with numpy. As typically the spectrum
-        # dimension is big, and the number of pixels to sum is small, it seems
-        # the easiest way is to just do some kind of "clever" mean. Using a
-        # masked array would also work, but that'd imply having a huge mask.
-        radius = width / 2
-        n = 0
-        # TODO: use same cleverness as mean() for dtype?
-        datasum = numpy.zeros(chrono2d.shape[0], dtype=numpy.float64)
-        # Scan the square around the point, and only pick the points in the circle
-        for px in range(max(0, int(x - radius)),
-                        min(int(x + radius) + 1, chrono2d.shape[-1])):
-            for py in range(max(0, int(y - radius)),
-                            min(int(y + radius) + 1, chrono2d.shape[-2])):
-                if math.hypot(x - px, y - py) <= radius:
-                    n += 1
-                    datasum += chrono2d[:, py, px]
-
-        mean = datasum / n
+        # Only the pixels in the circle are read, and averaged
+        sampling = spectrum.get_point_sampling(chrono2d.shape, (x, y), width)
+        mean, = spectrum.extract_samples(chrono2d, [sampling])
+        mean = mean[0]
         return model.DataArray(mean.astype(chrono2d.dtype), md)
 
     def projectAsRaw(self):
@@ -47,6 +47,13 @@ try:
 except ImportError:
     arpolarimetry = None
 
+# Maximum memory used by the cumulative sum of a spectrum cube (in bytes). Above
+# it, the average of the bands is directly computed from the cube. The sum takes
+# 8 bytes per element for floating point data (ie, the calibrated data), and
+# 4 bytes for integer data of 16 bits or less. So, for instance, with 1000
+# channels, it's limited to about 350x350 px for calibrated data.
+MAX_SPECTRUM_INDEX_SIZE = 1e9
+
 
 class StaticStream(Stream):
     """
@@ -558,7 +565,9 @@ class StaticSpectrumStream(StaticStream):
 
         # TODO: need to handle DAS properly, in case it's tiled (in XY), to avoid
         # loading too much data in memory.
-        # Ensure the data is a DataArray, as we don't handle (yet) DAS
+        # Ensure the data is a DataArray, as we don't handle (yet) DAS. Note
+        # that some formats (eg, uncompressed HDF5) memory-map the file, so the
+        # data is only loaded when accessed, and can be reclaimed by the OS.
         if isinstance(image, model.DataArrayShadow):
             image = image.getData()
 
@@ -645,6 +654,12 @@ class StaticSpectrumStream(StaticStream):
 
         # the raw data after calibration
         self.calibrated = model.VigilantAttribute(image)
+        # None or (DataArray, None or ndarray): the calibrated data and the
+        # cumulative sum of its spectrum cube (see _getSpectrumIndex()), shared
+        # by all the projections. None is used while it's being computed, or if
+        # it's not possible to compute it.
+        self._spec_index = None
+        self._spec_index_lock = threading.Lock()
 
         if "acq_type" not in kwargs:
             if image.shape[0] > 1 and image.shape[1] > 1:
@@ -764,6 +779,88 @@ class StaticSpectrumStream(StaticStream):
         assert low_px <= high_px
         return low_px, high_px
 
+    @staticmethod
+    def _getSpectrumCube(data):
+        """
+        data (DataArray of shape CTZYX): the calibrated data
+        return (ndarray of shape CYX): the intensity of each wavelength, averaged over time
+        """
+        # Average time values if they exist.
+        if data.shape[1] > 1:
+            t = data.shape[1] - 1
+            data = numpy.mean(data[0:t], axis=1)
+            data = data[:, 0, :, :]
+        else:
+            data = data[:, 0, 0, :, :]
+        return data
+
+    def _getSpectrumIndex(self, calibrated):
+        """
+        Returns the cumulative sum along C of the spectrum cube of the calibrated
+        data, which allows to compute the average of any band in O(YX). It is
+        computed only once per calibrated data, in a separate thread, when first
+        requested.
+        calibrated (DataArray of shape CTZYX): the calibrated data
+        return (None or ndarray of shape C+1 YX): the cumulative sum, starting
+          with 0, or None if it's not (yet) available.
+        """
+        with self._spec_index_lock:
+            if self._spec_index is not None and self._spec_index[0] is calibrated:
+                return self._spec_index[1]
+            self._spec_index = (calibrated, None)
+
+        if calibrated.shape[0] <= 1:  # No spectrum => nothing to gain
+            return None
+        if numpy.issubdtype(calibrated.dtype, numpy.integer) and calibrated.shape[1] <= 1:
+            # Integers are summed as integers, to keep the precision. As long
+            # as it cannot overflow, 32 bits is sufficient.
+            dinfo = numpy.iinfo(calibrated.dtype)
+            if max(-dinfo.min, dinfo.max) * calibrated.shape[0] <= numpy.iinfo(numpy.int32).max:
+                dtype = numpy.int32
+            else:
+                dtype = numpy.int64
+        else:
+            dtype = numpy.float64
+        index_size = ((calibrated.shape[0] + 1) * calibrated.shape[-2] * calibrated.shape[-1] *
+                      numpy.dtype(dtype).itemsize)
+        if index_size > MAX_SPECTRUM_INDEX_SIZE:
+            logging.info("Spectrum cube too big (%s) to compute its cumulative sum", calibrated.shape)
+            return None
+
+        t = threading.Thread(target=self._computeSpectrumIndex, args=(calibrated, dtype),
+                             name="Spectrum index computation")
+        t.daemon = True
+        t.start()
+        return None
+
+    def _computeSpectrumIndex(self, calibrated, dtype):
+        """
+        Computes the cumulative sum of the spectrum cube, and stores it in
+        ._spec_index. If the calibrated data changes in the meantime, the
+        computation is stopped.
+        calibrated (DataArray of shape CTZYX)
+        dtype (numpy.dtype): the type of the cumulative sum
+        """
+        try:
+            tstart = time.time()
+            data = self._getSpectrumCube(calibrated)
+            cumsum = numpy.empty((data.shape[0] + 1,) + data.shape[1:], dtype=dtype)
+            cumsum[0] = 0
+            # Computed by blocks of lines, to not keep computing for old data
+            for y in range(0, data.shape[1], 16):
+                if self.calibrated.value is not calibrated:
+                    logging.debug("Stopping computation of the spectrum index, as the data changed")
+                    return
+                numpy.cumsum(data[:, y:y + 16], axis=0, dtype=dtype, out=cumsum[1:, y:y + 16])
+
+            with self._spec_index_lock:
+                if self._spec_index[0] is calibrated:
+                    self._spec_index = (calibrated, cumsum)
+            logging.debug("Computed spectrum index of shape %s in %g s",
+                          cumsum.shape, time.time() - tstart)
+        except Exception:
+            logging.exception("Failed to compute the spectrum index")
+
     # We don't have problems of rerunning this when the data is updated,
     # as the data is static.
     def _updateCalibratedData(self, bckg=None, coef=None):
@@ -44,6 +44,7 @@ from odemis.model import MD_POS, MD_DESCRIPTION, MD_PIXEL_SIZE, MD_ACQ_DATE, MD_
 from odemis.model import hasVA
 from odemis.util import units, executeAsyncTask, almost_equal, img
 import queue
+import tempfile
 import threading
 import time
 
@@ -75,6 +76,17 @@ EBEAM_DETECTORS = ("se-detector", "bs-detector", "cl-detector", "monochromator",
 GUI_BLUE = (47, 167, 212) # FG_COLOUR_EDIT - from src/odemis/gui/__init__.py
 GUI_ORANGE = (255, 163, 0) # FG_COLOUR_HIGHLIGHT - from src/odemis/gui/__init__.py
 
+# Size (in bytes) above which the data of an acquisition is stored in a
+# memory-mapped temporary file instead of the RAM. This allows very large
+# acquisitions (eg, spectrum or time-correlator maps) to not be limited by the
+# memory available. None to always keep the data in RAM.
+MEMMAP_DATA_SIZE = 2e9
+# Directory where the memory-mapped temporary files are created. It should be
+# on a disk big enough to contain the whole acquisition (and not on a tmpfs, which
+# is stored in RAM). None to use the default temporary directory (see
+# tempfile.gettempdir(), which can be changed with the TMPDIR environment variable).
+MEMMAP_DATA_DIR = None
+
 
 class MultipleDetectorStream(with_metaclass(ABCMeta, Stream)):
     """
@@ -626,6 +638,28 @@ class MultipleDetectorStream(with_metaclass(ABCMeta, Stream)):
 
         return center, pxs
 
+    def _allocateData(self, shape, dtype):
+        """
+        Allocate an array to store the data of the whole acquisition. The data
+        of each pixel is expected to be directly written into it, so that no
+        assembly (and copy) of the data is needed at the end of the acquisition.
+        If the array is big (see MEMMAP_DATA_SIZE), it is memory-mapped on a
+        temporary file (in MEMMAP_DATA_DIR), which is automatically deleted
+        when the array is not used anymore.
+        shape (tuple of 0<int): shape of the array
+        dtype (numpy.dtype): type of the data
+        return (numpy.ndarray): array full of zeros
+        """
+        nbytes = int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize
+        if MEMMAP_DATA_SIZE is not None and nbytes > MEMMAP_DATA_SIZE:
+            logging.debug("Storing the %s data of %d bytes in a temporary file", shape, nbytes)
+            with tempfile.TemporaryFile(dir=MEMMAP_DATA_DIR) as f:
+                # The file is extended with zeros, and stays available (until
+                # the array is deleted) even once it's closed.
+                return numpy.memmap(f, dtype=dtype, mode="w+", shape=shape)
+        else:
+            return numpy.zeros(shape, dtype=dtype)
+
     def _assemble2DData(self, rep, data_list):
         """
         Take all the data received from a 0D DataFlow and assemble it in a
@@ -658,7 +692,8 @@ class MultipleDetectorStream(with_metaclass(ABCMeta, Stream)):
                    MD_PIXEL_SIZE: pxs})
 
         # concatenate data into one big array of (number of pixels,1)
-        flat_list = [ar.flatten() for ar in data_list]
+        # Note: ravel() avoids copying the data twice (as it's typically already contiguous)
+        flat_list = [ar.ravel() for ar in data_list]
         main_data = numpy.concatenate(flat_list)
         logging.debug("Assembling %s points into %s shape", main_data.shape, rep)
         # reshape to (Y, X)
@@ -681,10 +716,10 @@ class MultipleDetectorStream(with_metaclass(ABCMeta, Stream)):
         # N = len(data_list)
         T, S = data_list[0].shape
         X, Y = rep
-        # copy into one big array N, Y, X
-        arr = numpy.array(data_list)
 
         if T == 1 and S == 1:
+            # copy into one big array N, Y, X
+            arr = numpy.array(data_list)
             # fast path: the data is already ordered just copy
             # reshape to get a 2D image
             # check if number of px scans (rep) is equal to number of images acquired (arr)
@@ -698,15 +733,11 @@ class MultipleDetectorStream(with_metaclass(ABCMeta, Stream)):
                 arr = numpy.mean(arr, 2).astype(data_list[0].dtype)
 
         else:
-            # need to reorder data by tiles
-            # change N to Y, X
-            arr.shape = (Y, X, T, S)
-            # change to Y, T, X, S by moving the "T" axis
-            arr = numpy.rollaxis(arr, 2, 1)
-            # and apply the change in memory (= 1 copy)
-            arr = numpy.ascontiguousarray(arr)
-            # reshape to apply the tiles
-            arr.shape = (Y * T, X * S)
+            # need to reorder data by tiles: copy each tile directly at its place
+            arr = self._allocateData((Y * T, X * S), data_list[0].dtype)
+            for i, d in enumerate(data_list):
+                y, x = divmod(i, X)
+                arr[y * T:(y + 1) * T, x * S:(x + 1) * S] = d
 
         # start with the metadata from the first point
         md = data_list[0].metadata.copy()
@@ -823,7 +854,7 @@ class MultipleDetectorStream(with_metaclass(ABCMeta, Stream)):
             md.update({MD_POS: center,
                        MD_PIXEL_SIZE: pxs,
                        MD_DESCRIPTION: self._streams[n].name.value})
-            da = model.DataArray(numpy.zeros(shape=rep[::-1] * numpy.array(tile_shape), dtype=raw_data.dtype), md)
+            da = model.DataArray(self._allocateData(tuple(rep[::-1] * numpy.array(tile_shape)), raw_data.dtype), md)
             self._live_data[n].append(da)
             self._acq_mask = numpy.zeros(shape=rep[::-1] * numpy.array(tile_shape), dtype=numpy.bool)
 
@@ -860,7 +891,7 @@ class MultipleDetectorStream(with_metaclass(ABCMeta, Stream)):
             md.update({MD_POS: center,
                        MD_PIXEL_SIZE: pxs,
                        MD_DESCRIPTION: self._streams[n].name.value})
-            da = model.DataArray(numpy.zeros(shape=rep[::-1], dtype=raw_data.dtype), md)
+            da = model.DataArray(self._allocateData(rep[::-1], raw_data.dtype), md)
             self._live_data[n].append(da)
             self._acq_mask = numpy.zeros(rep[::-1], dtype=numpy.bool)
 
@@ -890,8 +921,12 @@ class MultipleDetectorStream(with_metaclass(ABCMeta, Stream)):
                 md[model.MD_EXP_TIME] *= len(data)
             md[model.MD_INTEGRATION_COUNT] = md.get(model.MD_INTEGRATION_COUNT, 1) * len(data)
 
-            self._raw.append(model.DataArray(
-                                 numpy.mean(data, axis=0).astype(data[0].dtype), md))
+            # Average in place, in the first data (which is not used anymore for
+            # the live view), slice by slice to avoid copying all the data.
+            avg = data[0]
+            for i in range(avg.shape[0]):
+                avg[i] = numpy.mean([d[i] for d in data], axis=0)
+            self._raw.append(model.DataArray(avg, md))
         else:  # No data at all
             logging.warning("No final data for stream %s/%d", self.name.value, n)
 
@@ -963,8 +998,17 @@ class SEMCCDMDStream(MultipleDetectorStream):
     detector trigger, but it's very reliable.
     If the "integration time" requested is longer than the maximum exposure time of the detector,
     image integration will be performed.
+    Alternatively, if the e-beam scanner reports its new positions (.newPosition),
+    the acquisition can be done with a "continuous scan" (see .continuousScan):
+    the e-beam scans the ROI by blocks of pixels, while the CCD acquires one image
+    every time the e-beam moves to the next pixel.
     """
 
+    # Extra time (s) the e-beam stays on each pixel, on top of the CCD exposure
+    # and readout time, during a continuous scan. It leaves time to the CCD to
+    # be ready for the next trigger.
+    CONTINUOUS_SCAN_MARGIN = 5e-3
+
     def __init__(self, name, streams):
         """
         :param streams (list of Streams): In addition to the requirements of
@@ -1001,6 +1045,29 @@ class SEMCCDMDStream(MultipleDetectorStream):
         self._trigger = self._ccd.softwareTrigger
         self._ccd_idx = len(self._streams) - 1  # optical detector is always last in streams
 
+        # If True, the acquisition is done with a continuous scan: the CCD is
+        # synchronised on the new positions of the e-beam, and the e-beam scans
+        # a whole block of pixels at once. That avoids most of the overhead
+        # per pixel of the (default) software synchronisation, but relies on
+        # the CCD to acquire each image within the dwell time. The
+        # synchronisation is checked with the acquisition date of each image.
+        # Only available if the hardware supports it.
+        if (isinstance(getattr(self._emitter, "newPosition", None), model.EventBase) and
+            isinstance(getattr(self._det0, "softwareTrigger", None), model.EventBase)):
+            self.continuousScan = model.BooleanVA(False)
+        # queue.Queue of DataArray: the CCD images received during a continuous scan
+        self._ccd_frames = None
+
+        # None or dataio.hdf5.AcquisitionWriter: if set, the data of the CCD is
+        # written to the file as soon as it's acquired, instead of being kept in
+        # memory (only supported by the spectrum and temporal spectrum streams).
+        # In the data acquired, it's then a DataArrayShadow, which can only be
+        # read until the writer is closed. Each polarization is stored as a
+        # separate image. The writer is not closed by the stream.
+        self.dataWriter = None
+        # int -> int: polarization index -> index of the image in .dataWriter
+        self._writer_images = {}
+
     def _estimateRawAcquisitionTime(self):
         """
         :returns (float): Time in s for acquiring the whole image, without drift correction.
@@ -1022,7 +1089,11 @@ class SEMCCDMDStream(MultipleDetectorStream):
             else:
                 exp = self._sccd._getDetectorVA("exposureTime").value
 
-            dur_image = (exp + readout + 0.03) * 1.20
+            if self._canScanContinuously():
+                # No overhead per pixel, just a small one per block of pixels
+                dur_image = (exp + readout + self.CONTINUOUS_SCAN_MARGIN) * 1.05
+            else:
+                dur_image = (exp + readout + 0.03) * 1.20
             duration = numpy.prod(self.repetition.value) * dur_image
             # Add the setup time
             duration += self.SETUP_OVERHEAD
@@ -1102,9 +1173,9 @@ class SEMCCDMDStream(MultipleDetectorStream):
         if fuzzing:
             logging.info("Using fuzzing with tile shape = %s", tile_shape)
             # Handle fuzzing by scanning tile instead of spot
-            self._emitter.scale.value = scale
-            self._emitter.resolution.value = tile_shape  # grid scan
-            self._emitter.dwellTime.value = self._emitter.dwellTime.clip(dt)
+            self._emitter.setVAValues([("scale", scale),
+                                       ("resolution", tile_shape),  # grid scan
+                                       ("dwellTime", self._emitter.dwellTime.clip(dt))])
         else:
             # Set SEM to spot mode, without caring about actual position (set later)
             self._emitter.scale.value = (1, 1)  # min, to avoid limits on translation
@@ -1133,6 +1204,56 @@ class SEMCCDMDStream(MultipleDetectorStream):
 
         self._raw.append(da)
 
+    def _allocateCCDData(self, pol_idx, shape, dtype, md):
+        """
+        Allocate the storage of the CCD data of the whole acquisition, for one
+        polarization. If .dataWriter is set, it's a new image in the file,
+        otherwise an array (see _allocateData()).
+        The data of each pixel should be stored with _writeCCDData().
+        pol_idx (int): polarization index
+        shape (tuple of 5 0<int): shape of the data, as CTZYX
+        dtype (numpy.dtype): type of the data
+        md (dict str -> value): metadata of the data
+        return (DataArray or DataArrayShadow): the storage of the data
+        """
+        if self.dataWriter is None:
+            return model.DataArray(self._allocateData(shape, dtype), md)
+
+        if pol_idx == 0:  # New acquisition
+            self._writer_images = {}
+        # The data arrives pixel by pixel, line by line => a chunk is a part of
+        # a line, small enough to stay in the HDF5 chunk cache (1 MiB) until all
+        # its pixels are written.
+        px_size = shape[0] * shape[1] * numpy.dtype(dtype).itemsize
+        chunks = shape[:2] + (1, 1, max(1, min(shape[-1], 512 * 1024 // px_size)))
+        n = self.dataWriter.add_image(shape, dtype, md, chunks=chunks)
+        self._writer_images[pol_idx] = n
+        return self.dataWriter.get_image(n)
+
+    def _writeCCDData(self, pol_idx, px_idx, data):
+        """
+        Stores the data of one pixel, in the storage allocated by _allocateCCDData()
+        pol_idx (int): polarization index
+        px_idx (int, int): pixel index (Y, X)
+        data (ndarray of shape CT): the data of the pixel
+        """
+        if self.dataWriter is None:
+            self._live_data[self._ccd_idx][pol_idx][:, :, 0, px_idx[0], px_idx[1]] = data
+        else:
+            self.dataWriter.write(self._writer_images[pol_idx], data.reshape(data.shape + (1, 1, 1)),
+                                  (0, 0, 0) + tuple(px_idx))
+
+    def _assembleFinalData(self, n, data):
+        """
+        Same as MultipleDetectorStream._assembleFinalData(), but if the CCD data
+        is in .dataWriter, each polarization is kept as a separate image, as
+        it cannot be averaged in place.
+        """
+        if n == self._ccd_idx and data and isinstance(data[0], model.DataArrayShadow):
+            self._raw.extend(data)
+        else:
+            super(SEMCCDMDStream, self)._assembleFinalData(n, data)
+
     def _runAcquisition(self, future):
         """
         Acquires images from multiple detectors via software synchronisation.
@@ -1142,9 +1263,40 @@ class SEMCCDMDStream(MultipleDetectorStream):
         if hasattr(self, "useScanStage") and self.useScanStage.value:
             # TODO does not support polarimetry or image integration so far
             return self._runAcquisitionScanStage(future)
+        elif self._canScanContinuously():
+            return self._runAcquisitionContinuous(future)
         else:
             return self._runAcquisitionEbeam(future)
 
+    def _canScanContinuously(self):
+        """
+        :returns (bool): True if the acquisition should be done with a continuous
+          scan (ie, requested by the user, and compatible with the other settings).
+        """
+        if not (hasattr(self, "continuousScan") and self.continuousScan.value):
+            return False
+
+        # In these cases, the CCD doesn't acquire exactly one image per pixel
+        if hasattr(self, "fuzzing") and self.fuzzing.value:
+            logging.debug("Continuous scan not possible with fuzzing, will use a scan per pixel")
+            return False
+        if self._integrationTime and self._integrationCounts.value > 1:
+            logging.debug("Continuous scan not possible with image integration, will use a scan per pixel")
+            return False
+        return True
+
+    def _onData(self, n, df, data):
+        if n == self._ccd_idx and self._ccd_frames is not None:
+            # Continuous scan: every image is for a different pixel
+            if self._acq_min_date > data.metadata.get(model.MD_ACQ_DATE, 0):
+                logging.warning("Dropping CCD image because it started %g s too early",
+                                self._acq_min_date - data.metadata.get(model.MD_ACQ_DATE, 0))
+                return
+            self._ccd_frames.put(data)
+            return
+
+        super(SEMCCDMDStream, self)._onData(n, df, data)
+
     def _runAcquisitionEbeam(self, future):
         """
         Acquires images from the multiple detectors via software synchronisation.
@@ -1533,6 +1685,368 @@ class SEMCCDMDStream(MultipleDetectorStream):
             # no need to retry
             break
 
+    def _adjustHardwareSettingsContinuous(self):
+        """
+        Read the SEM and CCD stream settings and adapt the SEM scanner for a
+        continuous scan: the e-beam scans the pixels of the repetition, and stays
+        on each pixel long enough for the CCD to acquire a whole image.
+        :returns: img_time (float): Estimated time for a whole CCD image.
+                  px_time (float): Dwell time of the e-beam on each pixel.
+        """
+        img_time, _ = self._adjustHardwareSettings()
+
+        # Same as the SEMMDStream: one e-beam pixel per pixel of the repetition
+        rep = self.repetition.value
+        roi = self.roi.value
+        eshape = self._emitter.shape
+        scale = (((roi[2] - roi[0]) * eshape[0]) / rep[0],
+                 ((roi[3] - roi[1]) * eshape[1]) / rep[1])
+        cscale = self._emitter.scale.clip(scale)
+        if cscale != scale:
+            logging.warning("Emitter scale requested (%s) != accepted (%s)",
+                            cscale, scale)
+        self._emitter.scale.value = cscale
+
+        dt = img_time + self.CONTINUOUS_SCAN_MARGIN
+        self._emitter.dwellTime.value = self._emitter.dwellTime.clip(dt)
+        px_time = self._emitter.dwellTime.value
+        if px_time <= img_time:
+            raise ValueError("E-beam dwell time %g s is too short for CCD images of %g s" %
+                             (px_time, img_time))
+
+        return img_time, px_time
+
+    def _runAcquisitionContinuous(self, future):
+        """
+        Acquires images from the multiple detectors with a continuous scan.
+        The e-beam scans the ROI by blocks of pixels (one software trigger per
+        block). The CCD is synchronised on the new positions of the e-beam, so it
+        acquires one image per pixel, without having to restart the SEM detector
+        for every pixel. The synchronisation of the CCD images with the pixels
+        is checked based on their acquisition dates.
+        Warning: can be quite memory consuming if the grid is big
+        :param future: Current future running for the whole acquisition.
+        :returns (list of DataArray): All the data acquired.
+        :raises:
+          CancelledError() if cancelled
+          Exceptions if error
+        """
+        try:
+            self._acq_done.clear()
+            img_time, px_time = self._adjustHardwareSettingsContinuous()
+            spot_pos = self._getSpotPositions()
+            pos_flat = spot_pos.reshape((-1, 2))  # X/Y together (X iterates first)
+            rep = self.repetition.value  # (int, int): number of pixels in the ROI (X, Y)
+            npixels = int(numpy.prod(rep))
+            tot_num = npixels  # total number of images to acquire
+            sub_pxs = self._emitter.pixelSize.value
+
+            self._acq_data = [[] for _ in self._streams]  # just to be sure it's really empty
+            self._live_data = [[] for _ in self._streams]
+            self._raw = []
+            self._anchor_raw = []
+            self._current_scan_area = (0, 0, 0, 0)
+            logging.debug("Starting continuous scan acquisition of %s pixels (dt=%g s) with components %s",
+                          rep, px_time, ", ".join(s._detector.name for s in self._streams))
+
+            # if no polarimetry hardware present
+            pos_polarizations = [None]
+            time_move_pol_left = 0  # sec extra time needed to move HW
+            if self._analyzer:
+                if self._acquireAllPol.value:
+                    pos_polarizations = POL_POSITIONS
+                    tot_num *= len(pos_polarizations)
+                else:
+                    pos_polarizations = [self._polarization.value]
+                logging.debug("Will acquire the following polarization positions: %s", list(pos_polarizations))
+                time_move_pol_left = POL_MOVE_TIME * len(pos_polarizations)
+
+            leech_np, leech_time_ppx = self._startLeeches(img_time, tot_num,
+                                                          (len(pos_polarizations), rep[1], rep[0]))
+
+            # The CCD acquires an image every time the e-beam moves to a new
+            # pixel, and the e-beam scans a block of pixels at every trigger.
+            self._acq_min_date = time.time()
+            self._ccd_frames = queue.Queue()
+            self._ccd_df.synchronizedOn(self._emitter.newPosition)
+            self._ccd_df.subscribe(self._subscribers[self._ccd_idx])
+            self._df0.synchronizedOn(self._det0.softwareTrigger)
+            self._df0.subscribe(self._subscribers[0])
+
+            n = 0  # number of images acquired so far
+            for pol_idx, pol_pos in enumerate(pos_polarizations):
+                if pol_pos is not None:
+                    logging.debug("Acquiring with the polarization position %s", pol_pos)
+                    f = self._analyzer.moveAbs({"pol": pol_pos})
+                    f.result()
+                    time_move_pol_left -= POL_MOVE_TIME
+
+                # number of spots scanned so far (for this polarization)
+                spots_sum = 0
+                while spots_sum < npixels:
+                    # Acquire the maximum amount of pixels until next leech
+                    npixels2scan = min([np for np in leech_np if np is not None] +
+                                       [npixels - spots_sum, int(self._live_update_period // px_time) + 1])
+                    # Only scan rectangular blocks of pixels which start at the beginning of a row
+                    n_y, n_x = leech.get_next_rectangle((rep[1], rep[0]), spots_sum, npixels2scan)
+                    npixels2scan = n_x * n_y
+
+                    px_idx = (spots_sum // rep[0], spots_sum % rep[0])  # current pixel index
+                    self._current_scan_area = (px_idx[1],
+                                               px_idx[0],
+                                               px_idx[1] + n_x - 1,
+                                               px_idx[0] + n_y - 1)
+
+                    start = time.time()
+                    sem_data, ccd_data = self._acquireBlockContinuous(
+                        pos_flat[spots_sum:(spots_sum + npixels2scan)], (n_x, n_y),
+                        img_time, px_time)
+
+                    self._assembleBlockContinuous(sem_data, ccd_data, px_idx, rep, pol_idx, sub_pxs)
+                    spots_sum += npixels2scan
+                    n += npixels2scan
+
+                    # Live update the setting stream with the new data
+                    try:
+                        self._sccd._onNewData(self._ccd_df, ccd_data[-1])
+                    except Exception:
+                        logging.exception("Failed to update CCD live view")
+                    self._shouldUpdateImage()
+                    logging.debug("Done acquiring image number %s out of %s.", n, tot_num)
+
+                    if self._acq_state == CANCELLED:
+                        raise CancelledError()
+
+                    leech_time_left = (tot_num - n) * leech_time_ppx
+                    self._updateProgress(future, time.time() - start, n, tot_num,
+                                         leech_time_left + time_move_pol_left)
+
+                    # Check if it's time to run a leech
+                    self._acq_data = [[sem_data], [ccd_data[-1]]]
+                    for li, l in enumerate(self.leeches):
+                        if leech_np[li] is None:
+                            continue
+                        leech_np[li] -= npixels2scan
+                        if leech_np[li] < 0:
+                            logging.error("Acquired too many pixels, and skipped leech %s", l)
+                            leech_np[li] = 0
+                        if leech_np[li] == 0:
+                            try:
+                                np = l.next([d[-1] for d in self._acq_data])
+                            except Exception:
+                                logging.exception("Leech %s failed, will retry next pixel", l)
+                                np = 1  # try again next pixel
+                            leech_np[li] = np
+                            if self._acq_state == CANCELLED:
+                                raise CancelledError()
+
+                    self._acq_data = [[] for _ in self._streams]  # delete acq_data to use less RAM
+
+            # acquisition done!
+            self._stopContinuousScan()
+
+            with self._acq_lock:
+                if self._acq_state == CANCELLED:
+                    raise CancelledError()
+                self._acq_state = FINISHED
+            self._current_scan_area = None  # Indicate we are done for the live update
+
+            # Process all the (intermediary) ._live_data to the right shape/format for the final ._raw
+            for stream_idx, das in enumerate(self._live_data):
+                self._assembleFinalData(stream_idx, das)
+
+            self._stopLeeches()
+
+            if self._dc_estimator:
+                self._anchor_raw.append(self._assembleAnchorData(self._dc_estimator.raw))
+
+        except Exception as exp:
+            if not isinstance(exp, CancelledError):
+                logging.exception("Continuous scan acquisition of multiple detectors failed")
+
+            # make sure it's all stopped
+            self._stopContinuousScan()
+
+            self._raw = []
+            self._anchor_raw = []
+            if not isinstance(exp, CancelledError) and self._acq_state == CANCELLED:
+                logging.warning("Converting exception to cancellation")
+                raise CancelledError()
+            raise
+        else:
+            return self.raw
+        finally:
+            self._current_scan_area = None  # Indicate we are done for the live (also in case of error)
+            for s in self._streams:
+                s._unlinkHwVAs()
+            self._dc_estimator = None
+            self._current_future = None
+            self._ccd_frames = None
+            self._acq_data = [[] for _ in self._streams]  # regain a bit of memory
+
+            self._acq_done.set()
+            # Only after this flag, as it's used by the im_thread too
+            self._live_data = [[] for _ in self._streams]
+            self._streams[0].raw = []
+            self._streams[0].image.value = None
+
+    def _stopContinuousScan(self):
+        """
+        Stop the SEM and CCD dataflows of a continuous scan
+        """
+        for s, sub in zip(self._streams, self._subscribers):
+            s._dataflow.unsubscribe(sub)
+        self._ccd_df.synchronizedOn(None)
+        self._df0.synchronizedOn(None)
+
+    def _acquireBlockContinuous(self, pos, res, img_time, px_time):
+        """
+        Scans a block of pixels with the e-beam, and acquire one CCD image per pixel.
+        In case the CCD images do not match the pixels, the block is acquired again.
+        :param pos (ndarray of shape (N, 2)): The e-beam positions of each pixel
+          of the block (X iterates first), in the emitter translation coordinates.
+        :param res (int, int): The number of pixels in X, Y of the block.
+        :param img_time (0<float): Expected time spend for one CCD image.
+        :param px_time (0<float): Dwell time of the e-beam on each pixel.
+        :returns:
+            sem_data (DataArray): The SEM image of the block.
+            ccd_data (list of DataArray): The CCD images, one per pixel.
+        :raises:
+            CancelledError: if the acquisition was cancelled
+            IOError: if the acquisition repeatedly fails to synchronise
+        """
+        npixels = res[0] * res[1]
+        self._emitter.resolution.value = res
+        em_res = self._emitter.resolution.value
+        if em_res != res:
+            raise ValueError("Failed to configure emitter resolution to %s, got %s" %
+                             (res, em_res))
+
+        # Move the beam to the center of the block
+        trans = tuple(pos.mean(axis=0))
+        if self._dc_estimator:
+            trans = (trans[0] - self._dc_estimator.tot_drift[0],
+                     trans[1] - self._dc_estimator.tot_drift[1])
+        cptrans = self._emitter.translation.clip(trans)
+        if cptrans != trans:
+            if self._dc_estimator:
+                logging.error("Drift of %s px caused acquisition region out "
+                              "of bounds: needed to scan spot at %s.",
+                              self._dc_estimator.tot_drift, trans)
+            else:
+                logging.error("Unexpected clipping in the scan spot position %s", trans)
+        self._emitter.translation.value = cptrans
+
+        failures = 0  # keeps track of acquisition failures
+        while True:  # Done only once normally, excepted in case of failures
+            if self._acq_state == CANCELLED:
+                raise CancelledError()
+
+            self._acq_data[0] = []
+            self._acq_complete[0].clear()
+            start = time.time()
+            self._acq_min_date = start
+            self._det0.softwareTrigger.notify()
+
+            # Wait for all the CCD images, and the SEM image
+            max_end_t = start + npixels * px_time * 1.5 + 5
+            ccd_data = []
+            while len(ccd_data) < npixels and time.time() < max_end_t:
+                if self._acq_state == CANCELLED:
+                    raise CancelledError()
+                try:
+                    ccd_data.append(self._ccd_frames.get(timeout=0.1))
+                except queue.Empty:
+                    pass
+            sem_received = self._acq_complete[0].wait(max(0.1, max_end_t - time.time()))
+            if self._acq_state == CANCELLED:
+                raise CancelledError()
+
+            if not sem_received:
+                error = "no SEM data received after %g s" % (time.time() - start,)
+            elif len(ccd_data) < npixels:
+                error = "only %d CCD images received out of %d" % (len(ccd_data), npixels)
+            else:
+                error = self._checkContinuousSync(ccd_data, img_time, px_time)
+
+            if error is None:
+                return self._acq_data[0][-1], ccd_data
+
+            failures += 1
+            if failures >= 3:
+                raise IOError("Continuous scan acquisition repeatedly fails to synchronize: %s" % (error,))
+
+            logging.warning("Continuous scan of block at %s failed (%s), will try again",
+                            cptrans, error)
+            # Restart all the acquisition, hoping this time we will synchronize properly
+            self._stopContinuousScan()
+            time.sleep(1)
+            self._ccd_frames = queue.Queue()  # Drop any late image
+            self._ccd_df.synchronizedOn(self._emitter.newPosition)
+            self._ccd_df.subscribe(self._subscribers[self._ccd_idx])
+            self._df0.synchronizedOn(self._det0.softwareTrigger)
+            self._df0.subscribe(self._subscribers[0])
+
+    def _checkContinuousSync(self, ccd_data, img_time, px_time):
+        """
+        Checks that each CCD image was acquired while the e-beam was on its pixel,
+        based on the acquisition dates of the images.
+        :param ccd_data (list of DataArray): The CCD images, one per pixel.
+        :param img_time (0<float): Expected time spend for one CCD image.
+        :param px_time (0<float): Dwell time of the e-beam on each pixel.
+        :returns (str or None): Description of the issue, or None if the images
+          are synchronised.
+        """
+        dates = numpy.array([d.metadata.get(MD_ACQ_DATE, 0) for d in ccd_data])
+        # Difference with the beginning of each pixel, relative to the first pixel
+        late = dates - dates[0] - numpy.arange(len(dates)) * px_time
+        # Each image should start before the end of its pixel minus the image
+        # time. Allow a bit of jitter, but never half a pixel, as it'd be the
+        # sign that an image is missing or was acquired twice.
+        max_late = min(px_time / 2, px_time - img_time + self.CONTINUOUS_SCAN_MARGIN)
+        worst = numpy.argmax(numpy.abs(late))
+        if abs(late[worst]) > max_late:
+            return ("CCD image %d started %g s away from its pixel (max %g s)" %
+                    (worst, late[worst], max_late))
+        logging.debug("CCD images synchronised with the e-beam with max delay %g s", late[worst])
+        return None
+
+    def _assembleBlockContinuous(self, sem_data, ccd_data, px_idx, rep, pol_idx, sub_pxs):
+        """
+        Stores the data of a block acquired with a continuous scan into the ._live_data,
+        as if each pixel had been acquired separately.
+        :param sem_data (DataArray): The SEM image of the block.
+        :param ccd_data (list of DataArray): The CCD images, one per pixel.
+        :param px_idx (int, int): The index (Y, X) of the first pixel of the block.
+        :param rep (int, int): The repetition (X, Y) of the whole acquisition.
+        :param pol_idx (int): The polarization index.
+        :param sub_pxs (float, float): The e-beam pixel size (at scale 1), to
+          convert the drift into a distance.
+        """
+        n_y, n_x = sem_data.shape[-2:]
+        # MD_POS of the SEM image is the center of the block
+        center = sem_data.metadata[MD_POS]
+        pxs = self._getPixelSize()
+        drift_shift = self._dc_estimator.tot_drift if self._dc_estimator else (0, 0)
+        for i, d in enumerate(ccd_data):
+            y, x = divmod(i, n_x)
+            idx = (px_idx[0] + y, px_idx[1] + x)
+            pos = (center[0] + (x - (n_x - 1) / 2) * pxs[0],
+                   center[1] - (y - (n_y - 1) / 2) * pxs[1])  # Y is upside down
+            md = sem_data.metadata.copy()
+            md[MD_POS] = pos
+            sem_px = model.DataArray(sem_data[..., y:y + 1, x:x + 1], md)
+
+            # MD_POS needs to be the position of the e-beam (without the shift
+            # for drift correction)
+            d.metadata[MD_POS] = (pos[0] + drift_shift[0] * sub_pxs[0],
+                                  pos[1] - drift_shift[1] * sub_pxs[1])
+            d = self._preprocessData(self._ccd_idx, d, idx)
+            ccd_data[i] = d
+
+            self._assembleLiveData(0, sem_px, idx, rep, pol_idx)
+            self._assembleLiveData(self._ccd_idx, d, idx, rep, pol_idx)
+
     def _adjustHardwareSettingsScanStage(self):
         """
         Read the SEM and CCD stream settings and adapt the SEM scanner
@@ -2160,17 +2674,19 @@ class SEMSpectrumMDStream(SEMCCDMDStream):
             # Compute metadata based on SEM metadata
             semmd = self._live_data[0][pol_idx].metadata
             # handle sub-pixels (aka fuzzing)
-            md[MD_PIXEL_SIZE] = (semmd[MD_PIXEL_SIZE][0] * self._emitter.resolution.value[0],
-                                 semmd[MD_PIXEL_SIZE][1] * self._emitter.resolution.value[1])
+            semshape = self._live_data[0][pol_idx].shape
+            tile_shape = (semshape[-1] // rep[0], semshape[-2] // rep[1])
+            md[MD_PIXEL_SIZE] = (semmd[MD_PIXEL_SIZE][0] * tile_shape[0],
+                                 semmd[MD_PIXEL_SIZE][1] * tile_shape[1])
             md[MD_POS] = self._live_data[0][pol_idx].metadata[MD_POS]
             md[MD_DIMS] = "CTZYX"
             md[MD_DESCRIPTION] = self._streams[n].name.value
 
             # Shape of spectrum data = C11YX
-            da = numpy.zeros(shape=(spec_shape[1], 1, 1, rep[1], rep[0]), dtype=raw_data.dtype)
-            self._live_data[n].append(model.DataArray(da, md))
+            da = self._allocateCCDData(pol_idx, (spec_shape[1], 1, 1, rep[1], rep[0]), raw_data.dtype, md)
+            self._live_data[n].append(da)
 
-        self._live_data[n][pol_idx][:, 0, 0, px_idx[0], px_idx[1]] = raw_data.reshape(spec_shape[1])
+        self._writeCCDData(pol_idx, px_idx, raw_data.reshape(spec_shape[1], 1))
 
 
 class SEMTemporalMDStream(MultipleDetectorStream):
@@ -2252,7 +2768,8 @@ class SEMTemporalMDStream(MultipleDetectorStream):
 
         n = 0
         se_data = []
-        tc_data = []
+        tc_data = None  # DataArray of shape CTZYX, allocated when receiving the first data
+        rep = self.repetition.value
         spot_pos = self._getSpotPositions()
 
         # Dwell times can be modified to account for drift correction, save original values to
@@ -2262,7 +2779,7 @@ class SEMTemporalMDStream(MultipleDetectorStream):
         try:
             img_time, ninteg = self._adjustHardwareSettings()
 
-            for px_idx in numpy.ndindex(*self.repetition.value[::-1]):
+            for px_idx in numpy.ndindex(*rep[::-1]):
                 x, y = tuple(spot_pos[px_idx])
                 se_px_data = []
                 tc_px_data = []
@@ -2290,7 +2807,7 @@ class SEMTemporalMDStream(MultipleDetectorStream):
                         tot_dc_vect[0] += dc_vect[0]
                         tot_dc_vect[1] += dc_vect[1]
                 n += 1
-                logging.info("Acquired %d out of %d pixels", n, numpy.prod(self.repetition.value))
+                logging.info("Acquired %d out of %d pixels", n, numpy.prod(rep))
 
                 # TODO: use _integrateImages(), once the function is per image
 
@@ -2304,8 +2821,14 @@ class SEMTemporalMDStream(MultipleDetectorStream):
                     tc_md[model.MD_DWELL_TIME] *= ninteg
                 except KeyError:
                     logging.warning("No dwell time metadata in time-correlator data")
-                pxsum = model.DataArray(pxsum.astype(dtype), tc_md)
-                tc_data.append(pxsum)
+                tc_px = model.DataArray(pxsum.astype(dtype), tc_md)
+                # The time-correlator data is of shape 1, T (XT). Copy it
+                # directly into the final data, to avoid keeping all the pixels
+                # separately (which would double the memory usage).
+                if tc_data is None:
+                    tc_data = model.DataArray(self._allocateData((1, tc_px.shape[-1], 1, rep[1], rep[0]), dtype),
+                                              tc_md)
+                tc_data[0, :, 0, px_idx[0], px_idx[1]] = tc_px.reshape(-1)
 
                 pxsum = numpy.sum(se_px_data, 0)
                 pxsum = numpy.minimum(pxsum, idt.max * numpy.ones(pxsum.shape))
@@ -2318,7 +2841,7 @@ class SEMTemporalMDStream(MultipleDetectorStream):
                 se_data.append(s)
 
                 # Live update the setting stream with the new data
-                self._tc_stream._onNewData(self._tc_stream._dataflow, tc_data[-1])
+                self._tc_stream._onNewData(self._tc_stream._dataflow, tc_px)
 
             self._onCompletedData(0, se_data)
             self._onCompletedData(1, tc_data)
@@ -2376,20 +2899,17 @@ class SEMTemporalMDStream(MultipleDetectorStream):
                 s._dataflow.unsubscribe(sub)
 
     def _onCompletedData(self, n, raw_das):
+        """
+        n (0<=int): the detector/stream index
+        raw_das (list of DataArray or DataArray): for the SEM, the data as
+          received from the detector. For the time-correlator, the data of all
+          the pixels, already assembled, of shape CTZYX.
+        """
         if n != 1:  # It's SEM data => no special way to treat it
             return super(SEMTemporalMDStream, self)._onCompletedData(n, raw_das)
 
-        md = raw_das[0].metadata.copy()
-
-        # The time-correlator data is of shape 1, 65535 (XT). So the first
-        # dimension can always be discarded and the second dimension is T.
-        # All the data is scanned in Y(slow)/X(fast) order.
-        # This will not work anymore if we include fuzzing.
-        rep = self.repetition.value
-        das = numpy.array(raw_das)
-        shape = das.shape  # N1T = rep[1] * rep[0], 1, detector.resolution[0]
-        das.shape = (1, 1, rep[1], rep[0], shape[-1])  # Add CZ == 11 + separate YX
-        das = numpy.rollaxis(das, 4, 1)  # Move T: CZYXT -> CTZYX
+        das = raw_das
+        md = das.metadata.copy()
         md[MD_DIMS] = "CTZYX"
 
         # Compute metadata based on SEM metadata
@@ -2447,19 +2967,21 @@ class SEMTemporalSpectrumMDStream(SEMCCDMDStream):
             # Compute metadata based on SEM metadata
             semmd = self._live_data[0][pol_idx].metadata
             # handle sub-pixels (aka fuzzing)
-            md[MD_PIXEL_SIZE] = (semmd[MD_PIXEL_SIZE][0] * self._emitter.resolution.value[0],
-                                 semmd[MD_PIXEL_SIZE][1] * self._emitter.resolution.value[1])
+            semshape = self._live_data[0][pol_idx].shape
+            tile_shape = (semshape[-1] // rep[0], semshape[-2] // rep[1])
+            md[MD_PIXEL_SIZE] = (semmd[MD_PIXEL_SIZE][0] * tile_shape[0],
+                                 semmd[MD_PIXEL_SIZE][1] * tile_shape[1])
             md[MD_POS] = self._live_data[0][pol_idx].metadata[MD_POS]
             md[MD_DIMS] = "CTZYX"
             md[MD_DESCRIPTION] = self._streams[n].name.value
 
             # Shape of spectrum data = CT1YX
-            da = numpy.zeros(shape=(spec_res, temp_res, 1, rep[1], rep[0]), dtype=raw_data.dtype)
-            self._live_data[n].append(model.DataArray(da, md))
+            da = self._allocateCCDData(pol_idx, (spec_res, temp_res, 1, rep[1], rep[0]), raw_data.dtype, md)
+            self._live_data[n].append(da)
 
         # Detector image has a shape of (time, lambda)
         raw_data = raw_data.T  # transpose to (lambda, time)
-        self._live_data[n][pol_idx][:, :, 0, px_idx[0], px_idx[1]] = raw_data.reshape(spec_res, temp_res)
+        self._writeCCDData(pol_idx, px_idx, raw_data.reshape(spec_res, temp_res))
 
 
 class SEMARMDStream(SEMCCDMDStream):
@@ -2467,7 +2989,17 @@ class SEMARMDStream(SEMCCDMDStream):
     Multiple detector Stream made of SEM + AR.
     It handles acquisition, but not rendering (so .image always returns an empty
     image).
+    The AR data is passed as one DataArray per e-beam position (and polarization),
+    as each of them has its own metadata (eg, MD_POS). However, they are all
+    views of a single array, allocated at the beginning of each polarization, so
+    that big acquisitions can be stored on disk (see MEMMAP_DATA_SIZE).
     """
+    def __init__(self, name, streams):
+        super(SEMARMDStream, self).__init__(name, streams)
+        # Array of shape Y, X, AR image shape, containing the AR data of the
+        # current polarization
+        self._ar_data = None
+
     def _assembleLiveData(self, n, raw_data, px_idx, rep, pol_idx):
         """
         :param n: (int) number of the current stream
@@ -2481,8 +3013,15 @@ class SEMARMDStream(SEMCCDMDStream):
         if n != self._ccd_idx:
             return super(SEMARMDStream, self)._assembleLiveData(n, raw_data, px_idx, rep, pol_idx)
 
-        raw_data.metadata[MD_DESCRIPTION] = self._streams[n].name.value
-        self._live_data[n].append(raw_data)
+        md = raw_data.metadata.copy()
+        md[MD_DESCRIPTION] = self._streams[n].name.value
+
+        # The pixels are always scanned starting from the top-left one
+        px_idx = tuple(px_idx)
+        if px_idx == (0, 0) or self._ar_data is None:
+            self._ar_data = self._allocateData(tuple(rep[::-1]) + raw_data.shape, raw_data.dtype)
+        self._ar_data[px_idx] = raw_data
+        self._live_data[n].append(model.DataArray(self._ar_data[px_idx], md))
 
     def _assembleFinalData(self, n, data):
         """
@@ -2495,6 +3034,7 @@ class SEMARMDStream(SEMCCDMDStream):
 
         # Add all the DataArrays of the AR independently
         self._raw.extend(data)
+        self._ar_data = None  # The data is now only referenced by the DataArrays
 
 # TODO: ideally it should inherit from FluoStream
 class ScannedFluoMDStream(MultipleDetectorStream):
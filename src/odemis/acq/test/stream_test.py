@@ -30,7 +30,7 @@ from odemis import model
 import odemis
 from odemis.acq import stream, calibration, path, leech
 from odemis.acq.leech import ProbeCurrentAcquirer
-from odemis.acq.stream import POL_POSITIONS, POL_POSITIONS_RESULTS
+from odemis.acq.stream import POL_POSITIONS, POL_POSITIONS_RESULTS, _sync
 from odemis.acq.stream import RGBSpatialSpectrumProjection, \
     SinglePointSpectrumProjection, SinglePointTemporalProjection, \
     LineSpectrumProjection, MeanSpectrumProjection
@@ -42,6 +42,8 @@ from odemis.util import test, conversion, img, spectrum, find_closest
 from odemis.util.test import assert_array_not_equal
 import os
 from past.builtins import long
+import shutil
+import tempfile
 import threading
 import time
 import unittest
@@ -59,6 +61,7 @@ SPARC2_CONFIG = CONFIG_PATH + "sim/sparc2-sim-scanner.odm.yaml"
 SPARC2POL_CONFIG = CONFIG_PATH + "sim/sparc2-polarizer-sim.odm.yaml"
 SPARC2STREAK_CONFIG = CONFIG_PATH + "sim/sparc2-streakcam-sim.odm.yaml"
 TIME_CORRELATOR_CONFIG = CONFIG_PATH + "sim/sparc2-time-correlator-sim.odm.yaml"
+SPARC2SIMSEM_CONFIG = CONFIG_PATH + "sim/sparc2-focus-test.odm.yaml"
 
 RGBCAM_CLASS = simcam.Camera
 RGBCAM_KWARGS = dict(name="camera", role="overview", image="simcam-fake-overview.h5")
@@ -1004,6 +1007,43 @@ class SPARCTestCase(unittest.TestCase):
         self.assertTrue(self.done)
         self.assertTrue(not f.cancelled())
 
+    def test_acq_ar_memmap(self):
+        """
+        Test AR acquisition with the data stored in a temporary file
+        """
+        sems = stream.SEMStream("test sem", self.sed, self.sed.data, self.ebeam)
+        ars = stream.ARSettingsStream("test ar", self.ccd, self.ccd.data, self.ebeam,
+                                      detvas={"exposureTime"})
+        sas = stream.SEMARMDStream("test sem-ar", [sems, ars])
+
+        ars.roi.value = (0.1, 0.1, 0.8, 0.8)
+        self.ccd.binning.value = (4, 4)
+        ars.detExposureTime.value = 0.02  # s
+        ars.repetition.value = (3, 2)
+        num_ar = numpy.prod(ars.repetition.value)
+
+        prev_size, prev_dir = _sync.MEMMAP_DATA_SIZE, _sync.MEMMAP_DATA_DIR
+        _sync.MEMMAP_DATA_SIZE = 0  # Any data goes to a temporary file
+        _sync.MEMMAP_DATA_DIR = tempfile.mkdtemp()
+        try:
+            timeout = 1 + 1.5 * sas.estimateAcquisitionTime()
+            f = sas.acquire()
+            data = f.result(timeout)
+        finally:
+            shutil.rmtree(_sync.MEMMAP_DATA_DIR)
+            _sync.MEMMAP_DATA_SIZE, _sync.MEMMAP_DATA_DIR = prev_size, prev_dir
+
+        self.assertEqual(len(data), num_ar + 1)
+        ar_das = data[1:]
+        # Each AR image has its own metadata, but they are all stored in the file
+        self.assertEqual(len(set(d.metadata[model.MD_POS] for d in ar_das)), num_ar)
+        for d in ar_das:
+            self.assertEqual(d.shape, ar_das[0].shape)
+            base = d
+            while base is not None and not isinstance(base, numpy.memmap):
+                base = base.base
+            self.assertIsNotNone(base)
+
 #     @skip("simple")
     def test_sync_future_cancel(self):
         self.image = None
@@ -1228,6 +1268,46 @@ class SPARCTestCase(unittest.TestCase):
         sp_dims = spec_md.get(model.MD_DIMS, "CTZYX"[-sp_da.ndim::])
         self.assertEqual(sp_dims, "CTZYX")
 
+    def test_acq_spec_writer(self):
+        """
+        Test Spectrometer acquisition with the data directly written to a file
+        """
+        sems = stream.SEMStream("test sem", self.sed, self.sed.data, self.ebeam)
+        specs = stream.SpectrumSettingsStream("test spec", self.spec, self.spec.data, self.ebeam,
+                                              detvas={"exposureTime"})
+        sps = stream.SEMSpectrumMDStream("test sem-spec", [sems, specs])
+
+        specs.roi.value = (0.15, 0.6, 0.8, 0.8)
+        specs.detExposureTime.value = 0.01  # s
+        specs.repetition.value = (5, 6)
+        exp_pos, exp_pxs, exp_res = self._roiToPhys(specs)
+
+        tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(tmpdir, "spec.h5")
+        try:
+            with hdf5.AcquisitionWriter(filename) as writer:
+                sps.dataWriter = writer
+                timeout = 1 + 2.5 * sps.estimateAcquisitionTime()
+                data = sps.acquire().result(timeout)
+
+                self.assertEqual(len(data), 2)
+                sem_da, sp_da = data
+                self.assertEqual(sem_da.shape, exp_res[::-1])
+                # The spectrum data is in the file, and not in memory
+                self.assertIsInstance(sp_da, model.DataArrayShadow)
+                self.assertEqual(sp_da.shape[1:], (1, 1) + tuple(exp_res[::-1]))
+                self.assertGreater(sp_da.shape[0], 1)
+                numpy.testing.assert_allclose(sp_da.metadata[model.MD_POS], exp_pos)
+                numpy.testing.assert_allclose(sp_da.metadata[model.MD_PIXEL_SIZE], exp_pxs)
+                spec = sp_da.getData()
+                self.assertTrue(numpy.any(spec))
+
+            rdata = hdf5.read_data(filename)
+            self.assertEqual(len(rdata), 1)
+            numpy.testing.assert_array_equal(rdata[0], spec)
+        finally:
+            shutil.rmtree(tmpdir)
+
 #     @skip("simple")
     def test_acq_fuz(self):
         """
@@ -2123,6 +2203,44 @@ class SPARC2TestCase(unittest.TestCase):
         pcmd = spec_md[model.MD_EBEAM_CURRENT_TIME]
         self.assertGreater(len(pcmd), 5 * 6 / 2)
 
+    def test_acq_spec_memmap(self):
+        """
+        Test Spectrometer acquisition with the data stored in a temporary file
+        """
+        # Create the stream
+        sems = stream.SEMStream("test sem", self.sed, self.sed.data, self.ebeam)
+        specs = stream.SpectrumSettingsStream("test spec", self.spec, self.spec.data, self.ebeam,
+                                              detvas={"exposureTime"})
+        sps = stream.SEMSpectrumMDStream("test sem-spec", [sems, specs])
+
+        specs.roi.value = (0.15, 0.6, 0.8, 0.8)
+        specs.detExposureTime.value = 0.01  # s
+        specs.repetition.value = (5, 6)
+        exp_pos, exp_pxs, exp_res = self._roiToPhys(specs)
+
+        prev_size = _sync.MEMMAP_DATA_SIZE
+        _sync.MEMMAP_DATA_SIZE = 0  # Any data goes to a temporary file
+        try:
+            timeout = 1 + 1.5 * sps.estimateAcquisitionTime()
+            f = sps.acquire()
+            data = f.result(timeout)
+        finally:
+            _sync.MEMMAP_DATA_SIZE = prev_size
+
+        self.assertEqual(len(data), len(sps.raw))
+        sem_da, sp_da = data
+        self.assertEqual(sem_da.shape, exp_res[::-1])
+        self.assertEqual(sp_da.shape[-2:], exp_res[::-1])
+        self.assertTrue(sp_da.any())
+        numpy.testing.assert_allclose(sp_da.metadata[model.MD_POS], exp_pos)
+        numpy.testing.assert_allclose(sp_da.metadata[model.MD_PIXEL_SIZE], exp_pxs)
+
+        # The data was directly written in the file, without being copied
+        base = sp_da
+        while base is not None and not isinstance(base, numpy.memmap):
+            base = base.base
+        self.assertIsNotNone(base)
+
     def test_acq_cl_leech(self):
         """
         Test acquisition for SEM MD CL intensity + 2 leeches
@@ -2189,6 +2307,109 @@ class SPARC2TestCase(unittest.TestCase):
         self.assertGreater(len(pcmd), 500 / 10)
 
 
+class SPARC2SimSEMTestCase(unittest.TestCase):
+    """
+    Tests to be run with a (simulated) SPARCv2, with an e-beam scanner which
+    provides .newPosition, to test the continuous scan.
+    """
+    backend_was_running = False
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            test.start_backend(SPARC2SIMSEM_CONFIG)
+        except LookupError:
+            logging.info("A running backend is already found, skipping tests")
+            cls.backend_was_running = True
+            return
+        except IOError as exp:
+            logging.error(str(exp))
+            raise
+
+        # Find CCD & SEM components
+        cls.spec = model.getComponent(role="spectrometer-integrated")
+        cls.ebeam = model.getComponent(role="e-beam")
+        cls.sed = model.getComponent(role="se-detector")
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.backend_was_running:
+            return
+        test.stop_backend()
+
+    def setUp(self):
+        if self.backend_was_running:
+            self.skipTest("Running backend found")
+
+    def _create_spec_streams(self, exp, rep, continuous):
+        sems = stream.SEMStream("test sem", self.sed, self.sed.data, self.ebeam)
+        specs = stream.SpectrumSettingsStream("test spec", self.spec, self.spec.data, self.ebeam,
+                                              detvas={"exposureTime"})
+        sps = stream.SEMSpectrumMDStream("test sem-spec", [sems, specs])
+
+        specs.roi.value = (0.15, 0.6, 0.8, 0.8)
+        specs.detExposureTime.value = exp
+        specs.repetition.value = rep
+        sps.continuousScan.value = continuous
+        return sps
+
+    def _acquire(self, sps):
+        timeout = 5 + 1.5 * sps.estimateAcquisitionTime()
+        start = time.time()
+        f = sps.acquire()
+        data = f.result(timeout)
+        dur = time.time() - start
+        self.assertTrue(f.done())
+        self.assertEqual(len(data), len(sps.raw))
+        return data, dur
+
+    def test_acq_spec_continuous(self):
+        """
+        Test Spectrometer acquisition with continuous scan, compared to the
+        default (scan per pixel) acquisition
+        """
+        rep = (7, 5)
+        sps = self._create_spec_streams(0.02, rep, False)
+        data_px, dur_px = self._acquire(sps)
+        sps = self._create_spec_streams(0.02, rep, True)
+        data, dur = self._acquire(sps)
+        logging.debug("Acquisition took %g s, instead of %g s with scan per pixel", dur, dur_px)
+
+        sem_da, sp_da = data
+        self.assertEqual(sem_da.shape, rep[::-1])
+        sshape = sp_da.shape
+        self.assertEqual(len(sshape), 5)
+        self.assertGreater(sshape[0], 1)  # should have at least 2 wavelengths
+        self.assertEqual(sshape[-2:], rep[::-1])
+        # All the pixels have been acquired
+        self.assertTrue(numpy.all(sp_da.reshape(sshape[0], -1).any(axis=0)))
+
+        # Same metadata as with the scan per pixel
+        for da, da_px in zip(data, data_px):
+            self.assertEqual(da.shape, da_px.shape)
+            numpy.testing.assert_allclose(da.metadata[model.MD_POS], da_px.metadata[model.MD_POS])
+            numpy.testing.assert_allclose(da.metadata[model.MD_PIXEL_SIZE], da_px.metadata[model.MD_PIXEL_SIZE])
+        numpy.testing.assert_allclose(sem_da.metadata[model.MD_POS], sp_da.metadata[model.MD_POS])
+        numpy.testing.assert_allclose(sem_da.metadata[model.MD_PIXEL_SIZE], sp_da.metadata[model.MD_PIXEL_SIZE])
+
+    def test_acq_spec_continuous_cancel(self):
+        """
+        Test cancelling a Spectrometer acquisition with continuous scan
+        """
+        sps = self._create_spec_streams(0.02, (20, 30), True)
+        f = sps.acquire()
+        time.sleep(1)
+        self.assertTrue(f.cancel())
+        self.assertTrue(f.cancelled())
+        with self.assertRaises(CancelledError):
+            f.result()
+
+        # The next acquisition should work fine
+        sps = self._create_spec_streams(0.02, (4, 3), True)
+        data, dur = self._acquire(sps)
+        self.assertEqual(data[1].shape[-2:], (3, 4))
+
+
 class SPARC2StreakCameraTestCase(unittest.TestCase):
     """
     Tests to be run with a (simulated) SPARCv2 equipped with a streak camera
@@ -4473,6 +4694,50 @@ class StaticStreamsTestCase(unittest.TestCase):
         im2d = proj_spatial.image.value
         self.assertEqual(im2d.shape, spec.shape[-2:] + (3,))
 
+    def test_spectrum_2d_index(self):
+        """Test the band averages of RGBSpatialSpectrumProjection with the spectrum index"""
+        spec = self._create_spectrum_data()
+        specs = stream.StaticSpectrumStream("test", spec)
+        proj_spatial = RGBSpatialSpectrumProjection(specs)
+        time.sleep(0.5)  # wait a bit for the index to be computed
+        calibrated = specs.calibrated.value
+        self.assertIs(specs._spec_index[0], calibrated)
+        cumsum = specs._spec_index[1]
+        self.assertIsNotNone(cumsum)
+        self.assertEqual(cumsum.dtype, numpy.int32)  # uint16 data with few channels
+
+        # Another projection of the same stream uses the same index
+        proj_spatial2 = RGBSpatialSpectrumProjection(specs)
+        time.sleep(0.5)
+        self.assertIs(specs._getSpectrumIndex(calibrated), cumsum)
+
+        cube = specs._getSpectrumCube(calibrated)
+        bands = [(0, 0), (2, 2), (0, 250), (10, 200), (200, 250)]
+        tstart = time.time()
+        avgs = proj_spatial._getBandAverages(calibrated, bands)
+        dur_index = time.time() - tstart
+        for b, av in zip(bands, avgs):
+            numpy.testing.assert_allclose(av, numpy.mean(cube[b[0]:b[1] + 1], axis=0))
+
+        # Without index, it should give the same result
+        specs._spec_index = (calibrated, None)
+        tstart = time.time()
+        avgs_noindex = proj_spatial._getBandAverages(calibrated, bands)
+        dur_noindex = time.time() - tstart
+        for av, av_noindex in zip(avgs, avgs_noindex):
+            numpy.testing.assert_allclose(av, av_noindex)
+        logging.info("Computed %d band averages in %g s with index, and %g s without",
+                     len(bands), dur_index, dur_noindex)
+
+        # New data => the index is recomputed
+        dbckg = numpy.ones(spec.shape, dtype=numpy.uint16)
+        obckg = model.DataArray(dbckg, metadata={model.MD_WL_LIST: list(spec.metadata[model.MD_WL_LIST])})
+        specs.background.value = calibration.get_spectrum_data([obckg])
+        time.sleep(0.5)
+        self.assertIsNot(specs.calibrated.value, calibrated)
+        self.assertIs(specs._spec_index[0], specs.calibrated.value)
+        self.assertIsNotNone(specs._spec_index[1])
+
     def test_spectrum_0d(self):
         """Test StaticSpectrumStream 0D"""
         spec = self._create_spectrum_data()
@@ -5034,13 +5299,16 @@ class StaticStreamsTestCase(unittest.TestCase):
 
     def test_rgb_tiled_stream_pan(self):
         read_tiles = []
-        def getTileMock(self, x, y, zoom):
+        # The tiles are cached, so count only the ones actually read from the file
+        def readTileMock(self, tiff_file, x, y, zoom):
             tile_desc = "(%d, %d), z: %d" % (x, y, zoom)
             read_tiles.append(tile_desc)
-            return tiff.DataArrayShadowPyramidalTIFF._getTileOldSP(self, x, y, zoom)
+            return tiff.DataArrayShadowPyramidalTIFF._readTileOldSP(self, tiff_file, x, y, zoom)
 
-        tiff.DataArrayShadowPyramidalTIFF._getTileOldSP = tiff.DataArrayShadowPyramidalTIFF.getTile
-        tiff.DataArrayShadowPyramidalTIFF.getTile = getTileMock
+        tiff.DataArrayShadowPyramidalTIFF._readTileOldSP = tiff.DataArrayShadowPyramidalTIFF._readTile
+        tiff.DataArrayShadowPyramidalTIFF._readTile = readTileMock
+        # Only count the tiles needed for the display
+        stream.RGBSpatialProjection.PREFETCH_TILES = False
 
         POS = (5.0, 7.0)
         size = (3000, 2000, 3)
@@ -5061,10 +5329,10 @@ class StaticStreamsTestCase(unittest.TestCase):
         pj = stream.RGBSpatialProjection(ss)
         time.sleep(0.5)
 
-        # the maxzoom image has 2 tiles. So far 4 was read: 2 on the constructor, for
-        # _updateHistogram and _updateDRange. And 2 for _updateImage, because .rect
-        # and .mpp are initialized to the maxzoom image
-        self.assertEqual(4, len(read_tiles))
+        # the maxzoom image has 2 tiles. So far 2 were read: on the constructor, for
+        # _updateHistogram and _updateDRange. _updateImage (.rect and .mpp are
+        # initialized to the maxzoom image) gets them from the cache.
+        self.assertEqual(2, len(read_tiles))
 
         full_image_rect = (POS[0] - 0.0015, POS[1] - 0.001, POS[0] + 0.0015, POS[1] + 0.001)
 
@@ -5073,7 +5341,7 @@ class StaticStreamsTestCase(unittest.TestCase):
         pj.rect.value = full_image_rect
         # Wait a little bit to make sure the image has been generated
         time.sleep(0.5)
-        self.assertEqual(28, len(read_tiles))
+        self.assertEqual(26, len(read_tiles))
         self.assertEqual(len(pj.image.value), 6)
         self.assertEqual(len(pj.image.value[0]), 4)
 
@@ -5081,15 +5349,15 @@ class StaticStreamsTestCase(unittest.TestCase):
         pj.rect.value = (POS[0] - 0.0015, POS[1] - 0.001, POS[0], POS[1] + 0.001)
         # Wait a little bit to make sure the image has been generated
         time.sleep(0.5)
-        self.assertEqual(28, len(read_tiles))
+        self.assertEqual(26, len(read_tiles))
         self.assertEqual(len(pj.image.value), 3)
         self.assertEqual(len(pj.image.value[0]), 4)
 
-        # half image (right side), only the center tiles will are cached
+        # half image (right side), all tiles are still cached
         pj.rect.value = (POS[0], POS[1] - 0.001, POS[0] + 0.0015, POS[1] + 0.001)
         # Wait a little bit to make sure the image has been generated
         time.sleep(0.5)
-        self.assertEqual(40, len(read_tiles))
+        self.assertEqual(26, len(read_tiles))
         self.assertEqual(len(pj.image.value), 4)
         self.assertEqual(len(pj.image.value[0]), 4)
 
@@ -5098,7 +5366,7 @@ class StaticStreamsTestCase(unittest.TestCase):
 
         # Wait a little bit to make sure the image has been generated
         time.sleep(0.5)
-        self.assertEqual(40, len(read_tiles))
+        self.assertEqual(26, len(read_tiles))
         self.assertEqual(len(pj.image.value), 1)
         self.assertEqual(len(pj.image.value[0]), 1)
 
@@ -5109,17 +5377,67 @@ class StaticStreamsTestCase(unittest.TestCase):
             time.sleep(0.5)
 
         # get the old function back to the class
-        tiff.DataArrayShadowPyramidalTIFF.getTile = tiff.DataArrayShadowPyramidalTIFF._getTileOldSP
+        tiff.DataArrayShadowPyramidalTIFF._readTile = tiff.DataArrayShadowPyramidalTIFF._readTileOldSP
+        stream.RGBSpatialProjection.PREFETCH_TILES = True
+
+    def test_rgb_tiled_stream_prefetch(self):
+        read_tiles = []
+        def readTileMock(self, tiff_file, x, y, zoom):
+            tile_desc = "(%d, %d), z: %d" % (x, y, zoom)
+            read_tiles.append(tile_desc)
+            return tiff.DataArrayShadowPyramidalTIFF._readTileOldSF(self, tiff_file, x, y, zoom)
+
+        tiff.DataArrayShadowPyramidalTIFF._readTileOldSF = tiff.DataArrayShadowPyramidalTIFF._readTile
+        tiff.DataArrayShadowPyramidalTIFF._readTile = readTileMock
+
+        POS = (5.0, 7.0)
+        md = {
+            model.MD_DIMS: 'YXC',
+            model.MD_POS: POS,
+            model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+        }
+        arr = numpy.zeros((2000, 3000, 3), dtype=numpy.uint8)
+        arr[:, :, 0] = numpy.linspace(0, 255, 3000, dtype=numpy.uint8)
+        data = model.DataArray(arr, metadata=md)
+        tiff.export(FILENAME, data, pyramid=True)
+
+        acd = tiff.open_data(FILENAME)
+        ss = stream.RGBStream("test", acd.content[0])
+        pj = stream.RGBSpatialProjection(ss)
+        time.sleep(0.5)
+
+        # Small rect in the top-left tile, at the second zoom level (6x4 tiles)
+        pj.mpp.value = 2e-6
+        pj.rect.value = (POS[0] - 0.0015, POS[1] + 0.0009, POS[0] - 0.0014, POS[1] + 0.001)
+        time.sleep(1)
+        self.assertEqual(len(pj.image.value), 1)
+        self.assertEqual(len(pj.image.value[0]), 1)
+        # The neighbouring tiles and the ones of the next zoom level are read in advance
+        self.assertIn("(1, 1), z: 1", read_tiles)
+        self.assertIn("(1, 1), z: 0", read_tiles)
+
+        # Pan to the tile on the right => already read
+        nread = len(read_tiles)
+        pj.rect.value = (POS[0] - 0.00098, POS[1] + 0.0009, POS[0] - 0.00088, POS[1] + 0.001)
+        time.sleep(0.5)
+        self.assertEqual(len(pj.image.value), 1)
+        self.assertIn("(1, 0), z: 1", read_tiles[:nread])
+        self.assertNotIn("(1, 0), z: 1", read_tiles[nread:])
+
+        tiff.DataArrayShadowPyramidalTIFF._readTile = tiff.DataArrayShadowPyramidalTIFF._readTileOldSF
 
     def test_rgb_tiled_stream_zoom(self):
         read_tiles = []
-        def getTileMock(self, x, y, zoom):
+        # The tiles are cached, so count only the ones actually read from the file
+        def readTileMock(self, tiff_file, x, y, zoom):
             tile_desc = "(%d, %d), z: %d" % (x, y, zoom)
             read_tiles.append(tile_desc)
-            return tiff.DataArrayShadowPyramidalTIFF._getTileOldSZ(self, x, y, zoom)
+            return tiff.DataArrayShadowPyramidalTIFF._readTileOldSZ(self, tiff_file, x, y, zoom)
 
-        tiff.DataArrayShadowPyramidalTIFF._getTileOldSZ = tiff.DataArrayShadowPyramidalTIFF.getTile
-        tiff.DataArrayShadowPyramidalTIFF.getTile = getTileMock
+        tiff.DataArrayShadowPyramidalTIFF._readTileOldSZ = tiff.DataArrayShadowPyramidalTIFF._readTile
+        tiff.DataArrayShadowPyramidalTIFF._readTile = readTileMock
+        # Only count the tiles needed for the display
+        stream.RGBSpatialProjection.PREFETCH_TILES = False
 
         POS = (5.0, 7.0)
         dtype = numpy.uint8
@@ -5151,10 +5469,10 @@ class StaticStreamsTestCase(unittest.TestCase):
         pj = stream.RGBSpatialProjection(ss)
         time.sleep(0.5)
 
-        # the maxzoom image has 2 tiles. So far 4 was read: 2 on the constructor, for
-        # _updateHistogram and _updateDRange. And 2 for _updateImage, because .rect
-        # and .mpp are initialized to the maxzoom image
-        self.assertEqual(4, len(read_tiles))
+        # the maxzoom image has 2 tiles. So far 2 were read: on the constructor, for
+        # _updateHistogram and _updateDRange. _updateImage (.rect and .mpp are
+        # initialized to the maxzoom image) gets them from the cache.
+        self.assertEqual(2, len(read_tiles))
 
         # delta full rect
         dfr = [-0.0015, -0.001, 0.0015, 0.001]
@@ -5168,7 +5486,7 @@ class StaticStreamsTestCase(unittest.TestCase):
         # Wait a little bit to make sure the image has been generated
         time.sleep(0.2)
         # no tiles are read from the disk
-        self.assertEqual(4, len(read_tiles))
+        self.assertEqual(2, len(read_tiles))
         self.assertEqual(len(pj.image.value), 2)
         self.assertEqual(len(pj.image.value[0]), 1)
         # top-left pixel of the left tile
@@ -5186,7 +5504,7 @@ class StaticStreamsTestCase(unittest.TestCase):
         # Wait a little bit to make sure the image has been generated
         time.sleep(0.5)
         # no tiles are read from the disk
-        self.assertEqual(4, len(read_tiles))
+        self.assertEqual(2, len(read_tiles))
         self.assertEqual(len(pj.image.value), 1)
         self.assertEqual(len(pj.image.value[0]), 1)
         # top-left pixel of the only tile
@@ -5203,7 +5521,7 @@ class StaticStreamsTestCase(unittest.TestCase):
         # Wait a little bit to make sure the image has been generated
         time.sleep(0.5)
         # only one tile is read
-        self.assertEqual(5, len(read_tiles))
+        self.assertEqual(3, len(read_tiles))
         self.assertEqual(len(pj.image.value), 1)
         self.assertEqual(len(pj.image.value[0]), 1)
         # top-left pixel of the only tile
@@ -5227,14 +5545,15 @@ class StaticStreamsTestCase(unittest.TestCase):
 
         # Wait a little bit to make sure the image has been generated
         time.sleep(0.5)
-        # Only 2 tiles read from disk. It means that the loop inside _updateImage,
-        # triggered by the change on .rect was immediately stopped when .mpp changed
-        if len(read_tiles) == 8:
-            logging.warning("Two tiles read while expected to have just one, but "
+        # No tile read from disk, as the ones at max mpp are cached. It means
+        # that the loop inside _updateImage, triggered by the change on .rect
+        # was immediately stopped when .mpp changed
+        if len(read_tiles) == 4:
+            logging.warning("One tile read while expected to have none, but "
                             "this is acceptable as updateImage thread might have "
                             "gone very fast.")
         else:
-            self.assertEqual(7, len(read_tiles))
+            self.assertEqual(3, len(read_tiles))
         self.assertEqual(len(pj.image.value), 2)
         self.assertEqual(len(pj.image.value[0]), 1)
 
@@ -5282,8 +5601,9 @@ class StaticStreamsTestCase(unittest.TestCase):
         # Wait a little bit to make sure the image has been generated
         time.sleep(0.5)
 
-        # reads 4 tiles from the disk, no tile is cached becase the zoom changed
-        self.assertEqual(10, len(read_tiles))
+        # reads 3 tiles from the disk, only the center one is cached, as it
+        # was read at the same zoom level before
+        self.assertEqual(9, len(read_tiles))
         self.assertEqual(len(pj.image.value), 2)
         self.assertEqual(len(pj.image.value[0]), 2)
         # top-left pixel of the top-left tile
@@ -5296,7 +5616,8 @@ class StaticStreamsTestCase(unittest.TestCase):
         numpy.testing.assert_array_equal([130, 130, 0], pj.image.value[0][0][255, 255, :])
 
         # get the old function back to the class
-        tiff.DataArrayShadowPyramidalTIFF.getTile = tiff.DataArrayShadowPyramidalTIFF._getTileOldSZ
+        tiff.DataArrayShadowPyramidalTIFF._readTile = tiff.DataArrayShadowPyramidalTIFF._readTileOldSZ
+        stream.RGBSpatialProjection.PREFETCH_TILES = True
 
     def test_rgb_updatable_stream(self):
         """Test RGBUpdatableStream """
@@ -28,6 +28,7 @@ from gettext import ngettext
 import logging
 import numpy
 from odemis import dataio, model
+from odemis.dataio import hdf5
 from odemis.acq.stream import StaticSEMStream, StaticCLStream, StaticSpectrumStream, \
                               StaticARStream, StaticFluoStream
 import odemis
@@ -54,7 +55,7 @@ def open_acq(fn):
     if fmt_mng is None:
         logging.warning("Failed to find a fitting importer for file %s", fn)
         # TODO: try all the formats?
-        fmt_mng = dataio.hdf5
+        fmt_mng = hdf5
 
     if not hasattr(fmt_mng, "read_data"):
         raise NotImplementedError("No support for importing format %s" % fmt_mng.FORMAT)
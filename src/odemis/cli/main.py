@@ -178,7 +178,7 @@ def build_graph_children(comps):
     Constructs a graph based on the children hierarchy, so each component is a
     node, and the children are sub-nodes of their parent. Precisely, it builds a
     tree, or several trees if there is more than one root component.
-    comps (set of Component): All the components
+    comps (dict Component -> set of Component): All the components -> their children
     return (dict {Component -> dict {Component -> dict...}}): parent -> children, recursive
     """
     # Start from the leaves, which have no children, and merge all the leaves
@@ -189,7 +189,7 @@ def build_graph_children(comps):
     while lefts:
         prev_lefts = lefts.copy()
         for comp in prev_lefts:
-            children = set(comp.children.value)
+            children = comps[comp]
             if not (children - set(graph.keys())):
                 graph[comp] = {k: v for k, v in graph.items() if k in children}
                 for child in children:
@@ -215,7 +215,9 @@ def list_components(pretty=True):
     # Show the root first, and don't use it for the graph, because its "children"
     # are actually "dependencies", and it'd multiple parents in the graph.
     microscope = model.getMicroscope()
-    subcomps = model.getComponents() - {microscope}
+    # Get everything in one call, instead of asking the children of each component
+    tree = model.getComponentsTree()
+    subcomps = {c: children for c, children in tree.items() if c != microscope}
 
     print_component(microscope, pretty)
     if pretty:
@@ -71,6 +71,33 @@ class TestWithoutBackend(unittest.TestCase):
         output = out.getvalue()
         self.assertTrue(b"optional arguments" in output)
     
+#    @skip("Simple")
+    def test_import_time(self):
+        """
+        Check that the heavy dependencies are not loaded just to start the CLI,
+        and report how long it takes
+        """
+        # Modules which are only needed for some of the commands
+        heavy_modules = ["scipy", "cv2", "h5py", "libtiff", "PIL", "wx",
+                         "odemis.acq", "odemis.dataio.tiff", "odemis.dataio.hdf5",
+                         "odemis.util.img"]
+        code = ("import sys, time\n"
+                "tstart = time.time()\n"
+                "import odemis.cli.main\n"
+                "print(time.time() - tstart)\n"
+                "print(','.join(m for m in %r if m in sys.modules))\n" % (heavy_modules,))
+
+        durs = []
+        for i in range(3):
+            out = subprocess.check_output([sys.executable, "-c", code]).decode("utf-8")
+            dur, loaded = out.split("\n")[:2]
+            durs.append(float(dur))
+            self.assertEqual(loaded, "", "Modules %s were loaded at import" % (loaded,))
+        logging.info("Importing the CLI took %g s (min of %s)", min(durs), durs)
+        # Normally ~0.5 s. Very large margin to not fail on slow computers, but
+        # still catch eg, importing the whole GUI.
+        self.assertLess(min(durs), 5)
+
 #    @skip("Simple")
     def test_error_command_line(self):
         """
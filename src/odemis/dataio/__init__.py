@@ -28,7 +28,6 @@ import logging
 import os
 
 from ._base import *
-from odemis.dataio import tiff
 
 # The interface of a "format manager" is as follows:
 #  * one module
@@ -39,10 +38,18 @@ from odemis.dataio import tiff
 #  * read_thumbnail (callable): read the thumbnail(s) of a file
 #  if it doesn't support writing, then is has no .export(), and if it doesn't
 #  support reading, then it has not read_data().
+# The modules are only imported when first needed, as they depend on many
+# libraries which are slow to load (h5py, libtiff, PIL...). So they have to be
+# explicitly imported (eg, "from odemis.dataio import hdf5") before use.
 _iomodules = ["tiff", "stiff", "hdf5", "png", "csv", "catmaid"]
 __all__ = _iomodules + ["get_available_formats", "get_converter", "find_fittest_converter"]
 
 
+# Marks that find_fittest_converter() should fall back to TIFF (without having
+# to import it when the module is loaded)
+_TIFF_DEFAULT = object()
+
+
 def get_available_formats(mode=os.O_RDWR, allowlossy=False):
     """
     Find the available file formats
@@ -101,15 +108,16 @@ def get_converter(fmt):
     raise ValueError("No converter for format %s found" % fmt)
 
 
-def find_fittest_converter(filename, default=tiff, mode=os.O_WRONLY, allowlossy=False):
+def find_fittest_converter(filename, default=_TIFF_DEFAULT, mode=os.O_WRONLY, allowlossy=False):
     """
     Find the most fitting exporter according to a filename (actually, its extension)
     filename (string): (path +) filename with extension
-    default (dataio. Module): default exporter to pick if no really fitting
-      exporter is found
+    default (None or dataio. Module): default exporter to pick if no really fitting
+      exporter is found. If not specified, TIFF is used.
     mode: cf get_available_formats()
     allowlossy: cf get_available_formats()
-    returns (dataio. Module): the right exporter
+    returns (dataio. Module or None): the right exporter (None only if default
+      is None and no fitting exporter is found)
     """
     fn_low = filename.lower() # case insensitive
     # If filename is a bytes, .startswith()/.endswith() functions implicitly
@@ -143,6 +151,8 @@ def find_fittest_converter(filename, default=tiff, mode=os.O_WRONLY, allowlossy=
         logging.debug("Determined that '%s' corresponds to %s format",
                       basename, best_fmt)
         conv = get_converter(best_fmt)
+    elif default is _TIFF_DEFAULT:
+        conv = importlib.import_module(".tiff", __name__)
     else:
         conv = default
 
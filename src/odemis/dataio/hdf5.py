@@ -23,17 +23,28 @@ from __future__ import division
 from past.builtins import basestring, unicode
 
 import collections
+from contextlib import contextmanager
 import h5py
 import json
 import logging
+import multiprocessing
 import numpy
 from odemis import model
 import odemis
+from odemis.model import DataArrayShadow, AcquisitionData
 from odemis.util import spectrum, img, fluo
-from odemis.util.conversion import JsonExtraEncoder
+from odemis.util.conversion import JsonExtraEncoder, get_tile_md_pos
 import os
+import threading
 import time
 
+# The hdf5plugin module provides extra compression filters (Blosc, LZ4, Zstd...).
+# It's optional, but needed to write, and read, files using these filters.
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
 
 # User-friendly name
 FORMAT = "HDF5"
@@ -42,6 +53,31 @@ EXTENSIONS = [u".h5", u".hdf5"]
 LOSSY = False
 CAN_SAVE_PYRAMID = False
 
+TILE_SIZE = 256  # Size of the tiles, when the images are read by tiles (with open_data())
+# Chunks adapted to access both the spectrum of a point and a sub-cube of a few
+# wavelengths of a spectrum cube (CTZYX)
+CUBE_CHUNKS = (64, 1, 1, 64, 64)
+
+# Compression filters available, by name -> arguments to pass to create_dataset()
+# The "shuffle" filter groups together the bytes of same significance, which
+# helps a lot to compress images of more than 8 bits.
+COMPRESSIONS = {
+    "gzip": {"compression": "gzip"},  # The historical one, slow
+    "gzip-fast": {"compression": "gzip", "compression_opts": 1, "shuffle": True},
+    # Only supported by h5py (and not by other software)
+    "lzf": {"compression": "lzf", "shuffle": True},
+}
+if hdf5plugin:
+    # Multi-threaded, and very fast. Requires the filters from hdf5plugin
+    # (or similar) to be read by any software.
+    COMPRESSIONS["lz4"] = dict(hdf5plugin.Blosc(cname="lz4", clevel=5,
+                                                shuffle=hdf5plugin.Blosc.SHUFFLE))
+    COMPRESSIONS["zstd"] = dict(hdf5plugin.Blosc(cname="zstd", clevel=2,
+                                                 shuffle=hdf5plugin.Blosc.SHUFFLE))
+# gzip with the lowest level and shuffle compresses about as well as the default
+# level, but several times faster, and the file can be read by any software.
+DEFAULT_COMPRESSION = "gzip-fast"
+
 # We are trying to follow the same format as SVI, as defined here:
 # http://www.svi.nl/HDF5
 # A file follows this structure:
@@ -139,16 +175,28 @@ def _create_image_dataset(group, dataset_name, image, **kwargs):
     """
     assert(len(image.shape) >= 2)
     image_dataset = group.create_dataset(dataset_name, data=image, **kwargs)
+    _add_image_class(image_dataset, lambda: (image.min(), image.max()))
+    return image_dataset
 
+
+def _add_image_class(image_dataset, get_range):
+    """
+    Adds the attributes of the HDF5 image specification to a dataset
+    image_dataset (HDF Dataset): the dataset containing the image. It should
+      have at least 2 dimensions
+    get_range (callable): returns the minimum and maximum values of the image.
+      It is only called for greyscale images.
+    """
+    shape = image_dataset.shape
     # numpy.string_ is to force fixed-length string (necessary for compatibility)
     # FIXME: needs to be NULLTERM, not NULLPAD... but h5py doesn't allow to distinguish
     image_dataset.attrs["CLASS"] = numpy.string_("IMAGE")
     # Colour image?
-    if image.ndim == 3 and (image.shape[-3] == 3 or image.shape[-1] == 3):
+    if len(shape) == 3 and (shape[-3] == 3 or shape[-1] == 3):
         # TODO: check dtype is int?
         image_dataset.attrs["IMAGE_SUBCLASS"] = numpy.string_("IMAGE_TRUECOLOR")
         image_dataset.attrs["IMAGE_COLORMODEL"] = numpy.string_("RGB")
-        if image.shape[-3] == 3:
+        if shape[-3] == 3:
             # Stored as [pixel components][height][width]
             image_dataset.attrs["INTERLACE_MODE"] = numpy.string_("INTERLACE_PLANE")
         else: # This is the numpy standard
@@ -157,13 +205,11 @@ def _create_image_dataset(group, dataset_name, image, **kwargs):
     else:
         image_dataset.attrs["IMAGE_SUBCLASS"] = numpy.string_("IMAGE_GRAYSCALE")
         image_dataset.attrs["IMAGE_WHITE_IS_ZERO"] = numpy.array(0, dtype="uint8")
-        image_dataset.attrs["IMAGE_MINMAXRANGE"] = [image.min(), image.max()]
+        image_dataset.attrs["IMAGE_MINMAXRANGE"] = list(get_range())
 
     image_dataset.attrs["DISPLAY_ORIGIN"] = numpy.string_("UL") # not rotated
     image_dataset.attrs["IMAGE_VERSION"] = numpy.string_("1.2")
 
-    return image_dataset
-
 
 def _read_image_dataset(dataset):
     """
@@ -174,6 +220,19 @@ def _read_image_dataset(dataset):
      IOError: if it doesn't conform to the standard
      NotImplementedError: if the image uses so fancy standard features
     """
+    md = _read_image_class(dataset)
+    return model.DataArray(dataset[...], md)
+
+
+def _read_image_class(dataset):
+    """
+    Get the metadata from the attributes of a dataset respecting the HDF5 image
+     specification, without reading the data.
+    returns (dict str -> value): the metadata. If RGB, MD_DIMS indicates the order.
+    raises
+     IOError: if it doesn't conform to the standard
+     NotImplementedError: if the image uses so fancy standard features
+    """
     # check basic format
     if len(dataset.shape) < 2:
         raise IOError("Image has a shape of %s" % (dataset.shape,))
@@ -184,7 +243,7 @@ def _read_image_dataset(dataset):
     # conversion is almost entirely different depending on subclass
     subclass = dataset.attrs.get("IMAGE_SUBCLASS", b"IMAGE_GRAYSCALE")
 
-    image = model.DataArray(dataset[...])
+    md = {}
     if subclass == b"IMAGE_GRAYSCALE":
         pass
     elif subclass == b"IMAGE_TRUECOLOR":
@@ -203,9 +262,9 @@ def _read_image_dataset(dataset):
 
         if il_mode == b"INTERLACE_PLANE":
             # colour is first dim
-            image.metadata[model.MD_DIMS] = "CYX"
+            md[model.MD_DIMS] = "CYX"
         elif il_mode == b"INTERLACE_PIXEL":
-            image.metadata[model.MD_DIMS] = "YXC"
+            md[model.MD_DIMS] = "YXC"
         else:
             raise NotImplementedError("Unable to handle images of subclass '%s'" % subclass)
 
@@ -217,7 +276,7 @@ def _read_image_dataset(dataset):
     if dorig != b"UL":
         logging.warning("Image rotation %s not handled", dorig)
 
-    return image
+    return md
 
 
 def _add_image_info(group, dataset, image):
@@ -1416,6 +1475,114 @@ def _dataFromSVIHDF5(f):
     return data
 
 
+def _thumbShadowsFromHDF5(f):
+    """
+    Create the DataArrayShadows of the thumbnails of an HDF5 file.
+    Expects to find them as IMAGE in Preview/Image.
+    f (h5py.File): the root of the file
+    return (list of DataArrayShadowHDF5)
+    """
+    thumbs = []
+    # look for the Preview directory
+    try:
+        grp = f["Preview"]
+    except KeyError:
+        # no thumbnail
+        return thumbs
+
+    # scan for images
+    for name, ds in grp.items():
+        # an image? (== has the attribute CLASS: IMAGE)
+        if isinstance(ds, h5py.Dataset) and ds.attrs.get("CLASS") == b"IMAGE":
+            try:
+                md = _read_image_class(ds)
+                if name == "Image":
+                    md = _read_image_info(grp)
+            except Exception:
+                logging.info("Skipping image '%s' which couldn't be read.", name)
+                continue
+
+            thumbs.append(DataArrayShadowHDF5(ds, (), ds.shape, ds.dtype, md))
+
+    return thumbs
+
+
+def _shadowsFromSVIHDF5(f, tiled=False):
+    """
+    Create the DataArrayShadows of the microscopy data from an HDF5 file using
+    the SVI convention. It works the same way as _dataFromSVIHDF5(), but without
+    reading the data.
+    f (h5py.File): the root of the file
+    tiled (bool): see open_data()
+    return (list of DataArrayShadowHDF5)
+    """
+    shadows = []
+
+    for obj in f.values():
+        # find all the expected and interesting objects
+        try:
+            svidata = obj["SVIData"]
+            imagedata = obj["ImageData"]
+            image = imagedata["Image"]
+            physicaldata = obj["PhysicalData"]
+        except KeyError:
+            continue  # not conforming => try next object
+
+        try:
+            md = _read_image_class(image)
+        except Exception:
+            logging.exception("Failed to read data of acquisition '%s'", obj.name)
+            continue
+
+        try:
+            md.update(_read_image_info(imagedata))
+        except Exception:
+            logging.exception("Failed to parse metadata of acquisition '%s'", obj.name)
+
+        # Use an array of the right shape, but without memory, to find out how
+        # the data is split (per channel)
+        da = model.DataArray(numpy.broadcast_to(numpy.zeros((), dtype=image.dtype), image.shape), md)
+        das = _parse_physical_data(physicaldata, da)
+        if len(das) == 1:
+            shadows.append(DataArrayShadowHDF5(image, (), das[0].shape, image.dtype, das[0].metadata,
+                                               tiled=tiled))
+        else:  # One DataArray per channel
+            for i, d in enumerate(das):
+                shadows.append(DataArrayShadowHDF5(image, (i,), d.shape, image.dtype, d.metadata,
+                                                   tiled=tiled))
+
+    return shadows
+
+
+def _shadowsFromHDF5(f, tiled=False):
+    """
+    Create the DataArrayShadows of the microscopy data from an HDF5 file.
+    f (h5py.File): the root of the file
+    tiled (bool): see open_data()
+    return (list of DataArrayShadowHDF5)
+    """
+    # if follows SVI convention => use the special function
+    for obj in f.values():
+        if (isinstance(obj, h5py.Group) and
+            isinstance(obj.get("SVIData"), h5py.Group)):
+            return _shadowsFromSVIHDF5(f, tiled)
+
+    shadows = []
+    # go rough: return any dataset with numbers (and more than one element)
+
+    def addIfWorthy(name, obj):
+        if not isinstance(obj, h5py.Dataset):
+            return
+        if not obj.dtype.kind in "biufc":
+            return
+        if numpy.prod(obj.shape) <= 1:
+            return
+        shadows.append(DataArrayShadowHDF5(obj, (), obj.shape, obj.dtype, tiled=tiled))
+
+    f.visititems(addIfWorthy)
+    return shadows
+
+
 def _dataFromHDF5(filename):
     """
     Read microscopy data from an HDF5 file.
@@ -1465,15 +1632,82 @@ def _mergeCorrectionMetadata(da):
     return model.DataArray(da, md) # create a view
 
 
-def _saveAsHDF5(filename, ldata, thumbnail, compressed=True):
+def _get_filters(compression):
+    """
+    compression (str or None): name of the compression (from COMPRESSIONS), or
+      None for no compression.
+    return (dict str -> value): arguments to pass to create_dataset()
+    raise ValueError: if the compression is not available
+    """
+    if compression is None:
+        return {}
+    try:
+        return COMPRESSIONS[compression]
+    except KeyError:
+        raise ValueError("Compression %s not available, should be one of %s" %
+                         (compression, ", ".join(sorted(COMPRESSIONS.keys()))))
+
+
+# Number of files currently compressed with Blosc, which changed the environment
+_blosc_users = 0
+_blosc_lock = threading.Lock()
+
+
+@contextmanager
+def _bloscThreads(filters):
+    """
+    Context manager to compress with Blosc using one thread per CPU.
+    The Blosc filter has no option for the number of threads: it reads it from
+    the environment, at each compression. So it's only set in the environment
+    while the data is written (unless the user has already set it).
+    filters (dict str -> value): the compression filter, as returned by _get_filters()
+    """
+    global _blosc_users
+    use_blosc = (hdf5plugin is not None and
+                 filters.get("compression") == hdf5plugin.BLOSC_ID)
+    with _blosc_lock:
+        if use_blosc and (_blosc_users or "BLOSC_NTHREADS" not in os.environ):
+            if not _blosc_users:
+                os.environ["BLOSC_NTHREADS"] = str(multiprocessing.cpu_count())
+            _blosc_users += 1
+        else:
+            use_blosc = False
+    try:
+        yield
+    finally:
+        if use_blosc:
+            with _blosc_lock:
+                _blosc_users -= 1
+                if not _blosc_users:
+                    del os.environ["BLOSC_NTHREADS"]
+
+
+def _add_thumbnail(f, thumbnail, filters):
+    """
+    Saves the thumbnail in the special group "Preview"
+    f (h5py.File): the root of the file
+    thumbnail (DataArray): see export
+    filters (dict str -> value): the compression filter, as returned by _get_filters()
+    """
+    thumbnail = _mergeCorrectionMetadata(thumbnail)
+    # Save the image as-is in a special group "Preview"
+    prevg = f.create_group("Preview")
+    _updateRGBMD(thumbnail) # ensure RGB info is there if needed
+    ids = _create_image_dataset(prevg, "Image", thumbnail, **filters)
+    _add_image_info(prevg, ids, thumbnail)
+
+
+def _saveAsHDF5(filename, ldata, thumbnail, compression=DEFAULT_COMPRESSION, chunks=None):
     """
     Saves a list of DataArray as a HDF5 (SVI) file.
     filename (string): name of the file to save
     ldata (list of DataArray): list of 2D (up to 5D) data of int or float. 
      Should have at least one array.
     thumbnail (None or DataArray): see export
-    compressed (boolean): whether the file is compressed or not.
+    compression (str or None): see export
+    chunks (None or tuple of 5 ints): see export
     """
+    filters = _get_filters(compression)
     # h5py will extend the current file by default, so we want to make sure
     # there is no file at all.
     try:
@@ -1481,36 +1715,29 @@ def _saveAsHDF5(filename, ldata, thumbnail, compressed=True):
     except OSError:
         pass
     f = h5py.File(filename, "w") # w will fail if file exists
-    if compressed:
-        # szip is not free for commercial usage and lzf doesn't seem to be
-        # well supported yet
-        compression = "gzip"
-    else:
-        compression = None
 
-    if thumbnail is not None:
-        thumbnail = _mergeCorrectionMetadata(thumbnail)
-        # Save the image as-is in a special group "Preview"
-        prevg = f.create_group("Preview")
-        _updateRGBMD(thumbnail) # ensure RGB info is there if needed
-        ids = _create_image_dataset(prevg, "Image", thumbnail, compression=compression)
-        _add_image_info(prevg, ids, thumbnail)
+    with _bloscThreads(filters):
+        if thumbnail is not None:
+            _add_thumbnail(f, thumbnail, filters)
 
-    # merge correction metadata (as we cannot save them separatly in OME-TIFF)
-    ldata = [_mergeCorrectionMetadata(da) for da in ldata]
+        # merge correction metadata (as we cannot save them separatly in OME-TIFF)
+        ldata = [_mergeCorrectionMetadata(da) for da in ldata]
 
-    # list ndarray/list of list of metadata (one per channel)
-    acq, mds = _groupImages(ldata)
-    for i, da in enumerate(acq):
-        ga = f.create_group("Acquisition%d" % i)
-        _add_acquistion_svi(ga, da, mds[i], compression=compression)
+        # list ndarray/list of list of metadata (one per channel)
+        acq, mds = _groupImages(ldata)
+        for i, da in enumerate(acq):
+            ga = f.create_group("Acquisition%d" % i)
+            kwargs = {}
+            if chunks is not None and da.ndim == len(chunks):  # Not for RGB (CYX)
+                kwargs["chunks"] = tuple(max(1, min(c, l)) for c, l in zip(chunks, da.shape))
+            kwargs.update(filters)
+            _add_acquistion_svi(ga, da, mds[i], **kwargs)
 
-    f.close()
+        f.close()
 
 
-# TODO: allow to append data to a file, or any other way to allow saving large
-# data without having everything in memory simultaneously.
-def export(filename, data, thumbnail=None):
+def export(filename, data, thumbnail=None, compressed=True, chunks=None,
+           compression=DEFAULT_COMPRESSION):
     '''
     Write an HDF5 file with the given image and metadata
     filename (unicode): filename of the file to create (including path)
@@ -1524,13 +1751,222 @@ def export(filename, data, thumbnail=None):
       (reasonable) size. Must be either 2D array (greyscale) or 3D with last 
       dimension of length 3 (RGB). If the exporter doesn't support it, it will
       be dropped silently.
+    compressed (boolean): whether the file is compressed or not.
+    chunks (None or tuple of 5 ints): maximum shape of the chunks in which the
+      data is stored (in the order CTZYX). It defines which parts of the data
+      can be read quickly with open_data(). For instance, CUBE_CHUNKS allows
+      to read sub-cubes of spectrum data. If None, it is automatically selected.
+    compression (str): the compression filter used if compressed, one of
+      COMPRESSIONS. "lz4" and "zstd" are the fastest, but are only available
+      if hdf5plugin is installed, and the file can only be read by software
+      which also has these filters.
+    raise ValueError: if the compression is not available
     '''
     # TODO: add an argument to not do any clever data aggregation?
     if not isinstance(data, (list, tuple)):
         # TODO should probably not enforce it: respect duck typing
         assert(isinstance(data, model.DataArray))
         data = [data]
-    _saveAsHDF5(filename, data, thumbnail)
+    if not compressed:
+        compression = None
+    _saveAsHDF5(filename, data, thumbnail, compression, chunks=chunks)
+
+
+class AcquisitionWriter(object):
+    """
+    Writes an HDF5 file incrementally, so that an acquisition can be saved while
+    it is acquired, without having all the data in memory.
+    Each image is stored in a chunked dataset, which can be written block by
+    block, at any position and in any order. The length of some dimensions can
+    be unknown, in which case the dataset is extended as the data arrives. The
+    metadata and thumbnail are written when the file is closed, so they can
+    still be updated during the acquisition.
+    Contrarily to export(), the images are never merged along C.
+    This is the only writer which supports writing the data pixel by pixel
+    (eg, a spectrum cube acquired point by point). The TIFF writer needs
+    complete planes, in order.
+    Note: it is meant for acquisition code which knows the file name before
+    acquiring. The spectrum and temporal spectrum acquisition streams can write
+    their (large) data with it (see SEMCCDMDStream.dataWriter).
+    """
+
+    def __init__(self, filename, thumbnail=None, compressed=True,
+                 compression=DEFAULT_COMPRESSION):
+        """
+        filename (unicode): filename of the file to create (including path)
+        thumbnail (None or model.DataArray): see export()
+        compressed (boolean): whether the file is compressed or not.
+        compression (str): the compression filter used if compressed, see export()
+        raise ValueError: if the compression is not available
+        """
+        self._filters = _get_filters(compression if compressed else None)
+        # h5py will extend the current file by default, so we want to make sure
+        # there is no file at all.
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        self.filename = filename
+        self._f = h5py.File(filename, "w") # w will fail if file exists
+        self._thumbnail = thumbnail
+        # For each image: group, dataset, metadata, (min, max) of the data written
+        self._images = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_image(self, shape, dtype, metadata, chunks=True):
+        """
+        Creates a new (empty) image in the file
+        shape (tuple of (int or None)): the shape of the image, in the order
+          CTZYX. If it has less than 5 dimensions, the first ones are considered
+          of length 1 (except for RGB data, as CYX). If a length is None, the
+          dimension starts empty and is extended when data is written further.
+        dtype (numpy.dtype): the type of the data
+        metadata (dict str -> value): the metadata of the image. MD_DIMS, if
+          present, must be CTZYX (or CYX for RGB).
+        chunks (True or tuple of int): the shape of the chunks of the dataset.
+          If True, it is automatically selected. It is more efficient to pick
+          chunks close to the shape of the blocks written.
+        return (int): the index of the image
+        raise ValueError: if the dimensions are not supported
+        """
+        md = dict(metadata)
+        l = len(shape)
+        dims = md.get(model.MD_DIMS, "CTZYX"[-l::])
+        if dims == "CYX" and shape[0] in {3, 4}:
+            pass  # RGB
+        elif dims == "CTZYX"[-l::]:
+            # Extend the missing dimensions to 1
+            shape = (1,) * (5 - l) + tuple(shape)
+            if chunks is not True:
+                chunks = (1,) * (5 - l) + tuple(chunks)
+            dims = "CTZYX"
+        else:
+            raise ValueError("Dimensions %s not supported, should be CTZYX" % (dims,))
+        md[model.MD_DIMS] = dims
+
+        n = len(self._images)
+        ga = self._f.create_group("Acquisition%d" % n)
+        gi = ga.create_group("ImageData")
+        maxshape = tuple(shape)
+        shape = tuple(0 if s is None else s for s in maxshape)
+        ids = gi.create_dataset("Image", shape=shape, dtype=dtype, maxshape=maxshape,
+                                chunks=chunks, **self._filters)
+        self._images.append([ga, ids, md, None])
+        return n
+
+    def write(self, n, data, offset=None):
+        """
+        Writes a block of data in an image
+        n (int): the index of the image, as returned by add_image()
+        data (numpy.ndarray): the block of data. If it has less dimensions than
+          the image, the first dimensions are considered of length 1.
+        offset (None or tuple of int): the position in the image of the first
+          element of the block. If it has less dimensions than the image, the
+          first dimensions are considered to be at 0. None is the same as all 0's.
+        raise ValueError: if the block doesn't fit in the image
+        """
+        image = self._images[n]
+        ids = image[1]
+        if data.ndim > ids.ndim:
+            raise ValueError("Data of shape %s has more dimensions than the image (%s)" %
+                             (data.shape, ids.shape))
+        data = data.reshape((1,) * (ids.ndim - data.ndim) + data.shape)
+        if offset is None:
+            offset = ()
+        offset = (0,) * (ids.ndim - len(offset)) + tuple(offset)
+
+        # Extend the dataset if the data is further than the current end
+        for i, (o, s) in enumerate(zip(offset, data.shape)):
+            if o + s > ids.shape[i]:
+                if ids.maxshape[i] is not None:
+                    raise ValueError("Data of shape %s at %s doesn't fit in image of shape %s" %
+                                     (data.shape, offset, ids.shape))
+                ids.resize(o + s, axis=i)
+
+        with _bloscThreads(self._filters):
+            ids[tuple(slice(o, o + s) for o, s in zip(offset, data.shape))] = data
+
+        # Update the range of the image, for the IMAGE_MINMAXRANGE attribute
+        if data.size:
+            dmin, dmax = data.min(), data.max()
+            if image[3] is not None:
+                dmin, dmax = min(dmin, image[3][0]), max(dmax, image[3][1])
+            image[3] = dmin, dmax
+
+    def append(self, n, data):
+        """
+        Writes a block of data at the end of the image, along the first dimension
+          which has an unknown length.
+        n (int): the index of the image, as returned by add_image()
+        data (numpy.ndarray): the block of data. If it has less dimensions than
+          the image, the first dimensions are considered of length 1.
+        raise ValueError: if the image has no dimension with an unknown length
+        """
+        ids = self._images[n][1]
+        try:
+            axis = ids.maxshape.index(None)
+        except ValueError:
+            raise ValueError("Image %d has no dimension to append data to" % (n,))
+        offset = [0] * ids.ndim
+        offset[axis] = ids.shape[axis]
+        self.write(n, data, offset)
+
+    def get_image(self, n):
+        """
+        Gives access to an image being written, to read it back
+        n (int): the index of the image, as returned by add_image()
+        return (DataArrayShadow): the image, with its metadata. The data can
+          only be read until the writer is closed.
+        """
+        ga, ids, md, drange = self._images[n]
+        return DataArrayShadowHDF5(ids, (), ids.shape, ids.dtype, md)
+
+    def update_metadata(self, n, metadata):
+        """
+        Updates the metadata of an image
+        n (int): the index of the image, as returned by add_image()
+        metadata (dict str -> value): the metadata to update
+        """
+        md = self._images[n][2]
+        md.update(metadata)
+
+    def set_thumbnail(self, thumbnail):
+        """
+        thumbnail (None or model.DataArray): see export()
+        """
+        self._thumbnail = thumbnail
+
+    def close(self):
+        """
+        Writes the metadata and the thumbnail, and closes the file
+        """
+        if self._f is None:
+            return
+
+        # The last chunks of data are compressed when the file is closed
+        with _bloscThreads(self._filters):
+            if self._thumbnail is not None:
+                _add_thumbnail(self._f, self._thumbnail, self._filters)
+
+            for ga, ids, md, drange in self._images:
+                # The metadata is written based on a DataArray of the final shape,
+                # but which doesn't use any memory.
+                da = model.DataArray(numpy.broadcast_to(numpy.zeros((), dtype=ids.dtype), ids.shape), md)
+                da = _mergeCorrectionMetadata(da)
+                # StateEnumeration
+                _h5py_enum_commit(ga, b"StateEnumeration", _dtstate)
+                _add_image_class(ids, lambda: drange or (0, 0))
+                _add_image_info(ga["ImageData"], ids, da)
+                _add_image_metadata(ga, da, None)
+                _add_svi_info(ga)
+
+            self._f.close()
+        self._f = None
 
 
 def read_data(filename):
@@ -1553,6 +1989,24 @@ def read_data(filename):
     return _dataFromHDF5(filename)
 
 
+def open_data(filename, tiled=False):
+    """
+    Opens an HDF5 file, and return an AcquisitionData instance. The data is only
+    read when needed, so that it's possible to quickly access a part of the data,
+    even if the file is very large.
+    filename (unicode): filename of the file to read
+    tiled (bool): if True, the 2D images can also be read by tiles (getTile()).
+      As the file contains no sub-resolution images, a tile at a low zoom level
+      is computed from the whole area at full resolution, which is slower than
+      reading the whole image once. So it's only worthy if the caller mostly
+      reads small parts of large images.
+    return (AcquisitionData): an opened file
+    raises:
+        IOError in case the file format is not as expected.
+    """
+    return AcquisitionDataHDF5(filename, tiled)
+
+
 def read_thumbnail(filename):
     """
     Read the thumbnail data of a given HDF5 file.
@@ -1567,3 +2021,151 @@ def read_thumbnail(filename):
 
     return _thumbFromHDF5(filename)
 
+
+
+
+class DataArrayShadowHDF5(DataArrayShadow):
+    """
+    Represents an image stored in an HDF5 dataset. The data is only read when
+    requested: either fully, by selecting a part of it (ie, like a numpy array),
+    or, if the image is 2D, by tile.
+    """
+
+    def __init__(self, dataset, index, shape, dtype, metadata=None, tiled=False):
+        """
+        dataset (h5py.Dataset): the dataset containing the image
+        index (tuple of int): the position of the image in the dataset, if the
+          dataset contains several images (ie, one per channel). Empty if the
+          dataset contains just this image.
+        shape (tuple of int): The shape of the corresponding DataArray
+        dtype (numpy.dtype): The data type
+        metadata (dict str->val): The metadata
+        tiled (bool): if True, and the image is 2D, it can be read by tiles
+        """
+        self._dataset = dataset
+        self._index = index
+
+        md = metadata if metadata else {}
+        dims = md.get(model.MD_DIMS, "CTZYX"[-len(shape)::])
+        # Tiles are only available if all the dimensions except X and Y are of
+        # length 1. As there are no sub-resolution images in the file, the
+        # zoom levels are just computed as for pyramidal TIFF files.
+        if tiled and len(dims) == len(shape) and "X" in dims and "Y" in dims and all(
+                l == 1 for l, d in zip(shape, dims) if d not in "XY"):
+            width, height = shape[dims.index("X")], shape[dims.index("Y")]
+            maxzoom = 0
+            while width >= TILE_SIZE and height >= TILE_SIZE:
+                maxzoom += 1
+                width //= 2
+                height //= 2
+            DataArrayShadow.__init__(self, shape, dtype, md, maxzoom=maxzoom,
+                                     tile_shape=(TILE_SIZE, TILE_SIZE))
+        else:
+            DataArrayShadow.__init__(self, shape, dtype, md)
+
+    def getData(self):
+        """
+        Fetches the whole data (at full resolution) of image.
+        If the dataset is stored uncompressed and contiguous, the file is
+        memory-mapped instead of read, so only the parts of the data actually
+        accessed are loaded, and the memory can be reclaimed by the OS. The
+        array can be modified, but the changes are never written to the file.
+        return DataArray: the data, with its metadata
+        """
+        ds = self._dataset
+        if ds.chunks is None and ds.compression is None and not getattr(ds, "external", None):
+            try:
+                offset = ds.id.get_offset()
+            except Exception:  # Older h5py, or data not yet allocated
+                offset = None
+            if offset is not None:
+                data = numpy.memmap(ds.file.filename, dtype=ds.dtype, mode="c",
+                                    offset=offset, shape=ds.shape)
+                return model.DataArray(data[self._index], self.metadata.copy())
+
+        return self[...]
+
+    def __getitem__(self, key):
+        """
+        Reads only the selected part of the data.
+        key (int, slice, Ellipsis, or tuple of them): the selection, as for a
+          numpy array. Only "basic" indexing is supported, with positive steps.
+        return (DataArray): the data selected, with a copy of the metadata
+          (which is not updated, even if some dimensions are removed)
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        data = self._dataset[self._index + key]
+        return model.DataArray(data, self.metadata.copy())
+
+    def getTile(self, x, y, zoom):
+        """
+        Fetches one tile
+        x (0<=int): X index of the tile.
+        y (0<=int): Y index of the tile
+        zoom (0<=int): zoom level to use. The total shape of the image is shape / 2**zoom.
+            The number of tiles available in an image is ceil((shape//zoom)/tile_shape)
+            As the file doesn't contain sub-resolution images, the whole area
+            of the tile is read at full resolution, and then reduced.
+        return:
+            tile (DataArray): tile containing the image data and the relevant
+              metadata. It has the same number of dimensions as the image.
+        raise ValueError: if the tile doesn't exist
+        """
+        if not hasattr(self, "maxzoom"):
+            raise ValueError("Image of shape %s cannot be read by tiles" % (self.shape,))
+        if not 0 <= zoom <= self.maxzoom:
+            raise ValueError("Invalid Z value %d" % (zoom,))
+
+        dims = self.metadata.get(model.MD_DIMS, "CTZYX"[-self.ndim::])
+        xi, yi = dims.index("X"), dims.index("Y")
+        z = 2 ** zoom
+        tw, th = self.tile_shape
+        # Size of the image, and of the tile, at the zoom level
+        width, height = self.shape[xi] // z, self.shape[yi] // z
+        w, h = min(tw, width - x * tw), min(th, height - y * th)
+        if x < 0 or y < 0 or w <= 0 or h <= 0:
+            raise ValueError("Invalid tile %d, %d at zoom %d" % (x, y, zoom))
+
+        # Read the whole area of the tile: reading only one pixel every z would
+        # not be faster, as the data is read by (complete) chunks anyway.
+        key = [slice(None)] * self.ndim
+        key[xi] = slice(x * tw * z, (x * tw + w) * z)
+        key[yi] = slice(y * th * z, (y * th + h) * z)
+        tile = self[tuple(key)]
+        if z > 1:
+            # Each pixel of the tile is the mean of the z x z pixels it covers
+            # (same as img.rescale_hq(), but it supports any dtype). All the
+            # other dimensions are of length 1, so it's just a 2D image.
+            plane = numpy.moveaxis(tile, (yi, xi), (0, 1)).reshape(h, z, w, z)
+            plane = plane.mean(axis=(1, 3))
+            if numpy.issubdtype(tile.dtype, numpy.integer):
+                plane = numpy.round(plane)
+            plane = plane.astype(tile.dtype).reshape((h, w) + (1,) * (self.ndim - 2))
+            tile = model.DataArray(numpy.moveaxis(plane, (0, 1), (yi, xi)), tile.metadata)
+
+        orig_pixel_size = self.metadata.get(model.MD_PIXEL_SIZE, (1, 1))
+        # calculate the pixel size of the tile for the zoom level
+        tile.metadata[model.MD_PIXEL_SIZE] = tuple(ps * z for ps in orig_pixel_size)
+        # calculate the center of the tile
+        tile.metadata[model.MD_POS] = get_tile_md_pos((x, y), self.tile_shape, tile, self)
+
+        return tile
+
+
+class AcquisitionDataHDF5(AcquisitionData):
+    """
+    Implements AcquisitionData for HDF5 files
+    """
+
+    def __init__(self, filename, tiled=False):
+        """
+        Constructor
+        filename (string): The name of the HDF5 file
+        tiled (bool): see open_data()
+        """
+        # The file stays opened as long as the data might be read
+        self._file = h5py.File(filename, "r")
+        data = _shadowsFromHDF5(self._file, tiled)
+        thumbnails = _thumbShadowsFromHDF5(self._file)
+        AcquisitionData.__init__(self, tuple(data), tuple(thumbnails))
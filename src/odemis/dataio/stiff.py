@@ -37,7 +37,8 @@ LOSSY = False
 # identifier of a file.
 
 
-def export(filename, data, thumbnail=None, compressed=True, pyramid=False):
+def export(filename, data, thumbnail=None, compressed=True, pyramid=False,
+           compression=tiff.DEFAULT_COMPRESSION):
     '''
     Write a collection of multiple OME-TIFF files with the given images and 
     metadata
@@ -50,5 +51,7 @@ def export(filename, data, thumbnail=None, compressed=True, pyramid=False):
       with last dimension of length 3 (RGB). If the exporter doesn't support it,
       it will be dropped silently.
     compressed (boolean): whether the file is compressed or not.
+    compression (str): the compression type used if compressed, see tiff.export()
     '''
-    tiff.export(filename, data, thumbnail, compressed, multiple_files=True, pyramid=pyramid)
+    tiff.export(filename, data, thumbnail, compressed, multiple_files=True, pyramid=pyramid,
+                compression=compression)
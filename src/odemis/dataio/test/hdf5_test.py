@@ -1253,6 +1253,203 @@ class TestHDF5IO(unittest.TestCase):
         owl = rdata[0].metadata[model.MD_OUT_WL]  # nm
         self.assertEqual(owl, ldata[0].metadata[model.MD_OUT_WL])
 
+    def testAcquisitionWriter(self):
+        """
+        Check the data written incrementally is the same as exported at once
+        """
+        md_spec = {model.MD_DESCRIPTION: "spectrum",
+                   model.MD_ACQ_DATE: time.time(),
+                   model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+                   model.MD_POS: (1e-3, -30e-3),
+                   model.MD_WL_LIST: [500e-9 + i * 1e-9 for i in range(50)],
+                   model.MD_DIMS: "CTZYX",
+                   }
+        md_sem = {model.MD_DESCRIPTION: "sem",
+                  model.MD_ACQ_DATE: time.time(),
+                  model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+                  model.MD_POS: (1e-3, -30e-3),
+                  model.MD_DWELL_TIME: 1e-6,
+                  }
+        spec = numpy.random.randint(0, 4000, (50, 1, 1, 30, 40)).astype(numpy.uint16)
+        sem = numpy.random.random((30, 40)).astype(numpy.float32)
+        ldata = [model.DataArray(spec, md_spec), model.DataArray(sem, md_sem)]
+        thumbnail = model.DataArray(numpy.zeros((100, 90, 3), dtype=numpy.uint8))
+
+        hdf5.export(FILENAME, ldata, thumbnail)
+        exp_data = hdf5.read_data(FILENAME)
+        os.remove(FILENAME)
+
+        with hdf5.AcquisitionWriter(FILENAME) as writer:
+            nspec = writer.add_image(spec.shape, spec.dtype, md_spec, chunks=(50, 1, 1, 1, 40))
+            nsem = writer.add_image(sem.shape, sem.dtype, {})
+            # Pass the data pixel by pixel, as during a spectrum acquisition
+            for y in range(spec.shape[-2]):
+                for x in range(spec.shape[-1]):
+                    writer.write(nspec, spec[:, :, :, y:y + 1, x:x + 1], (0, 0, 0, y, x))
+                writer.write(nsem, sem[y], (y, 0))
+
+            # Data too big
+            with self.assertRaises(ValueError):
+                writer.write(nsem, sem, (1, 0))
+            # No unknown dimension
+            with self.assertRaises(ValueError):
+                writer.append(nsem, sem)
+
+            # The metadata and thumbnail can be set at the end
+            writer.update_metadata(nsem, md_sem)
+            writer.set_thumbnail(thumbnail)
+
+        rdata = hdf5.read_data(FILENAME)
+        self.assertEqual(len(rdata), len(exp_data))
+        for rd, ed in zip(rdata, exp_data):
+            numpy.testing.assert_array_equal(rd, ed)
+            self.assertEqual(rd.metadata, ed.metadata)
+        self.assertEqual(len(hdf5.read_thumbnail(FILENAME)), 1)
+
+    def testAcquisitionWriterAppend(self):
+        """
+        Check the data can be appended along a dimension of unknown length
+        """
+        md = {model.MD_DESCRIPTION: "time series",
+              model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+              model.MD_POS: (1e-3, -30e-3),
+              }
+        frames = numpy.random.randint(0, 4000, (7, 30, 40)).astype(numpy.uint16)
+        with hdf5.AcquisitionWriter(FILENAME, compressed=False) as writer:
+            n = writer.add_image((1, None, 1, 30, 40), frames.dtype, md)
+            for f in frames:
+                writer.append(n, f)
+
+        rdata = hdf5.read_data(FILENAME)
+        self.assertEqual(len(rdata), 1)
+        self.assertEqual(rdata[0].shape, (1, 7, 1, 30, 40))
+        numpy.testing.assert_array_equal(rdata[0][0, :, 0], frames)
+
+    def testExportCompression(self):
+        """
+        Check the data is identical with every compression available
+        """
+        data = model.DataArray(numpy.random.randint(0, 4000, (1, 1, 1, 300, 270)).astype(numpy.uint16),
+                               {model.MD_PIXEL_SIZE: (1e-6, 1e-6), model.MD_POS: (1e-3, -30e-3)})
+        self.assertIn(hdf5.DEFAULT_COMPRESSION, hdf5.COMPRESSIONS)
+        for compression in [None] + list(hdf5.COMPRESSIONS.keys()):
+            hdf5.export(FILENAME, data, compression=compression)
+            rdata = hdf5.read_data(FILENAME)
+            numpy.testing.assert_array_equal(rdata[0], data)
+
+            with hdf5.AcquisitionWriter(FILENAME, compression=compression) as writer:
+                n = writer.add_image(data.shape, data.dtype, data.metadata)
+                writer.write(n, data)
+            rdata = hdf5.read_data(FILENAME)
+            numpy.testing.assert_array_equal(rdata[0], data)
+
+        with self.assertRaises(ValueError):
+            hdf5.export(FILENAME, data, compression="szip")
+
+    def testOpenData(self):
+        """
+        Check the data can be read lazily, and is the same as with read_data()
+        """
+        md_spec = {model.MD_DESCRIPTION: "spectrum",
+                   model.MD_ACQ_DATE: time.time(),
+                   model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+                   model.MD_POS: (1e-3, -30e-3),
+                   model.MD_WL_LIST: [500e-9 + i * 1e-9 for i in range(100)],
+                   }
+        md_sem = {model.MD_DESCRIPTION: "sem",
+                  model.MD_ACQ_DATE: time.time(),
+                  model.MD_PIXEL_SIZE: (1e-7, 1e-7),
+                  model.MD_POS: (1e-3, -30e-3),
+                  }
+        md_fluo = [{model.MD_DESCRIPTION: "fluo%d" % i,
+                    model.MD_ACQ_DATE: time.time(),
+                    model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+                    model.MD_POS: (1e-3, -30e-3),
+                    model.MD_IN_WL: (500e-9 + i * 100e-9, 520e-9 + i * 100e-9),
+                    model.MD_OUT_WL: (600e-9 + i * 100e-9, 620e-9 + i * 100e-9),
+                    } for i in range(2)]
+        spec = numpy.random.randint(0, 4000, (100, 1, 1, 70, 90)).astype(numpy.uint16)
+        sem = numpy.random.randint(0, 4000, (600, 520)).astype(numpy.uint16)
+        fluo = [numpy.random.randint(0, 4000, (1, 1, 1, 50, 60)).astype(numpy.uint16)
+                for md in md_fluo]
+        ldata = ([model.DataArray(spec, md_spec), model.DataArray(sem, md_sem)] +
+                 [model.DataArray(f, md) for f, md in zip(fluo, md_fluo)])
+        thumbnail = model.DataArray(numpy.zeros((100, 90, 3), dtype=numpy.uint8))
+
+        hdf5.export(FILENAME, ldata, thumbnail, chunks=hdf5.CUBE_CHUNKS)
+        f = h5py.File(FILENAME, "r")
+        self.assertEqual(f["Acquisition0/ImageData/Image"].chunks, (64, 1, 1, 64, 64))
+        f.close()
+
+        exp_data = hdf5.read_data(FILENAME)
+        acd = hdf5.open_data(FILENAME)
+        self.assertEqual(len(acd.content), len(exp_data))
+        self.assertEqual(len(acd.thumbnails), 1)
+        self.assertEqual(acd.thumbnails[0].shape, thumbnail.shape)
+        for sd, ed in zip(acd.content, exp_data):
+            self.assertEqual(sd.shape, ed.shape)
+            self.assertEqual(sd.dtype, ed.dtype)
+            self.assertEqual(sd.metadata, ed.metadata)
+            d = sd.getData()
+            numpy.testing.assert_array_equal(d, ed)
+            self.assertEqual(d.metadata, ed.metadata)
+
+        # Select just a few wavelengths
+        sspec = acd.content[0]
+        self.assertFalse(hasattr(sspec, "maxzoom"))  # Not a 2D image
+        numpy.testing.assert_array_equal(sspec[10:12], spec[10:12])
+        numpy.testing.assert_array_equal(sspec[:, 0, 0, 5, 7], spec[:, 0, 0, 5, 7])
+
+        # The channels of fluorescence images merged are still separated
+        numpy.testing.assert_array_equal(acd.content[3][0, 0, 10], fluo[1][0, 0, 0, 10])
+
+        # Tiles are only available on request
+        self.assertFalse(hasattr(acd.content[1], "maxzoom"))
+        acd = hdf5.open_data(FILENAME, tiled=True)
+        ssem = acd.content[1]
+        self.assertEqual(ssem.maxzoom, 2)
+        tile = ssem.getTile(0, 0, 0)
+        numpy.testing.assert_array_equal(tile[0, 0, 0], sem[:256, :256])
+        self.assertEqual(tile.metadata[model.MD_PIXEL_SIZE], (1e-7, 1e-7))
+        tile = ssem.getTile(2, 2, 0)  # bottom-right, smaller than a full tile
+        numpy.testing.assert_array_equal(tile[0, 0, 0], sem[512:, 512:])
+        tile = ssem.getTile(1, 0, 1)
+        self.assertEqual(tile.shape[-2:], (256, 260 - 256))
+        # Each pixel is the mean of the 2x2 pixels at full resolution
+        exp_tile = sem[:512, 512:520].reshape(256, 2, 4, 2).mean(axis=(1, 3))
+        numpy.testing.assert_array_equal(tile[0, 0, 0], numpy.round(exp_tile).astype(sem.dtype))
+        self.assertEqual(tile.metadata[model.MD_PIXEL_SIZE], (2e-7, 2e-7))
+        with self.assertRaises(ValueError):
+            ssem.getTile(3, 0, 0)
+        with self.assertRaises(ValueError):
+            ssem.getTile(0, 0, 3)
+
+    def testOpenDataUncompressed(self):
+        """
+        Check the data of an uncompressed file is memory-mapped by getData()
+        """
+        md = {model.MD_DESCRIPTION: "spectrum",
+              model.MD_ACQ_DATE: time.time(),
+              model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+              model.MD_WL_LIST: [500e-9 + i * 1e-9 for i in range(100)],
+              }
+        spec = numpy.random.randint(0, 4000, (100, 1, 1, 70, 90)).astype(numpy.uint16)
+        hdf5.export(FILENAME, model.DataArray(spec, md), compressed=False)
+
+        acd = hdf5.open_data(FILENAME)
+        d = acd.content[0].getData()
+        base = d.base
+        while base is not None and not isinstance(base, numpy.memmap):
+            base = base.base
+        self.assertIsInstance(base, numpy.memmap)
+        numpy.testing.assert_array_equal(d, spec)
+        self.assertEqual(d.metadata[model.MD_WL_LIST], md[model.MD_WL_LIST])
+
+        # Modifying the data doesn't change the file
+        d[0, 0, 0, 0, 0] = spec[0, 0, 0, 0, 0] + 1
+        rdata = hdf5.read_data(FILENAME)
+        numpy.testing.assert_array_equal(rdata[0], spec)
+
     def testReadMDTime(self):
         """
         Checks that we can read back the metadata of an acquisition with time correlation
@@ -23,9 +23,11 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 # Don't import unicode_literals to avoid issues with external functions. Code works on python2 and python3.
 from __future__ import division
 
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import libtiff
 import logging
+import math
 import numpy
 from numpy.polynomial import polynomial
 from odemis import model
@@ -46,6 +48,8 @@ import xml.etree.ElementTree as ET
 logging.getLogger().setLevel(logging.DEBUG)
 
 FILENAME = u"test" + tiff.EXTENSIONS[0]
+
+
 class TestTiffIO(unittest.TestCase):
 
     def tearDown(self):
@@ -1890,12 +1894,66 @@ class TestTiffIO(unittest.TestCase):
         # read the subimage
         subimage = im.read_image()
         self.assertEqual(subimage.shape, (147, 128))
-        # Checking the values in the corner of the tile. The downsampling uses
-        # the neighbour pixels to calculate a pixel in the resized image.
-        self.assertEqual(subimage[0][0], 130)
-        self.assertEqual(subimage[0][-1], 385)
-        self.assertEqual(subimage[-1][0], 9893)
-        self.assertEqual(subimage[-1][-1], 10148)
+        # Checking the values in the corner of the tile. The downsampling
+        # averages every 2x2 pixels (and drops the last odd row/column).
+        self.assertEqual(subimage[0][0], 129)
+        self.assertEqual(subimage[0][-1], 383)
+        self.assertEqual(subimage[-1][0], 9637)
+        self.assertEqual(subimage[-1][-1], 9891)
+
+    def testPyramidLevels(self):
+        """
+        Checks the sub-resolution images are 2x2 averages of the previous level,
+        without accumulating the rounding errors
+        """
+        size = (1031, 600)
+        arr = numpy.random.randint(0, 2 ** 12, size[::-1]).astype(numpy.uint16)
+        data = model.DataArray(arr, metadata={model.MD_PIXEL_SIZE: (1e-6, 1e-6)})
+
+        shapes = tiff._genResizedShapes(data)
+        levels = list(tiff._genPyramidLevels(data))
+        self.assertEqual([l.shape for l in levels], shapes)
+        self.assertEqual(shapes, [(300, 515), (150, 257)])
+
+        for z, l in enumerate(levels, 1):
+            # Each pixel is the average of the pixels it covers in the full image
+            h, w, s = l.shape[0], l.shape[1], 2 ** z
+            exp = arr[:h * s, :w * s].reshape(h, s, w, s).mean(axis=(1, 3))
+            numpy.testing.assert_allclose(l, exp, atol=0.5)
+        self.assertEqual(levels[-1].metadata[model.MD_PIXEL_SIZE], (4e-6, 4e-6))
+
+    def testExportPyramidStreamingLevels(self):
+        """
+        Checks the sub-resolution images can be passed one by one to write_image()
+        """
+        size = (600, 400)
+        arr = numpy.zeros(size[::-1], dtype=numpy.uint8)
+        data = model.DataArray(arr)
+        shapes = tiff._genResizedShapes(data)
+        self.assertEqual(len(shapes), 1)
+
+        def gen_levels():
+            for i, s in enumerate(shapes):
+                yield model.DataArray(numpy.full(s, i + 1, dtype=numpy.uint8))
+
+        f = libtiff.TIFF.open(FILENAME, mode="w")
+        tiff.write_image(f, data, pyramid=True, levels=gen_levels())
+        f.close()
+
+        im = libtiff.TIFF.open(FILENAME)
+        sub_ifds = im.GetField(T.TIFFTAG_SUBIFD)
+        self.assertEqual(len(sub_ifds), 1)
+        im.SetSubDirectory(sub_ifds[0])
+        subimage = im.read_image()
+        self.assertEqual(subimage.shape, shapes[0])
+        self.assertTrue(numpy.all(subimage == 1))
+
+        # Wrong shape of a level => error
+        f = libtiff.TIFF.open(FILENAME, mode="w")
+        with self.assertRaises(ValueError):
+            tiff.write_image(f, data, pyramid=True,
+                             levels=[model.DataArray(numpy.zeros((10, 10), dtype=numpy.uint8))])
+        f.close()
 
     def testExportThinPyramid(self):           
         """
@@ -2162,6 +2220,177 @@ class TestTiffIO(unittest.TestCase):
             # the image is not tiled
             rdata.content[0].getTile(0, 0, 0)
 
+    def testAcquisitionWriter(self):
+        """
+        Check the data written incrementally is the same as exported at once
+        """
+        md_spec = {model.MD_DESCRIPTION: "spectrum",
+                   model.MD_ACQ_DATE: time.time(),
+                   model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+                   model.MD_POS: (1e-3, -30e-3),
+                   model.MD_WL_LIST: [500e-9 + i * 1e-9 for i in range(5)],
+                   model.MD_DIMS: "CTZYX",
+                   }
+        md_sem = {model.MD_DESCRIPTION: "sem",
+                  model.MD_ACQ_DATE: time.time(),
+                  model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+                  model.MD_POS: (1e-3, -30e-3),
+                  }
+        md_rgb = {model.MD_DESCRIPTION: "rgb",
+                  model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+                  model.MD_POS: (1e-3, -30e-3),
+                  model.MD_DIMS: "YXC",
+                  }
+        spec = numpy.random.randint(0, 4000, (5, 1, 1, 300, 270)).astype(numpy.uint16)
+        sem = numpy.random.random((300, 270)).astype(numpy.float32)
+        rgb = numpy.random.randint(0, 255, (300, 270, 3)).astype(numpy.uint8)
+        ldata = [model.DataArray(spec, md_spec),
+                 model.DataArray(sem, md_sem),
+                 model.DataArray(rgb, md_rgb)]
+        thumbnail = model.DataArray(numpy.zeros((100, 90, 3), dtype=numpy.uint8))
+
+        tiff.export(FILENAME, ldata, thumbnail)
+        exp_data = tiff.read_data(FILENAME)
+        os.remove(FILENAME)
+
+        images = [(da.shape, da.dtype, da.metadata) for da in ldata]
+        with tiff.AcquisitionWriter(FILENAME, images, thumbnail) as writer:
+            # Pass the data in blocks of rows of various sizes
+            for c in range(spec.shape[0]):
+                for y in range(0, 300, 100):
+                    writer.write(spec[c, 0, 0, y:y + 100])
+            writer.write(sem[:7])
+            writer.write(sem[7:])
+            for y in range(0, 300, 60):
+                writer.write(rgb[y:y + 60])
+
+            # No more data expected
+            with self.assertRaises(ValueError):
+                writer.write(sem[:10])
+
+        rdata = tiff.read_data(FILENAME)
+        self.assertEqual(len(rdata), len(exp_data))
+        for rd, ed in zip(rdata, exp_data):
+            numpy.testing.assert_array_equal(rd, ed)
+            self.assertEqual(rd.metadata, ed.metadata)
+        self.assertEqual(len(tiff.read_thumbnail(FILENAME)), 1)
+
+    def testAcquisitionWriterIncomplete(self):
+        """
+        Check the file is still valid if not all the data has been written
+        """
+        md = {model.MD_DESCRIPTION: "sem",
+              model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+              model.MD_POS: (1e-3, -30e-3),
+              }
+        sem = numpy.random.randint(1, 4000, (2, 1, 1, 300, 270)).astype(numpy.uint16)
+        writer = tiff.AcquisitionWriter(FILENAME, [(sem.shape, sem.dtype, md)], compressed=False)
+
+        # Wrong shape
+        with self.assertRaises(ValueError):
+            writer.write(sem[0, 0, 0, :, :100])
+        with self.assertRaises(ValueError):
+            writer.write(numpy.zeros((301, 270), dtype=sem.dtype))
+
+        writer.write(sem[0, 0, 0, :150])
+        writer.close()
+
+        rdata = tiff.read_data(FILENAME)
+        self.assertEqual(len(rdata), 1)
+        self.assertEqual(rdata[0].shape, sem.shape)
+        numpy.testing.assert_array_equal(rdata[0][0, 0, 0, :150], sem[0, 0, 0, :150])
+        self.assertTrue(numpy.all(rdata[0][0, 0, 0, 150:] == 0))
+        self.assertTrue(numpy.all(rdata[0][1] == 0))
+
+    def testExportCompression(self):
+        """
+        Check the data is identical with every compression available
+        """
+        data = model.DataArray(numpy.random.randint(0, 4000, (1, 1, 1, 300, 270)).astype(numpy.uint16),
+                               {model.MD_PIXEL_SIZE: (1e-6, 1e-6), model.MD_POS: (1e-3, -30e-3)})
+        self.assertIn(tiff.DEFAULT_COMPRESSION, tiff.COMPRESSIONS)
+        for compression in tiff.COMPRESSIONS:
+            tiff.export(FILENAME, data, compression=compression)
+            rdata = tiff.read_data(FILENAME)
+            # The reader drops the leading dimensions of length 1
+            numpy.testing.assert_array_equal(rdata[0], data[0, 0, 0])
+
+            with tiff.AcquisitionWriter(FILENAME, [(data.shape, data.dtype, data.metadata)],
+                                        compression=compression) as writer:
+                writer.write(data[0, 0, 0])
+            rdata = tiff.read_data(FILENAME)
+            numpy.testing.assert_array_equal(rdata[0], data[0, 0, 0])
+
+        with self.assertRaises(ValueError):
+            tiff.export(FILENAME, data, compression="rle")
+        # No compression => the compression type doesn't matter
+        tiff.export(FILENAME, data, compressed=False, compression="rle")
+
+    def testAcquisitionDataTIFFParallelTiles(self):
+        """
+        Read the tiles from multiple threads, and several times (from the cache)
+        """
+        size = (1000, 700)
+        md = {
+            model.MD_DIMS: 'YX',
+            model.MD_POS: (5.0, 7.0),
+            model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+        }
+        arr = numpy.arange(size[0] * size[1], dtype=numpy.uint16).reshape(size[::-1])
+        data = model.DataArray(arr, metadata=md)
+        tiff.export(FILENAME, data, pyramid=True)
+
+        rdata = tiff.open_data(FILENAME)
+        das = rdata.content[0]
+        coords = [(x, y, z) for z in range(das.maxzoom + 1)
+                  for x in range(int(math.ceil(size[0] / 2 ** z / 256)))
+                  for y in range(int(math.ceil(size[1] / 2 ** z / 256)))]
+        exp_tiles = [das.getTile(x, y, z) for x, y, z in coords]
+        numpy.testing.assert_array_equal(exp_tiles[0], arr[:256, :256])
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for i in range(3):
+                tiles = list(executor.map(lambda c: das.getTile(*c), coords))
+                for t, et in zip(tiles, exp_tiles):
+                    numpy.testing.assert_array_equal(t, et)
+                    self.assertEqual(t.metadata, et.metadata)
+
+        # The metadata of a tile can be modified without affecting the next ones
+        tile = das.getTile(0, 0, 0)
+        tile.metadata[model.MD_POS] = (0, 0)
+        self.assertEqual(das.getTile(0, 0, 0).metadata[model.MD_POS], exp_tiles[0].metadata[model.MD_POS])
+
+        # Overwrite the file => new tiles
+        tiff.export(FILENAME, model.DataArray(arr[:, ::-1].copy(), metadata=md), pyramid=True)
+        rdata = tiff.open_data(FILENAME)
+        numpy.testing.assert_array_equal(rdata.content[0].getTile(0, 0, 0), arr[:256, ::-1][:, :256])
+
+    def testAcquisitionDataTIFFReplaced(self):
+        """
+        Check the tiles are still read from the file opened, after it's replaced or deleted
+        """
+        size = (1000, 700)
+        md = {
+            model.MD_DIMS: 'YX',
+            model.MD_POS: (5.0, 7.0),
+            model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+        }
+        arr = numpy.arange(size[0] * size[1], dtype=numpy.uint16).reshape(size[::-1])
+        tiff.export(FILENAME, model.DataArray(arr, md), pyramid=True)
+
+        rdata = tiff.open_data(FILENAME)
+        das = rdata.content[0]
+        numpy.testing.assert_array_equal(das.getTile(0, 0, 0), arr[:256, :256])
+
+        # Replace the file by another one with different data
+        other_fn = "other" + tiff.EXTENSIONS[0]
+        tiff.export(other_fn, model.DataArray(arr[::-1].copy(), md), pyramid=True)
+        os.rename(other_fn, FILENAME)
+        numpy.testing.assert_array_equal(das.getTile(1, 0, 0), arr[:256, 256:512])
+
+        os.remove(FILENAME)
+        numpy.testing.assert_array_equal(das.getTile(0, 1, 0), arr[256:512, :256])
+
     def testAcquisitionDataTIFFLargerFile(self):
 
         def getSubData(dast, zoom, rect):
@@ -25,6 +25,7 @@ from past.builtins import basestring
 from builtins import range
 
 import calendar
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import json
 from libtiff import TIFF
@@ -71,6 +72,117 @@ CAN_SAVE_PYRAMID = True # indicates the support for pyramidal export
 TILE_SIZE = 256 # Tile size of pyramidal images
 LOSSY = False
 
+
+def _isCodecConfigured(name):
+    """
+    name (str): name of the compression, as in the libtiff COMPRESSION_* constants
+    return (bool): True if the libtiff library can write data with this compression
+    """
+    try:
+        scheme = getattr(T, "COMPRESSION_" + name.upper())
+        return bool(T.libtiff.TIFFIsCODECConfigured(scheme))
+    except AttributeError:  # Too old version of libtiff or pylibtiff
+        return False
+
+
+# Compressions available, by name (as in the libtiff COMPRESSION_* constants).
+# All of them are lossless, and support the horizontal differencing predictor,
+# which makes images of more than 8 bits much more compressible.
+COMPRESSIONS = ["lzw", "adobe_deflate"]
+# zstd is the fastest, but only supported by recent software
+COMPRESSIONS += [c for c in ("zstd", "lzma") if _isCodecConfigured(c)]
+# According to this page: http://www.openmicroscopy.org/site/support/file-formats/ome-tiff/ome-tiff-data
+# LZW is a good trade-off between compatibility and small size (reduces file
+# size by about 2). It's also faster than deflate. => that's why we use it by default
+DEFAULT_COMPRESSION = "lzw"
+
+# Tiles read from pyramidal images, shared by all the opened files of the
+# process (contrarily to the cache of projected tiles, which is per projection).
+# (file path, modification time, size, directory, zoom, x, y) -> DataArray (read-only)
+TILE_CACHE_SIZE = 256 * 1024 ** 2  # bytes
+_tile_cache = util.LRUCache(TILE_CACHE_SIZE, sizeof=lambda t: t.nbytes)
+
+# Maximum number of handles kept open per file, when they are not used
+MAX_IDLE_HANDLES = 4
+
+
+class _TIFFHandlePool(object):
+    """
+    Handles to read the same TIFF file from multiple threads in parallel. Each
+    handle is used by only one thread at a time. The handles are opened when
+    needed, and a few of them are kept for the next reads. They are all closed
+    when the pool is deleted, ie, when the file is not used anymore.
+    """
+
+    def __init__(self, filename):
+        """
+        filename (str): path to the TIFF file
+        """
+        fn = os.path.realpath(filename)
+        st = os.stat(fn)
+        # Identifies the file for the tile cache. The modification time and
+        # size ensure a file overwritten doesn't use the tiles of the previous
+        # version.
+        self.file_key = (fn, st.st_mtime, st.st_size)
+        self._lock = threading.Lock()
+        self._idle = []  # TIFF handles not used
+        # Set to True as soon as the file is not the same anymore
+        self.changed = False
+
+    def __del__(self):
+        self.close()
+
+    def acquire(self):
+        """
+        Gets a handle, to be passed back with release() after use
+        return (TIFF): the handle, only to be used from the current thread
+        raise IOError: if the file cannot be opened anymore, or has changed since
+          the pool was created
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        if self.changed:
+            raise IOError("File %s has changed" % (self.file_key[0],))
+
+        fn, mtime, size = self.file_key
+        try:
+            tfile = TIFF.open(fn, mode='r')
+        except Exception as ex:  # libtiff raises TypeError
+            self.changed = True
+            raise IOError("Failed to open %s: %s" % (fn, ex))
+        # Check after opening, so that the handle surely reads the same file
+        try:
+            st = os.stat(fn)
+            if (st.st_mtime, st.st_size) != (mtime, size):
+                raise IOError("File %s has changed" % (fn,))
+        except (IOError, OSError):
+            self.changed = True
+            tfile.close()
+            raise
+        return tfile
+
+    def release(self, tfile):
+        """
+        Passes back a handle acquired
+        tfile (TIFF): the handle, which is not used anymore by the current thread
+        """
+        with self._lock:
+            if len(self._idle) < MAX_IDLE_HANDLES:
+                self._idle.append(tfile)
+                return
+        tfile.close()
+
+    def close(self):
+        """
+        Closes all the handles not used
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for tfile in idle:
+            tfile.close()
+
+
 # We try to make it as much as possible looking like a normal (multi-page) TIFF,
 # with as much metadata as possible saved in the known TIFF tags. In addition,
 # we ensure it's compatible with OME-TIFF, which support much more metadata, and
@@ -1649,14 +1761,124 @@ def _mergeCorrectionMetadata(da):
     return model.DataArray(da, md) # create a view
 
 
-def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_files=False,
+def _prepareThumbnail(thumbnail):
+    """
+    Prepares the thumbnail to be saved
+    thumbnail (DataArray): see export
+    return (DataArray): the thumbnail, with the correction metadata merged and
+      MD_DIMS set if it's an RGB image
+    """
+    thumbnail = _mergeCorrectionMetadata(thumbnail)
+    # If thumbnail is 3 dims, but doesn't defined MD_DIMS, don't concider
+    # it as (CT)ZYX, but an RGB as either CYX or YXC.
+    if model.MD_DIMS not in thumbnail.metadata and len(thumbnail.shape) == 3:
+        if thumbnail.shape[0] in (3, 4):
+            dims = "CYX"
+        else:
+            dims = "YXC" # The most likely actually
+        thumbnail.metadata[model.MD_DIMS] = dims
+        logging.debug("Add MD_DIMS = %s to thumbnail metadata", thumbnail.metadata[model.MD_DIMS])
+    return thumbnail
+
+
+def _writeThumbnail(f, thumbnail, ometxt, compression):
+    """
+    Writes the thumbnail as the first image of the file
+    f (libtiff file handle): Handle of a TIFF file, with nothing written yet
+    thumbnail (DataArray): as returned by _prepareThumbnail()
+    ometxt (str): the OME-XML description of all the images of the file
+    compression (str or None): Compression type to be used on the TIFF file
+    """
+    # save the thumbnail just as the first image
+    # FIXME: Note that this is contrary to the specification which states:
+    # "If multiple subfiles are written, the first one must be the
+    # full-resolution image." The main problem is that most thumbnailers
+    # use the first image as thumbnail. Maybe we should provide our own
+    # clever thumbnailer?
+    f.SetField(T.TIFFTAG_IMAGEDESCRIPTION, ometxt)
+    f.SetField(T.TIFFTAG_PAGENAME, b"Composited image")
+    # Flag for saying it's a thumbnail
+    f.SetField(T.TIFFTAG_SUBFILETYPE, T.FILETYPE_REDUCEDIMAGE)
+
+    # Warning, upstream Pylibtiff has a bug: it can only write RGB images are
+    # organised as 3xHxW, while normally in numpy, it's HxWx3.
+    # Our version is fixed
+
+    # write_rgb makes it clever to detect RGB vs. Greyscale
+    f.write_image(thumbnail, compression=compression, write_rgb=True)
+
+
+def _getPlanes(data):
+    """
+    Finds how the data is split into planes (ie, TIFF pages)
+    data (DataArray): the data to save
+    return:
+      data (DataArray): the data, with the dimensions possibly reordered
+      hdim (tuple of int): the shape of the higher dimensions. Each index
+        corresponds to a plane (ie, data[i] is a 2D or RGB image).
+      write_rgb (bool): True if each plane is an RGB image
+    """
+    # if metadata indicates YXC format just handle it as RGB
+    if data.metadata.get(model.MD_DIMS) == 'YXC' and data.shape[-1] in (3, 4):
+        write_rgb = True
+        hdim = data.shape[:-3]
+    # TODO: handle RGB for C at any position before and after XY, but iif TZ=11
+    # for data > 2D: write as a sequence of 2D images or RGB images
+    elif data.ndim == 5 and data.shape[0] == 3:  # RGB
+        # Write an RGB image, instead of 3 images along C
+        write_rgb = True
+        hdim = data.shape[1:3]
+        data = numpy.rollaxis(data, 0, -2) # move C axis near YX
+    else:
+        write_rgb = False
+        hdim = data.shape[:-2]
+
+    return data, hdim, write_rgb
+
+
+def _setTiffTags(f, tags):
+    """
+    Sets the metadata tags of the next image to be written
+    f (libtiff file handle): Handle of a TIFF file
+    tags (dict int -> value): as returned by _convertToTiffTag()
+    """
+    for key, val in tags.items():
+        try:
+            f.SetField(key, val)
+        except Exception:
+            logging.exception("Failed to store tag %s with value '%s'", key, val)
+
+
+def _checkCompression(compression):
+    """
+    compression (str or None): Compression type requested
+    raise ValueError: if the compression is not available
+    """
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError("Compression %s not available, should be one of %s" %
+                         (compression, ", ".join(COMPRESSIONS)))
+
+
+def _getPlaneCompression(dtype, compression):
+    """
+    dtype (numpy.dtype): type of the data of the plane
+    compression (str or None): Compression type requested
+    return (str or None): Compression type which can be used for the plane
+    """
+    if dtype in [numpy.int64, numpy.uint64]:
+        return None # libtiff doesn't support compression on these types
+    else:
+        return compression
+
+
+def _saveAsMultiTiffLT(filename, ldata, thumbnail, compression=DEFAULT_COMPRESSION, multiple_files=False,
                        file_index=None, uuid_list=None, pyramid=False):
     """
     Saves a list of DataArray as a multiple-page TIFF file.
     filename (string): name of the file to save
     ldata (list of DataArray): list of 2D data of int or float. Should have at least one array
     thumbnail (None or DataArray): see export
-    compressed (boolean): whether the file is LZW compressed or not.
+    compression (str or None): the compression type, or None for no compression
     multiple_files (boolean): whether the data is distributed across multiple
       files or not.
     file_index (int): index of this particular file.
@@ -1674,29 +1896,12 @@ def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_fil
     else:
         f = TIFF.open(filename, mode='w')
 
-    # According to this page: http://www.openmicroscopy.org/site/support/file-formats/ome-tiff/ome-tiff-data
-    # LZW is a good trade-off between compatibility and small size (reduces file
-    # size by about 2). => that's why we use it by default
-    if compressed:
-        compression = "lzw"
-    else:
-        compression = None
-
     # merge correction metadata (as we cannot save them separatly in OME-TIFF)
     ldata = [_mergeCorrectionMetadata(da) for da in ldata]
 
     # OME tags: a XML document in the ImageDescription of the first image
     if thumbnail is not None:
-        thumbnail = _mergeCorrectionMetadata(thumbnail)
-        # If thumbnail is 3 dims, but doesn't defined MD_DIMS, don't concider
-        # it as (CT)ZYX, but an RGB as either CYX or YXC.
-        if model.MD_DIMS not in thumbnail.metadata and len(thumbnail.shape) == 3:
-            if thumbnail.shape[0] in (3, 4):
-                dims = "CYX"
-            else:
-                dims = "YXC" # The most likely actually
-            thumbnail.metadata[model.MD_DIMS] = dims
-            logging.debug("Add MD_DIMS = %s to thumbnail metadata", thumbnail.metadata[model.MD_DIMS])
+        thumbnail = _prepareThumbnail(thumbnail)
         alldata = [thumbnail] + ldata
     else:
         alldata = ldata
@@ -1705,24 +1910,8 @@ def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_fil
     ometxt = _convertToOMEMD(alldata, multiple_files, findex=file_index, fname=filename, uuids=uuid_list)
 
     if thumbnail is not None:
-        # save the thumbnail just as the first image
-        # FIXME: Note that this is contrary to the specification which states:
-        # "If multiple subfiles are written, the first one must be the
-        # full-resolution image." The main problem is that most thumbnailers
-        # use the first image as thumbnail. Maybe we should provide our own
-        # clever thumbnailer?
-        f.SetField(T.TIFFTAG_IMAGEDESCRIPTION, ometxt)
+        _writeThumbnail(f, thumbnail, ometxt, compression)
         ometxt = None
-        f.SetField(T.TIFFTAG_PAGENAME, b"Composited image")
-        # Flag for saying it's a thumbnail
-        f.SetField(T.TIFFTAG_SUBFILETYPE, T.FILETYPE_REDUCEDIMAGE)
-
-        # Warning, upstream Pylibtiff has a bug: it can only write RGB images are
-        # organised as 3xHxW, while normally in numpy, it's HxWx3.
-        # Our version is fixed
-
-        # write_rgb makes it clever to detect RGB vs. Greyscale
-        f.write_image(thumbnail, compression=compression, write_rgb=True)
 
 
         # TODO also save it as thumbnail of the image (in limited size)
@@ -1783,32 +1972,11 @@ def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_fil
             f.SetField(T.TIFFTAG_IMAGEDESCRIPTION, ometxt)
             ometxt = None
 
-        # if metadata indicates YXC format just handle it as RGB
-        if data.metadata.get(model.MD_DIMS) == 'YXC' and data.shape[-1] in (3, 4):
-            write_rgb = True
-            hdim = data.shape[:-3]
-        # TODO: handle RGB for C at any position before and after XY, but iif TZ=11
-        # for data > 2D: write as a sequence of 2D images or RGB images
-        elif data.ndim == 5 and data.shape[0] == 3:  # RGB
-            # Write an RGB image, instead of 3 images along C
-            write_rgb = True
-            hdim = data.shape[1:3]
-            data = numpy.rollaxis(data, 0, -2) # move C axis near YX
-        else:
-            write_rgb = False
-            hdim = data.shape[:-2]
-
+        data, hdim, write_rgb = _getPlanes(data)
         for i in numpy.ndindex(*hdim):
             # Save metadata (before the image)
-            for key, val in tags.items():
-                try:
-                    f.SetField(key, val)
-                except Exception:
-                    logging.exception("Failed to store tag %s with value '%s'", key, val)
-            if data[i].dtype in [numpy.int64, numpy.uint64]:
-                c = None # libtiff doesn't support compression on these types
-            else:
-                c = compression
+            _setTiffTags(f, tags)
+            c = _getPlaneCompression(data[i].dtype, compression)
             write_image(f, data[i], write_rgb=write_rgb, compression=c, pyramid=pyramid)
 
 
@@ -1834,7 +2002,60 @@ def _genResizedShapes(data):
     return resized_shapes
 
 
-def write_image(f, arr, compression=None, write_rgb=False, pyramid=False):
+def _genPyramidLevels(data, resized_shapes=None):
+    """
+    Generates the sub-resolution images of a pyramid. Each level is computed from
+    the previous one, by averaging every 2x2 pixels, so that the full resolution
+    image is only read once.
+    data (DataArray): The original image (2D or YXC)
+    resized_shapes (None or list of tuples): the shapes of the levels, as returned
+      by _genResizedShapes(). If None, they are computed.
+    yield (DataArray): the sub-resolution images, from the largest to the smallest
+    """
+    if resized_shapes is None:
+        resized_shapes = _genResizedShapes(data)
+    dims = data.metadata.get(model.MD_DIMS, "CTZYX"[-data.ndim:])
+    xi, yi = dims.index("X"), dims.index("Y")
+
+    # The levels are computed as floats, and only rounded when returned, so
+    # that the rounding errors don't add up from one level to the next one.
+    if numpy.issubdtype(data.dtype, numpy.floating):
+        ftype = data.dtype
+    elif data.dtype.itemsize <= 2:
+        ftype = numpy.float32
+    else:
+        ftype = numpy.float64
+
+    prev = data
+    scale = 1
+    for shape in resized_shapes:
+        # Sum every 2x2 pixels. If the previous level has an odd size, the last
+        # row/column is dropped (as the shapes of _genResizedShapes() are
+        # rounded down).
+        level = numpy.zeros(shape, dtype=ftype)
+        for oy in (0, 1):
+            for ox in (0, 1):
+                sl = [slice(None)] * data.ndim
+                sl[yi] = slice(oy, shape[yi] * 2, 2)
+                sl[xi] = slice(ox, shape[xi] * 2, 2)
+                level += prev[tuple(sl)]
+        level /= 4
+        prev = level
+        scale *= 2
+
+        if level.dtype != data.dtype:
+            level = numpy.round(level).astype(data.dtype)
+        # Same metadata update as img.rescale_hq()
+        md = data.metadata.copy()
+        for k in (model.MD_PIXEL_SIZE, model.MD_BINNING):
+            if k in md:
+                md[k] = tuple(v * scale for v in md[k])
+        if model.MD_AR_POLE in md:
+            md[model.MD_AR_POLE] = tuple(v / scale for v in md[model.MD_AR_POLE])
+        yield model.DataArray(level, md)
+
+
+def write_image(f, arr, compression=None, write_rgb=False, pyramid=False, levels=None):
     """
     f (libtiff file handle): Handle of a TIFF file
     arr (DataArray): DataArray to be written to the file
@@ -1842,6 +2063,13 @@ def write_image(f, arr, compression=None, write_rgb=False, pyramid=False):
     write_rgb (boolean): True if the image is RGB, False if the image is grayscale
     pyramid (boolean): whether the file should be saved in the pyramid format or not.
       In this format, each image is saved along with different zoom levels
+    levels (None or iterable of DataArrays): the sub-resolution images, from
+      the largest to the smallest, with the shapes returned by _genResizedShapes().
+      Only used if pyramid is True. If None, they are computed from arr. It can
+      be a generator, in which case each level is requested only when the
+      previous one has been written, so that they never all need to be in memory
+      at the same time.
+    raise ValueError: if levels doesn't contain the expected sub-resolution images
     """
     # if not pyramid, just save the image in the TIFF file, and return
     if not pyramid:
@@ -1854,6 +2082,9 @@ def write_image(f, arr, compression=None, write_rgb=False, pyramid=False):
 
     # generate the sizes of the zoom levels to be generated and saved
     resized_shapes = _genResizedShapes(arr)
+    if levels is None:
+        levels = _genPyramidLevels(arr, resized_shapes)
+    levels = iter(levels)
 
     # do not write the SUBIFD tag when there are no subimages
     if len(resized_shapes) > 0:
@@ -1861,20 +2092,33 @@ def write_image(f, arr, compression=None, write_rgb=False, pyramid=False):
         # when this tag is present.
         f.SetField(T.TIFFTAG_SUBIFD, [0] * len(resized_shapes))
 
-    # write the original image
-    f.write_tiles(arr, TILE_SIZE, TILE_SIZE, compression, write_rgb)
-    # generate the rescaled images and write the tiled image
-    for resized_shape in resized_shapes:
-        # rescale the image
-        subim = img.rescale_hq(arr, resized_shape)
-
-        # Before writting the actual data, we set the special metadata
-        f.SetField(T.TIFFTAG_SUBFILETYPE, T.FILETYPE_REDUCEDIMAGE)
-        # write the tiled image to the TIFF file
-        f.write_tiles(subim, TILE_SIZE, TILE_SIZE, compression, write_rgb)
-
-
-def export(filename, data, thumbnail=None, compressed=True, multiple_files=False, pyramid=False):
+    # All the tiles have to be written via the same TIFF handle, so they cannot
+    # be compressed in parallel. However, libtiff releases the GIL while
+    # compressing, so the next level is computed in a separate thread meanwhile.
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        fsubim = executor.submit(next, levels, None)
+        # write the original image
+        f.write_tiles(arr, TILE_SIZE, TILE_SIZE, compression, write_rgb)
+        # write each rescaled image as a tiled image
+        for resized_shape in resized_shapes:
+            subim = fsubim.result()
+            if subim is None or subim.shape != resized_shape:
+                raise ValueError("Expected sub-resolution image of shape %s, but got %s" %
+                                 (resized_shape, None if subim is None else subim.shape))
+            fsubim = executor.submit(next, levels, None)
+
+            # Before writting the actual data, we set the special metadata
+            f.SetField(T.TIFFTAG_SUBFILETYPE, T.FILETYPE_REDUCEDIMAGE)
+            # write the tiled image to the TIFF file
+            f.write_tiles(subim, TILE_SIZE, TILE_SIZE, compression, write_rgb)
+            subim = None  # Free the memory as soon as possible
+    finally:
+        executor.shutdown(wait=True)
+
+
+def export(filename, data, thumbnail=None, compressed=True, multiple_files=False, pyramid=False,
+           compression=DEFAULT_COMPRESSION):
     '''
     Write a TIFF file with the given image and metadata
     filename (unicode): filename of the file to create (including path)
@@ -1891,7 +2135,14 @@ def export(filename, data, thumbnail=None, compressed=True, multiple_files=False
     compressed (boolean): whether the file is compressed or not.
     multiple_files (boolean): whether the data is distributed across multiple
       files or not.
+    compression (str): the compression type used if compressed, one of
+      COMPRESSIONS. "zstd" is the fastest, but some software cannot read it.
+    raise ValueError: if the compression is not available
     '''
+    if not compressed:
+        compression = None
+    _checkCompression(compression)
+
     if isinstance(data, list):
         if multiple_files:
             if thumbnail is not None:
@@ -1904,14 +2155,205 @@ def export(filename, data, thumbnail=None, compressed=True, multiple_files=False
                 uuid_list.append(uuid.uuid4().urn)
             for i in range(nfiles):
                 # TODO: Take care of thumbnails
-                _saveAsMultiTiffLT(filename, data, None, compressed,
+                _saveAsMultiTiffLT(filename, data, None, compression,
                                    multiple_files, i, uuid_list, pyramid)
         else:
-            _saveAsMultiTiffLT(filename, data, thumbnail, compressed, pyramid=pyramid)
+            _saveAsMultiTiffLT(filename, data, thumbnail, compression, pyramid=pyramid)
     else:
         # TODO should probably not enforce it: respect duck typing
         assert(isinstance(data, model.DataArray))
-        _saveAsMultiTiffLT(filename, [data], thumbnail, compressed, pyramid=pyramid)
+        _saveAsMultiTiffLT(filename, [data], thumbnail, compression, pyramid=pyramid)
+
+
+class AcquisitionWriter(object):
+    """
+    Writes a TIFF file incrementally, so that an acquisition can be saved while
+    it is acquired, without having all the data in memory.
+    As the OME-XML metadata is stored in the first page of the file, the shape,
+    dtype and metadata of all the images must be known when creating the file.
+    The data is then passed plane (YX) by plane, in the same order as export()
+    saves them (ie, for each image, along the higher dimensions CTZ). Each plane
+    can be passed in several blocks of rows, which are written as tiles as soon
+    as enough rows are available.
+    It's not possible to write at a given position, and in particular, data
+    acquired pixel by pixel (eg, a spectrum cube, where each pixel contains
+    data for every plane) cannot be written as it arrives. Only
+    hdf5.AcquisitionWriter supports this. This is because a page of a TIFF
+    file must be complete before the next page is started.
+    The pyramidal format and multiple files are not supported.
+    Note: the acquisition streams don't use it, see hdf5.AcquisitionWriter.
+    """
+
+    def __init__(self, filename, images, thumbnail=None, compressed=True,
+                 compression=DEFAULT_COMPRESSION):
+        """
+        filename (str): filename of the file to create (including path)
+        images (list of (tuple of int, numpy.dtype, dict)): the shape, dtype and
+          metadata of each image, as the DataArrays which would be passed to
+          export().
+        thumbnail (None or DataArray): see export()
+        compressed (boolean): whether the file is compressed or not.
+        compression (str): the compression type used if compressed, see export()
+        raise ValueError: if the compression is not available
+        """
+        self.filename = filename
+        if not compressed:
+            compression = None
+        _checkCompression(compression)
+
+        # Represent the images as DataArrays without any actual memory, which
+        # is sufficient to compute the OME-XML metadata
+        ldata = [model.DataArray(numpy.broadcast_to(numpy.zeros((), dtype=dtype), shape), md)
+                 for shape, dtype, md in images]
+        # merge correction metadata (as we cannot save them separatly in OME-TIFF)
+        ldata = [_mergeCorrectionMetadata(da) for da in ldata]
+        if thumbnail is not None:
+            thumbnail = _prepareThumbnail(thumbnail)
+            alldata = [thumbnail] + ldata
+        else:
+            alldata = ldata
+        ometxt = _convertToOMEMD(alldata, fname=filename)
+
+        # tags, shape, dtype, compression of each plane to write
+        self._planes = []
+        for data in ldata:
+            tags = _convertToTiffTag(data.metadata)
+            data, hdim, write_rgb = _getPlanes(data)
+            for i in numpy.ndindex(*hdim):
+                plane = data[i]
+                c = _getPlaneCompression(plane.dtype, compression)
+                self._planes.append((tags, plane.shape, plane.dtype, c))
+
+        self._f = TIFF.open(filename, mode='w')
+        if thumbnail is not None:
+            _writeThumbnail(self._f, thumbnail, ometxt, compression)
+            ometxt = None
+        self._ometxt = ometxt
+
+        self._plane_idx = 0  # index of the plane being written
+        self._row = 0  # number of rows of the current plane already received
+        self._band = None  # rows received, but not yet written
+        self._band_rows = 0  # number of rows in ._band
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, data):
+        """
+        Writes the next rows of the current plane. Once a plane is complete, the
+          following rows are written in the next plane.
+        data (numpy.ndarray): the rows, of shape HxW (or HxWxC for RGB), with
+          W (and C) the same as the plane.
+        raise ValueError: if the data doesn't fit in the current plane
+        """
+        if self._plane_idx >= len(self._planes):
+            raise ValueError("All the planes of %s have already been written" % (self.filename,))
+        tags, shape, dtype, compression = self._planes[self._plane_idx]
+        if data.shape[1:] != shape[1:]:
+            raise ValueError("Rows of shape %s cannot be written in a plane of shape %s" %
+                             (data.shape, shape))
+        if self._row + data.shape[0] > shape[0]:
+            raise ValueError("%d rows passed but only %d rows left in the plane" %
+                             (data.shape[0], shape[0] - self._row))
+
+        if self._row == 0:
+            self._startPlane(tags, shape, dtype, compression)
+
+        # Accumulate the rows until there are enough to fill a band of tiles
+        while data.shape[0] > 0:
+            n = min(TILE_SIZE - self._band_rows, data.shape[0])
+            self._band[self._band_rows:self._band_rows + n] = data[:n]
+            data = data[n:]
+            self._band_rows += n
+            self._row += n
+            if self._band_rows == TILE_SIZE or self._row == shape[0]:
+                self._writeBand(shape)
+
+        if self._row == shape[0]:
+            # Plane complete
+            self._f.WriteDirectory()
+            self._plane_idx += 1
+            self._row = 0
+            self._band = None
+
+    def _startPlane(self, tags, shape, dtype, compression):
+        """
+        Sets all the tags of the new plane, before writing its tiles
+        """
+        f = self._f
+        _setTiffTags(f, tags)
+        if self._ometxt:  # save OME tags if not yet done
+            f.SetField(T.TIFFTAG_IMAGEDESCRIPTION, self._ometxt)
+            self._ometxt = None
+
+        if numpy.issubdtype(dtype, numpy.floating):
+            sample_format = T.SAMPLEFORMAT_IEEEFP
+        elif numpy.issubdtype(dtype, numpy.signedinteger):
+            sample_format = T.SAMPLEFORMAT_INT
+        else:
+            sample_format = T.SAMPLEFORMAT_UINT
+
+        if compression is None:
+            f.SetField(T.TIFFTAG_COMPRESSION, T.COMPRESSION_NONE)
+        else:
+            f.SetField(T.TIFFTAG_COMPRESSION, getattr(T, "COMPRESSION_" + compression.upper()))
+            # All the compressions available support the predictor
+            if sample_format != T.SAMPLEFORMAT_IEEEFP:
+                f.SetField(T.TIFFTAG_PREDICTOR, T.PREDICTOR_HORIZONTAL)
+        f.SetField(T.TIFFTAG_BITSPERSAMPLE, dtype.itemsize * 8)
+        f.SetField(T.TIFFTAG_SAMPLEFORMAT, sample_format)
+        f.SetField(T.TIFFTAG_ORIENTATION, T.ORIENTATION_TOPLEFT)
+        f.SetField(T.TIFFTAG_TILEWIDTH, TILE_SIZE)
+        f.SetField(T.TIFFTAG_TILELENGTH, TILE_SIZE)
+        f.SetField(T.TIFFTAG_IMAGEWIDTH, shape[1])
+        f.SetField(T.TIFFTAG_IMAGELENGTH, shape[0])
+        f.SetField(T.TIFFTAG_PLANARCONFIG, T.PLANARCONFIG_CONTIG)
+        if len(shape) == 3:  # RGB
+            f.SetField(T.TIFFTAG_PHOTOMETRIC, T.PHOTOMETRIC_RGB)
+            f.SetField(T.TIFFTAG_SAMPLESPERPIXEL, shape[2])
+            if shape[2] == 4:  # RGBA
+                f.SetField(T.TIFFTAG_EXTRASAMPLES, [T.EXTRASAMPLE_UNASSALPHA], count=1)
+        else:
+            f.SetField(T.TIFFTAG_PHOTOMETRIC, T.PHOTOMETRIC_MINISBLACK)
+
+        self._band = numpy.empty((TILE_SIZE,) + shape[1:], dtype=dtype)
+        self._band_rows = 0
+
+    def _writeBand(self, shape):
+        """
+        Writes all the tiles of the band of rows received
+        """
+        y = self._row - self._band_rows
+        tile = numpy.zeros((TILE_SIZE, TILE_SIZE) + shape[2:], dtype=self._band.dtype)
+        for x in range(0, shape[1], TILE_SIZE):
+            w = min(TILE_SIZE, shape[1] - x)
+            # On the edges, the rest of the tile is filled with 0
+            tile[...] = 0
+            tile[:self._band_rows, :w] = self._band[:self._band_rows, x:x + w]
+            self._f.WriteTile(tile.ctypes.data, x, y, 0, 0)
+        self._band_rows = 0
+
+    def close(self):
+        """
+        Finishes writing the file. If some data has not been written, it is
+          filled with 0's, so that the file is still valid.
+        """
+        if self._f is None:
+            return
+
+        if self._plane_idx < len(self._planes):
+            logging.warning("Closing %s with only %d planes out of %d complete, will fill up with 0's",
+                            self.filename, self._plane_idx, len(self._planes))
+            while self._plane_idx < len(self._planes):
+                tags, shape, dtype, compression = self._planes[self._plane_idx]
+                n = min(TILE_SIZE, shape[0] - self._row)
+                self.write(numpy.zeros((n,) + shape[1:], dtype=dtype))
+
+        self._f.close()
+        self._f = None
 
 
 def read_data(filename):
@@ -2059,6 +2501,8 @@ class DataArrayShadowPyramidalTIFF(DataArrayShadowTIFF):
             'tiff_file' (handle): Handle of the tiff file
             'dir_index' (int): Index of the directory
             'lock' (threading.Lock): The lock that controls the access to the TIFF file
+            'handles' (_TIFFHandlePool): Optional, extra handles to the TIFF
+              file. If present, the tiles are cached and can be read in parallel.
         shape (tuple of int): The shape of the corresponding DataArray
         dtype (numpy.dtype): The data type
         metadata (dict str->val): The metadata
@@ -2105,34 +2549,68 @@ class DataArrayShadowPyramidalTIFF(DataArrayShadowTIFF):
             # It is the case when the DataArray has multiple pixelData (eg, when data has more than 2D).
             raise NotImplementedError("DataArray has multiple pixelData")
 
-        with tiff_info['lock']:
-            tiff_file = tiff_info['handle']
-            tiff_file.SetDirectory(tiff_info['dir_index'])
+        handles = tiff_info.get('handles')
+        if handles is None:
+            with tiff_info['lock']:
+                return self._readTile(tiff_info['handle'], x, y, zoom)
+
+        tile_key = handles.file_key + (tiff_info['dir_index'], zoom, x, y)
+        try:
+            tile = _tile_cache[tile_key]
+        except KeyError:
+            try:
+                # Use a separate handle, so no need to lock
+                tiff_file = handles.acquire()
+            except IOError as ex:
+                # The file has been deleted or overwritten => only the original
+                # handle can still read it.
+                logging.debug("Reading tile with the original handle: %s", ex)
+                with tiff_info['lock']:
+                    tile = self._readTile(tiff_info['handle'], x, y, zoom)
+            else:
+                try:
+                    tile = self._readTile(tiff_file, x, y, zoom)
+                finally:
+                    handles.release(tiff_file)
+            tile.flags.writeable = False
+            _tile_cache[tile_key] = tile
+        # Return a view, so that the caller can modify the metadata
+        return model.DataArray(tile, tile.metadata.copy())
+
+    def _readTile(self, tiff_file, x, y, zoom):
+        '''
+        Reads one tile from the file
+        tiff_file (TIFF): the handle of the file. It must not be used
+          simultaneously by another thread.
+        x, y, zoom: see getTile()
+        return (DataArray): the tile
+        '''
+        tiff_file.SetDirectory(self.tiff_info['dir_index'])
 
-            if zoom != 0:
-                # get an array of offsets, one for each subimage
-                sub_ifds = tiff_file.GetField(T.TIFFTAG_SUBIFD)
-                if not sub_ifds:
-                    raise ValueError("Image does not have zoom levels")
+        if zoom != 0:
+            # get an array of offsets, one for each subimage
+            sub_ifds = tiff_file.GetField(T.TIFFTAG_SUBIFD)
+            if not sub_ifds:
+                raise ValueError("Image does not have zoom levels")
 
-                if not (0 <= zoom <= len(sub_ifds)):
-                    raise ValueError("Invalid Z value %d" % (zoom,))
+            if not (0 <= zoom <= len(sub_ifds)):
+                raise ValueError("Invalid Z value %d" % (zoom,))
 
-                # set the offset of the subimage. Z=0 is the main image
-                tiff_file.SetSubDirectory(sub_ifds[zoom - 1])
+            # set the offset of the subimage. Z=0 is the main image
+            tiff_file.SetSubDirectory(sub_ifds[zoom - 1])
 
-            orig_pixel_size = self.metadata.get(model.MD_PIXEL_SIZE, (1, 1))
+        orig_pixel_size = self.metadata.get(model.MD_PIXEL_SIZE, (1, 1))
 
-            # calculate the pixel size of the tile for the zoom level
-            tile_pixel_size = tuple(ps * 2 ** zoom for ps in orig_pixel_size)
+        # calculate the pixel size of the tile for the zoom level
+        tile_pixel_size = tuple(ps * 2 ** zoom for ps in orig_pixel_size)
 
-            xp = x * self.tile_shape[0]
-            yp = y * self.tile_shape[1]
-            tile = tiff_file.read_one_tile(xp, yp)
-            tile = model.DataArray(tile, self.metadata.copy())
-            tile.metadata[model.MD_PIXEL_SIZE] = tile_pixel_size
-            # calculate the center of the tile
-            tile.metadata[model.MD_POS] = get_tile_md_pos((x, y), self.tile_shape, tile, self)
+        xp = x * self.tile_shape[0]
+        yp = y * self.tile_shape[1]
+        tile = tiff_file.read_one_tile(xp, yp)
+        tile = model.DataArray(tile, self.metadata.copy())
+        tile.metadata[model.MD_PIXEL_SIZE] = tile_pixel_size
+        # calculate the center of the tile
+        tile.metadata[model.MD_POS] = get_tile_md_pos((x, y), self.tile_shape, tile, self)
 
         return tile
 
@@ -2155,7 +2633,7 @@ class AcquisitionDataTIFF(AcquisitionData):
         except ValueError as ex:
             logging.info("Failed to use the OME data (%s), will use standard TIFF",
                          ex)
-            data, thumbnails = self._getAllDataArrayShadows(tiff_file, self._lock)
+            data, thumbnails = self._getAllDataArrayShadows(tiff_file, self._lock, filename)
 
         # In case we open a basic TIFF file not generated by Odemis, this is a
         # very common "corner case": only one image, and no metadata. At least,
@@ -2165,11 +2643,13 @@ class AcquisitionDataTIFF(AcquisitionData):
 
         AcquisitionData.__init__(self, tuple(data), tuple(thumbnails))
 
-    def _getAllDataArrayShadows(self, tfile, lock):
+    def _getAllDataArrayShadows(self, tfile, lock, filename=None):
         """
         Create the all DataArrayShadows for the given TIFF file
         tfile (tiff handle): Handle for the TIFF file
         lock (threading.Lock): The lock that controls the access to the TIFF file
+        filename (str or None): path to the TIFF file, used to read the tiles
+          from multiple threads simultaneously. If None, only tfile is used.
         return:
             data (list of DataArrayShadows or None): DataArrayShadows
                for each IFD representing a proper image. None are inserted for
@@ -2177,11 +2657,13 @@ class AcquisitionDataTIFF(AcquisitionData):
             thumbnails (list of DataArrayShadows): DataArrayShadows for all the
                thumbnails images found in the file
         """
+        # Shared by all the images of the file
+        handles = _TIFFHandlePool(filename) if filename is not None else None
         data = []
         thumbnails = []
         # iterates all the directories of the TIFF file
         for dir_index in self._iterDirectories(tfile):
-            das, is_thumb = self._createDataArrayShadows(tfile, dir_index, lock)
+            das, is_thumb = self._createDataArrayShadows(tfile, dir_index, lock, handles)
             if is_thumb:
                 data.append(None)
                 thumbnails.append(das)
@@ -2249,14 +2731,14 @@ class AcquisitionDataTIFF(AcquisitionData):
                     continue
 
                 # TODO: we could have a separate lock per file?
-                d, t = self._getAllDataArrayShadows(stfile, self._lock)
+                d, t = self._getAllDataArrayShadows(stfile, self._lock, sfn)
                 data.extend(d)
                 thumbnails.extend(t)
                 uuids_read[u] = sfn
 
             if not data:
                 # Nothing loading (not even the current file) => load this file
-                data, thumbnails = self._getAllDataArrayShadows(tfile, self._lock)
+                data, thumbnails = self._getAllDataArrayShadows(tfile, self._lock, filename)
 
             _updateMDFromOME(omeroot, data)
             data = AcquisitionDataTIFF._foldArrayShadowsFromOME(omeroot, data)
@@ -2355,12 +2837,13 @@ class AcquisitionDataTIFF(AcquisitionData):
         raise LookupError("No OME XML data found")
 
     @staticmethod
-    def _createDataArrayShadows(tfile, dir_index, lock):
+    def _createDataArrayShadows(tfile, dir_index, lock, handles=None):
         """
         Create the DataArrayShadow from the TIFF metadata for the current directory
         tfile (tiff handle): Handle for the TIFF file
         dir_index (int): Index of the directory in the TIFF file
         lock (threading.Lock): The lock that controls the access to the TIFF file
+        handles (None or _TIFFHandlePool): extra handles to the TIFF file
         return:
             das (DataArrayShadows): DataArrayShadows representing the image
             is_thumbnail (bool): True if the image is a thumbnail
@@ -2389,6 +2872,8 @@ class AcquisitionDataTIFF(AcquisitionData):
         # in case the DataArray has multiple pixelData (eg, when data has more than 2D).
         # Add also the lock of the TIFF file
         tiff_info = {'handle': tfile, 'dir_index': dir_index, 'lock': lock}
+        if handles is not None:
+            tiff_info['handles'] = handles
         das = DataArrayShadowTIFF(tiff_info, shape, typ, md)
 
         return das, _isThumbnail(tfile)
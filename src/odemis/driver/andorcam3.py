@@ -1946,7 +1946,8 @@ class AndorCam3DataFlow(model.DataFlow):
         """
         camera: andorcam instance ready to acquire images
         """
-        model.DataFlow.__init__(self)
+        # Large images at high frame rate => avoid copying them through 0MQ
+        model.DataFlow.__init__(self, shared_mem=True)
         self.component = weakref.ref(camera)
         self._sync_event = None # synchronization Event
         self._prev_max_discard = self._max_discard
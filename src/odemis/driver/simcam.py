@@ -380,7 +380,8 @@ class Camera(model.DigitalCamera):
 
 class SimpleDataFlow(model.DataFlow):
     def __init__(self, ccd):
-        super(SimpleDataFlow, self).__init__()
+        # Large images at high frame rate => avoid copying them through 0MQ
+        super(SimpleDataFlow, self).__init__(shared_mem=True)
         self._ccd = ccd
         self._sync_event = None
         self._evtq = None  # a Queue to store received events (= float, time of the event)
@@ -208,6 +208,10 @@ class Scanner(model.Emitter):
                           unit="A")
         self.accelVoltage = model.FloatContinuous(10e3, (1e3, 30e3), unit="V")
 
+        # Event which is triggered at each new pixel scanned, if someone listens
+        # to it (in which case the scan is simulated pixel per pixel).
+        self.newPosition = model.Event()
+
     def _onHFV(self, hfv):
         self._updatePixelSize()
         self._updateDepthOfField()
@@ -515,15 +519,30 @@ class Detector(model.Detector):
         """
         try:
             while not self._acquisition_must_stop.is_set():
-                dwelltime = self.parent._scanner.dwellTime.value
-                resolution = self.parent._scanner.resolution.value
-                duration = numpy.prod(resolution) * dwelltime
-                if self._acquisition_must_stop.wait(duration):
-                    break
                 # TODO: it's not a very proper simulation for multiple detectors,
                 # as in Odemis the convention for SEM is that the ebeam waits
                 # for _all_ the detectors to be ready before scanning.
-                self.data._waitSync()
+                self.data._waitSync(self._acquisition_must_stop)
+                if self._acquisition_must_stop.is_set():
+                    break
+                scanner = self.parent._scanner
+                dwelltime = scanner.dwellTime.value
+                resolution = scanner.resolution.value
+                if scanner.newPosition.hasListeners():
+                    # Simulate each pixel, so that the listeners can follow the scan.
+                    # The pixels are paced on the start time, to not accumulate
+                    # the (small) latency of each wait.
+                    start = time.time()
+                    for i in range(int(numpy.prod(resolution))):
+                        scanner.newPosition.notify()
+                        left = start + (i + 1) * dwelltime - time.time()
+                        if self._acquisition_must_stop.wait(max(0, left)):
+                            break
+                else:
+                    duration = numpy.prod(resolution) * dwelltime
+                    self._acquisition_must_stop.wait(duration)
+                if self._acquisition_must_stop.is_set():
+                    break
                 callback(self._simulate_image())
         except Exception:
             logging.exception("Unexpected failure during image acquisition")
@@ -601,14 +620,20 @@ class SEMDataFlow(model.DataFlow):
 
         self._evtq.put(time.time())
 
-    def _waitSync(self):
+    def _waitSync(self, must_stop):
         """
         Block until the Event on which the dataflow is synchronised has been
           received. If the DataFlow is not synchronised on any event, this
           method immediately returns
-        """
-        if self._sync_event:
-            self._evtq.get()
+        must_stop (threading.Event): if set, stop waiting (as the acquisition
+          is being stopped)
+        """
+        while self._sync_event and not must_stop.is_set():
+            try:
+                self._evtq.get(timeout=0.1)
+                return
+            except queue.Empty:
+                pass
 
 class EbeamFocus(model.Actuator):
     """
@@ -84,6 +84,7 @@ from odemis.gui.util.widgets import ProgressiveFutureConnector, AxisConnector, \
     ScannerFoVAdapter
 from odemis.util import units, spot, limit_invocation, fsdecode
 from odemis.util.dataio import data_to_static_streams, open_acquisition
+from odemis.util.tracing import tracer
 
 # The constant order of the toolbar buttons
 TOOL_ORDER = (TOOL_ZOOM, TOOL_ROI, TOOL_ROA, TOOL_RO_ANCHOR, TOOL_RULER, TOOL_POINT,
@@ -4606,12 +4607,13 @@ class TabBarController(object):
             priority = tab_def["controller"].get_display_priority(main_data)
             if priority is not None:
                 assert priority >= 0
-                tpnl = tab_def["panel"](self.main_frame)
-                # Insert as "second" item, to be just below the buttons.
-                # As only one tab is shown at a time, the exact order isn't important.
-                main_sizer.Insert(1, tpnl, flag=wx.EXPAND, proportion=1)
-                tab = tab_def["controller"](tab_def["name"], tab_def["button"],
-                                            tpnl, main_frame, main_data)
+                with tracer.span(tab_def["name"], cat="tab"):
+                    tpnl = tab_def["panel"](self.main_frame)
+                    # Insert as "second" item, to be just below the buttons.
+                    # As only one tab is shown at a time, the exact order isn't important.
+                    main_sizer.Insert(1, tpnl, flag=wx.EXPAND, proportion=1)
+                    tab = tab_def["controller"](tab_def["name"], tab_def["button"],
+                                                tpnl, main_frame, main_data)
                 if max_prio < priority:
                     max_prio = priority
                     default_tab = tab
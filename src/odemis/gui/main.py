@@ -33,8 +33,10 @@ from odemis.gui.cont import acquisition
 from odemis.gui.cont.menu import MenuController
 from odemis.gui.util import call_in_wx_main
 from odemis.gui.xmlh import odemis_get_resources
+from odemis.util.tracing import tracer, TRACE_ENV
 import sys
 import threading
+import time
 import traceback
 import wx
 from wx.lib.pubsub import pub
@@ -111,7 +113,8 @@ class OdemisGUIApp(wx.App):
             gui.icon = img.getIcon("icon/ico_gui_full_256.png")
             gui.name = odemis.__shortname__
             try:
-                microscope = model.getMicroscope()
+                with tracer.span("connect back-end"):
+                    microscope = model.getMicroscope()
             except (IOError, Pyro4.errors.CommunicationError) as e:
                 logging.exception("Failed to connect to back-end")
                 msg = ("The Odemis GUI could not connect to the Odemis back-end:"
@@ -132,11 +135,14 @@ class OdemisGUIApp(wx.App):
         # TODO: if microscope.ghost is not empty => wait and/or display a special
         # "hardware status" tab.
 
-        self.main_data = guimodel.MainGUIData(microscope)
+        with tracer.span("main data"):
+            self.main_data = guimodel.MainGUIData(microscope)
         # Load the main frame
-        self.main_frame = main_xrc.xrcfr_main(None)
+        with tracer.span("main frame"):
+            self.main_frame = main_xrc.xrcfr_main(None)
 
-        self.init_gui()
+        with tracer.span("init gui"):
+            self.init_gui()
 
         try:
             from odemis.gui.dev.powermate import Powermate
@@ -221,7 +227,8 @@ class OdemisGUIApp(wx.App):
 
             # Create the main tab controller and store a global reference
             # in the odemis.gui.cont package
-            self.tab_controller = tabs.TabBarController(tab_defs, self.main_frame, self.main_data)
+            with tracer.span("tabs"):
+                self.tab_controller = tabs.TabBarController(tab_defs, self.main_frame, self.main_data)
 
             # Connect the log panel button of each tab
             def toggle_log_panel(_):
@@ -253,13 +260,17 @@ class OdemisGUIApp(wx.App):
             self.main_frame.legend_logo = gui.legend_logo
 
             # Now starts the plugins, after the rest of the GUI is ready
-            pfns = plugin.find_plugins()
-            for p in pfns:
-                pis = plugin.load_plugin(p, self.main_data.microscope, self)
-                self.plugins.extend(pis)
+            with tracer.span("plugins"):
+                pfns = plugin.find_plugins()
+                for p in pfns:
+                    pis = plugin.load_plugin(p, self.main_data.microscope, self)
+                    self.plugins.extend(pis)
 
             # making it very late seems to make it smoother
             wx.CallAfter(self.main_frame.Show)
+            if tracer.enabled:
+                # Called once the window is shown, and all the pending events processed
+                wx.CallAfter(wx.CallAfter, self._on_startup_done)
 
         except Exception:
             self.excepthook(*sys.exc_info())
@@ -268,6 +279,18 @@ class OdemisGUIApp(wx.App):
             # the program keeps running in the background.
             raise
 
+    @call_in_wx_main
+    def _on_startup_done(self):
+        """
+        Saves the startup trace, once the main window is shown
+        """
+        tracer.add("window shown", time.time())
+        try:
+            tracer.save()
+            logging.info("Startup phases:\n%s", tracer.summary())
+        except Exception:
+            logging.exception("Failed to save the startup trace")
+
     @call_in_wx_main
     def on_debug_va(self, enabled):
         """
@@ -418,6 +441,7 @@ def main(args):
     """
     args is the list of arguments passed
     """
+    tmain = time.time()
 
     # HACK: odemis.model sets it at 16, because some hardware components needs
     # a lot of simultaneous connections. One the client side, there is almost
@@ -444,6 +468,10 @@ def main(args):
                         default=0, help="set verbosity level (0-2, default = 0)")
     parser.add_argument('--log-target', dest='logtarget',
                         help="Location of the GUI log file")
+    parser.add_argument("--trace", dest="trace", metavar="FILE",
+                        help="Record the duration of each startup phase and save it "
+                        "in Chrome trace format. Tracing can also be enabled by setting "
+                        "%s to a directory." % (TRACE_ENV,))
 
     options = parser.parse_args(args[1:])
 
@@ -461,6 +489,12 @@ def main(args):
     loglev = loglev_names[min(len(loglev_names) - 1, options.loglev)]
     log.init_logger(loglev, options.logtarget)
 
+    if options.trace:
+        tracer.enable(options.trace)
+    else:
+        tracer.enable_from_env("odemis-gui")
+    tracer.add("imports", tracer.start_time, tmain)
+
     if 'linux' in sys.platform:
         # Set WM_CLASS on linux, needed to get connected to the right icon.
         # wxPython doesn't do it, see http://trac.wxwidgets.org/ticket/12778
@@ -25,7 +25,8 @@ This file is part of Odemis.
 from __future__ import division
 
 import logging
-from odemis import model, dataio
+from odemis import model
+from odemis.dataio import hdf5
 from odemis.gui import plugin
 from odemis.gui.util import get_home_folder
 import os
@@ -109,7 +110,7 @@ class SimplePlugin(Plugin):
         f.set_result(None)  # Indicate it's over
 
         if d:
-            dataio.hdf5.export(self.filename.value, d)
+            hdf5.export(self.filename.value, d)
 
         dlg.Destroy()
 
@@ -77,23 +77,37 @@ TINT_SIZE = 0.0155
 
 
 # TODO: rename to *_bgra_*
-def format_rgba_darray(im_darray, alpha=None):
+def format_rgba_darray(im_darray, alpha=None, irange=None, tint=(255, 255, 255)):
     """ Reshape the given numpy.ndarray from RGB to BGRA format
-    im_darray (DataArray or tuple of tuple of DataArray): input image
+    im_darray (DataArray or tuple of tuple of DataArray): input image. If it is
+      a 2D greyscale image, it is converted directly to BGRA (in one pass),
+      using irange and tint.
     alpha (0 <= int <= 255 or None): If an alpha value is provided it will be
       set in the '4th' byte and used to scale the other RGB values within the array.
+    irange (None or tuple of 2 values): for greyscale image only, the intensities
+      mapped to black/white (see img.DataArray2RGB()).
+    tint (3-tuple of 0 < int <256, or matplotlib Colormap): for greyscale image
+      only, the colour of the image (see img.DataArray2RGB()).
     return (DataArray or tuple of tuple of DataArray): The return type is the same of im_darray
     """
-    if im_darray.shape[-1] == 3:
+    if im_darray.ndim == 2:
+        bgra = img.DataArray2BGRA(im_darray, irange, tint, 255 if alpha is None else alpha)
+        return model.DataArray(bgra)
+
+    elif im_darray.shape[-1] == 3:
         h, w, _ = im_darray.shape
         rgba_shape = (h, w, 4)
         rgba = numpy.empty(rgba_shape, dtype=numpy.uint8)
         # Copy the data over with bytes 0 and 2 being swapped (RGB becomes BGR through the -1)
-        rgba[:, :, 0:3] = im_darray[:, :, ::-1]
+        if alpha is not None and alpha != 255:
+            # Scale to the alpha while copying, via a look-up table (same
+            # computation as scale_to_alpha())
+            alut = (numpy.arange(256) * (alpha / 255)).astype(numpy.uint8)
+            numpy.take(alut, im_darray[:, :, ::-1], out=rgba[:, :, 0:3], mode="clip")
+        else:
+            rgba[:, :, 0:3] = im_darray[:, :, ::-1]
         if alpha is not None:
             rgba[:, :, 3] = alpha
-            if alpha != 255:
-                rgba = scale_to_alpha(rgba)
         new_darray = model.DataArray(rgba)
 
         return new_darray
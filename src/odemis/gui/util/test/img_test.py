@@ -36,6 +36,7 @@ from odemis.gui.model import TOOL_RULER, TOOL_LABEL
 from odemis.gui.util import img
 from odemis.gui.util.img import wxImage2NDImage, format_rgba_darray, insert_tile_to_image, merge_screen, \
     calculate_ticks
+from odemis.util.img import DataArray2RGB
 import os
 import time
 import unittest
@@ -99,6 +100,21 @@ class TestRGBA(unittest.TestCase):
         self.assertEqual(bgraim.shape, (32, 64, 4))
         self.assertTrue((bgraim == 0).all())
 
+    def test_grey_to_bgra(self):
+        """
+        A greyscale image is converted in one pass, identical to the
+        conversion to RGB followed by the conversion to BGRA
+        """
+        size = (32, 64)
+        greyim = model.DataArray(numpy.random.randint(0, 4096, size, dtype=numpy.uint16))
+        for tint in ((255, 255, 255), (0, 73, 255)):
+            for alpha in (255, 100):
+                bgraim = format_rgba_darray(greyim, alpha, (0, 4095), tint)
+                self.assertEqual(bgraim.shape, (32, 64, 4))
+
+                rgbim = DataArray2RGB(greyim, (0, 4095), tint)
+                numpy.testing.assert_array_equal(bgraim, format_rgba_darray(rgbim, alpha))
+
     def test_rgba_to_bgra(self):
         size = (32, 64, 4)
         rgbaim = model.DataArray(numpy.zeros(size, dtype=numpy.uint8))
@@ -178,6 +178,51 @@ class Component(ComponentBase):
     def name(self):
         return self._name
 
+    def getVAValues(self, names=None):
+        """
+        Read the value of multiple VigilantAttributes at once. When called
+        remotely, it takes a single call, instead of one per VA.
+        names (None or iterable of str): names of the VAs to read. If None,
+          all the VAs of the component are read.
+        return (dict str -> value): VA name -> value
+        raise AttributeError: if a name doesn't correspond to a VA of the component
+        """
+        if names is None:
+            vas = getVAs(self)
+        else:
+            vas = {}
+            for n in names:
+                if not hasVA(self, n):
+                    raise AttributeError("%s has no VA %s" % (self.name, n))
+                vas[n] = getattr(self, n)
+
+        return {n: va.value for n, va in vas.items()}
+
+    def setVAValues(self, values):
+        """
+        Change the value of multiple VigilantAttributes at once. When called
+        remotely, it takes a single call, instead of one per VA.
+        values (dict str -> value, or list of (str, value)): VA name -> new value.
+          The VAs are set in the given order, which matters when the setter of a
+          VA affects another one (eg, binning and resolution).
+        return (dict str -> value): VA name -> actual value, once all the VAs
+          are set.
+        raise: the exception of the first VA which failed to be set. The
+          previous VAs are set, and the following ones are left untouched.
+        """
+        if isinstance(values, dict):
+            values = values.items()
+
+        vas = []
+        for n, v in values:
+            if not hasVA(self, n):
+                raise AttributeError("%s has no VA %s" % (self.name, n))
+            va = getattr(self, n)
+            va.value = v
+            vas.append((n, va))
+
+        return {n: va.value for n, va in vas}
+
     def terminate(self):
         """
         Stop the Component from executing.
@@ -574,6 +619,26 @@ class Microscope(HwComponent):
     def model(self):
         return self._model
 
+    def getComponentsTree(self):
+        """
+        Snapshot of all the components alive, with their hierarchy. As each
+        component is sent with its roattributes and the proxies to its VAs,
+        DataFlows and Events, the whole microscope can be known by a client
+        with a single call.
+        Note: the children of the components are deduced from the model (ie,
+        the components they create), which avoids one call per component.
+        return (dict str -> (Component, set of str)): for each component
+          (including the microscope), its name -> the component, and the names
+          of its children.
+        """
+        comps = {c.name: c for c in self.alive.value}
+        tree = {self.name: (self, {c.name for c in self.children.value})}
+        for name, comp in comps.items():
+            children = {n for n, attrs in self._model.items()
+                        if attrs.get("creator") == name and n in comps}
+            tree[name] = (comp, children)
+        return tree
+
 
 class Detector(with_metaclass(ABCMeta, HwComponent)):
     """
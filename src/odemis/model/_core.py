@@ -65,6 +65,11 @@ BACKEND_FILE = BASE_DIRECTORY + "/backend.ipc" # the official ipc file for backe
 BACKEND_NAME = "backend" # the official name for the backend container
 
 _microscope = None
+# The components received from the backend, for the current _microscope.
+# The same proxies are always returned, so that their connections (and the ones
+# of their VAs) are reused.
+_comp_proxies_mic = None
+_comp_proxies = {}  # str -> Component: name -> proxy
 
 def getMicroscope():
     """
@@ -119,9 +124,35 @@ def getComponents():
     """
     return (set of Component): all the HwComponents (alive) managed by the backend
     """
+    return set(getComponentsTree().keys())
+
+
+def getComponentsTree():
+    """
+    Get all the components alive (including the microscope), with their
+    hierarchy, in a single call to the backend.
+    return (dict Component -> set of Component): each component -> its children
+    """
+    global _comp_proxies_mic
     microscope = getMicroscope()
-    return microscope.alive.value | {microscope}
-    # return _getChildren(microscope)
+    snapshot = microscope.getComponentsTree()
+
+    if _comp_proxies_mic is not microscope:
+        _comp_proxies.clear()
+        _comp_proxies_mic = microscope
+    _comp_proxies[microscope.name] = microscope
+
+    # Reuse the proxies already known, if it's still the same component
+    comps = {}
+    for name, (comp, children) in snapshot.items():
+        prev_comp = _comp_proxies.get(name)
+        if prev_comp is not None and prev_comp == comp:
+            comps[name] = prev_comp
+        else:
+            comps[name] = _comp_proxies[name] = comp
+
+    return {comps[name]: {comps[n] for n in children if n in comps}
+            for name, (comp, children) in snapshot.items()}
 
 
 def _getChildren(root):
@@ -131,9 +162,13 @@ def _getChildren(root):
     root (HwComponent): the component to start from
     returns (set of HwComponents)
     """
-    ret = {root}
-    for child in root.children.value:
-        ret |= _getChildren(child)
+    tree = getComponentsTree()
+    ret = set()
+    todo = {root}
+    while todo:
+        comp = todo.pop()
+        ret.add(comp)
+        todo |= tree.get(comp, set()) - ret
 
     return ret
 
@@ -411,6 +446,62 @@ def getObject(container_name, object_name):
     return container.getObject(quote(object_name))
 
 
+# Only one process is created at a time, as the logging locks are held meanwhile
+_fork_lock = threading.Lock()
+
+
+def _getLoggingLocks():
+    """
+    Lists the locks which have to be held while creating a process, so that
+    they are not acquired by another thread in the new process.
+    return (list of RLock): the locks of the logging module and its handlers
+    """
+    # Note: since Python 3.7, the logging module reinitializes its locks in the
+    # new process. However, a thread could still be writing to the stream of a
+    # handler, whose (internal) lock would stay acquired.
+    locks = [logging._lock]
+    for wr in logging._handlerList:
+        h = wr()
+        if h is not None and h.lock is not None:
+            locks.append(h.lock)
+    return locks
+
+
+def _startProcess(p, locks):
+    """
+    Starts a process, while other threads might be running (and logging)
+    Forking while another thread holds a lock leaves it acquired forever in the
+    new process (cf http://bugs.python.org/issue6721). So the processes are
+    created one at a time, while holding the logging locks.
+    p (multiprocessing.Process): the process to start. Its target must release
+      the locks first thing.
+    locks (list of RLock): the locks to hold, as returned by _getLoggingLocks()
+    """
+    with _fork_lock:
+        for l in locks:
+            l.acquire()
+        try:
+            p.start()
+        finally:
+            for l in reversed(locks):
+                l.release()
+
+
+def _manageForkedContainer(locks, name, isready):
+    """
+    Target of the process created by _startProcess(), which manages a container
+    locks (list of RLock): the locks held during the fork, owned by the current
+      thread (as it's the copy of the thread which forked)
+    name, isready: see _manageContainer()
+    """
+    for l in reversed(locks):
+        try:
+            l.release()
+        except RuntimeError:
+            pass  # Already reinitialized by the logging module
+    _manageContainer(name, isready)
+
+
 def createNewContainer(name, validate=True, in_own_process=True):
     """
     creates a new container in an independent and isolated process
@@ -422,13 +513,15 @@ def createNewContainer(name, validate=True, in_own_process=True):
     # create a container separately
     if in_own_process:
         isready = multiprocessing.Event()
-        p = multiprocessing.Process(name="Container " + name, target=_manageContainer,
-                                    args=(name, isready))
+        locks = _getLoggingLocks()
+        p = multiprocessing.Process(name="Container " + name, target=_manageForkedContainer,
+                                    args=(locks, name, isready))
+        _startProcess(p, locks)
     else:
         isready = threading.Event()
         p = threading.Thread(name="Container " + name, target=_manageContainer,
                              args=(name, isready))
-    p.start()
+        p.start()
     if not isready.wait(5):  # wait maximum 5s
         logging.error("Container %s is taking too long to get ready", name)
         raise IOError("Container creation timeout")
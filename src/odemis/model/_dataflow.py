@@ -27,16 +27,25 @@ from __future__ import division, print_function
 
 from past.builtins import basestring
 import Pyro4
+import collections
 import logging
+import mmap
 import numpy
-from odemis.model import _metadata
+from odemis.model import _metadata, _mdcodec
 from odemis.util import inspect_getmembers
-from odemis.util.weak import WeakMethod, WeakRefLostError
+from odemis.util.weak import WeakMethod, WeakRefLostError, WeakMethodBound, \
+    WeakMethodFree
 import os
+import struct
 import threading
 import time
 import zmq
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 from . import _core
 
 
@@ -95,6 +104,104 @@ class DataArray(numpy.ndarray):
     #     out_arr.metadata = self.metadata
     #     return numpy.ndarray.__array_wrap__(self, out_arr, context)
 
+# Subscription policies, to define how the data is delivered to a listener
+# which is slower than the data generation.
+DF_POLICY_LATEST = "latest"  # only the newest data waiting is kept
+DF_POLICY_QUEUE = "queue"  # up to N data are kept, the oldest are dropped
+DF_POLICY_LOSSLESS = "lossless"  # all the data is kept (until memory is full)
+
+
+class QueuedListener(object):
+    """
+    Delivers the data to a listener from a separate thread, following a
+    subscription policy. This way, the listener cannot slow down the other
+    listeners of the same DataFlow, and it can be guaranteed to receive all
+    the data.
+    """
+
+    def __init__(self, listener, policy, queue_size=None):
+        """
+        listener (WeakMethod): the callback
+        policy (DF_POLICY_*): how to handle the data not yet delivered
+        queue_size (None or int > 0): maximum number of data waiting, only
+          used for DF_POLICY_QUEUE
+        """
+        if policy == DF_POLICY_QUEUE:
+            if queue_size is None or queue_size < 1:
+                raise ValueError("Policy %s requires queue_size >= 1, but got %s" %
+                                 (policy, queue_size))
+        elif policy not in (DF_POLICY_LATEST, DF_POLICY_LOSSLESS):
+            raise ValueError("Unknown subscription policy %s" % (policy,))
+        self.listener = listener
+        self.policy = policy
+        self.queue_size = queue_size
+        self.received = 0  # number of data passed to the listener
+        self.dropped = 0  # number of data discarded
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run,
+                                        name="DataFlow listener %s" % (policy,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def push(self, dataflow, data):
+        """
+        Add new data to be delivered to the listener
+        """
+        with self._cond:
+            if self.policy == DF_POLICY_LATEST:
+                self.dropped += len(self._queue)
+                self._queue.clear()
+            elif self.policy == DF_POLICY_QUEUE:
+                while len(self._queue) >= self.queue_size:
+                    self._queue.popleft()
+                    self.dropped += 1
+            self._queue.append((dataflow, data))
+            self._cond.notify()
+
+    def drop(self, count=1):
+        """
+        Record that some data was lost before it could be pushed
+        count (int > 0): number of data lost
+        """
+        with self._cond:
+            self.dropped += count
+
+    def stop(self):
+        """
+        Stop the delivery. The data not yet delivered is dropped.
+        Note: it doesn't wait for the listener to be finished.
+        """
+        with self._cond:
+            self.dropped += len(self._queue)
+            self._queue.clear()
+            self._queue.append(None)
+            self._cond.notify()
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    while not self._queue:
+                        self._cond.wait()
+                    item = self._queue.popleft()
+                if item is None:
+                    return
+                dataflow, data = item
+                try:
+                    self.listener(dataflow, data)
+                    self.received += 1
+                except WeakRefLostError:
+                    dataflow.unsubscribe(self.listener)
+                    return
+                except Exception:
+                    # we cannot abort just because the listener failed once
+                    logging.exception("Exception when notifying a data_flow")
+        except Exception:
+            if logging:
+                logging.exception("Ending listener thread due to exception")
+
+
 class DataFlowBase(object):
     """
     This is an abstract class that must be extended by each detector which
@@ -105,6 +212,8 @@ class DataFlowBase(object):
     """
     def __init__(self):
         self._listeners = set()
+        # WeakMethod -> QueuedListener, for the listeners with a policy
+        self._queued_listeners = {}
         self._lock = threading.RLock()  # need to be acquired to modify the set
 
     # to be overridden
@@ -113,31 +222,96 @@ class DataFlowBase(object):
 #        # TODO timeout argument?
 #        pass
 
-    def subscribe(self, listener):
+    def _count_listeners(self):
+        return len(self._listeners) + len(self._queued_listeners)
+
+    def subscribe(self, listener, policy=None, queue_size=None):
         """
         Register a callback function to be called when the ActiveValue is
         listener (function): callback function which takes as arguments
            dataflow (this object) and data (the new data array)
+        policy (None or DF_POLICY_*): if None, the listener is called directly
+          from the thread which receives the data, and the data may be
+          discarded (see max_discard) if the listeners are too slow.
+          Otherwise, the listener is called from its own thread, and the data
+          received while the listener is busy is handled according to the
+          policy: DF_POLICY_LATEST only keeps the newest data,
+          DF_POLICY_QUEUE keeps up to queue_size data, and DF_POLICY_LOSSLESS
+          never drops any data.
+        queue_size (None or int > 0): maximum number of data waiting to be
+          delivered, for DF_POLICY_QUEUE.
+        raise ValueError: if the policy is not valid
         """
         # TODO update rate argument to indicate how often we need an update?
         assert callable(listener)
 
         with self._lock:
-            count_before = len(self._listeners)
-            self._listeners.add(WeakMethod(listener))
-            logging.debug("Listener %r subscribed, now %d subscribers", listener, len(self._listeners))
+            count_before = self._count_listeners()
+            self._add_listener(listener, policy, queue_size)
+            logging.debug("Listener %r subscribed, now %d subscribers", listener, self._count_listeners())
             if count_before == 0:
                 self.start_generate()
 
     def unsubscribe(self, listener):
         with self._lock:
-            count_before = len(self._listeners)
-            self._listeners.discard(WeakMethod(listener))
-            count_after = len(self._listeners)
+            count_before = self._count_listeners()
+            self._remove_listener(listener)
+            count_after = self._count_listeners()
             logging.debug("Listener %r unsubscribed, now %d subscribers", listener, count_after)
             if count_before > 0 and count_after == 0:
                 self.stop_generate()
 
+    def _add_listener(self, listener, policy=None, queue_size=None):
+        """
+        Store the listener, with the given policy. Must be called with the lock.
+        If the listener is already subscribed, its policy is updated.
+        """
+        wl = WeakMethod(listener)
+        self._remove_listener(listener)
+        if policy is None:
+            self._listeners.add(wl)
+        else:
+            self._queued_listeners[wl] = QueuedListener(wl, policy, queue_size)
+        self._on_listeners_changed()
+
+    def _remove_listener(self, listener):
+        """
+        Must be called with the lock.
+        listener (callable or WeakMethod)
+        """
+        if not isinstance(listener, (WeakMethodBound, WeakMethodFree)):
+            listener = WeakMethod(listener)
+        self._listeners.discard(listener)
+        ql = self._queued_listeners.pop(listener, None)
+        if ql:
+            ql.stop()
+        self._on_listeners_changed()
+
+    def _on_listeners_changed(self):
+        """
+        Called whenever the set of listeners (or their policy) changes.
+        To be overridden.
+        """
+        pass
+
+    def getDroppedCount(self, listener):
+        """
+        Return the number of data which has been discarded for a given listener.
+        listener (callable): a listener subscribed with a policy
+        return (int or None): number of data dropped since the subscription.
+          None if the listener is subscribed without policy (because then
+          the discarding is not tracked per listener).
+        raise LookupError: if the listener is not subscribed
+        """
+        wl = WeakMethod(listener)
+        with self._lock:
+            if wl in self._listeners:
+                return None
+            try:
+                return self._queued_listeners[wl].dropped
+            except KeyError:
+                raise LookupError("Listener %r is not subscribed" % (listener,))
+
 #    # to be overridden
 #    def synchronizedOn(self, event):
 #        raise NotImplementedError("This DataFlow doesn't support Event synchronization")
@@ -171,6 +345,30 @@ class DataFlowBase(object):
         """
         assert(isinstance(data, numpy.ndarray))
 
+        self._notify_queued(data)
+        self._notify_direct(data)
+
+    def _notify_queued(self, data):
+        """
+        Pass the data to all the listeners which have a policy
+        """
+        # to allow modify the dict while calling
+        for ql in list(self._queued_listeners.values()):
+            ql.push(self, data)
+
+    def _notify_dropped(self, count=1):
+        """
+        Record that some data was lost before it could be passed to the
+        listeners, so that it's reported by getDroppedCount()
+        count (int > 0): number of data lost
+        """
+        for ql in list(self._queued_listeners.values()):
+            ql.drop(count)
+
+    def _notify_direct(self, data):
+        """
+        Call all the listeners which have no policy
+        """
         # Never take the lock here, to avoid the case where stop_generate() waits
         # for one last notify
 
@@ -186,23 +384,244 @@ class DataFlowBase(object):
                 logging.exception("Exception when notifying a data_flow")
 
 
+# Directory where the shared memory segments are created (must be a tmpfs)
+SHM_DIRECTORY = "/dev/shm"
+# Arrays smaller than this are always sent over 0MQ: for them, the cost of
+# mapping the segment is bigger than the cost of the copy.
+SHM_MIN_SIZE = 256 * 1024  # bytes
+# Each segment starts with a header containing the generation number (uint64).
+# The data starts after it, aligned on a cache line.
+_SHM_HEADER = struct.Struct("<Q")
+_SHM_DATA_OFFSET = 64  # bytes
+
+
+class SharedMemorySegment(object):
+    """
+    One shared memory segment, as seen by the producer (ie, in read/write mode).
+    The segment is a file in SHM_DIRECTORY, starting with a header containing
+    the generation number of the data currently stored, followed by the data.
+    """
+
+    def __init__(self, path):
+        """
+        path (str): the file name of the segment. It should not exist yet.
+        """
+        self.path = path
+        self.generation = 0
+        self.size = 0  # bytes available for the data
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        self._mm = None
+
+    def try_lock(self):
+        """
+        Try to acquire exclusive ownership of the segment.
+        return (bool): True if the segment is not used by any reader anymore,
+          and is now locked. False if some reader still has it mapped.
+        """
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):  # EWOULDBLOCK
+            return False
+        return True
+
+    def unlock(self):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def write(self, data):
+        """
+        Copy the data into the segment, and increase the generation number.
+        Must be called with the lock held.
+        data (numpy.ndarray): data to copy
+        return (int): the new generation number
+        """
+        if self.size < data.nbytes:
+            self._resize(data.nbytes)
+
+        dest = numpy.ndarray(data.shape, data.dtype, buffer=self._mm,
+                             offset=_SHM_DATA_OFFSET)
+        dest[...] = data  # Also works if data is not C-contiguous
+        del dest  # Release the buffer, so that the mmap can be closed
+
+        self.generation += 1
+        _SHM_HEADER.pack_into(self._mm, 0, self.generation)
+        return self.generation
+
+    def _resize(self, size):
+        """
+        Change the size of the segment. Must be called with the lock held.
+        size (int > 0): minimum number of bytes needed for the data
+        """
+        # Round up to full pages, to avoid resizing for every slightly bigger array
+        size = -(-size // mmap.PAGESIZE) * mmap.PAGESIZE
+        if self._mm is not None:
+            self._mm.close()
+        os.ftruncate(self._fd, _SHM_DATA_OFFSET + size)
+        self._mm = mmap.mmap(self._fd, _SHM_DATA_OFFSET + size)
+        self.size = size
+
+    def close(self):
+        """
+        Release the segment. Readers which still have it mapped can still
+        access their data.
+        """
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        try:
+            os.close(self._fd)
+        except OSError:
+            pass
+        try:
+            os.remove(self.path)
+        except OSError:
+            logging.warning("Failed to delete shared memory segment %s", self.path)
+
+
+class SharedMemoryRing(object):
+    """
+    A ring of shared memory segments, used by a DataFlow to transmit arrays to
+    the subscribers located on the same computer, without sending the data
+    itself over 0MQ. Only a small descriptor (file name + generation) is sent.
+
+    Ownership and recycling protocol:
+     * Only the producer (the DataFlow) creates, writes, and deletes the
+       segments. While writing a segment, it holds an exclusive flock() on it,
+       and after the data is written, it increases the generation number
+       stored in the header of the segment.
+     * The reader opens the segment, takes a shared flock() on it, and checks
+       that the generation number in the header matches the one of the
+       descriptor. If not, the segment has already been recycled, and the
+       array is dropped (and counted in getDroppedCount()). Otherwise, the segment is mapped
+       read-only, and the array directly uses this memory. The lock is held
+       as long as the mapping exists, so as long as the array is referenced.
+     * Before writing, the producer picks the next segment of the ring which
+       can be exclusively locked (ie, no reader holds it anymore). If they are
+       all locked, a new segment is added to the ring (up to max_segments).
+       If that's not possible either, the array is sent the standard way, over
+       0MQ.
+    As flock() locks are automatically released by the kernel when a process
+    ends, a reader crashing never blocks a segment forever.
+    """
+
+    def __init__(self, name, min_segments=3, max_segments=16):
+        """
+        name (str): unique name, used as base for the segment file names
+        min_segments (int > 0): number of segments to create immediately
+        max_segments (int >= min_segments): maximum number of segments in the ring
+        """
+        self._basename = os.path.join(SHM_DIRECTORY, "odemis-%s-" % (name,))
+        self._max_segments = max_segments
+        self._segments = []
+        self._next = 0  # index of the next segment to try to use
+        for i in range(min_segments):
+            self._add_segment()
+
+    def _add_segment(self):
+        seg = SharedMemorySegment("%s%d" % (self._basename, len(self._segments)))
+        self._segments.append(seg)
+        return seg
+
+    def write(self, data):
+        """
+        Store the data into a free segment of the ring.
+        data (numpy.ndarray): data to copy
+        return (dict or None): descriptor of the data location, to be passed to
+          open_shared_array(). None if no segment was available.
+        """
+        nsegs = len(self._segments)
+        for i in range(nsegs):
+            idx = (self._next + i) % nsegs
+            seg = self._segments[idx]
+            if seg.try_lock():
+                break
+        else:
+            if nsegs >= self._max_segments:
+                return None
+            idx = nsegs
+            seg = self._add_segment()
+            if not seg.try_lock():  # Should never happen
+                return None
+
+        try:
+            gen = seg.write(data)
+        finally:
+            seg.unlock()
+        self._next = (idx + 1) % len(self._segments)
+        return {"path": seg.path, "gen": gen}
+
+    def close(self):
+        """
+        Delete all the segments
+        """
+        for seg in self._segments:
+            seg.close()
+        self._segments = []
+
+
+def open_shared_array(desc, dtype, shape):
+    """
+    Map (zero-copy) an array written by a SharedMemoryRing.
+    desc (dict): descriptor as returned by SharedMemoryRing.write()
+    dtype (numpy.dtype): type of the array
+    shape (tuple of int): shape of the array
+    return (numpy.ndarray or None): read-only array, directly using the shared
+      memory. None if the data is not available anymore (because the segment
+      was recycled or deleted by the producer).
+    """
+    try:
+        fd = os.open(desc["path"], os.O_RDONLY)
+    except OSError:
+        return None  # The producer is gone
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        # Note: mmap() duplicates the file descriptor, which shares the lock.
+        # So the lock is held until the mapping is released (= when the array
+        # is garbage collected), even after closing fd.
+        mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    finally:
+        os.close(fd)
+
+    gen = _SHM_HEADER.unpack_from(mm, 0)[0]
+    if gen != desc["gen"]:
+        mm.close()  # Also releases the lock
+        return None
+
+    dtype = numpy.dtype(dtype)
+    count = int(numpy.prod(shape))
+    array = numpy.frombuffer(mm, dtype=dtype, count=count, offset=_SHM_DATA_OFFSET)
+    array.shape = shape
+    return array
+
+
 # DataFlow object to create on the server (in a component)
 class DataFlow(DataFlowBase):
-    def __init__(self, max_discard=100): # XXX max_discard=100
+    def __init__(self, max_discard=100, shared_mem=False): # XXX max_discard=100
         """
         max_discard (int): mount of messages that can be discarded in a row if
                             a new one is already available. 0 to keep (notify)
                             all the messages (dangerous if callback is slower
                             than the generator).
+        shared_mem (bool): if True, the large arrays are passed to the remote
+          subscribers via shared memory, and only a descriptor is sent over 0MQ.
+          It avoids copying the data, which is worthy for large and frequent
+          arrays. If shared memory is not available, the data is sent normally.
         """
         DataFlowBase.__init__(self)
         # different from ._listeners for notify() to do different things
         self._remote_listeners = set() # any unique string works
+        # The remote listeners which need all the data (subset of _remote_listeners)
+        self._remote_lossless = set()
+        self._seq = 0  # number of the latest data sent remotely, to detect data lost
 
         self._global_name = None # to be filled when registered
         self._ctx = None
         self.pipe = None
         self._max_discard = max_discard
+        self._shared_mem = shared_mem
+        self._shm_ring = None  # SharedMemoryRing, created when registered
+        # Only send the metadata which changed since the previous data
+        self._md_encoder = _mdcodec.MetadataEncoder()
 
     def _getproxystate(self):
         """
@@ -267,7 +686,16 @@ class DataFlow(DataFlowBase):
         # not recommended by 0MQ. At least, we should never access it from this
         # thread anymore. To be safe, it might need a pub-sub forwarder proxy inproc
         self._ctx = zmq.Context(1)
-        self.pipe = self._ctx.socket(zmq.PUB)
+        if hasattr(zmq, "XPUB_VERBOSE"):  # zmq v3.2+
+            # XPUB passes the subscriptions to us, so that the metadata of the
+            # next data is sent as a key frame when a subscriber connects or
+            # asks for it (and only then).
+            self.pipe = self._ctx.socket(zmq.XPUB)
+            self.pipe.setsockopt(zmq.XPUB_VERBOSE, 1)
+        else:
+            # No way to know when a subscriber connects => only key frames
+            self.pipe = self._ctx.socket(zmq.PUB)
+            self._md_encoder = _mdcodec.MetadataEncoder(keyframe_period=0)
         self.pipe.linger = 1 # don't keep messages more than 1s after close
         self._update_pipe_hwm()
 
@@ -277,6 +705,17 @@ class DataFlow(DataFlowBase):
         logging.debug("server is registered to send to " + "ipc://" + self._global_name)
         self.pipe.bind("ipc://" + self._global_name)
 
+        if self._shared_mem:
+            if fcntl is None or not os.path.isdir(SHM_DIRECTORY):
+                logging.info("Shared memory not available, will send data of %s over 0MQ",
+                             self._global_name)
+            else:
+                try:
+                    self._shm_ring = SharedMemoryRing("%x-%x" % (os.getpid(), id(self)))
+                except (IOError, OSError):
+                    logging.exception("Failed to create shared memory for %s, will send data over 0MQ",
+                                      self._global_name)
+
     def _unregister(self):
         """
         unregister the dataflow from the daemon and clean up the 0MQ bindings
@@ -289,9 +728,12 @@ class DataFlow(DataFlowBase):
             self.pipe = None
             self._ctx.term()
             self._ctx = None
+        if self._shm_ring:
+            self._shm_ring.close()
+            self._shm_ring = None
 
     def _count_listeners(self):
-        return len(self._listeners) + len(self._remote_listeners)
+        return DataFlowBase._count_listeners(self) + len(self._remote_listeners)
 
     def get(self, asap=True):
         """
@@ -324,16 +766,23 @@ class DataFlow(DataFlowBase):
     # speed up a bit calls to them), but as Pyro doesn't ensure the order, it's
     # not possible because it could lead to wrong behaviour in case of quick
     # subscribe/unsubscribe.
-    def subscribe(self, listener):
+    def subscribe(self, listener, policy=None, queue_size=None):
         with self._lock:
             count_before = self._count_listeners()
 
             # add string to listeners if listener is string
             if isinstance(listener, basestring):
                 self._remote_listeners.add(listener)
+                # A proxy subscribes again if the policy of its listeners changes
+                if policy == DF_POLICY_LOSSLESS:
+                    self._remote_lossless.add(listener)
+                else:
+                    self._remote_lossless.discard(listener)
+                # The key frame for the new subscriber is sent when its 0MQ
+                # subscription is received (cf _check_subscriptions())
             else:
                 assert callable(listener)
-                self._listeners.add(WeakMethod(listener))
+                self._add_listener(listener, policy, queue_size)
 
             logging.debug("Listener %r subscribed, now %d subscribers on %s", listener, self._count_listeners(), self._global_name)
             if count_before == 0:
@@ -345,8 +794,9 @@ class DataFlow(DataFlowBase):
             if isinstance(listener, basestring):
                 # remove string from listeners
                 self._remote_listeners.discard(listener)
+                self._remote_lossless.discard(listener)
             else:
-                self._listeners.discard(WeakMethod(listener))
+                self._remove_listener(listener)
 
             count_after = self._count_listeners()
             logging.debug("Listener %r unsubscribed, now %d subscribers on %s", listener, count_after, self._global_name)
@@ -364,29 +814,80 @@ class DataFlow(DataFlowBase):
             # is gone (if there is a way to associate it)
 
             # TODO thread-safe for self.pipe ?
-            dformat = {"dtype": str(data.dtype), "shape": data.shape}
-            self.pipe.send_pyobj(dformat, zmq.SNDMORE)
-            self.pipe.send_pyobj(data.metadata, zmq.SNDMORE)
-            try:
-                if not data.flags["C_CONTIGUOUS"]:
-                    # if not in C order, it will be received incorrectly
-                    # TODO: if it's just rotated, send the info to reconstruct it
-                    # and avoid the memory copy
-                    raise TypeError("Need C ordered array")
-                self.pipe.send(memoryview(data), copy=False)
-            except TypeError:
-                # not all buffers can be sent zero-copy (e.g., has strides)
-                # try harder by copying (which removes the strides)
-                logging.debug("Failed to send data with zero-copy")
-                data = numpy.require(data, requirements=["C_CONTIGUOUS"])
-                self.pipe.send(memoryview(data), copy=False)
+            self._check_subscriptions()
+            self._seq += 1
+            dformat = {"dtype": str(data.dtype), "shape": data.shape, "seq": self._seq}
+            shm_desc = None
+            # A segment can be recycled before being read, so if a subscriber
+            # needs all the data, it's sent over 0MQ.
+            if self._shm_ring and not self._remote_lossless and data.nbytes >= SHM_MIN_SIZE:
+                try:
+                    shm_desc = self._shm_ring.write(data)
+                except Exception:
+                    logging.exception("Failed to write data to shared memory")
+            if shm_desc:
+                # Only the location of the data is sent, the last part is empty
+                dformat["shm"] = shm_desc
+                self._send_header(dformat, data.metadata)
+                self.pipe.send(b"")
+            else:
+                self._send_array(dformat, data)
 
         # publish locally
         DataFlowBase.notify(self, data)
 
+    def _check_subscriptions(self):
+        """
+        Process the subscription messages received on the pipe. Whenever a
+        subscriber connects, or requests a key frame (because it cannot decode
+        the metadata), the metadata of the next data is sent as a key frame.
+        Note: the subscriptions must be read from the same thread as the one
+        sending the data, so it's done just before sending.
+        """
+        if not hasattr(zmq, "XPUB_VERBOSE"):
+            return  # PUB pipe => every message is a key frame anyway
+
+        while self.pipe.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+            msg = self.pipe.recv()
+            # First byte is 1 for subscription, 0 for unsubscription
+            if msg[:1] == b"\x01":
+                self._md_encoder.reset()
+
+    def _send_header(self, dformat, md):
+        """
+        Send the first two parts of the message: the format and the metadata
+        dformat (dict): format of the data
+        md (dict): metadata of the data
+        """
+        self.pipe.send(_mdcodec.encode_value(dformat), zmq.SNDMORE)
+        self.pipe.send(self._md_encoder.encode(md), zmq.SNDMORE)
+
+    def _send_array(self, dformat, data):
+        """
+        Send the whole array over 0MQ
+        dformat (dict): format of the data
+        data (DataArray): the data to be sent
+        """
+        self._send_header(dformat, data.metadata)
+        try:
+            if not data.flags["C_CONTIGUOUS"]:
+                # if not in C order, it will be received incorrectly
+                # TODO: if it's just rotated, send the info to reconstruct it
+                # and avoid the memory copy
+                raise TypeError("Need C ordered array")
+            self.pipe.send(memoryview(data), copy=False)
+        except TypeError:
+            # not all buffers can be sent zero-copy (e.g., has strides)
+            # try harder by copying (which removes the strides)
+            logging.debug("Failed to send data with zero-copy")
+            data = numpy.require(data, requirements=["C_CONTIGUOUS"])
+            self.pipe.send(memoryview(data), copy=False)
+
     def __del__(self):
         if self._count_listeners() > 0:
             self.stop_generate()
+        for ql in self._queued_listeners.values():
+            ql.stop()
         self._unregister()
 
 # DataFlowBase object automatically created on the client (in an Odemic component)
@@ -412,6 +913,8 @@ class DataFlowProxy(DataFlowBase, Pyro4.Proxy):
         self._ctx = None
         self._commands = None
         self._thread = None
+        self._remote_subscribed = False
+        self._remote_policy = None  # policy used for the remote subscription
 
     def __getstate__(self):
         # must permit to recreate a proxy to a data-flow in a different container
@@ -430,6 +933,8 @@ class DataFlowProxy(DataFlowBase, Pyro4.Proxy):
         self._ctx = None
         self._commands = None
         self._thread = None
+        self._remote_subscribed = False
+        self._remote_policy = None
 
     # .get() is a direct remote call
 
@@ -438,11 +943,50 @@ class DataFlowProxy(DataFlowBase, Pyro4.Proxy):
     #.unsubscribe()
     #.notify()
 
+    def _on_listeners_changed(self):
+        # If some listeners have a policy, all the data must be received, and
+        # they will do the discarding themselves.
+        if self._thread:
+            self._thread.keep_all = bool(self._queued_listeners)
+
+        # The remote DataFlow needs to know when all the data must be received
+        policy = self._get_remote_policy()
+        if self._remote_subscribed and policy != self._remote_policy:
+            Pyro4.Proxy.__getattr__(self, "subscribe")(self._proxy_name, policy)
+            self._remote_policy = policy
+
+    def _get_remote_policy(self):
+        """
+        return (None or DF_POLICY_LOSSLESS): the policy of the remote subscription
+        """
+        if any(ql.policy == DF_POLICY_LOSSLESS for ql in self._queued_listeners.values()):
+            return DF_POLICY_LOSSLESS
+        return None
+
+    def _notify_dropped(self, count=1):
+        if self._remote_policy == DF_POLICY_LOSSLESS:
+            logging.warning("%d data of %s lost, while a listener is subscribed as lossless",
+                            count, self._global_name)
+        DataFlowBase._notify_dropped(self, count)
+
+    def _notify_received(self, data, discard):
+        """
+        Called by the subscription thread for each data received
+        data (DataArray): the data received
+        discard (bool): if True, the listeners without policy should not get it,
+          as a newer data is already available
+        """
+        self._notify_queued(data)
+        if not discard:
+            self._notify_direct(data)
+
     def _create_thread(self):
         self._ctx = zmq.Context(1) # apparently 0MQ reuse contexts
         self._commands = self._ctx.socket(zmq.PAIR)
         self._commands.bind("inproc://" + self._global_name)
-        self._thread = SubscribeProxyThread(self.notify, self._global_name, self.max_discard, self._ctx)
+        self._thread = SubscribeProxyThread(self._notify_received, self._notify_dropped,
+                                            self._global_name, self.max_discard, self._ctx)
+        self._thread.keep_all = bool(self._queued_listeners)
         self._thread.start()
 
     def start_generate(self):
@@ -455,10 +999,13 @@ class DataFlowProxy(DataFlowBase, Pyro4.Proxy):
         # send subscription to the actual dataflow
         # a bit tricky because the underlying method gets created on the fly
 #        Pyro4.Proxy.subscribe(self, self._global_name)
-        Pyro4.Proxy.__getattr__(self, "subscribe")(self._proxy_name)
+        self._remote_policy = self._get_remote_policy()
+        Pyro4.Proxy.__getattr__(self, "subscribe")(self._proxy_name, self._remote_policy)
+        self._remote_subscribed = True
 
     def stop_generate(self):
         # stop the remote subscription
+        self._remote_subscribed = False
         Pyro4.Proxy.__getattr__(self, "unsubscribe")(self._proxy_name)
         self._commands.send(b"UNSUB")  # asynchronous (necessary to not deadlock)
 
@@ -467,7 +1014,7 @@ class DataFlowProxy(DataFlowBase, Pyro4.Proxy):
             # end the thread (but it will stop as soon as it notices we are gone anyway)
             if self._thread:
                 if self._thread.is_alive():
-                    if len(self._listeners):
+                    if self._count_listeners():
                         if logging:
                             logging.debug("Stopping subscription while there "
                                           "are still subscribers because dataflow '%s' is going out of context",
@@ -479,6 +1026,8 @@ class DataFlowProxy(DataFlowBase, Pyro4.Proxy):
                 # Not needed: called when garbage-collected and it's dangerous
                 # as it blocks until all connections are closed.
                 # self._ctx.term()
+            for ql in self._queued_listeners.values():
+                ql.stop()
         except Exception:
             pass
         try:
@@ -487,10 +1036,20 @@ class DataFlowProxy(DataFlowBase, Pyro4.Proxy):
             pass # don't be too rough if that fails, it's not big deal anymore
 
 
+# Prefix of the 0MQ topic subscribed by a receiver to request a key frame of the
+# metadata. No message is ever sent on it: the first part of a message is the
+# encoded format, which never starts with 0xff.
+_KEYFRAME_REQUEST_TOPIC = b"\xffkeyframe"
+# Minimum time (s) between two key frame requests of a receiver
+_KEYFRAME_REQUEST_PERIOD = 0.1
+
+
 class SubscribeProxyThread(threading.Thread):
-    def __init__(self, notifier, uri, max_discard, zmq_ctx):
+    def __init__(self, notifier, drop_notifier, uri, max_discard, zmq_ctx):
         """
         notifier (callable): method to call when a new array arrives
+        drop_notifier (callable): method to call with the number of arrays lost
+          (ie, which were sent, but couldn't be passed to the notifier)
         uri (string): unique string to identify the connection
         max_discard (int)
         zmq_ctx (0MQ context): available 0MQ context to use
@@ -499,10 +1058,14 @@ class SubscribeProxyThread(threading.Thread):
         self.daemon = True
         self.uri = uri
         self.max_discard = max_discard
+        # If True, the data which could be discarded is still received (and
+        # passed to the notifier with discard=True)
+        self.keep_all = False
         self._ctx = zmq_ctx
         # don't keep strong reference to notifier so that it can be garbage
         # collected normally and it will let us know then that we can stop
         self.w_notifier = WeakMethod(notifier)
+        self.w_drop_notifier = WeakMethod(drop_notifier)
 
         # create a zmq synchronised channel to receive _commands
         self._commands = zmq_ctx.socket(zmq.PAIR)
@@ -517,12 +1080,18 @@ class SubscribeProxyThread(threading.Thread):
         else:  # zmq v2
             self._data.hwm = 0
         self._data.connect("ipc://" + uri)
+        self._kf_requests = 0  # number of key frames requested
 
-        # TODO: we need a more advance support for max_discards to be able to
-        # ensure all the data is received when the client needs it.
-        # API should be either:
-        #  *  .max_discard = XXX (= per dataflow)
-        #  * .subscribe(callback, discard=True) (per subscriber)
+    def _request_keyframe(self):
+        """
+        Ask the DataFlow to send the metadata of the next data as a key frame.
+        The request is passed as a subscription to a dedicated topic, which is
+        unique so that it's always reported to the DataFlow.
+        """
+        self._kf_requests += 1
+        topic = _KEYFRAME_REQUEST_TOPIC + ("%x-%d" % (id(self), self._kf_requests)).encode("ascii")
+        self._data.setsockopt(zmq.SUBSCRIBE, topic)
+        self._data.setsockopt(zmq.UNSUBSCRIBE, topic)
 
     def run(self):
         """
@@ -536,6 +1105,9 @@ class SubscribeProxyThread(threading.Thread):
             poller.register(self._commands, zmq.POLLIN)
             poller.register(self._data, zmq.POLLIN)
             discarded = 0
+            md_decoder = _mdcodec.MetadataDecoder()
+            last_seq = None  # number of the latest data received
+            kf_req_time = 0  # time of the latest key frame request
             while True:
                 socks = dict(poller.poll())
 
@@ -543,6 +1115,7 @@ class SubscribeProxyThread(threading.Thread):
                 if self._commands in socks:
                     message = self._commands.recv()
                     if message == b"SUB":
+                        last_seq = None  # The data sent while not subscribed is not lost
                         self._data.setsockopt(zmq.SUBSCRIBE, b'')
                         logging.debug("Subscribed to remote dataflow %s", self.uri)
                         self._commands.send(b"SUBD")
@@ -560,30 +1133,78 @@ class SubscribeProxyThread(threading.Thread):
                 if self._data in socks:
                     # TODO: be more resilient if wrong data is received (can
                     # block forever)
-                    array_format = self._data.recv_pyobj()
-                    array_md = self._data.recv_pyobj()
+                    array_format = self._data.recv()
+                    array_md = self._data.recv()
                     array_buf = self._data.recv(copy=False)
+                    array_format = _mdcodec.decode_value(array_format)
+                    # Data can be lost by 0MQ (eg, if the send queue is full)
+                    seq = array_format.get("seq")
+                    if last_seq is not None and seq is not None and seq > last_seq + 1:
+                        logging.debug("Data %d to %d of %s lost during transfer",
+                                      last_seq + 1, seq - 1, self.uri)
+                        try:
+                            self.w_drop_notifier(seq - last_seq - 1)
+                        except WeakRefLostError:
+                            return
+                    last_seq = seq
+
+                    # The metadata must always be decoded, even if the data
+                    # is discarded, to keep the decoder cache up-to-date.
+                    try:
+                        array_md = md_decoder.decode(array_md)
+                    except LookupError:
+                        # Missed the key frame (eg, because 0MQ only connected
+                        # after it was sent) => ask for a new one
+                        logging.info("Dropping data of %s, as its metadata is not yet known", self.uri)
+                        now = time.time()
+                        if now > kf_req_time + _KEYFRAME_REQUEST_PERIOD:
+                            kf_req_time = now
+                            self._request_keyframe()
+                        try:
+                            self.w_drop_notifier(1)
+                        except WeakRefLostError:
+                            return
+                        continue
                     # logging.debug("Received new DataArray over ZMQ for %s", self.uri)
                     # more fresh data already?
+                    discard = False
                     if (self._data.getsockopt(zmq.EVENTS) & zmq.POLLIN and
                         discarded < self.max_discard):
                         discarded += 1
                         # logging.debug("Discarding object received as a newer one is available")
-                        continue
-                    # TODO: only log the accumulated number every second, to avoid log flooding
-#                     if discarded:
-#                         logging.debug("Dataflow %s dropped %d arrays", self.uri, discarded)
-                    discarded = 0
+                        if not self.keep_all:
+                            continue
+                        discard = True
+                    else:
+                        # TODO: only log the accumulated number every second, to avoid log flooding
+#                         if discarded:
+#                             logging.debug("Dataflow %s dropped %d arrays", self.uri, discarded)
+                        discarded = 0
                     # TODO: any need to use zmq.utils.rebuffer.array_from_buffer()?
-                    if len(array_buf):
+                    if "shm" in array_format:
+                        array = open_shared_array(array_format["shm"],
+                                                  array_format["dtype"],
+                                                  array_format["shape"])
+                        if array is None:
+                            # Already recycled by the producer, because all the
+                            # other segments of the ring were busy.
+                            logging.debug("Dropping data of %s, as its shared memory was recycled "
+                                          "before being read (ring too small?)", self.uri)
+                            try:
+                                self.w_drop_notifier(1)
+                            except WeakRefLostError:
+                                return
+                            continue
+                    elif len(array_buf):
                         array = numpy.frombuffer(array_buf, dtype=array_format["dtype"])
+                        array.shape = array_format["shape"]
                     else: # frombuffer doesn't support zero length array
                         array = numpy.empty((0,), dtype=array_format["dtype"])
-                    array.shape = array_format["shape"]
+                        array.shape = array_format["shape"]
                     darray = DataArray(array, metadata=array_md)
 
                     try:
-                        self.w_notifier(darray)
+                        self.w_notifier(darray, discard)
                     except WeakRefLostError:
                         return  # It's a sign there is nothing left to do
         except Exception:
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 16 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+# Compact binary encoding of the metadata (and format) of the DataArrays sent
+# by the DataFlows over 0MQ. Compared to pickle, it's schema-aware: the
+# conventional MD_* strings are sent as a 2-byte index. In addition, the
+# MetadataEncoder/Decoder keep a cache per connection, so that only the
+# metadata which changed since the last "key frame" is sent.
+
+from __future__ import division
+
+import numpy
+from odemis.model import _metadata
+import pickle
+import struct
+import time
+import zlib
+
+# All the conventional strings (keys and values), in a fixed order, so that
+# they can be referred to by their index. Both sides of the connection run the
+# same code, but to be safe the key frames contain a checksum of the table.
+_MD_STRINGS = tuple(sorted(set(v for k, v in vars(_metadata).items()
+                               if k.startswith("MD_") and isinstance(v, str))))
+_MD_STRINGS_IDX = {s: i for i, s in enumerate(_MD_STRINGS)}
+_MD_STRINGS_CRC = zlib.crc32("\n".join(_MD_STRINGS).encode("utf-8")) & 0xffffffff
+
+# Type tags (1 byte)
+_T_NONE = 0
+_T_TRUE = 1
+_T_FALSE = 2
+_T_INT = 3  # int64
+_T_FLOAT = 4  # float64
+_T_STR = 5  # uint32 length + utf-8
+_T_BYTES = 6  # uint32 length + bytes
+_T_TUPLE = 7  # uint32 count + items
+_T_LIST = 8  # uint32 count + items
+_T_DICT = 9  # uint32 count + (key, value) items
+_T_SET = 10  # uint32 count + items
+_T_FROZENSET = 11  # uint32 count + items
+_T_NDARRAY = 12  # dtype (as str) + uint8 ndim + uint64 * ndim + raw data
+_T_NPSCALAR = 13  # dtype (as str) + raw data
+_T_MDSTR = 14  # uint16 index in _MD_STRINGS
+_T_PICKLE = 15  # uint32 length + pickled object
+
+_TAG = struct.Struct("<B")
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_LEN = struct.Struct("<I")
+_IDX = struct.Struct("<H")
+_DIM = struct.Struct("<Q")
+
+_INT_MIN, _INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+# Pre-packed tags of the most common types
+_B_FLOAT = _TAG.pack(_T_FLOAT)
+_B_INT = _TAG.pack(_T_INT)
+_B_MDSTR = _TAG.pack(_T_MDSTR)
+
+# Message types of the MetadataEncoder
+_MSG_KEYFRAME = b"K"  # uint32 id + uint32 CRC + dict
+_KEYFRAME_HDR = struct.Struct("<II")
+# uint32 id of the key frame + uint16 number of changed entries + uint16
+# number of removed keys, followed by the (key, value) changed, and the keys removed
+_MSG_DELTA = b"D"
+_DELTA_HDR = struct.Struct("<IHH")
+
+_MISSING = object()
+
+
+def _encode(v, out):
+    """
+    Append the binary representation of a value to the out list
+    v (object): value to encode
+    out (list of bytes)
+    """
+    t = type(v)
+    if t is float:
+        out.append(_B_FLOAT + _FLOAT.pack(v))
+    elif t is str:
+        idx = _MD_STRINGS_IDX.get(v)
+        if idx is not None:
+            out.append(_B_MDSTR + _IDX.pack(idx))
+        else:
+            b = v.encode("utf-8")
+            out.append(_TAG.pack(_T_STR) + _LEN.pack(len(b)))
+            out.append(b)
+    elif t is bool:  # before int, as it's a subclass of int
+        out.append(_TAG.pack(_T_TRUE if v else _T_FALSE))
+    elif t is int and _INT_MIN <= v <= _INT_MAX:
+        out.append(_B_INT + _INT.pack(v))
+    elif v is None:
+        out.append(_TAG.pack(_T_NONE))
+    elif t in (tuple, list, set, frozenset):
+        tag = {tuple: _T_TUPLE, list: _T_LIST, set: _T_SET, frozenset: _T_FROZENSET}[t]
+        out.append(_TAG.pack(tag) + _LEN.pack(len(v)))
+        for i in v:
+            _encode(i, out)
+    elif t is dict:
+        out.append(_TAG.pack(_T_DICT) + _LEN.pack(len(v)))
+        for k, i in v.items():
+            _encode(k, out)
+            _encode(i, out)
+    elif t is bytes:
+        out.append(_TAG.pack(_T_BYTES) + _LEN.pack(len(v)))
+        out.append(v)
+    elif t is numpy.ndarray and not v.dtype.hasobject:
+        dt = v.dtype.str.encode("ascii")
+        out.append(_TAG.pack(_T_NDARRAY) + _TAG.pack(len(dt)) + dt + _TAG.pack(v.ndim))
+        out.append(b"".join(_DIM.pack(d) for d in v.shape))
+        out.append(v.tobytes())
+    elif isinstance(v, numpy.generic) and not v.dtype.hasobject:
+        dt = v.dtype.str.encode("ascii")
+        out.append(_TAG.pack(_T_NPSCALAR) + _TAG.pack(len(dt)) + dt)
+        out.append(v.tobytes())
+    else:
+        # Anything else (including subclasses of the basic types): let pickle
+        # take care of it, as it's guaranteed to return exactly the same object.
+        b = pickle.dumps(v, pickle.HIGHEST_PROTOCOL)
+        out.append(_TAG.pack(_T_PICKLE) + _LEN.pack(len(b)))
+        out.append(b)
+
+
+def _decode(buf, pos):
+    """
+    Read one value from the buffer
+    buf (bytes or memoryview)
+    pos (int): position of the value in the buffer
+    return (object, int): the value and the position after it
+    """
+    tag = buf[pos]
+    if not isinstance(tag, int):  # Python 2
+        tag = ord(tag)
+    pos += 1
+    if tag == _T_FLOAT:
+        return _FLOAT.unpack_from(buf, pos)[0], pos + _FLOAT.size
+    elif tag == _T_MDSTR:
+        return _MD_STRINGS[_IDX.unpack_from(buf, pos)[0]], pos + _IDX.size
+    elif tag == _T_INT:
+        return _INT.unpack_from(buf, pos)[0], pos + _INT.size
+    elif tag == _T_STR:
+        l = _LEN.unpack_from(buf, pos)[0]
+        pos += _LEN.size
+        return bytes(buf[pos:pos + l]).decode("utf-8"), pos + l
+    elif tag == _T_NONE:
+        return None, pos
+    elif tag == _T_TRUE:
+        return True, pos
+    elif tag == _T_FALSE:
+        return False, pos
+    elif tag in (_T_TUPLE, _T_LIST, _T_SET, _T_FROZENSET):
+        n = _LEN.unpack_from(buf, pos)[0]
+        pos += _LEN.size
+        items = []
+        for i in range(n):
+            v, pos = _decode(buf, pos)
+            items.append(v)
+        if tag == _T_LIST:
+            return items, pos
+        t = {_T_TUPLE: tuple, _T_SET: set, _T_FROZENSET: frozenset}[tag]
+        return t(items), pos
+    elif tag == _T_DICT:
+        n = _LEN.unpack_from(buf, pos)[0]
+        pos += _LEN.size
+        d = {}
+        for i in range(n):
+            k, pos = _decode(buf, pos)
+            d[k], pos = _decode(buf, pos)
+        return d, pos
+    elif tag == _T_BYTES:
+        l = _LEN.unpack_from(buf, pos)[0]
+        pos += _LEN.size
+        return bytes(buf[pos:pos + l]), pos + l
+    elif tag in (_T_NDARRAY, _T_NPSCALAR):
+        l = _TAG.unpack_from(buf, pos)[0]
+        pos += _TAG.size
+        dtype = numpy.dtype(bytes(buf[pos:pos + l]).decode("ascii"))
+        pos += l
+        if tag == _T_NPSCALAR:
+            end = pos + dtype.itemsize
+            return numpy.frombuffer(bytes(buf[pos:end]), dtype=dtype)[0], end
+        ndim = _TAG.unpack_from(buf, pos)[0]
+        pos += _TAG.size
+        shape = tuple(_DIM.unpack_from(buf, pos + i * _DIM.size)[0] for i in range(ndim))
+        pos += ndim * _DIM.size
+        end = pos + int(numpy.prod(shape)) * dtype.itemsize
+        if end == pos:  # frombuffer doesn't support zero length array
+            return numpy.empty(shape, dtype=dtype), end
+        # Copy, so that the array is writeable and doesn't keep the buffer
+        a = numpy.frombuffer(bytes(buf[pos:end]), dtype=dtype).copy()
+        a.shape = shape
+        return a, end
+    elif tag == _T_PICKLE:
+        l = _LEN.unpack_from(buf, pos)[0]
+        pos += _LEN.size
+        return pickle.loads(bytes(buf[pos:pos + l])), pos + l
+    else:
+        raise ValueError("Unknown type tag %d at position %d" % (tag, pos - 1))
+
+
+def encode_value(v):
+    """
+    Convert a value (typically, a metadata dict) to a compact binary format.
+    Any picklable object is accepted. The basic python types, numpy arrays and
+    numpy scalars are encoded natively, other types are pickled.
+    v (object): value to encode
+    return (bytes): the binary representation
+    """
+    out = []
+    _encode(v, out)
+    return b"".join(out)
+
+
+def decode_value(buf):
+    """
+    Convert back a value encoded by encode_value()
+    buf (bytes or buffer)
+    return (object): the value
+    raise ValueError: if the buffer is not correctly formatted
+    """
+    try:
+        v, pos = _decode(memoryview(buf), 0)
+    except (struct.error, IndexError) as ex:
+        raise ValueError("Failed to decode value: %s" % (ex,))
+    if pos != len(buf):
+        raise ValueError("Buffer contains %d extra bytes" % (len(buf) - pos,))
+    return v
+
+
+def _same_value(a, b):
+    """
+    return (bool): True if a and b are known to be equal. If comparing them is
+      expensive (eg, arrays), they are considered different.
+    """
+    if a is b:
+        return True
+    if type(a) is not type(b) or isinstance(a, numpy.ndarray):
+        return False
+    try:
+        return bool(a == b)
+    except Exception:  # eg, tuple of arrays
+        return False
+
+
+class MetadataEncoder(object):
+    """
+    Encodes the metadata of a sequence of DataArrays, sending only the
+    differences compared to the previous key frame.
+    Typically, between two frames, only MD_ACQ_DATE changes, so the message
+    only contains this value and a reference to the key frame.
+    A key frame (ie, all the metadata) is sent when more than max_delta
+    entries have changed, every keyframe_period, or after a call to reset().
+    """
+
+    def __init__(self, keyframe_period=1.0, max_delta=8):
+        """
+        keyframe_period (float): maximum time (s) between two key frames. It
+          bounds the time a new receiver has to wait before being able to
+          decode the metadata.
+        max_delta (int): maximum number of changed entries in a delta
+        """
+        self._keyframe_period = keyframe_period
+        self._max_delta = max_delta
+        self._kf_id = 0
+        self._kf_md = None  # dict: the metadata of the latest key frame
+        self._kf_time = 0
+
+    def reset(self):
+        """
+        Force the next message to be a key frame. Typically, call it when a
+        new receiver is connected.
+        """
+        self._kf_md = None
+
+    def encode(self, md):
+        """
+        md (dict str -> value): the metadata
+        return (bytes): the message to be passed to MetadataDecoder.decode()
+        """
+        kf_md = self._kf_md
+        now = time.time()
+        if kf_md is not None and now < self._kf_time + self._keyframe_period:
+            out = []
+            nchanged = 0
+            nfound = 0  # number of keys also in the key frame
+            for k, v in md.items():
+                kv = kf_md.get(k, _MISSING)
+                if kv is not _MISSING:
+                    nfound += 1
+                    if v is kv or _same_value(v, kv):
+                        continue
+                nchanged += 1
+                if nchanged > self._max_delta:
+                    break
+                _encode(k, out)
+                _encode(v, out)
+            else:
+                if nfound == len(kf_md):
+                    removed = ()
+                else:
+                    removed = [k for k in kf_md if k not in md]
+                if len(removed) <= self._max_delta:
+                    for k in removed:
+                        _encode(k, out)
+                    hdr = _MSG_DELTA + _DELTA_HDR.pack(self._kf_id, nchanged, len(removed))
+                    return hdr + b"".join(out)
+
+        # Key frame
+        self._kf_id = (self._kf_id + 1) & 0xffffffff
+        self._kf_md = md.copy()  # shallow copy, in case the dict is modified later
+        self._kf_time = now
+        out = [_MSG_KEYFRAME + _KEYFRAME_HDR.pack(self._kf_id, _MD_STRINGS_CRC)]
+        _encode(md, out)
+        return b"".join(out)
+
+
+class MetadataDecoder(object):
+    """
+    Decodes the metadata encoded by a MetadataEncoder. One decoder should be
+    used per connection (ie, per encoder), and all the messages must be decoded
+    in the order they were encoded.
+    """
+
+    def __init__(self):
+        self._kf_id = None
+        self._kf_md = None
+
+    def decode(self, buf):
+        """
+        buf (bytes or buffer): message encoded by MetadataEncoder.encode()
+        return (dict str -> value): the metadata. It's a new dict, which can be
+          modified freely.
+        raise LookupError: if the key frame needed is unknown (typically, because
+          the connection started after it was sent)
+        raise ValueError: if the message is not correctly formatted
+        """
+        if not isinstance(buf, bytes):
+            buf = memoryview(buf)
+        try:
+            mtype = bytes(buf[0:1])
+            if mtype == _MSG_DELTA:
+                mid, nchanged, nremoved = _DELTA_HDR.unpack_from(buf, 1)
+                if mid != self._kf_id:
+                    raise LookupError("Metadata key frame %d unknown" % (mid,))
+                pos = 1 + _DELTA_HDR.size
+                md = self._kf_md.copy()
+                for i in range(nchanged):
+                    k, pos = _decode(buf, pos)
+                    md[k], pos = _decode(buf, pos)
+                for i in range(nremoved):
+                    k, pos = _decode(buf, pos)
+                    del md[k]
+                return md
+            elif mtype == _MSG_KEYFRAME:
+                mid, crc = _KEYFRAME_HDR.unpack_from(buf, 1)
+                if crc != _MD_STRINGS_CRC:
+                    raise ValueError("Metadata encoded with a different schema (%x != %x)" %
+                                     (crc, _MD_STRINGS_CRC))
+                md, pos = _decode(buf, 1 + _KEYFRAME_HDR.size)
+                self._kf_id = mid
+                self._kf_md = md
+                return md.copy()
+            else:
+                raise ValueError("Unknown message type %r" % (mtype,))
+        except (struct.error, IndexError, KeyError) as ex:
+            raise ValueError("Failed to decode metadata: %s" % (ex,))
+
@@ -31,10 +31,10 @@ import numpy
 from odemis.util.weak import WeakMethod, WeakRefLostError
 import os
 import threading
+import time
 import types
 import sys
 import zmq
-from scipy.spatial import distance
 
 from . import _core
 from odemis.util import inspect_getmembers
@@ -44,6 +44,65 @@ class NotSettableError(AttributeError):
     pass
 
 
+# Minimum time between two notifications of the same VA sent to the remote
+# listeners. If the value changes faster, the intermediary values are not sent,
+# and only the latest one is sent at the end of the period.
+REMOTE_NOTIFY_PERIOD = 0.02  # s
+
+_NO_VALUE = object()  # marker for "no pending value"
+
+
+class RemoteNotifier(object):
+    """
+    Sends the delayed (coalesced) notifications of the VAs to their remote
+    listeners. A single thread handles all the VAs of the container.
+    """
+
+    def __init__(self):
+        self._pending = {}  # VigilantAttribute -> time (s) when to send
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, va, due):
+        """
+        Request to call va._flush_remote() at the given time
+        va (VigilantAttribute)
+        due (float): time (s) at which to send the latest value
+        """
+        with self._cond:
+            self._pending[va] = min(due, self._pending.get(va, due))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="VA remote notifier")
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    while not self._pending:
+                        self._cond.wait()
+                    now = time.time()
+                    ready = [va for va, due in self._pending.items() if due <= now]
+                    if not ready:
+                        self._cond.wait(min(self._pending.values()) - now)
+                        continue
+                    for va in ready:
+                        del self._pending[va]
+
+                for va in ready:
+                    try:
+                        va._flush_remote()
+                    except Exception:
+                        logging.exception("Failed to send notification of %s", va)
+        except Exception:
+            if logging:
+                logging.exception("Ending VA remote notifier thread due to exception")
+
+_remote_notifier = RemoteNotifier()
+
+
 class VigilantAttributeBase(object):
     """
     An abstract class for VigilantAttributes and its proxy
@@ -148,6 +207,11 @@ class VigilantAttribute(VigilantAttributeBase):
         self.debug = False  # If True, this VA will print a call stack when its value is set
         self.max_discard = max_discard
 
+        # To coalesce the notifications to the remote listeners
+        self._remote_lock = threading.Lock()  # to be taken to use the pipe
+        self._remote_last_notify = 0  # time of the last value sent
+        self._remote_pending = _NO_VALUE  # latest value not yet sent
+
     def __default_setter(self, value):
         return value
 
@@ -324,11 +388,51 @@ class VigilantAttribute(VigilantAttributeBase):
 
         # publish the data remotely
         if self._remote_listeners:
-            self.pipe.send_pyobj(v)
+            self._notify_remote(v)
 
         # publish locally
         VigilantAttributeBase.notify(self, v)
 
+    def _notify_remote(self, v):
+        """
+        Send the value to the remote listeners. If the previous value was sent
+        less than REMOTE_NOTIFY_PERIOD ago, the value will be sent later (and
+        replaced by a newer value if one comes in the mean time).
+        If max_discard is 0, every value is sent immediately.
+        """
+        with self._remote_lock:
+            if self.max_discard > 0:
+                if self._remote_pending is not _NO_VALUE:
+                    # Will be sent soon anyway => just update the value
+                    self._remote_pending = v
+                    return
+                due = self._remote_last_notify + REMOTE_NOTIFY_PERIOD
+                if time.time() < due:
+                    self._remote_pending = v
+                    _remote_notifier.schedule(self, due)
+                    return
+
+            self._send_remote(v)
+
+    def _flush_remote(self):
+        """
+        Send the value pending to the remote listeners (if there is one)
+        """
+        with self._remote_lock:
+            v = self._remote_pending
+            if v is _NO_VALUE:
+                return
+            self._remote_pending = _NO_VALUE
+            if self._remote_listeners and self.pipe:
+                self._send_remote(v)
+
+    def _send_remote(self, v):
+        """
+        Must be called with the _remote_lock taken
+        """
+        self.pipe.send_pyobj(v)
+        self._remote_last_notify = time.time()
+
     def __del__(self):
         self._unregister()
 
@@ -1011,6 +1115,8 @@ class VAEnumerated(VigilantAttribute, Enumerated):
 
         # find the closest choice (for numbers or tuples only)
         if isinstance(val, collections.Iterable) or isinstance(val, numbers.Real):
+            # Imported only when needed, as scipy is slow to import
+            from scipy.spatial import distance
             ls = []
 
             for choice in self.choices:
@@ -243,6 +243,75 @@ class TestDataFlow(unittest.TestCase):
             dataflow.unsubscribe(self.receive_data2)
 
 
+    def test_df_policies(self):
+        """
+        Check that a slow listener doesn't cause data loss for a lossless one
+        """
+        self.df = SimpleDataFlow()
+        received_lossless = []
+        received_latest = []
+        received_queue = []
+
+        def receive_lossless(df, data):
+            received_lossless.append(data.metadata["num"])
+
+        def receive_latest(df, data):
+            received_latest.append(data.metadata["num"])
+            time.sleep(0.35)  # Much slower than the generation
+
+        def receive_queue(df, data):
+            received_queue.append(data.metadata["num"])
+            time.sleep(0.35)
+
+        self.df.subscribe(receive_latest, policy=model.DF_POLICY_LATEST)
+        self.df.subscribe(receive_queue, policy=model.DF_POLICY_QUEUE, queue_size=2)
+        self.df.subscribe(receive_lossless, policy=model.DF_POLICY_LOSSLESS)
+        time.sleep(2)
+        self.df.unsubscribe(receive_lossless)
+        self.df.unsubscribe(receive_latest)
+        self.df.unsubscribe(receive_queue)
+
+        # All the data received, in order, without any hole
+        self.assertGreaterEqual(len(received_lossless), 10)
+        self.assertEqual(received_lossless,
+                         list(range(received_lossless[0], received_lossless[0] + len(received_lossless))))
+
+        self.assertLess(len(received_latest), len(received_lossless))
+        self.assertLess(len(received_queue), len(received_lossless))
+
+        with self.assertRaises(LookupError):
+            self.df.getDroppedCount(receive_lossless)
+
+    def test_df_dropped_count(self):
+        self.df = SimpleDataFlow()
+
+        def receive_slow(df, data):
+            time.sleep(0.35)
+
+        self.df.subscribe(receive_slow, policy=model.DF_POLICY_LATEST)
+        time.sleep(1.5)
+        self.assertGreater(self.df.getDroppedCount(receive_slow), 0)
+        self.df.unsubscribe(receive_slow)
+
+        # Data lost before reaching the DataFlow (eg, during the transport) is also counted
+        received = []
+        def receive_lossless(df, data):
+            received.append(data)
+        self.df.subscribe(receive_lossless, policy=model.DF_POLICY_LOSSLESS)
+        self.df._notify_dropped(3)
+        time.sleep(0.2)
+        self.assertEqual(self.df.getDroppedCount(receive_lossless), 3)
+        self.df.unsubscribe(receive_lossless)
+
+        self.df.subscribe(self.receive_data)
+        self.assertIsNone(self.df.getDroppedCount(self.receive_data))
+        self.df.unsubscribe(self.receive_data)
+
+        with self.assertRaises(ValueError):
+            self.df.subscribe(receive_slow, policy=model.DF_POLICY_QUEUE)
+        with self.assertRaises(ValueError):
+            self.df.subscribe(receive_slow, policy="fast")
+
     def test_synchronized_df(self):
         self.dfe = SimpleDataFlow()
         self.dfs = SynchronizableDataFlow()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Created on 16 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division, print_function
+
+import logging
+import numpy
+from odemis import model
+from odemis.model import _mdcodec
+import pickle
+import time
+import unittest
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+def get_camera_md():
+    """
+    return (dict): metadata similar to a camera image
+    """
+    return {
+        model.MD_HW_NAME: "Andor Zyla 5.5 (s/n: VSC-01234)",
+        model.MD_SW_VERSION: "3.10.30003.5",
+        model.MD_HW_VERSION: "Firmware 14",
+        model.MD_ACQ_DATE: time.time(),
+        model.MD_EXP_TIME: 0.05,
+        model.MD_BINNING: (1, 1),
+        model.MD_PIXEL_SIZE: (1.625e-07, 1.625e-07),
+        model.MD_SENSOR_PIXEL_SIZE: (6.5e-06, 6.5e-06),
+        model.MD_SENSOR_SIZE: (2560, 2160),
+        model.MD_SENSOR_TEMP: -0.5,
+        model.MD_READOUT_TIME: 1e-08,
+        model.MD_GAIN: 1.1,
+        model.MD_BPP: 16,
+        model.MD_BASELINE: 100,
+        model.MD_POS: (0.0012, -0.0034),
+        model.MD_ROTATION: 0.0,
+        model.MD_LENS_MAG: 40.0,
+        model.MD_LENS_NA: 0.95,
+        model.MD_IN_WL: (4.2e-07, 4.6e-07),
+        model.MD_OUT_WL: (5e-07, 5.5e-07),
+        model.MD_LIGHT_POWER: 0.02,
+        model.MD_DET_TYPE: model.MD_DT_INTEGRATING,
+        model.MD_ACQ_TYPE: model.MD_AT_FLUO,
+    }
+
+
+class TestValueCodec(unittest.TestCase):
+
+    def assertSameValue(self, exp, v):
+        self.assertIs(type(v), type(exp))
+        if isinstance(exp, numpy.ndarray):
+            self.assertEqual(v.dtype, exp.dtype)
+            numpy.testing.assert_array_equal(v, exp)
+        else:
+            self.assertEqual(v, exp)
+
+    def test_basic_types(self):
+        for v in (None, True, False, 0, -5, 2 ** 62, 2 ** 70, 1.5, float("inf"),
+                  "", "abcé", model.MD_ACQ_DATE, b"\x00\x01",
+                  (1, 2.0), [1, "a"], {1, 2}, frozenset({"a"}),
+                  {"a": (1, 2), model.MD_POS: {"x": 1.0}},
+                  numpy.float32(1.5), numpy.uint16(3),
+                  numpy.arange(12, dtype=numpy.float32).reshape(3, 4),
+                  numpy.zeros((0, 4), dtype=numpy.uint8),
+                  ):
+            b = _mdcodec.encode_value(v)
+            self.assertSameValue(v, _mdcodec.decode_value(b))
+
+    def test_fallback(self):
+        """
+        Objects not natively supported are pickled
+        """
+        v = {"date": complex(1, 2), "obj": numpy.array([None, 1], dtype=object)}
+        dv = _mdcodec.decode_value(_mdcodec.encode_value(v))
+        self.assertEqual(dv["date"], v["date"])
+        self.assertEqual(list(dv["obj"]), [None, 1])
+
+    def test_md_strings(self):
+        """
+        Conventional strings are encoded shortly
+        """
+        b = _mdcodec.encode_value({model.MD_ACQ_TYPE: model.MD_AT_SPECTRUM})
+        self.assertLess(len(b), 16)
+
+    def test_bad_buffer(self):
+        b = _mdcodec.encode_value({"a": 1.0})
+        with self.assertRaises(ValueError):
+            _mdcodec.decode_value(b[:-3])
+        with self.assertRaises(ValueError):
+            _mdcodec.decode_value(b + b"\x00")
+
+
+class TestMetadataEncoder(unittest.TestCase):
+
+    def test_delta(self):
+        enc = _mdcodec.MetadataEncoder()
+        dec = _mdcodec.MetadataDecoder()
+        md = get_camera_md()
+
+        bkf = enc.encode(md)
+        self.assertEqual(dec.decode(bkf), md)
+
+        # Only the date changes => very short message
+        md[model.MD_ACQ_DATE] += 1
+        b = enc.encode(md)
+        self.assertLess(len(b), 32)
+        self.assertEqual(dec.decode(b), md)
+
+        # Removing & adding keys
+        del md[model.MD_LENS_NA]
+        md[model.MD_USER_NOTE] = "Test"
+        self.assertEqual(dec.decode(enc.encode(md)), md)
+
+        # The decoded metadata can be modified without consequences
+        dmd = dec.decode(enc.encode(md))
+        dmd[model.MD_EXP_TIME] = 10
+        self.assertEqual(dec.decode(enc.encode(md)), md)
+
+        # Everything changes => key frame
+        md2 = {model.MD_EXP_TIME: 2.0}
+        self.assertEqual(dec.decode(enc.encode(md2)), md2)
+
+    def test_new_receiver(self):
+        enc = _mdcodec.MetadataEncoder(keyframe_period=0.5)
+        dec = _mdcodec.MetadataDecoder()
+        md = get_camera_md()
+        enc.encode(md)
+
+        # The new decoder doesn't know the key frame
+        md[model.MD_ACQ_DATE] += 1
+        with self.assertRaises(LookupError):
+            dec.decode(enc.encode(md))
+
+        # After reset, it works immediately
+        enc.reset()
+        self.assertEqual(dec.decode(enc.encode(md)), md)
+
+        # A new key frame is sent regularly
+        dec = _mdcodec.MetadataDecoder()
+        time.sleep(0.6)
+        self.assertEqual(dec.decode(enc.encode(md)), md)
+
+    def test_speed(self):
+        """
+        Compare with the pickle encoding
+        """
+        md = get_camera_md()
+        n = 10000
+
+        tstart = time.time()
+        for i in range(n):
+            md[model.MD_ACQ_DATE] = tstart + i
+            b = pickle.dumps(md, pickle.HIGHEST_PROTOCOL)
+            pickle.loads(b)
+        dur_pickle = time.time() - tstart
+        len_pickle = len(b)
+
+        enc = _mdcodec.MetadataEncoder()
+        dec = _mdcodec.MetadataDecoder()
+        tstart = time.time()
+        for i in range(n):
+            md[model.MD_ACQ_DATE] = tstart + i
+            b = enc.encode(md)
+            dec.decode(b)
+        dur_codec = time.time() - tstart
+        len_codec = len(b)
+
+        logging.info("Pickle took %g µs for %d bytes, codec took %g µs for %d bytes",
+                     dur_pickle * 1e6 / n, len_pickle, dur_codec * 1e6 / n, len_codec)
+        self.assertLess(len_codec, len_pickle)
+
+
+if __name__ == "__main__":
+    unittest.main()
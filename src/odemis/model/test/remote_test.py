@@ -597,6 +597,77 @@ class RemoteTest(unittest.TestCase):
         self.assertEqual(count_end, self.count)
         self.assertGreaterEqual(count_end, 1)
 
+    def test_dataflow_shared_mem(self):
+        """
+        test passing DataArrays via shared memory
+        """
+        self.count = 0
+        self.data_arrays_sent = 0
+        self.expected_shape = (2048, 2048)
+        self.comp.datashm.reset()
+        self.comp.datashm.subscribe(self.receive_data)
+        time.sleep(0.5)
+        self.comp.datashm.unsubscribe(self.receive_data)
+        count_end = self.count
+        print("received %d arrays via shared memory over %d" % (self.count, self.data_arrays_sent))
+
+        time.sleep(0.1)
+        self.assertEqual(count_end, self.count)
+        self.assertGreaterEqual(count_end, 1)
+
+        # Holding the arrays must not corrupt them (the segments are not recycled)
+        arrays = []
+        def keep_data(df, data):
+            arrays.append((int(data[0][0]), data))
+        self.comp.datashm.subscribe(keep_data)
+        time.sleep(1)
+        self.comp.datashm.unsubscribe(keep_data)
+        self.assertGreaterEqual(len(arrays), 2)
+        for n, da in arrays:
+            self.assertEqual(da[0][0], n)
+            self.assertEqual(da[n % da.shape[0], 1], 255)
+
+    def test_dataflow_policy(self):
+        """
+        Check that a slow listener doesn't cause data loss for a lossless one
+        """
+        received = []
+        def receive_lossless(df, data):
+            received.append(int(data[0][0]))
+
+        def receive_slow(df, data):
+            time.sleep(0.5)
+
+        self.comp.data.reset()
+        self.comp.data.subscribe(receive_slow)
+        self.comp.data.subscribe(receive_lossless, policy=model.DF_POLICY_LOSSLESS)
+        time.sleep(2)
+        self.comp.data.unsubscribe(receive_slow)
+        self.comp.data.unsubscribe(receive_lossless)
+
+        self.assertGreaterEqual(len(received), 10)
+        self.assertEqual(received, list(range(received[0], received[0] + len(received))))
+
+    def test_dataflow_policy_shared_mem(self):
+        """
+        Check that a lossless listener receives all the data, even if it's slow
+        to read it, when the DataFlow uses shared memory
+        """
+        received = []
+        def receive_lossless(df, data):
+            received.append(int(data[0][0]))
+            time.sleep(0.1)  # Slower than the generation
+
+        self.comp.datashm.reset()
+        self.comp.datashm.subscribe(receive_lossless, policy=model.DF_POLICY_LOSSLESS)
+        time.sleep(2)
+        dropped = self.comp.datashm.getDroppedCount(receive_lossless)
+        self.comp.datashm.unsubscribe(receive_lossless)
+
+        self.assertEqual(dropped, 0)
+        self.assertGreaterEqual(len(received), 10)
+        self.assertEqual(received, list(range(received[0], received[0] + len(received))))
+
     def test_dataflow_empty(self):
         """
         test passing empty DataArray
@@ -718,6 +789,52 @@ class RemoteTest(unittest.TestCase):
         self.last_value = value
         self.assertIsInstance(value, (int, float))
 
+    def test_va_batch(self):
+        """
+        Read and write multiple VAs in a single call
+        """
+        self.comp.prop.value = 42
+        values = self.comp.getVAValues(["prop", "cont", "enum"])
+        self.assertEqual(values, {"prop": 42, "cont": 2.0, "enum": "a"})
+
+        # All the VAs
+        values = self.comp.getVAValues()
+        self.assertEqual(values["listval"], [2, 65])
+
+        newvals = self.comp.setVAValues([("prop", 12), ("enum", "c")])
+        self.assertEqual(newvals, {"prop": 12, "enum": "c"})
+        self.assertEqual(self.comp.prop.value, 12)
+        self.assertEqual(self.comp.enum.value, "c")
+
+        # Failure on the second VA => the first one is set, not the third one
+        with self.assertRaises(IndexError):
+            self.comp.setVAValues([("prop", 13), ("enum", "wfds"), ("cont", 0.5)])
+        self.assertEqual(self.comp.prop.value, 13)
+        self.assertEqual(self.comp.cont.value, 2.0)
+
+        with self.assertRaises(AttributeError):
+            self.comp.getVAValues(["prop", "ping"])
+
+        self.comp.enum.value = "a"
+
+    def test_va_coalesce(self):
+        """
+        Fast changes of a VA are coalesced, but the final value is always received
+        """
+        prop = self.comp.prop
+        self.called = 0
+        self.last_value = None
+        prop.subscribe(self.receive_va_update)
+        time.sleep(0.1)
+
+        for i in range(100):
+            self.comp.change_prop(i)
+        time.sleep(0.5)  # give time to receive notifications
+
+        self.assertEqual(self.last_value, 99)
+        self.assertLess(self.called, 100)
+        prop.unsubscribe(self.receive_va_update)
+
     def test_va_override(self):
         self.comp.prop.value = 42
         with self.assertRaises(AttributeError):
@@ -834,6 +951,7 @@ class MyComponent(model.Component):
         self.startAcquire = model.Event() # triggers when the acquisition of .data starts
         self.data = FakeDataFlow(sae=self.startAcquire)
         self.datas = SynchronizableDataFlow()
+        self.datashm = FakeDataFlow(shared_mem=True)
 
         self.data_count = 0
         self._df = None
@@ -24,6 +24,7 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division, print_function
 
 import argparse
+import collections
 import grp
 from logging import FileHandler
 import logging
@@ -33,6 +34,7 @@ import odemis
 from odemis.model import ST_UNLOADED, ST_STARTING
 from odemis.odemisd import modelgen
 from odemis.odemisd.mdupdater import MetadataUpdater
+from odemis.util.tracing import tracer, TRACE_ENV
 from odemis.util.driver import BACKEND_RUNNING, BACKEND_DEAD, BACKEND_STOPPED, \
     get_backend_status, BACKEND_STARTING
 import os
@@ -46,6 +48,9 @@ from concurrent import futures
 
 DEFAULT_SETTINGS_FILE = "/etc/odemis-settings.yaml"
 
+# Maximum number of components instantiated simultaneously
+MAX_PARALLEL_INSTANTIATIONS = 16
+
 status_to_xtcode = {BACKEND_RUNNING: 0,
                     BACKEND_DEAD: 1,
                     BACKEND_STOPPED: 2,
@@ -75,6 +80,13 @@ class BackendContainer(model.Container):
         self._settings = settings_file
         self._mdupdater = None
         self._inst_thread = None # thread running the component instantiation
+        # Protects the .ghosts and .alive VAs of the microscope, and the
+        # persistent data, which are updated by each instantiation
+        self._inst_lock = threading.Lock()
+        # Startup timeline: name of the component -> start time, end time, outcome (str)
+        # The end time and outcome are None while the component is starting.
+        self.timeline = collections.OrderedDict()
+        self._timeline_logged = False
         self._must_stop = threading.Event()
         self._dry_run = dry_run
         # TODO: have an argument to ask for disabling parallel start? same as create_sub_containers?
@@ -82,8 +94,9 @@ class BackendContainer(model.Container):
         # parse the instantiation file
         logging.debug("model instantiation file is: %s", self._model.name)
         try:
-            self._instantiator = modelgen.Instantiator(model_file, settings_file, self,
-                                                       create_sub_containers, dry_run)
+            with tracer.span("parse model"):
+                self._instantiator = modelgen.Instantiator(model_file, settings_file, self,
+                                                           create_sub_containers, dry_run)
             # save the model
             logging.info("model has been successfully parsed")
         except modelgen.ParseError as exp:
@@ -97,7 +110,8 @@ class BackendContainer(model.Container):
         # Initialize persistent data, will be updated and written to the settings_file in the
         # end and every time a va is changed.
         self._persistent_listeners = []  # keep reference to persistent va listeners
-        self._persistent_data = self._instantiator.read_yaml(settings_file)
+        with tracer.span("read settings"):
+            self._persistent_data = self._instantiator.read_yaml(settings_file)
 
     def _observe_persistent_va(self, comp, prop_name):
         """
@@ -150,7 +164,8 @@ class BackendContainer(model.Container):
 
     def run(self):
         # Create the root
-        mic = self._instantiator.instantiate_microscope()
+        with tracer.span("microscope"):
+            mic = self._instantiator.instantiate_microscope()
         self.setRoot(mic)
         logging.debug("Root component %s created", mic.name)
 
@@ -164,6 +179,7 @@ class BackendContainer(model.Container):
                 self._instantiate_all()
             finally:
                 self.terminate()
+                self._save_trace()
 
             logging.info("model has been successfully validated, exiting")
             return    # everything went fine
@@ -186,59 +202,59 @@ class BackendContainer(model.Container):
     def _instantiate_all(self):
         """
         Thread continuously monitoring the components that need to be instantiated
+        All the components which are independent from each other are instantiated
+        in parallel. As soon as a component is instantiated, the components which
+        depended on it are started.
         """
+        # Note: there is a bug in python when using lock (eg, logging)
+        # and simultaneously using threads and process: is a thread acquires
+        # a lock while a process is created, it will never be released.
+        # See http://bugs.python.org/issue6721
+        # So, while the components are instantiated in parallel, the containers
+        # (processes) are created one at a time, while holding the logging locks
+        # (cf model.createNewContainer()).
+        executor = futures.ThreadPoolExecutor(max_workers=MAX_PARALLEL_INSTANTIATIONS)
         try:
-            # Hack warning: there is a bug in python when using lock (eg, logging)
-            # and simultaneously using threads and process: is a thread acquires
-            # a lock while a process is created, it will never be released.
-            # See http://bugs.python.org/issue6721
-            # To ensure this is not happening, we wait long enough that all (2)
-            # threads have started (and logging nothing) before creating new processes.
-            time.sleep(1)
-
             mic = self._instantiator.microscope
+            tstart = time.time()
             failed = set() # set of str: name of components that failed recently
+            running = {}  # future -> str: name of the components being instantiated
             while not self._must_stop.is_set():
-                # Try to start simultaneously all the components that are
-                # independent from each other
-                nexts = set()
-                while not nexts:
-                    instantiated = set(c.name for c in mic.alive.value) | {mic.name}
-                    nexts = self._instantiator.get_instantiables(instantiated)
-                    # If still some non-failed component, immediately try again,
-                    # otherwise give some time for things to get fixed or broken
-                    nexts -= failed
-                    if not nexts:
-                        if self._dry_run:
-                            return # everything instantiated, good enough
-
-                        if self._must_stop.wait(10):
-                            return
-                        failed = set() # not recent anymore
-
-                logging.debug("Trying to instantiate comps: %s", ", ".join(nexts))
-
+                # Start all the components which only depend on components already alive
+                instantiated = set(c.name for c in mic.alive.value) | {mic.name}
+                nexts = self._instantiator.get_instantiables(instantiated)
+                nexts -= failed | set(running.values())
+                if nexts:
+                    logging.debug("Trying to instantiate comps: %s", ", ".join(nexts))
                 for n in nexts:
-                    ghosts = mic.ghosts.value.copy()
-                    if n not in ghosts:
-                        logging.warning("going to instantiate %s but not a ghost", n)
-                    # TODO: run each of them in a future, so that they start
-                    # in parallel, and (bonus) when the future is done, check
-                    # immediately which component can be started. The only
-                    # difficulty is to ensure non-concurrent access to .ghosts
-                    # and .alive .
-                    try:
+                    with self._inst_lock:
+                        ghosts = mic.ghosts.value.copy()
+                        if n not in ghosts:
+                            logging.warning("going to instantiate %s but not a ghost", n)
                         ghosts[n] = ST_STARTING
                         mic.ghosts.value = ghosts
-                        newcmps = self._instantiate_component(n)
-                        if self._must_stop.is_set():
-                            # in case the termination was too late to stop these new component
-                            for c in newcmps:
-                                try:
-                                    c.terminate()
-                                except Exception:
-                                    logging.warning("Failed to terminate component '%s'", c.name, exc_info=True)
-                            break
+                    f = executor.submit(self._start_component, n)
+                    running[f] = n
+
+                if not running:
+                    # Nothing left to do, at least for now
+                    self._log_timeline(tstart)
+                    if self._dry_run:
+                        return # everything instantiated, good enough
+
+                    # Give some time for things to get fixed or broken
+                    if self._must_stop.wait(10):
+                        return
+                    failed = set() # not recent anymore
+                    continue
+
+                # Wait for (at least) one component to be instantiated, but
+                # regularly check whether we should stop.
+                done, _ = futures.wait(running, timeout=1, return_when=futures.FIRST_COMPLETED)
+                for f in done:
+                    n = running.pop(f)
+                    try:
+                        newcmps = f.result()
                     except ValueError:
                         if self._dry_run:
                             raise
@@ -254,8 +270,76 @@ class BackendContainer(model.Container):
             logging.exception("Instantiator thread failed")
             raise
         finally:
+            # The components still starting are terminated as soon as they are
+            # instantiated (as _must_stop is set). In dry-run, the model is
+            # terminated just after, so they must be all done first.
+            executor.shutdown(wait=self._dry_run)
             logging.debug("Instantiator thread finished")
 
+    def _log_timeline(self, tstart):
+        """
+        Log how long each component took to start, the first time nothing is
+        left to start (even if some components failed to start)
+        tstart (float): time at which the instantiation started
+        """
+        if self._timeline_logged or not self.timeline:
+            return
+        self._timeline_logged = True
+        tend = max(e for s, e, r in self.timeline.values())
+        ghosts = self._instantiator.microscope.ghosts.value
+        if ghosts:
+            logging.info("Components instantiated in %g s, except for %s",
+                         tend - tstart, ", ".join(sorted(ghosts)))
+        else:
+            logging.info("All components instantiated in %g s", tend - tstart)
+        for n, (s, e, r) in self.timeline.items():
+            logging.info("Component %s: %s, started at %.3f s, in %.3f s",
+                         n, r, s - tstart, e - s)
+        tracer.add("components instantiated", tend)
+        self._save_trace()
+
+    def _save_trace(self):
+        """
+        Save the startup trace, if tracing is enabled
+        """
+        if not tracer.enabled:
+            return
+        try:
+            tracer.save()
+            logging.info("Startup phases:\n%s", tracer.summary())
+        except Exception:
+            logging.exception("Failed to save the startup trace")
+
+    def _start_component(self, name):
+        """
+        Instantiate a component, and record how long it took in the timeline
+        Can be called from multiple threads simultaneously, for different components.
+        return (set of HwComponent): see _instantiate_component()
+        raise ValueError: see _instantiate_component()
+        """
+        tstart = time.time()
+        self.timeline[name] = (tstart, None, None)
+        result = "failed"
+        try:
+            newcmps = self._instantiate_component(name)
+            if newcmps:
+                result = "started"
+                if self._must_stop.is_set():
+                    # in case the termination was too late to stop these new component
+                    for c in newcmps:
+                        try:
+                            c.terminate()
+                        except Exception:
+                            logging.warning("Failed to terminate component '%s'", c.name, exc_info=True)
+            else:
+                result = "device error"
+            return newcmps
+        finally:
+            tend = time.time()
+            self.timeline[name] = (tstart, tend, result)
+            tracer.add(name, tstart, tend, cat="component", result=result)
+            logging.debug("Component %s %s in %g s", name, result, tend - tstart)
+
     def _instantiate_component(self, name):
         """
         Instantiate a component and handle the outcome
@@ -267,15 +351,16 @@ class BackendContainer(model.Container):
         # TODO: use the AST from the microscope (instead of the original one
         # in _instantiator) to allow modifying it online?
         mic = self._instantiator.microscope
-        ghosts = mic.ghosts.value.copy()
         try:
             comp = self._instantiator.instantiate_component(name)
         except model.HwError as exp:
             # HwError means: hardware problem, try again later
             logging.warning("Failed to start component %s due to device error: %s",
                             name, exp)
-            ghosts[name] = exp
-            mic.ghosts.value = ghosts
+            with self._inst_lock:
+                ghosts = mic.ghosts.value.copy()
+                ghosts[name] = exp
+                mic.ghosts.value = ghosts
             return set()
         except Exception as exp:
             # Anything else means: microscope file or driver is borked => give up
@@ -302,19 +387,21 @@ class BackendContainer(model.Container):
                 logging.warning("Component %s instantiated extra unexpected components %s",
                                 name, new_names - exp_names)
 
-            mic.alive.value = mic.alive.value | new_cmps
-            # update ghosts by removing all the new components
-            dchildren = self._instantiator.get_children_names(name)
-            for n in dchildren:
-                del ghosts[n]
+            with self._inst_lock:
+                mic.alive.value = mic.alive.value | new_cmps
+                # update ghosts by removing all the new components
+                ghosts = mic.ghosts.value.copy()
+                dchildren = self._instantiator.get_children_names(name)
+                for n in dchildren:
+                    del ghosts[n]
 
-            mic.ghosts.value = ghosts
+                mic.ghosts.value = ghosts
 
-            for c in new_cmps:
-                prop_names, _ = self._instantiator.get_persistent(c.name)
-                for prop_name in prop_names:
-                    self._observe_persistent_va(c, prop_name)
-            self._update_persistent_metadata()
+                for c in new_cmps:
+                    prop_names, _ = self._instantiator.get_persistent(c.name)
+                    for prop_name in prop_names:
+                        self._observe_persistent_va(c, prop_name)
+                self._update_persistent_metadata()
 
             return new_cmps
 
@@ -635,6 +722,7 @@ def main(args):
     args is the list of arguments passed
     return (int): value to return to the OS as program exit code
     """
+    tmain = time.time()
 
     #print args
     # arguments handling
@@ -659,6 +747,10 @@ def main(args):
                          default=0, help="Set verbosity level (0-2, default = 0)")
     opt_grp.add_argument("--log-target", dest="logtarget", metavar="{auto,stderr,filename}",
                          default="auto", help="Specify the log target (auto, stderr, filename)")
+    opt_grp.add_argument("--trace", dest="trace", metavar="FILE",
+                         help="Record the duration of each startup phase and save it "
+                         "in Chrome trace format. Tracing can also be enabled by setting "
+                         "%s to a directory." % (TRACE_ENV,))
     # The settings file is opened here because root privileges are dropped at some point after
     # the initialization.
     opt_grp.add_argument("--settings", dest='settings',
@@ -714,6 +806,12 @@ def main(args):
         pyrolog = logging.getLogger("Pyro4")
         pyrolog.setLevel(min(pyrolog.getEffectiveLevel(), logging.INFO))
 
+    if options.trace:
+        tracer.enable(options.trace)
+    else:
+        tracer.enable_from_env("odemisd")
+    tracer.add("imports", tracer.start_time, tmain)
+
     # Useful to debug cases of multiple conflicting installations
     logging.info("Starting Odemis back-end v%s (from %s) using Python %d.%d",
                  odemis.__version__, __file__, sys.version_info[0], sys.version_info[1])
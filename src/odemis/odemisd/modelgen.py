@@ -30,7 +30,9 @@ import itertools
 import logging
 from odemis import model
 from odemis.util import mock
+from odemis.util.tracing import tracer
 import re
+import threading
 import yaml
 
 
@@ -168,6 +170,9 @@ class Instantiator(object):
         self._comp_container = {}  # comp name -> container: the container that runs the given component
         self.create_sub_containers = create_sub_containers # flag for creating sub-containers
         self.dry_run = dry_run # flag for instantiating mock version of the components
+        # Protects .components, .sub_containers, ._comp_container and the
+        # microscope children, as components can be instantiated in parallel
+        self._lock = threading.Lock()
 
         self._preparate_microscope()
 
@@ -585,8 +590,9 @@ class Instantiator(object):
         # if the component is connected to a PowerSupplier we first need to turn
         # it on before we instantiate it
         if "power_supplier" in args:
-            f = args["power_supplier"].supply({name: True})
-            f.result()
+            with tracer.span(name, cat="power supply"):
+                f = args["power_supplier"].supply({name: True})
+                f.result()
 
         if self.dry_run and not class_name == "Microscope":
             # mock class for everything but Microscope (because it is safe)
@@ -597,21 +603,26 @@ class Instantiator(object):
             cont = self._get_container(name)
             if cont is None:
                 # new container has the same name as the component
-                cont, comp = model.createInNewContainer(name, class_comp, args)
-                self.sub_containers[name] = cont
+                with tracer.span(name, cat="driver", container="new"):
+                    cont, comp = model.createInNewContainer(name, class_comp, args)
+                with self._lock:
+                    self.sub_containers[name] = cont
             else:
                 logging.debug("Creating %s in container %s", name, cont)
-                comp = model.createInContainer(cont, class_comp, args)
-            self._comp_container[name] = cont
+                with tracer.span(name, cat="driver", container="existing"):
+                    comp = model.createInContainer(cont, class_comp, args)
         except Exception:
             logging.error("Error while instantiating component %s.", name)
             raise
 
-        self.components.add(comp)
-        # Add all the children, which were created by delegation, to our list of components.
-        self.components |= comp.children.value
-        for child in comp.children.value:
-            self._comp_container[child.name] = cont
+        children = comp.children.value
+        with self._lock:
+            self._comp_container[name] = cont
+            self.components.add(comp)
+            # Add all the children, which were created by delegation, to our list of components.
+            self.components |= children
+            for child in children:
+                self._comp_container[child.name] = cont
 
         return comp
 
@@ -623,7 +634,9 @@ class Instantiator(object):
         Raises:
              LookupError: if no component is found
         """
-        for comp in self.components:
+        with self._lock:
+            comps = list(self.components)
+        for comp in comps:
             if comp.name == name:
                 return comp
         raise LookupError("No component named '%s' found" % name)
@@ -844,8 +857,8 @@ class Instantiator(object):
             ValueError: if the component has already been instantiated
             KeyError: if component should be created by delegation
         """
-        for c in self.components:
-            if c.name == name:
+        with self._lock:
+            if any(c.name == name for c in self.components):
                 raise ValueError("Trying to instantiate again component %s" % name)
 
         comp = self._instantiate_comp(name)
@@ -859,7 +872,8 @@ class Instantiator(object):
             self._update_metadata(c.name)
             self._update_affects(c.name)
         newchildren = set(c for c in newcmps if c.name in mchildren)
-        self.microscope.children.value = self.microscope.children.value | newchildren
+        with self._lock:
+            self.microscope.children.value = self.microscope.children.value | newchildren
 
         return comp
 
@@ -875,7 +889,8 @@ class Instantiator(object):
         """
         comps = set()
         if instantiated is None:
-            instantiated = set(c.name for c in self.components)
+            with self._lock:
+                instantiated = set(c.name for c in self.components)
         for n, attrs in self.ast.items():
             if n in instantiated: # should not be already instantiated
                 continue
@@ -526,6 +526,37 @@ class TestCommandLine(unittest.TestCase):
 # extends the class fully at module
 TestCommandLine.create_tests()
 
+
+class TestInstantiation(unittest.TestCase):
+    """
+    Test the instantiation of the components by the back-end container
+    """
+
+    @timeout(60)
+    def test_start_order(self):
+        """
+        Check each component is started only once all its dependencies are started
+        """
+        with open(SIM_CONFIG) as f:
+            cont = main.BackendContainer(f, None, dry_run=True, name="testbackend")
+            try:
+                cont.run()
+            finally:
+                cont.close()
+
+        inst = cont._instantiator
+        # All the components created explicitly (ie, not by delegation) are started
+        explicit = {n for n, attrs in inst.ast.items() if "class" in attrs}
+        self.assertEqual(set(cont.timeline.keys()), explicit - {inst.microscope.name})
+        for n, (start, end, result) in cont.timeline.items():
+            self.assertEqual(result, "started")
+            for dep in inst.get_required_components(n):
+                # Components created by delegation are started with their creator
+                if "class" not in inst.ast[dep]:
+                    dep = inst.ast[dep]["creator"]
+                self.assertLessEqual(cont.timeline[dep][1], start,
+                                     "%s started before its dependency %s" % (n, dep))
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -708,3 +708,77 @@ def bindFuture(future, fn, args=(), kwargs=None):
             future.set_exception(e)
     else:
         future.set_result(result)
+
+
+class LRUCache(object):
+    """
+    Thread-safe dict-like cache, limited in size. When the total size of the
+      values is over the maximum, the least recently used entries are dropped.
+    """
+
+    def __init__(self, max_size, sizeof=lambda v: 1):
+        """
+        max_size (0<=float): maximum total size of the values stored
+        sizeof (callable value -> float): returns the size of a value. By
+          default, each value counts as 1, so max_size is the number of entries.
+        """
+        self.max_size = max_size
+        self._sizeof = sizeof
+        self._entries = collections.OrderedDict()  # key -> (value, size), oldest first
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        """
+        (float): total size of the values currently stored
+        """
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __getitem__(self, key):
+        """
+        Also marks the entry as the most recently used
+        raise KeyError: if the key is not in the cache
+        """
+        with self._lock:
+            # Re-insert it at the end (as Python 2 has no move_to_end())
+            v, s = self._entries.pop(key)
+            self._entries[key] = (v, s)
+        return v
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        s = self._sizeof(value)
+        with self._lock:
+            try:
+                self._size -= self._entries.pop(key)[1]
+            except KeyError:
+                pass
+            if s > self.max_size:
+                return  # Too big to ever fit
+            self._entries[key] = (value, s)
+            self._size += s
+            # Drop the oldest entries
+            while self._size > self.max_size:
+                _, (_, old_s) = self._entries.popitem(last=False)
+                self._size -= old_s
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._size -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
@@ -27,11 +27,11 @@ matplotlib.use("Agg")  # use non-GUI backend
 import matplotlib.pyplot as plt
 import numpy
 from numpy import ma
-from scipy.interpolate import LinearNDInterpolator
+from scipy import sparse
 from scipy.spatial import Delaunay as DelaunayTriangulation
 
 from odemis import model
-from odemis.util import img
+from odemis.util import img, LRUCache
 from odemis.model import MD_POL_UP, MD_POL_DOP, MD_POL_DOCP, MD_POL_DOLP, \
     MD_POL_S1N, MD_POL_DS1N, MD_POL_S2N, MD_POL_DS2N, MD_POL_S3N, MD_POL_DS3N, \
     MD_POL_S1, MD_POL_S2, MD_POL_S3, MD_POL_DS1, MD_POL_DS2, MD_POL_DS3, \
@@ -70,6 +70,35 @@ def _ExtractAngleInformation(data, hole):
             Mask is dilated for visualization to avoid edge effects during triangulation
             and interpolation.
     """
+    theta_data, phi_data, omega, circle_mask, circle_mask_dilated = _ExtractMirrorGeometry(data, hole)
+
+    # Crop the input image to half circle (set values outside of half circle zero)
+    cropped_image = numpy.where(circle_mask, data, 0)
+
+    # intensity_data contains the intensity values from raw data.
+    # It already reflects the shape of the mirror
+    # and is normalized by omega (solid angle:
+    # measure for photon collection efficiency depending on theta and phi)
+    intensity_data = cropped_image / omega
+
+    return theta_data, phi_data, intensity_data, circle_mask_dilated
+
+
+def _ExtractMirrorGeometry(data, hole):
+    """
+    Calculates the corresponding theta and phi angles and the solid angle for
+    each pixel of the detector. These only depend on the mirror geometry, and
+    not on the content of the data.
+    :param data: (model.DataArray) The image that was projected on the detector after being
+            reflected on the parabolic mirror. Only its shape and metadata are used.
+    :returns:
+        theta_data: array containing theta values for each px in raw data
+        phi_data: array containing phi values for each px in raw data
+        omega: array containing the solid angle collected by each px in raw data
+        circle_mask: mask of the px which receive light from the mirror
+        circle_mask_dilated: same as circle_mask, but dilated (and without hole)
+            to avoid edge effects during triangulation and interpolation.
+    """
 
     assert (len(data.shape) == 2)  # => 2D with greyscale
 
@@ -83,8 +112,8 @@ def _ExtractAngleInformation(data, hole):
 
     pole_pos = (pole_x, pole_y)
 
-    # Crop the input image to half circle (set values outside of half circle zero)
-    cropped_image = _CropHalfCircle(data, pixel_size, pole_pos, hole=hole)
+    # Mask to crop the input image to half circle
+    circle_mask = _CreateMirrorMask(data, pixel_size, pole_pos, hole=hole)
 
     # return dilated circle_mask to crop input data
     # hole=False for dilated mask to avoid edge effects during interpolation
@@ -117,13 +146,7 @@ def _ExtractAngleInformation(data, hole):
     # phi_data: array containing phi values for each px in raw data
     theta_data, phi_data, omega = _FindAngle(x_array, y_array, pixel_size, parabola_f)
 
-    # intensity_data contains the intensity values from raw data.
-    # It already reflects the shape of the mirror
-    # and is normalized by omega (solid angle:
-    # measure for photon collection efficiency depending on theta and phi)
-    intensity_data = cropped_image / omega
-
-    return theta_data, phi_data, intensity_data, circle_mask_dilated
+    return theta_data, phi_data, omega, circle_mask, circle_mask_dilated
 
 
 def _FindAngle(x_array, y_array, pixel_size, parabola_f):
@@ -174,6 +197,7 @@ def _flipDataIfMirrorFlipped(data):
     """
         Inverts data and adjusts metadata for flipped mirror
         :parameter data: (model.DataArray) The image that was projected on the detector.
+        It can also contain multiple images, with shape (..., Y, X).
         The data is inverted and its metadata is adjusted in case of a flipped mirror.
         :returns: (model.DataArray) the image as it is in case of a standard mirror,
         the image with the inverted data and adjusted metadata in case of a flipped mirror.
@@ -181,12 +205,12 @@ def _flipDataIfMirrorFlipped(data):
 
     focus_distance = data.metadata.get(model.MD_AR_FOCUS_DISTANCE, AR_FOCUS_DISTANCE)
     if focus_distance < 0:
-        data = data[::-1, :]
+        data = data[..., ::-1, :]
         data.metadata = data.metadata.copy()
         data.metadata[model.MD_AR_FOCUS_DISTANCE] *= -1  # invert the focus distance for inverted mirror
         # put new y pole coordinate
         arpole = data.metadata[model.MD_AR_POLE]
-        data.metadata[model.MD_AR_POLE] = (arpole[0], data.shape[0] - 1 - arpole[1])
+        data.metadata[model.MD_AR_POLE] = (arpole[0], data.shape[-2] - 1 - arpole[1])
     return data
 
 
@@ -202,22 +226,161 @@ def AngleResolved2Polar(data, output_size, hole=True):
     :param hole: (boolean) Crop the pole if True.
     :returns: (model.DataArray) Converted image in polar view. Shape is (output_size, output_size).
     """
+    assert data.ndim == 2
+    return _ResampleAngleResolved(data, _PROJ_POLAR, output_size, hole)
+
+
+def AngleResolvedMap2Polar(data, output_size, hole=True):
+    """
+    Converts multiple angle resolved images, acquired with the same settings (eg, all
+    the images of an AR map), to polar projection. It is much faster than calling
+    AngleResolved2Polar() on each image separately.
+    :param data: (model.DataArray) The images, of shape (..., y, x). See
+            AngleResolved2Polar() for the metadata needed, which is shared by all the images.
+    :param output_size: (int) The size of each output image (assumed to be square).
+    :param hole: (boolean) Crop the pole if True.
+    :returns: (model.DataArray) Converted images in polar view. Shape is (..., output_size, output_size).
+    """
+    return _ResampleAngleResolved(data, _PROJ_POLAR, output_size, hole)
+
+
+def AngleResolved2Rectangular(data, output_size, hole=True):
+    """
+    Converts an angle resolved image to equirectangular (aka cylindrical) projection (ie, phi/theta axes).
+    Note: Even if the input contains only positive values, there might be some small negative
+    values in the output due to interpolation. Also note, that NaNs occurring in the
+    interpolation step are set to 0.
+    :param data: (model.DataArray) The image that was projected on the detector after being
+                reflected on the parabolic mirror. The flat line of the D shape is
+                expected to be horizontal, at the top. It needs MD_PIXEL_SIZE and MD_AR_POLE
+                metadata. Pixel size is the sensor pixel size * binning / magnification.
+    :param output_size: (int, int) The size of the output DataArray (theta, phi),
+                not including the theta/phi angles at the first row/column.
+    :param hole: (boolean) Crop the pole if True.
+    :returns: (model.DataArray) Converted image in equi-rectangular view. Shape is output_size.
+    """
+    assert data.ndim == 2
+    return _ResampleAngleResolved(data, _PROJ_RECTANGULAR, output_size, hole)
+
+
+def AngleResolvedMap2Rectangular(data, output_size, hole=True):
+    """
+    Converts multiple angle resolved images, acquired with the same settings (eg, all
+    the images of an AR map), to equirectangular projection. It is much faster than
+    calling AngleResolved2Rectangular() on each image separately.
+    :param data: (model.DataArray) The images, of shape (..., y, x). See
+                AngleResolved2Rectangular() for the metadata needed, which is shared by all the images.
+    :param output_size: (int, int) The size of each output image (theta, phi).
+    :param hole: (boolean) Crop the pole if True.
+    :returns: (model.DataArray) Converted images in equi-rectangular view. Shape is (...,) + output_size.
+    """
+    return _ResampleAngleResolved(data, _PROJ_RECTANGULAR, output_size, hole)
+
 
+# The conversion of an AR image to a projection is linear on the intensity of
+# the pixels, and the coefficients only depend on the mirror geometry, the
+# detector settings and the output size. So it's computed only once, as a sparse
+# matrix (the resampling operator), and each conversion is just a product of that
+# matrix by the image.
+_PROJ_POLAR = "polar"
+_PROJ_RECTANGULAR = "rectangular"
+
+# Maximum memory used to store the resampling operators (in bytes). A polar
+# operator for a 1134x1134 output uses ~50 MB.
+AR_OPERATOR_CACHE_SIZE = 256e6
+
+_operator_cache = LRUCache(AR_OPERATOR_CACHE_SIZE,
+                           sizeof=lambda op: op.data.nbytes + op.indices.nbytes + op.indptr.nbytes)
+
+
+def _ResampleAngleResolved(data, projection, output_size, hole):
+    """
+    Converts one or more angle resolved images to the given projection.
+    :param data: (model.DataArray) The image(s), of shape (..., y, x).
+    :param projection: (_PROJ_*) The type of projection.
+    :param output_size: (int or (int, int)) The size of the output, as accepted
+                by the AngleResolved2* function of the projection.
+    :param hole: (boolean) Crop the pole if True.
+    :returns: (model.DataArray) The projected image(s), of shape (...,) + output image shape.
+    """
     data = _flipDataIfMirrorFlipped(data)
+    operator = _GetResamplingOperator(data, projection, output_size, hole)
+    if projection == _PROJ_POLAR:
+        out_shape = (output_size, output_size)
+    else:
+        out_shape = tuple(output_size)
+
+    # One column per image, so that all the images are converted in a single product
+    images = numpy.asarray(data).reshape(-1, data.shape[-2] * data.shape[-1])
+    qz = operator.dot(images.T).T.reshape(data.shape[:-2] + out_shape)
+
+    qz[numpy.isnan(qz)] = 0  # remove NaNs created during interpolation
+    if projection == _PROJ_POLAR:
+        assert numpy.all(qz > -1)  # there should be no negative values, some very small due to interpolation are possible
+        qz[qz < 0] = 0  # all negative values (due to interpolation or wrong background subtraction) set to zero
+    # For the rectangular projection, keep negative values
+
+    return model.DataArray(qz, data.metadata)
+
 
+def _GetResamplingOperator(data, projection, output_size, hole):
+    """
+    Returns the resampling operator for the given data and projection. If it has
+    already been computed for the same geometry, the cached version is returned.
+    :param data: (model.DataArray) The image(s), of shape (..., y, x). Only the
+                shape and metadata are used.
+    :param projection: (_PROJ_*) The type of projection.
+    :param output_size: (int or (int, int)) The size of the output.
+    :param hole: (boolean) Crop the pole if True.
+    :returns: (scipy.sparse.csr_matrix) The operator, of shape (number of px in
+                output image, number of px in input image).
+    """
+    md = data.metadata
+    try:
+        key = (projection, output_size if projection == _PROJ_POLAR else tuple(output_size), hole,
+               data.shape[-2:], tuple(md[model.MD_PIXEL_SIZE]), tuple(md[model.MD_AR_POLE]),
+               md.get(model.MD_AR_PARABOLA_F, AR_PARABOLA_F),
+               md.get(model.MD_AR_XMAX, AR_XMAX),
+               md.get(model.MD_AR_HOLE_DIAMETER, AR_HOLE_DIAMETER),
+               md.get(model.MD_AR_FOCUS_DISTANCE, AR_FOCUS_DISTANCE))
+    except KeyError:
+        raise ValueError("Metadata required: MD_PIXEL_SIZE, MD_AR_POLE, MD_AR_PARABOLA_F.")
+
+    operator = _operator_cache.get(key)
+    if operator is None:
+        image = data[(0,) * (data.ndim - 2)]  # a 2D image, with the same metadata
+        if projection == _PROJ_POLAR:
+            operator = _ComputePolarOperator(image, output_size, hole)
+        else:
+            operator = _ComputeRectangularOperator(image, output_size, hole)
+        _operator_cache[key] = operator
+
+    return operator
+
+
+def _ComputePolarOperator(data, output_size, hole):
+    """
+    Computes the resampling operator to convert an angle resolved image to polar projection.
+    :param data: (model.DataArray) The image. Only the shape and metadata are used.
+    :param output_size: (int) The size of the output image (assumed to be square).
+    :param hole: (boolean) Crop the pole if True.
+    :returns: (scipy.sparse.csr_matrix) The operator, of shape (output_size², number of px in data).
+    """
     # calculate the corresponding theta and phi angles based on the geometrical properties
     # of the mirror for each px on the raw data
-    # TODO the angles are all the same for a given mirror shape
     # TODO runtime could be improved by calc mirror shape with pole pos at center and always move data to center
-    # TODO implement: if not theta, phi, intensity -> calc angles
-    theta_data, phi_data, intensity_data, circle_mask_dilated = _ExtractAngleInformation(data, hole)
+    theta_data, phi_data, omega, circle_mask, circle_mask_dilated = _ExtractMirrorGeometry(data, hole)
 
     # Crop the raw input data based on the mirror mask (circle_mask) to save memory and improve runtime.
     # We use a dilated mask for cropping to avoid edge effects during triangulation and interpolation.
-    # The additional data points (due to dilation) will be set to zero during the interpolation step by intensity_data.
+    # The additional data points (due to dilation) will be set to zero during the interpolation step by the px weights.
     theta_data_masked = theta_data[circle_mask_dilated]  # list of values for theta within mask
     phi_data_masked = phi_data[circle_mask_dilated]  # list of values for phi within mask
-    intensity_data_masked = intensity_data[circle_mask_dilated]  # list of values for intensity within mask
+    px_masked = numpy.flatnonzero(circle_mask_dilated)  # index of the px within mask
+
+    # The intensity of each px is cropped to the mirror shape and normalized by
+    # omega (solid angle: measure for photon collection efficiency depending on theta and phi)
+    px_weights = (circle_mask / omega).ravel()
 
     # Convert the spherical coordinates theta and phi into polar coordinates for display in GUI
     # theta equals radial distance r to center of whole (0 - 90 degree)
@@ -232,84 +395,46 @@ def AngleResolved2Polar(data, output_size, hole=True):
     # Therefore, not all px in the output image are populated.
     # Moreover, the data is masked with the mirror shape (mask_circle).
     # Therefore, we perform a delaunay triangulation of the given data points.
-    # The delaunay object is passed to the interpolator with the corresponding intensity values (intensity_data).
-    # The interpolator also receives a meshgrid (set of coordinates) of the size specified for the output image.
-    # The input data points (theta and phi) are mapped on the meshgrid. As the meshgrid contains much more positions
-    # compared to the input data points, the interpolator fills up the empty grid positions with intensity values.
-    # These intensity values are interpolated from the intensity values of the positions spanning the triangle they
-    # are contained in (triangle from delaunay triangulation).
-    # Grid positions located outside of any delaunay triangle are set to NaN.
+    # The output grid positions are then linearly interpolated from the intensity values of the positions
+    # spanning the triangle they are contained in (triangle from delaunay triangulation).
+    # Grid positions located outside of any delaunay triangle are set to 0.
 
     # Note: delaunay triangulation input points: ndarray of floats, shape (numpyoints, ndim) -> transpose data for input
     data_transposed = numpy.array([x_data_polar, y_data_polar]).T  # transpose moves angle orientation from CCW to CW
     triang = DelaunayTriangulation(data_transposed)
-    # create interpolation object
-    interp = LinearNDInterpolator(triang, intensity_data_masked.flat)
     # create grid of positions for interpolation: neg to pos as x/y data polar
     # contain now values from -output_size/2 to +output_size/2
     xi, yi = numpy.meshgrid(numpy.linspace(-output_size / 2, output_size / 2, output_size),
                             numpy.linspace(-output_size / 2, output_size / 2, output_size))
-
-    # interpolate
-    qz = interp(xi, yi)
     # polar coordinate transformation starts with 0 at horizontal axis by definition
-    qz = numpy.rot90(qz)  # rotate by 90 degrees CCW so we start 0 at top (angles will be CW orientated)
-    qz[numpy.isnan(qz)] = 0  # remove NaNs created during interpolation
-    assert numpy.all(qz > -1)  # there should be no negative values, some very small due to interpolation are possible
-    qz[qz < 0] = 0  # all negative values (due to interpolation or wrong background subtraction) set to zero
+    # rotate by 90 degrees CCW so we start 0 at top (angles will be CW orientated)
+    xi, yi = numpy.rot90(xi), numpy.rot90(yi)
 
-    # plot the data
-    # plt.figure()
-    # plt.plot(theta_data_polar, phi_data_polar)
-    #
-    # plt.figure()
-    # plt.plot(triang.points[:, 0], triang.points[:, 1])
-    #
-    # plt.figure()
-    # plt.plot(triang.points[:, 0], triang.points[:, 1], 'o')
-    # plt.triplot(triang.points[:, 0], triang.points[:, 1], triang.simplices.copy())
-    # plt.title("delaunay tesselation (triangulation)")
-
-    return model.DataArray(qz, data.metadata)
+    return _ComputeInterpolationOperator(triang, xi, yi, px_masked, px_weights)
 
 
-def AngleResolved2Rectangular(data, output_size, hole=True):
+def _ComputeRectangularOperator(data, output_size, hole):
     """
-    Converts an angle resolved image to equirectangular (aka cylindrical) projection (ie, phi/theta axes).
-    Note: Even if the input contains only positive values, there might be some small negative
-    values in the output due to interpolation. Also note, that NaNs occurring in the
-    interpolation step are set to 0.
-    :param data: (model.DataArray) The image that was projected on the detector after being
-                reflected on the parabolic mirror. The flat line of the D shape is
-                expected to be horizontal, at the top. It needs MD_PIXEL_SIZE and MD_AR_POLE
-                metadata. Pixel size is the sensor pixel size * binning / magnification.
-    :param output_size: (int, int) The size of the output DataArray (theta, phi),
-                not including the theta/phi angles at the first row/column.
+    Computes the resampling operator to convert an angle resolved image to equirectangular projection.
+    :param data: (model.DataArray) The image. Only the shape and metadata are used.
+    :param output_size: (int, int) The size of the output image (theta, phi).
     :param hole: (boolean) Crop the pole if True.
-    :returns: (model.DataArray) Converted image in equi-rectangular view. Shape is output_size.
+    :returns: (scipy.sparse.csr_matrix) The operator, of shape (theta * phi, number of px in data).
     """
-
-    data = _flipDataIfMirrorFlipped(data)
-
     # calculate the corresponding theta and phi angles based on the geometrical properties
     # of the mirror for each px on the raw data
-    theta_data, phi_data, intensity_data, circle_mask_dilated = _ExtractAngleInformation(data, hole)
+    theta_data, phi_data, omega, circle_mask, circle_mask_dilated = _ExtractMirrorGeometry(data, hole)
+    # The intensity of each px is cropped to the mirror shape and normalized by
+    # omega (solid angle: measure for photon collection efficiency depending on theta and phi)
+    px_weights = (circle_mask / omega).ravel()
+    px_indices = numpy.arange(data.size).reshape(data.shape)
 
     # extend the data range to take care of edge effects during interpolation step
     # extend the range of phi from 0 - 2pi to -2pi to 2pi to take care of periodicity of phi
     # Note: Don't try to extend the image left and right by an amount < pi.
     # It will lead to the mentioned problems with the interpolation (even pi is not enough).
-    # e.g. don't try the following - it produces edge effects...
-    # num = int(phi_data.shape[0] / 4)  # = pi
-    # phi_data_edge = numpy.append(numpy.append((phi_data - 2 * math.pi)[:, -num:], phi_data, axis=1),
-    #                              (phi_data + 2 * math.pi)[:, :num], axis=1)
-    # theta_data_edge = numpy.append(numpy.append(theta_data[:,-num:], theta_data, axis=1), theta_data[:,:num], axis=1)
-    # intensity_data_edge = numpy.append(numpy.append(intensity_data[:,-num:], intensity_data, axis=1),
-    #                                      intensity_data[:,:num], axis=1)
-    # circle_mask_dilated_2 = numpy.append(numpy.append(circle_mask_dilated[:, -num:], circle_mask_dilated, axis=1),
-    #                                      circle_mask_dilated[:, :num], axis=1)
-
-    # So triple the data for theta, intensity and mask, and extend phi to cover the range from -2pi to +2pi
+
+    # So triple the data for theta, the px and mask, and extend phi to cover the range from -2pi to +2pi
     # for interpolation only use the data from -pi to +3pi, which is sufficient to take care of most edge effects
     low_border = int(phi_data.shape[1] - phi_data.shape[1] / 2 + 1)
     high_border = int(phi_data.shape[1] * 2 + phi_data.shape[1] / 2 - 1)
@@ -318,42 +443,67 @@ def AngleResolved2Rectangular(data, output_size, hole=True):
         numpy.append(phi_data - 2 * math.pi, phi_data, axis=1),
         phi_data + 2 * math.pi, axis=1)[:, low_border: high_border]  # -pi to +3pi
     theta_data_doubled = numpy.tile(theta_data, (1, 3))[:, low_border: high_border]
-    intensity_data_doubled = numpy.tile(intensity_data, (1, 3))[:, low_border: high_border]
+    px_indices_doubled = numpy.tile(px_indices, (1, 3))[:, low_border: high_border]
     circle_mask_dilated_doubled = numpy.tile(circle_mask_dilated, (1, 3))[:, low_border: high_border]
 
     # Crop the raw input data based on the mirror mask (circle_mask) to save memory and improve runtime.
     # We use a dilated mask for cropping to avoid edge effects during triangulation.
-    # The additional data points (due to dilation) will be set to zero during the interpolation step by intensity_data.
+    # The additional data points (due to dilation) will be set to zero during the interpolation step by the px weights.
     theta_data_masked = theta_data_doubled[circle_mask_dilated_doubled]  # list containing values from 0 to +pi/2
     phi_data_masked = phi_data_doubled[circle_mask_dilated_doubled]  # list containing values from -pi to + 3pi
-    intensity_data_masked = intensity_data_doubled[circle_mask_dilated_doubled]
+    px_masked = px_indices_doubled[circle_mask_dilated_doubled]
 
     # Multiple theta-phi combinations will be mapped to the same px in the output image after polar-transformation.
     # Therefore, not all px in the output image are populated.
     # Moreover, the data is masked with the mirror shape (mask_circle).
     # Therefore, we perform a delaunay triangulation of the given data points.
-    # The delaunay object is passed to the interpolator with the corresponding intensity values (intensity_data).
-    # The interpolator also receives a meshgrid (set of coordinates) of the size specified for the output image.
-    # The input data points (theta and phi) are mapped on the meshgrid. As the meshgrid contains much more positions
-    # compared to the input data points, the interpolator fills up the empty grid positions with intensity values.
-    # These intensity values are interpolated from the intensity values of the positions spanning the triangle they
-    # are contained in (triangle from delaunay triangulation).
-    # Grid positions located outside of any delaunay triangle are set to NaN.
+    # The output grid positions are then linearly interpolated from the intensity values of the positions
+    # spanning the triangle they are contained in (triangle from delaunay triangulation).
+    # Grid positions located outside of any delaunay triangle are set to 0.
 
     # Note: delaunay triangulation input points: ndarray of floats, shape (numpoints, ndim) -> transpose data for input
     data_transposed = numpy.array([phi_data_masked, theta_data_masked]).T
     triang = DelaunayTriangulation(data_transposed)
-    # create interpolation object
-    interp = LinearNDInterpolator(triang, intensity_data_masked.flat)
     # create grid of positions for interpolation
     xi, yi = numpy.meshgrid(numpy.linspace(0, 2 * numpy.pi, output_size[1]),
                             numpy.linspace(0, numpy.pi / 2, output_size[0]))
 
-    # interpolate
-    qz = interp(xi, yi)
-    qz[numpy.isnan(qz)] = 0  # remove NaNs created during interpolation but keep negative values
+    return _ComputeInterpolationOperator(triang, xi, yi, px_masked, px_weights)
 
-    return model.DataArray(qz, data.metadata)
+
+def _ComputeInterpolationOperator(triang, xi, yi, px_points, px_weights):
+    """
+    Computes the sparse matrix equivalent to a linear interpolation (as done by
+    LinearNDInterpolator) over a triangulation, where the value of each point of
+    the triangulation is a weighted px of the input image.
+    :param triang: (DelaunayTriangulation) The triangulation of the input points.
+    :param xi, yi: (ndarrays of same shape) The positions where to interpolate.
+    :param px_points: (1D ndarray of int) For each input point of the triangulation, the
+                index of the corresponding px in the (flattened) input image.
+    :param px_weights: (1D ndarray of float) For each px of the (flattened) input image,
+                the factor to apply to its intensity.
+    :returns: (scipy.sparse.csr_matrix) The operator, of shape (xi.size, px_weights.size).
+                The positions outside of the triangulation have no coefficient (ie, output is 0).
+    """
+    points = numpy.column_stack((xi.ravel(), yi.ravel()))
+    simplices = triang.find_simplex(points)
+    inside = numpy.flatnonzero(simplices >= 0)
+    simplices = simplices[inside]
+
+    # Barycentric coordinates of each position in its triangle
+    transform = triang.transform[simplices]
+    bary = numpy.einsum("ijk,ik->ij", transform[:, :2, :], points[inside] - transform[:, 2, :])
+    coefs = numpy.column_stack((bary, 1 - bary.sum(axis=1)))
+
+    # Each position is the sum of the 3 (weighted) px at the vertices of its triangle.
+    # If the same px is used multiple times for a position, the coefficients are summed.
+    rows = numpy.repeat(inside, 3)
+    cols = px_points[triang.simplices[simplices]].ravel()
+    values = coefs.ravel() * px_weights[cols]
+    operator = sparse.csr_matrix((values, (rows, cols)), shape=(points.shape[0], px_weights.size))
+    operator.eliminate_zeros()  # The px outside of the mirror
+
+    return operator
 
 
 def ARBackgroundSubtract(data):
@@ -22,7 +22,6 @@ from __future__ import division
 from past.builtins import basestring, long
 
 import collections
-import cv2
 import json
 import logging
 import math
@@ -403,6 +402,7 @@ def get_img_transformation_md(mat, timage, src_img):
         [timage.shape[1], 0.0],
         [0.0, timage.shape[0]],
     ]
+    import cv2  # Imported only when needed, as it is slow to import
     converted_points = cv2.perspectiveTransform(numpy.array([points]), mat)[0]
 
     center_point = converted_points[0]
@@ -23,13 +23,14 @@ from __future__ import division
 
 from Pyro4.errors import CommunicationError
 import collections
+from concurrent import futures
 import logging
 import math
 from odemis import model
+from odemis.util.tracing import tracer
 import os
 import re
 import sys
-import threading
 
 
 def getSerialDriver(name):
@@ -179,40 +180,49 @@ def checkLightBand(band):
     # no error found
 
 # Special trick functions for speeding up Pyro start-up
-def _speedUpPyroVAConnect(comp):
+
+# Maximum number of connections opened simultaneously by speedUpPyroConnect()
+MAX_PYRO_CONNECTIONS = 8
+
+
+def _bindPyroObject(name, obj, cat):
     """
-    Ensures that all the VAs of the component will be quick to access
-    comp (Component)
+    Force the creation of the connection of a Pyro proxy
+    name (str): name of the object, for the trace
+    obj (Pyro4.Proxy)
+    cat (str): category of the object, for the trace
     """
-    # Force the creation of the connection
-    # If the connection already exists it's very fast, otherwise, we wait
-    # for the connection to be created in a separate thread
+    try:
+        with tracer.span(name, cat=cat):
+            obj._pyroBind()
+    except Exception:
+        logging.warning("Failed to connect to %s", name, exc_info=True)
 
-    for name, va in model.getVAs(comp).items():
-        t = threading.Thread(name="Connection to VA %s.%s" % (comp.name, name),
-                             target=va._pyroBind)
-        t.daemon = True
-        t.start()
 
 def speedUpPyroConnect(comp):
     """
-    Ensures that all the children of the component will be quick to access.
-    It does nothing but speed up later access.
+    Ensures that the component, all its children and all their VAs will be
+    quick to access.
+    It does nothing but speed up later access. The connections are created in
+    the background.
     comp (Component)
+    return (list of Futures): one per connection, finished once it's created
     """
     # each connection is pretty fast (~10ms) but when listing all the VAs of
     # all the components, it can easily add up to 1s if done sequentially.
-
-    def bind_obj(obj):
-#        logging.debug("binding comp %s", obj.name)
-        obj._pyroBind()
-        speedUpPyroConnect(obj)
-
-    _speedUpPyroVAConnect(comp)
-
-    for child in comp.children.value:
-        t = threading.Thread(name="Connection to %s" % child.name, target=bind_obj, args=(child,))
-        t.start()
+    # The whole tree is received in a single call, and a limited pool of threads
+    # creates the connections (instead of one thread per child and per VA).
+    comps = model._getChildren(comp)
+
+    executor = futures.ThreadPoolExecutor(max_workers=MAX_PYRO_CONNECTIONS)
+    fs = []
+    for c in comps:
+        fs.append(executor.submit(_bindPyroObject, c.name, c, "pyro connect"))
+        for name, va in model.getVAs(c).items():
+            fs.append(executor.submit(_bindPyroObject, "%s.%s" % (c.name, name),
+                                      va, "pyro connect va"))
+    executor.shutdown(wait=False)
+    return fs
 
 
 BACKEND_RUNNING = "RUNNING"
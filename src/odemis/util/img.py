@@ -24,11 +24,14 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 
 from __future__ import division
 
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import math
+import multiprocessing
 import numpy
 from odemis import model
 import scipy.ndimage
+import threading
 import cv2
 
 from odemis.model import MD_DWELL_TIME, MD_EXP_TIME
@@ -42,52 +45,6 @@ except ImportError:
     logging.warn("Failed to load optimised functions, slow version will be used.")
     img_fast = None
 
-# This is a weave-based optimised version (but weave requires g++ installed)
-#def DataArray2RGB_fast(data, irange, tint=(255, 255, 255)):
-#    """
-#    Do not call directly, use DataArray2RGB.
-#    Fast version of DataArray2RGB, which is based on C code
-#    """
-#    # we use weave to do the assignment in C code
-#    # this only gets compiled on the first call
-#    import scipy.weave as weave
-#    # ensure it's a basic ndarray, otherwise it confuses weave
-#    data = data.view(numpy.ndarray)
-#    w, h = data.shape
-#    ret = numpy.empty((w, h, 3), dtype=numpy.uint8)
-#    assert irange[0] < irange[1]
-#    irange = numpy.array(irange, dtype=data.dtype) # ensure it's the same type
-#    tintr = numpy.array([t / 255 for t in tint], dtype=numpy.float)
-#
-#    # TODO: special code when tint == white (should be 2x faster)
-#    code = """
-#    int impos=0;
-#    int retpos=0;
-#    float b = 255. / float(irange[1] - irange[0]);
-#    float d;
-#    for(int j=0; j<Ndata[1]; j++)
-#    {
-#        for (int i=0; i<Ndata[0]; i++)
-#        {
-#            // clip
-#            if (data[impos] <= irange[0]) {
-#                d = 0;
-#            } else if (data[impos] >= irange[1]) {
-#                d = 255;
-#            } else {
-#                d = float(data[impos] - irange[0]) * b;
-#            }
-#            // Note: can go x2 faster if tintr is skipped
-#            ret[retpos++] = d * tintr[0];
-#            ret[retpos++] = d * tintr[1];
-#            ret[retpos++] = d * tintr[2];
-#            impos++;
-#        }
-#    }
-#    """
-#    weave.inline(code, ["data", "ret", "irange", "tintr"])
-#    return ret
-
 
 def findOptimalRange(hist, edges, outliers=0):
     """
@@ -188,25 +145,173 @@ def compactHistogram(hist, length):
     chist = hist.reshape(length, hist.size // length)
     return numpy.sum(chist, 1)
 
-# TODO: compute histogram faster. There are several ways:
-# * x=numpy.bincount(a.flat, minlength=depth) => fast (~0.03s for
-#   a 2048x2048 array) but only works on flat array with uint8 and uint16 and
-#   creates 2**16 bins if uint16 (so need to do a reshape and sum on top of it)
-# * numpy.histogram(a, bins=256, range=(0,depth)) => slow (~0.09s for a
-#   2048x2048 array) but works exactly as needed directly in every case.
-# * see weave? (~ 0.01s for 2048x2048 array of uint16) eg:
-#  timeit.timeit("counts=numpy.zeros((2**16), dtype=numpy.uint32);
-#  weave.inline( code, ['counts', 'idxa'])", "import numpy;from scipy import weave; code=r\"for (int i=0; i<Nidxa[0]; i++) { COUNTS1( IDXA1(i)>>8)++; }\"; idxa=numpy.ones((2048*2048), dtype=numpy.uint16)+15", number=100)
-# * see cython?
-# for comparison, a.min() + a.max() are 0.01s for 2048x2048 array
 
+# Large images are split in chunks of (at least) this number of pixels, which
+# are processed in parallel (numpy releases the GIL during the computations).
+CHUNK_SIZE = 1024 * 1024
+# Floating point data is processed in blocks of this number of pixels
+_FLOAT_BLOCK_SIZE = 16384
+_executor = None  # ThreadPoolExecutor, created on first use
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """
+    return (ThreadPoolExecutor or None): the executor to process the chunks in
+      parallel, or None if there is only one CPU.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            ncpus = multiprocessing.cpu_count()
+            if ncpus <= 1:
+                return None
+            _executor = ThreadPoolExecutor(max_workers=min(ncpus, 8))
+        return _executor
+
+
+def _map_chunks(fn, data, out=None):
+    """
+    Run a function on chunks of the data, in parallel if there are several CPUs.
+    data (numpy.ndarray): the data, which will be split along the first dimension
+    fn (callable): the function to call on each chunk. It receives the chunk of
+      the data, and the corresponding chunk of out, if out is not None.
+    out (None or numpy.ndarray): array with the same first dimension as the data
+    return (list): the results of each call
+    """
+    if data.size < 2 * CHUNK_SIZE or data.ndim == 0 or data.shape[0] < 2:
+        chunks = [slice(None)]
+    else:
+        n = min(data.shape[0], int(math.ceil(data.size / CHUNK_SIZE)))
+        bounds = numpy.linspace(0, data.shape[0], n + 1).astype(int)
+        chunks = [slice(s, e) for s, e in zip(bounds[:-1], bounds[1:])]
+
+    if out is None:
+        call = lambda c: fn(data[c])
+    else:
+        call = lambda c: fn(data[c], out[c])
+
+    executor = _get_executor() if len(chunks) > 1 else None
+    if executor is None:
+        # Still process by chunks, as it keeps the intermediary arrays smaller
+        return [call(c) for c in chunks]
+
+    futs = [executor.submit(call, c) for c in chunks]
+    return [f.result() for f in futs]
+
+
+def _sum_counts(counts):
+    """
+    Sum histograms which might have different lengths.
+    counts (list of ndarray 1D)
+    return (ndarray 1D): as long as the longest histogram
+    """
+    if len(counts) == 1:
+        return counts[0]
+    hist = numpy.zeros(max(c.size for c in counts), dtype=counts[0].dtype)
+    for c in counts:
+        hist[:c.size] += c
+    return hist
+
+
+def _int_full_counts(data):
+    """
+    Compute the number of occurrences of every value of a ≤16-bit integer data.
+    data (ndarray of (u)int8 or (u)int16)
+    return (ndarray of int, offset): the counts, where index 0 corresponds to
+      the value offset (ie, the minimum value of the dtype). It can be shorter
+      than the whole range of the dtype, if the high values are not present.
+    """
+    if data.dtype.kind == "i":
+        # Handled as unsigned, with the sign bit flipped, which shifts the values
+        # by -min: -128 -> 0, 0 -> 128, 127 -> 255.
+        udt = numpy.dtype("u%d" % data.itemsize)
+        sign_bit = udt.type(1 << (8 * data.itemsize - 1))
+        counts = _map_chunks(lambda d: numpy.bincount(numpy.bitwise_xor(d.ravel().view(udt),
+                                                                        sign_bit)),
+                             data)
+        offset = -int(sign_bit)
+    else:
+        counts = _map_chunks(lambda d: numpy.bincount(d.ravel()), data)
+        offset = 0
+
+    return _sum_counts(counts), offset
+
+
+def _int_histogram(data, irange, length):
+    """
+    Compute the histogram of integer data, with integer bins of the same size.
+    Values outside of irange are discarded.
+    data (ndarray of integers, at most 32-bit)
+    irange (int, int): min/max values
+    length (0<int): number of bins
+    return (ndarray 1D of int)
+    """
+    lo, hi = irange
+    span = hi - lo + 1
+
+    def count_chunk(d):
+        idx = d.ravel().astype(numpy.int64)
+        idx -= lo
+        if length != span:
+            # computed in int64, so no overflow for data up to 32-bit
+            idx *= length
+            idx //= span
+        # All the outliers fall in the extra bins at each end
+        numpy.clip(idx, -1, length, out=idx)
+        idx += 1
+        return numpy.bincount(idx, minlength=length + 2)[1:length + 1]
+
+    return _sum_counts(_map_chunks(count_chunk, data))
+
+
+def _float_histogram(data, irange, length):
+    """
+    Compute the histogram of floating point data, with the same binning as
+    numpy.histogram().
+    data (ndarray of floats)
+    irange (float, float): min/max values (min < max)
+    length (0<int): number of bins
+    return (ndarray 1D of int)
+    """
+    lo, hi = irange
+    norm = length / (hi - lo)
+
+    def count_block(d, hist):
+        f = d - lo
+        f *= norm
+        numpy.floor(f, out=f)
+        f[f == length] = length - 1  # the max is part of the last bin
+        f[d > hi] = length
+        # All the outliers (and NaNs) fall in the extra bins at each end
+        numpy.fmax(f, -1, out=f)
+        numpy.fmin(f, length, out=f)
+        idx = f.astype(numpy.intp)
+        idx += 1
+        hist += numpy.bincount(idx, minlength=length + 2)[1:length + 1]
+
+    def count_chunk(d):
+        # Small blocks, so that the intermediary arrays stay in the CPU cache
+        d = d.ravel()
+        hist = numpy.zeros(length, dtype=numpy.intp)
+        for i in range(0, d.size, _FLOAT_BLOCK_SIZE):
+            count_block(d[i:i + _FLOAT_BLOCK_SIZE], hist)
+        return hist
+
+    return _sum_counts(_map_chunks(count_chunk, data))
 
-def histogram(data, irange=None):
+
+def histogram(data, irange=None, subsample=1):
     """
     Compute the histogram of the given image.
+    The computation is done in parallel on large images.
     data (numpy.ndarray of numbers): greyscale image
     irange (None or tuple of 2 unsigned int): min/max values to be found
       in the data. None => auto (min, max will be detected from the data)
+    subsample (1<=int): only use every N pixel along each dimension. Useful to
+      get quickly an approximate histogram of large images (eg, for live
+      display). Note that the number of pixels counted is then about
+      data.size / subsample ** data.ndim.
     return hist, edges:
      hist (ndarray 1D of 0<=int): number of pixels with the given value
       Note that the length of the returned histogram is not fixed. If irange
@@ -216,42 +321,192 @@ def histogram(data, irange=None):
        edges[1] is included in the bin. If irange is defined, it's the same
        values.
     """
+    # Discard the DataArray aspect, to get scalars out of the numpy operations
+    data = data.view(numpy.ndarray)
+    if subsample > 1:
+        data = data[(slice(None, None, subsample),) * data.ndim]
+
     if irange is None:
         if data.dtype.kind in "biu":
             idt = numpy.iinfo(data.dtype)
             irange = (idt.min, idt.max)
             if data.itemsize > 2:
                 # range is too big to be used as is => look really at the data
-                irange = (int(data.view(numpy.ndarray).min()),
-                          int(data.view(numpy.ndarray).max()))
+                irange = (int(data.min()), int(data.max()))
         else:
-            # cast to ndarray to ensure a scalar (instead of a DataArray)
-            irange = (data.view(numpy.ndarray).min(), data.view(numpy.ndarray).max())
-
-    # short-cuts (for the most usual types)
-    if data.dtype.kind in "bu" and irange[0] == 0 and data.itemsize <= 2 and len(data) > 0:
-        # TODO: for int (irange[0] < 0), treat as unsigned, and swap the first
-        # and second halves of the histogram.
-        # TODO: for 32 or 64 bits with full range, convert to a view looking
-        # only at the 2 high bytes.
-        length = irange[1] - irange[0] + 1
-        hist = numpy.bincount(data.flat, minlength=length)
-        edges = (0, hist.size - 1)
-        if edges[1] > irange[1]:
-            logging.warning("Unexpected value %d outside of range %s", edges[1], irange)
-    else:
+            irange = (data.min(), data.max())
+
+    if data.dtype.kind in "biu" and data.itemsize <= 2:
+        full, offset = _int_full_counts(data)
+        if data.dtype.kind in "bu" and irange[0] == 0:
+            # Short-cut for the most usual case: the histogram directly
+            # corresponds to the counts. It is extended if some values are
+            # above the range.
+            length = irange[1] + 1
+            if full.size < length:
+                hist = numpy.zeros(length, dtype=full.dtype)
+                hist[:full.size] = full
+            else:
+                nz = numpy.flatnonzero(full[length:])
+                if len(nz):
+                    length += nz[-1] + 1
+                hist = full[:length]
+            edges = (0, hist.size - 1)
+            if edges[1] > irange[1]:
+                logging.warning("Unexpected value %d outside of range %s", edges[1], irange)
+        else:
+            # Only keep the counts inside the range
+            lo, hi = int(irange[0]), int(irange[1])
+            vals = numpy.arange(full.size) + offset
+            inr = (lo <= vals) & (vals <= hi) & (full > 0)
+            length = hi - lo + 1
+            if length <= 8192:
+                hist = numpy.zeros(length, dtype=full.dtype)
+                hist[vals[inr] - lo] = full[inr]
+            else:
+                # Bin the counts, exactly as numpy.histogram() would do with the values
+                length = 8192
+                hist, _ = numpy.histogram(vals[inr], bins=length, range=(lo, hi),
+                                          weights=full[inr])
+                hist = hist.astype(full.dtype)
+            edges = (lo, hi)
+    elif data.dtype.kind in "biu" and data.itemsize <= 4:
+        lo, hi = int(irange[0]), int(irange[1])
+        length = min(8192, hi - lo + 1)
+        hist = _int_histogram(data, (lo, hi), length)
+        edges = (lo, hi)
+    elif data.dtype.kind == "f":
+        if not (numpy.isfinite(irange[0]) and numpy.isfinite(irange[1])):
+            raise ValueError("Range of [%s, %s] is not finite" % (irange[0], irange[1]))
+        length = 256
+        lo, hi = irange
+        if lo == hi:
+            # Same as numpy.histogram()
+            lo, hi = lo - 0.5, hi + 0.5
+        hist = _float_histogram(data, (lo, hi), length)
+        edges = irange
+    else:  # 64-bit integers, or other unusual types
         if data.dtype.kind in "biu":
             length = min(8192, irange[1] - irange[0] + 1)
         else:
-            # For floats, it will automatically find the minimum and maximum
             length = 256
-        hist, all_edges = numpy.histogram(data, bins=length, range=irange)
-        edges = (max(irange[0], all_edges[0]),
-                 min(irange[1], all_edges[-1]))
+        counts = _map_chunks(lambda d: numpy.histogram(d.ravel(), bins=length, range=irange)[0],
+                             data)
+        hist = _sum_counts(counts)
+        edges = irange
 
     return hist, edges
 
 
+class RunningHistogram(object):
+    """
+    Histogram of a series of images (eg, live data), which is updated
+    incrementally on each new image. The previous images still contribute to
+    the histogram, with an exponentially decaying weight. As consecutive images
+    are usually very similar, it permits to only look at part of each image.
+    The histogram is reset whenever its bins change (ie, new range or dtype).
+    """
+    def __init__(self, decay=0.5, interleave=1):
+        """
+        decay (0<=float<1): weight of the previous histogram when a new image is
+          added. 0 means only the latest image is used.
+        interleave (1<=int): only use one line every N lines of each image. The
+          next image uses the next set of lines, so that after N images, every
+          line has been used.
+        """
+        if not 0 <= decay < 1:
+            raise ValueError("decay must be between 0 and 1, but got %s" % (decay,))
+        if interleave < 1:
+            raise ValueError("interleave must be at least 1, but got %s" % (interleave,))
+        self.decay = decay
+        self.interleave = interleave
+        self._phase = 0  # the first line to use on the next image
+        self._hist = None  # ndarray of floats
+        self._edges = None
+        self._range_cache = {}  # outliers -> range
+        self._lock = threading.Lock()  # taken while updating
+
+    def reset(self):
+        """
+        Forget all the previous images
+        """
+        with self._lock:
+            self._hist = None
+            self._edges = None
+            self._range_cache = {}
+
+    @property
+    def hist(self):
+        """
+        (None or ndarray 1D of 0<=int): the current histogram, scaled to the
+          number of pixels in an image.
+        """
+        if self._hist is None:
+            return None
+        return numpy.rint(self._hist).astype(numpy.int64)
+
+    @property
+    def edges(self):
+        """
+        (None or tuple of 2 numbers): the edges of the histogram
+        """
+        return self._edges
+
+    def update(self, data, irange=None, subsample=1):
+        """
+        Add a new image to the histogram.
+        data (numpy.ndarray of numbers): greyscale image
+        irange (None or tuple of 2 numbers): min/max values, as in histogram()
+        subsample (1<=int): subsampling of the image, as in histogram()
+        return hist, edges: same as the .hist and .edges
+        """
+        with self._lock:
+            if self.interleave > 1 and data.ndim >= 1 and data.shape[0] >= self.interleave:
+                part = data[self._phase::self.interleave]
+                self._phase = (self._phase + 1) % self.interleave
+                scale = data.shape[0] / part.shape[0]
+            else:
+                part = data
+                scale = 1
+
+            hist, edges = histogram(part, irange, subsample)
+            hist = hist.astype(numpy.float64)
+            if scale != 1:
+                hist *= scale  # extrapolate to the whole image
+
+            if (self._hist is None or self._hist.shape != hist.shape or
+                self._edges != edges):
+                self._hist = hist
+                self._edges = edges
+            else:
+                self._hist *= self.decay
+                self._hist += (1 - self.decay) * hist
+                # Drop the counts of the values not seen for a long time, so that
+                # they are not considered at all by findOptimalRange().
+                self._hist[self._hist < 0.5] = 0
+            self._range_cache = {}
+
+            return self.hist, self._edges
+
+    def findOptimalRange(self, outliers=0):
+        """
+        Find the intensity range fitting best the current histogram.
+        The result is cached until the next update.
+        outliers (0<float<0.5): ratio of outliers to discard, as in findOptimalRange()
+        return (tuple of 2 values): the range (min and max values)
+        raise LookupError: if there is no histogram yet
+        """
+        with self._lock:
+            if self._hist is None:
+                raise LookupError("No image received yet")
+            try:
+                return self._range_cache[outliers]
+            except KeyError:
+                irange = findOptimalRange(self._hist, self._edges, outliers)
+                self._range_cache[outliers] = irange
+                return irange
+
+
 def guessDRange(data):
     """
     Guess the data range of the data given.
@@ -293,118 +548,204 @@ def isClipping(data, drange=None):
     return drange[1] in data
 
 
+def tint2LUT(tint):
+    """
+    Convert a tint into a look-up table.
+    tint (3-tuple of 0<=int<256, or matplotlib.colors.Colormap, or ndarray of
+      shape 256x3 of uint8): RGB colour for the maximum intensity (the minimum
+      intensity being black), or colours for each of the 256 intensities.
+    return (ndarray of shape 256x3 of uint8): RGB colour for each intensity
+    """
+    if isinstance(tint, numpy.ndarray):
+        if tint.shape != (256, 3):
+            raise ValueError("LUT tint must be of shape 256x3, but got %s" % (tint.shape,))
+        return tint.astype(numpy.uint8, copy=False)
+    elif hasattr(tint, "N") and callable(tint):  # matplotlib Colormap
+        rgba = tint(numpy.linspace(0, 1, 256))
+        return numpy.rint(rgba[:, :3] * 255).astype(numpy.uint8)
+    else:
+        if len(tint) != 3:
+            raise ValueError("Tint must be a RGB colour, but got %s" % (tint,))
+        lut = numpy.outer(numpy.arange(256), tint) / 255
+        return numpy.rint(lut).astype(numpy.uint8)
+
+
+def _get_intensity_index(data, irange):
+    """
+    Scale the data to 256 intensities
+    data (ndarray): the raw data
+    irange (2 numbers): the values mapped to 0 and 255. The first must be < second.
+    return (ndarray of uint8): same shape as data
+    """
+    # Ideally, it would be 255 / (irange[1] - irange[0]) + 0.5, but to avoid
+    # the addition, we can just use 255.99, and with the rounding down, it's
+    # very similar.
+    b = 255.99 / (irange[1] - irange[0])
+    if data.dtype.kind == "f":
+        f = data - numpy.array(irange[0], dtype=data.dtype)
+    else:  # Make sure to not overflow
+        f = numpy.subtract(data, irange[0], dtype=numpy.float64)
+    f *= b
+    # clip (fmax also converts NaNs to 0)
+    numpy.fmax(f, 0, out=f)
+    numpy.fmin(f, 255, out=f)
+    return f.astype(numpy.uint8)
+
+
+# (dtype str, irange, LUT bytes) -> ndarray of shape N x C of uint8
+_full_luts = {}
+_MAX_FULL_LUTS = 16
+
+
+def _get_full_lut(dtype, irange, lut):
+    """
+    Compute a look-up table which directly gives the colour for every possible
+    value of a (≤16-bit) integer type.
+    dtype (numpy.dtype): integer type of at most 16 bits
+    irange (2 ints): range of the values which are mapped to the LUT
+    lut (ndarray of shape 256 x C of uint8): colours of the 256 intensities
+    return (ndarray of shape 2**bits x C of uint8): the colour corresponding to
+      each value, indexed by the *unsigned* representation of the value.
+    """
+    key = (dtype.str, irange[0], irange[1], lut.shape, lut.tobytes())
+    try:
+        return _full_luts[key]
+    except KeyError:
+        pass
+
+    udtype = numpy.dtype("u%d" % dtype.itemsize)
+    values = numpy.arange(2 ** (8 * dtype.itemsize), dtype=udtype).view(dtype)
+    full_lut = lut[_get_intensity_index(values, irange)]
+
+    if len(_full_luts) >= _MAX_FULL_LUTS:
+        _full_luts.clear()
+    _full_luts[key] = full_lut
+    return full_lut
+
+
+def _DataArray2LUT(data, irange, lut):
+    """
+    Convert a greyscale image into a colour image, in one pass (per chunk of data).
+    data (ndarray 2D): greyscale image
+    irange (2 numbers): the values mapped to the first and last entries of the LUT.
+      The first must be strictly smaller than the second.
+    lut (ndarray of shape 256 x C of uint8): the colour of each intensity
+    return (ndarray of shape Y x X x C of uint8)
+    """
+    nchan = lut.shape[1]
+    ret = numpy.empty(data.shape + (nchan,), dtype=numpy.uint8)
+
+    if data.dtype.kind in "biu" and data.itemsize <= 2:
+        # Directly one look-up per pixel, from the raw value to the colour
+        full_lut = _get_full_lut(data.dtype, irange, lut)
+        udtype = numpy.dtype("u%d" % data.itemsize)
+        if nchan == 4:
+            # Much faster to copy each colour as one uint32
+            full_lut = full_lut.view(numpy.uint32)[:, 0]
+
+            def convert(d, r):
+                numpy.take(full_lut, d.view(udtype), out=r.view(numpy.uint32)[..., 0], mode="clip")
+        else:
+            def convert(d, r):
+                numpy.take(full_lut, d.view(udtype), axis=0, out=r, mode="clip")
+    elif img_fast and data.flags.c_contiguous and data.dtype.kind in "iuf" and nchan in (3, 4):
+        def convert(d, r):
+            img_fast.DataArray2LUT(d.reshape(-1), irange, lut, r.reshape(-1))
+    else:
+        def convert(d, r):
+            idx = _get_intensity_index(d, irange)
+            numpy.take(lut, idx, axis=0, out=r, mode="clip")
+
+    _map_chunks(convert, data, ret)
+    return ret
+
+
+def _get_rgb_irange(data, irange):
+    """
+    Find the intensity range to use for the conversion of an image to RGB
+    data (ndarray): greyscale image
+    irange (None or tuple of 2 values): see DataArray2RGB()
+    return data, irange: the data (which might be adjusted) and the range,
+      with the first value strictly smaller than the second one.
+    """
+    if irange is None:
+        irange = (numpy.nanmin(data), numpy.nanmax(data))
+        if math.isnan(irange[0]):
+            logging.warning("Trying to convert all-NaN data to RGB")
+            data = numpy.nan_to_num(data)
+            irange = (0, 1)
+    else:
+        # ensure irange is the same type as the data. It ensures we don't get
+        # crazy values.
+        irange = numpy.array(irange, data.dtype)
+        # TODO: warn if irange looks too different from original value?
+        if irange[0] == irange[1]:
+            logging.info("Requested RGB conversion with null-range %s", irange)
+
+    if data.dtype.kind in "biu":
+        # Ensure B&W if there is only one value allowed
+        if irange[0] >= irange[1]:
+            idt = numpy.iinfo(data.dtype)
+            if irange[0] > idt.min:
+                irange = (irange[0] - 1, irange[0])
+            else:
+                irange = (irange[0], irange[0] + 1)
+        irange = (int(irange[0]), int(irange[1]))
+    else:  # floats et al.
+        # Ensure B&W if there is just one value allowed
+        if irange[0] >= irange[1]:
+            irange = (irange[0] - 1e-9, irange[0])
+        irange = (float(irange[0]), float(irange[1]))
+
+    return data, irange
+
+
 # TODO: try to do cumulative histogram value mapping (=histogram equalization)?
 # => might improve the greys, but might be "too" clever
 def DataArray2RGB(data, irange=None, tint=(255, 255, 255)):
     """
-    :param data: (numpy.ndarray of unsigned int) 2D image greyscale (unsigned
-        float might work as well)
+    :param data: (numpy.ndarray of numbers) 2D image greyscale
     :param irange: (None or tuple of 2 values) min/max intensities mapped
         to black/white
         None => auto (min, max are from the data);
         0, max val of data => whole range is mapped.
         min must be < max, and must be of the same type as data.dtype.
-    :param tint: (3-tuple of 0 < int <256) RGB colour of the final image (each
-        pixel is multiplied by the value. Default is white.
+    :param tint: (3-tuple of 0 < int <256, or matplotlib Colormap) RGB colour
+        of the final image (each pixel is multiplied by the value). Default is
+        white. If it's a colormap, the intensities are mapped to its colours.
     :return: (numpy.ndarray of 3*shape of uint8) converted image in RGB with the
         same dimension
     """
-    # TODO: handle signed values
     assert(data.ndim == 2) # => 2D with greyscale
 
     # Discard the DataArray aspect and just get the raw array, to be sure we
     # don't get a DataArray as result of the numpy operations
     data = data.view(numpy.ndarray)
+    data, irange = _get_rgb_irange(data, irange)
+    return _DataArray2LUT(data, irange, tint2LUT(tint))
 
-    # fit it to 8 bits and update brightness and contrast at the same time
-    if irange is None:
-        irange = (numpy.nanmin(data), numpy.nanmax(data))
-        if math.isnan(irange[0]):
-            logging.warning("Trying to convert all-NaN data to RGB")
-            data = numpy.nan_to_num(data)
-            irange = (0, 1)
-    else:
-        # ensure irange is the same type as the data. It ensures we don't get
-        # crazy values, and also that numpy doesn't get confused in the
-        # intermediary dtype (cf .clip()).
-        irange = numpy.array(irange, data.dtype)
-        # TODO: warn if irange looks too different from original value?
-        if irange[0] == irange[1]:
-            logging.info("Requested RGB conversion with null-range %s", irange)
 
-    if data.dtype == numpy.uint8 and irange[0] == 0 and irange[1] == 255:
-        # short-cut when data is already the same type
-        # logging.debug("Applying direct range mapping to RGB")
-        drescaled = data
-        # TODO: also write short-cut for 16 bits by reading only the high byte?
-    else:
-        # If data might go outside of the range, clip first
-        if data.dtype.kind in "iu":
-            # no need to clip if irange is the whole possible range
-            idt = numpy.iinfo(data.dtype)
-            # Ensure B&W if there is only one value allowed
-            if irange[0] >= irange[1]:
-                if irange[0] > idt.min:
-                    irange = (irange[0] - 1, irange[0])
-                else:
-                    irange = (irange[0], irange[0] + 1)
-
-            if img_fast:
-                try:
-                    # only (currently) supports uint16
-                    return img_fast.DataArray2RGB(data, irange, tint)
-                except ValueError as exp:
-                    logging.info("Fast conversion cannot run: %s", exp)
-                except Exception:
-                    logging.exception("Failed to use the fast conversion")
-
-            if irange[0] > idt.min or irange[1] < idt.max:
-                data = data.clip(*irange)
-        else: # floats et al. => always clip
-            # Ensure B&W if there is just one value allowed
-            if irange[0] >= irange[1]:
-                irange = (irange[0] - 1e-9, irange[0])
-            data = data.clip(*irange)
-
-        dshift = data - irange[0]
-        if data.dtype == numpy.uint8:
-            drescaled = dshift  # re-use memory for the result
-        else:
-            # TODO: could directly use one channel of the 'rgb' variable?
-            drescaled = numpy.empty(data.shape, dtype=numpy.uint8)
-        # Ideally, it would be 255 / (irange[1] - irange[0]) + 0.5, but to avoid
-        # the addition, we can just use 255.99, and with the rounding down, it's
-        # very similar.
-        b = 255.99 / (irange[1] - irange[0])
-        numpy.multiply(dshift, b, out=drescaled, casting="unsafe")
-
-    # Now duplicate it 3 times to make it RGB (as a simple approximation of
-    # greyscale)
-    # dstack doesn't work because it doesn't generate in C order (uses strides)
-    # apparently this is as fast (or even a bit better):
-
-    # 0 copy (1 malloc)
-    rgb = numpy.empty(data.shape + (3,), dtype=numpy.uint8, order='C')
-
-    # Tint (colouration)
-    if tint == (255, 255, 255):
-        # fast path when no tint
-        # Note: it seems numpy.repeat() is 10x slower ?!
-        # a = numpy.repeat(drescaled, 3)
-        # a.shape = data.shape + (3,)
-        rgb[:, :, 0] = drescaled # 1 copy
-        rgb[:, :, 1] = drescaled # 1 copy
-        rgb[:, :, 2] = drescaled # 1 copy
-    else:
-        rtint, gtint, btint = tint
-        # multiply by a float, cast back to type of out, and put into out array
-        # TODO: multiplying by float(x/255) is the same as multiplying by int(x)
-        #       and >> 8
-        numpy.multiply(drescaled, rtint / 255, out=rgb[:, :, 0], casting="unsafe")
-        numpy.multiply(drescaled, gtint / 255, out=rgb[:, :, 1], casting="unsafe")
-        numpy.multiply(drescaled, btint / 255, out=rgb[:, :, 2], casting="unsafe")
-
-    return rgb
+def DataArray2BGRA(data, irange=None, tint=(255, 255, 255), alpha=255):
+    """
+    Same as DataArray2RGB(), but generates a BGRA image, with the colours
+    pre-multiplied by the alpha, as used by Cairo. The conversion is done in a
+    single pass, so it's faster than converting the output of DataArray2RGB().
+    :param data: (numpy.ndarray of numbers) 2D image greyscale
+    :param irange: (None or tuple of 2 values) see DataArray2RGB()
+    :param tint: (3-tuple of 0 < int <256, or matplotlib Colormap) see DataArray2RGB()
+    :param alpha: (0 <= int <= 255) the opacity of the image
+    :return: (numpy.ndarray of shape Y x X x 4 of uint8) converted image in BGRA
+    """
+    assert(data.ndim == 2) # => 2D with greyscale
+
+    data = data.view(numpy.ndarray)
+    data, irange = _get_rgb_irange(data, irange)
+    lut = tint2LUT(tint)
+    bgra_lut = numpy.empty((256, 4), dtype=numpy.uint8)
+    # Same computation as gui.util.img.scale_to_alpha()
+    numpy.multiply(lut[:, ::-1], alpha / 255, out=bgra_lut[:, :3], casting="unsafe")
+    bgra_lut[:, 3] = alpha
+    return _DataArray2LUT(data, irange, bgra_lut)
 
 
 def getYXFromZYX(data, zIndex=0):
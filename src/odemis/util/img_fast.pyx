@@ -18,98 +18,137 @@ You should have received a copy of the GNU General Public License along with Ode
 
 from __future__ import division
 import cython
+from libc.math cimport fmin, fmax
+from libc.stdint cimport uint32_t
 
 # import both numpy and the Cython declarations for numpy
 import numpy
 cimport numpy
 
-# TODO: use fused types to support multiple types (but needs Cython >= 0.20)
-ctypedef numpy.uint16_t uint16_t
+ctypedef fused data_t:
+    numpy.uint8_t
+    numpy.int8_t
+    numpy.uint16_t
+    numpy.int16_t
+    numpy.uint32_t
+    numpy.int32_t
+    numpy.uint64_t
+    numpy.int64_t
+    numpy.float32_t
+    numpy.float64_t
 
 # nogil allows multi-threading but prevents use of any Python objects or call
+# Note: the data is passed as a pointer (instead of a fused memoryview), so that
+# read-only arrays are accepted, and it builds with Cython 0.29. The functions
+# return an int (always 0), instead of void, so that Cython 3 doesn't need the
+# GIL to check for exceptions.
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int cDataArray2RGBLUT(const data_t* data, Py_ssize_t datalen,
+                            double irange0, double irange1,
+                            const numpy.uint8_t* lut, numpy.uint8_t* ret) nogil:
+    # Same scaling as the numpy version: 255.99 instead of 255 + rounding
+    cdef double b = 255.99 / (irange1 - irange0)
+    cdef int idx
+    cdef Py_ssize_t i
+    cdef const numpy.uint8_t* col
+
+    for i in range(datalen):
+        # clip without branches (which are slow on random data). NaN -> 0.
+        idx = <int> fmin(fmax((<double> data[i] - irange0) * b, 0.), 255.)
+        col = &lut[idx * 3]
+        ret[0] = col[0]
+        ret[1] = col[1]
+        ret[2] = col[2]
+        ret += 3
+    return 0
+
+
 @cython.cdivision(True)
-cdef void cDataArray2RGB(uint16_t* data, int datalen, uint16_t irange0, uint16_t irange1,
-                         int* tint, numpy.uint8_t* ret) nogil:
-    cdef double b = 255. / <double>(irange1 - irange0)
-    cdef double br = (b * <double>tint[0]) / 255.
-    cdef double bg = (b * <double>tint[1]) / 255.
-    cdef double bb = (b * <double>tint[2]) / 255.
-
-    cdef numpy.uint8_t di
-    cdef double df
-    cdef int retpos = 0
-
-    if tint[0] == tint[1] == tint[2] == 255:
-        # optimised version, without tinting (about 2x faster)
-        for i in range(datalen):
-            # clip
-            if data[i] <= irange0:
-                di = 0
-            elif data[i] >= irange1:
-                di = 255
-            else:
-                di = <numpy.uint8_t> ((data[i] - irange0) * b + 0.5)
-            ret[retpos] = di
-            retpos += 1
-            ret[retpos] = di
-            retpos += 1
-            ret[retpos] = di
-            retpos += 1
-    else:
-        for i in range(datalen):
-            # clip
-            if data[i] <= irange0:
-                ret[retpos] = 0
-                retpos += 1
-                ret[retpos] = 0
-                retpos += 1
-                ret[retpos] = 0
-                retpos += 1
-            elif data[i] >= irange1:
-                ret[retpos] = tint[0]
-                retpos += 1
-                ret[retpos] = tint[1]
-                retpos += 1
-                ret[retpos] = tint[2]
-                retpos += 1
-            else:
-                df = (data[i] - irange0)
-                ret[retpos] = <numpy.uint8_t> (df * br + 0.5)
-                retpos += 1
-                ret[retpos] = <numpy.uint8_t> (df * bg + 0.5)
-                retpos += 1
-                ret[retpos] = <numpy.uint8_t> (df * bb + 0.5)
-                retpos += 1
-
-# This function is probably not needed, but I have no idea how to instantiate
-# a numpy array which can be passed as a pointer
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def wrapDataArray2RGB(numpy.ndarray[uint16_t, ndim=2] data not None,
+cdef int cDataArray2RGBALUT(const data_t* data, Py_ssize_t datalen,
+                             double irange0, double irange1,
+                             const uint32_t* lut, uint32_t* ret) nogil:
+    # Each colour (4 bytes) is copied as one uint32
+    cdef double b = 255.99 / (irange1 - irange0)
+    cdef int idx
+    cdef Py_ssize_t i
+
+    for i in range(datalen):
+        idx = <int> fmin(fmax((<double> data[i] - irange0) * b, 0.), 255.)
+        ret[i] = lut[idx]
+    return 0
+
+
+cdef int cDataArray2LUT(const data_t* data, Py_ssize_t datalen,
+                         double irange0, double irange1,
+                         const numpy.uint8_t* lut, int nchan, numpy.uint8_t* ret) nogil:
+    if nchan == 3:
+        return cDataArray2RGBLUT(data, datalen, irange0, irange1, lut, ret)
+    else:
+        return cDataArray2RGBALUT(data, datalen, irange0, irange1,
+                                  <const uint32_t*> lut, <uint32_t*> ret)
+
+
+def DataArray2LUT(numpy.ndarray data not None,
                   irange,
-                  tint,
-                  numpy.ndarray[numpy.uint8_t, ndim=3] ret not None):
-    cdef int ctint[3]
-    ctint[0] = tint[0]
-    ctint[1] = tint[1]
-    ctint[2] = tint[2]
-    cDataArray2RGB(&data[0,0], data.size, irange[0], irange[1], ctint, &ret[0,0,0])
-
-
-def DataArray2RGB(data, irange, tint=(255, 255, 255)):
-    if not data.flags.c_contiguous:
-        raise ValueError("Optimised version only works with C-contiguous arrays")
-    if data.dtype != numpy.uint16:
-        # Note: cython automatically detects such errors, but it seems that with
-        # ctyhon 0.23, it can leak memory.
-        raise ValueError("Optimised version only works on uint16 (got %s)" % (data.dtype,))
-    # Note: we could also make an optimised version for F-contiguous arrays,
-    # but it's not clear when it'd be useful. For more complex arrays, it's also
-    # probably possible to generate a faster version than numpy, but I don't
-    # know how.
-    if irange[0] >= irange[1]:
+                  const numpy.uint8_t[:, ::1] lut not None,
+                  numpy.uint8_t[::1] ret not None):
+    """
+    Convert greyscale data to colours, in a single pass. The data is scaled to
+    256 intensities, which are converted via the look-up table.
+    The GIL is released during the conversion.
+    data (ndarray 1D, C-contiguous, of (u)int8 to (u)int64, float32 or float64):
+      the (flattened) greyscale data
+    irange (2 numbers): values mapped to the first/last entry of the LUT
+    lut (ndarray of shape 256 x C, uint8): colour of each intensity, with C = 3 or 4
+    ret (ndarray 1D of uint8): output, of length data.size * C
+    """
+    if data.ndim != 1 or not data.flags.c_contiguous:
+        raise ValueError("Data should be a 1D C-contiguous array")
+    if lut.shape[0] != 256 or lut.shape[1] not in (3, 4):
+        raise ValueError("LUT should be of shape 256 x 3 or 4, but got %d x %d" %
+                         (lut.shape[0], lut.shape[1]))
+    if ret.shape[0] != data.shape[0] * lut.shape[1]:
+        raise ValueError("Output should have %d values, but got %d" %
+                         (data.shape[0] * lut.shape[1], ret.shape[0]))
+    if not irange[0] < irange[1]:
         raise ValueError("irange needs to be a tuple of low/high values")
-    ret = numpy.empty(data.shape + (3,), dtype=numpy.uint8)
-    wrapDataArray2RGB(data, irange, tint, ret)
-    return ret
-
+    if data.shape[0] == 0:
+        return
+
+    cdef double irange0 = irange[0]
+    cdef double irange1 = irange[1]
+    cdef Py_ssize_t datalen = data.shape[0]
+    cdef const void* d = numpy.PyArray_DATA(data)
+    cdef const numpy.uint8_t* plut = &lut[0, 0]
+    cdef int nchan = lut.shape[1]
+    cdef numpy.uint8_t* pret = &ret[0]
+    cdef int dtype = numpy.PyArray_TYPE(data)
+
+    with nogil:
+        if dtype == numpy.NPY_UINT8:
+            cDataArray2LUT(<const numpy.uint8_t*> d, datalen, irange0, irange1, plut, nchan, pret)
+        elif dtype == numpy.NPY_INT8:
+            cDataArray2LUT(<const numpy.int8_t*> d, datalen, irange0, irange1, plut, nchan, pret)
+        elif dtype == numpy.NPY_UINT16:
+            cDataArray2LUT(<const numpy.uint16_t*> d, datalen, irange0, irange1, plut, nchan, pret)
+        elif dtype == numpy.NPY_INT16:
+            cDataArray2LUT(<const numpy.int16_t*> d, datalen, irange0, irange1, plut, nchan, pret)
+        elif dtype == numpy.NPY_UINT32:
+            cDataArray2LUT(<const numpy.uint32_t*> d, datalen, irange0, irange1, plut, nchan, pret)
+        elif dtype == numpy.NPY_INT32:
+            cDataArray2LUT(<const numpy.int32_t*> d, datalen, irange0, irange1, plut, nchan, pret)
+        elif dtype == numpy.NPY_UINT64:
+            cDataArray2LUT(<const numpy.uint64_t*> d, datalen, irange0, irange1, plut, nchan, pret)
+        elif dtype == numpy.NPY_INT64:
+            cDataArray2LUT(<const numpy.int64_t*> d, datalen, irange0, irange1, plut, nchan, pret)
+        elif dtype == numpy.NPY_FLOAT32:
+            cDataArray2LUT(<const numpy.float32_t*> d, datalen, irange0, irange1, plut, nchan, pret)
+        elif dtype == numpy.NPY_FLOAT64:
+            cDataArray2LUT(<const numpy.float64_t*> d, datalen, irange0, irange1, plut, nchan, pret)
+        else:
+            with gil:
+                raise TypeError("Unsupported data type %s" % (data.dtype,))
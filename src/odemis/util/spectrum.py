@@ -29,10 +29,21 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 
 import logging
+import math
+import numpy
 from numpy.polynomial import polynomial
 from odemis import model
+from odemis.util import LRUCache
+from scipy import sparse
 from builtins import range
 
+# Maximum memory used to cache the sampling of the lines and points (in bytes)
+SAMPLING_CACHE_SIZE = 64e6
+# (tuple) -> (ndarray, ndarray, csr_matrix): see get_line_sampling()
+_sampling_cache = LRUCache(SAMPLING_CACHE_SIZE,
+                           sizeof=lambda s: s[0].nbytes + s[1].nbytes + s[2].data.nbytes +
+                                            s[2].indices.nbytes + s[2].indptr.nbytes)
+
 
 def get_wavelength_per_pixel(da):
     """
@@ -208,3 +219,163 @@ def coefficients_to_dataarray(coef):
     da.metadata[model.MD_WL_LIST] = wl_list
 
     return da
+
+
+def _weights_to_sampling(shape, rows, ys, xs, weights, n):
+    """
+    Converts a list of (point, pixel, weight) into a sampling, with the weights
+    normalized so that each point is the weighted mean of the pixels.
+    shape (int, int): YX shape of the data
+    rows (ndarray of int): index of the point
+    ys, xs (ndarrays of int): position of the pixel
+    weights (ndarray of float): weight of the pixel for the point
+    n (int): number of points
+    return (ndarray, ndarray, csr_matrix): see get_line_sampling()
+    """
+    # Only keep the pixels inside the data
+    inside = ((0 <= ys) & (ys < shape[0]) & (0 <= xs) & (xs < shape[1]) & (weights > 0))
+    rows, ys, xs, weights = rows[inside], ys[inside], xs[inside], weights[inside]
+
+    # Each pixel is read only once, even if it's used by several points
+    px_idx, cols = numpy.unique(ys * shape[1] + xs, return_inverse=True)
+    px_ys, px_xs = numpy.divmod(px_idx, shape[1])
+    # Note: the duplicated (point, pixel) are summed
+    w = sparse.csr_matrix((weights, (rows, cols.ravel())), shape=(n, len(px_idx)))
+
+    # Normalize by the total weight of each point, so that the parts of the
+    # point which fall outside of the data do not count.
+    totw = numpy.asarray(w.sum(axis=1)).ravel()
+    totw[totw == 0] = 1  # Points completely outside => stay 0
+    w = sparse.diags(1 / totw).dot(w).tocsr()
+    return px_ys, px_xs, w
+
+
+def get_line_sampling(shape, start, end, width=1):
+    """
+    Computes which pixels should be read, and how they should be weighted, to
+    get the values along a line. The values are bilinearly interpolated, and
+    averaged over the width of the line. If part of the line (width) falls
+    outside of the data, only the part inside the data is taken into account.
+    The result is cached, so calling it again with the same line is cheap.
+    shape (int, int): YX shape of the data
+    start (float, float): XY position of the first point of the line (in px)
+    end (float, float): XY position of the last point of the line (in px)
+    width (int >= 1): number of points sampled perpendicularly to the line,
+      1 px apart.
+    return (ndarray of int, ndarray of int, csr_matrix of shape NxK): the Y and
+      X positions of the K pixels to read, and the weight of each of these
+      pixels for each of the N points of the line. N is 1 + the length of the
+      line (in px), and the first point is at the start.
+    raise ValueError: if the line is less than 1 px long
+    """
+    shape = tuple(shape[-2:])
+    start = tuple(float(v) for v in start)
+    end = tuple(float(v) for v in end)
+    key = ("line", shape, start, end, width)
+    sampling = _sampling_cache.get(key)
+    if sampling is not None:
+        return sampling
+
+    v = (end[0] - start[0], end[1] - start[1])
+    l = math.hypot(*v)
+    if l < 1:
+        raise ValueError("Line %s -> %s is too short" % (start, end))
+    n = 1 + int(l)
+
+    # Position of each sample, as width x n
+    xs = numpy.linspace(start[0], end[0], n)
+    ys = numpy.linspace(start[1], end[1], n)
+    # Spread over the width, along the perpendicular unit vector
+    pv = (-v[1] / l, v[0] / l)
+    spread = (width - 1) / 2
+    offsets = numpy.linspace(-spread, spread, width)
+    xs = xs + (pv[0] * offsets)[:, numpy.newaxis]
+    ys = ys + (pv[1] * offsets)[:, numpy.newaxis]
+    rows = numpy.broadcast_to(numpy.arange(n), xs.shape)
+
+    # Bilinear interpolation: each sample is a weighted sum of the 4 pixels around
+    x0 = numpy.floor(xs)
+    y0 = numpy.floor(ys)
+    fx = xs - x0
+    fy = ys - y0
+    x0 = x0.astype(numpy.int64)
+    y0 = y0.astype(numpy.int64)
+    all_rows, all_ys, all_xs, all_w = [], [], [], []
+    for dy, wy in ((0, 1 - fy), (1, fy)):
+        for dx, wx in ((0, 1 - fx), (1, fx)):
+            all_rows.append(rows.ravel())
+            all_ys.append((y0 + dy).ravel())
+            all_xs.append((x0 + dx).ravel())
+            all_w.append((wy * wx).ravel())
+
+    sampling = _weights_to_sampling(shape, numpy.concatenate(all_rows),
+                                    numpy.concatenate(all_ys), numpy.concatenate(all_xs),
+                                    numpy.concatenate(all_w), n)
+    _sampling_cache[key] = sampling
+    return sampling
+
+
+def get_point_sampling(shape, pos, width=1):
+    """
+    Computes which pixels should be read, and how they should be weighted, to
+    get the average value around a point. All the pixels whose center is within
+    the circle of diameter width are averaged.
+    The result is cached, so calling it again with the same point is cheap.
+    shape (int, int): YX shape of the data
+    pos (int, int): XY position of the point (in px)
+    width (int >= 1): diameter of the circle (in px)
+    return (ndarray of int, ndarray of int, csr_matrix of shape 1xK): the Y and
+      X positions of the K pixels to read, and the weight of each of them.
+    """
+    shape = tuple(shape[-2:])
+    x, y = pos
+    key = ("point", shape, x, y, width)
+    sampling = _sampling_cache.get(key)
+    if sampling is not None:
+        return sampling
+
+    radius = width / 2
+    # Scan the square around the point, and only pick the points in the circle
+    pxs = numpy.arange(max(0, int(x - radius)), min(int(x + radius) + 1, shape[1]))
+    pys = numpy.arange(max(0, int(y - radius)), min(int(y + radius) + 1, shape[0]))
+    pxs, pys = numpy.meshgrid(pxs, pys)
+    incircle = numpy.hypot(x - pxs, y - pys) <= radius
+    pxs, pys = pxs[incircle], pys[incircle]
+
+    sampling = _weights_to_sampling(shape, numpy.zeros(len(pxs), dtype=numpy.int64),
+                                    pys, pxs, numpy.ones(len(pxs)), 1)
+    _sampling_cache[key] = sampling
+    return sampling
+
+
+def extract_samples(data, samplings):
+    """
+    Computes the values of the data for several samplings (lines or points) at
+    once. Only the pixels needed are read from the data.
+    data (ndarray of shape ...YX): the data, for instance a CYX spectrum cube
+    samplings (list of tuples): samplings as returned by get_line_sampling() or
+      get_point_sampling(), for data of the same YX shape.
+    return (list of ndarrays of shape N...): for each sampling, the value for
+      each of its N points, as float64. For instance, with CYX data and a line
+      sampling, each array is of shape NC.
+    """
+    if not samplings:
+        return []
+
+    ys = numpy.concatenate([s[0] for s in samplings])
+    xs = numpy.concatenate([s[1] for s in samplings])
+    if len(samplings) == 1:
+        weights = samplings[0][2]
+    else:
+        weights = sparse.block_diag([s[2] for s in samplings], format="csr")
+
+    # Only read the pixels needed, as ...K
+    sub = data[..., ys, xs]
+    lead_shape = sub.shape[:-1]
+    sub = sub.reshape(-1, sub.shape[-1])
+    values = weights.dot(sub.T.astype(numpy.float64))  # N x (...)
+    values = values.reshape((values.shape[0],) + lead_shape)
+
+    # Separate back each sampling
+    splits = numpy.cumsum([s[2].shape[0] for s in samplings])[:-1]
+    return numpy.split(values, splits)
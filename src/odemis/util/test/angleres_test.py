@@ -442,6 +442,46 @@ class TestAngleResolvedDataConversion(unittest.TestCase):
         self.assertEqual(result.shape, (201, 201, 3))
         self.assertEqual(result_polar_2.shape, result_polar_1.shape)
 
+    def test_map2polar(self):
+        """
+        Tests converting multiple images at once gives the same result as one at a time.
+        """
+        data = self.white_data_512
+        ar_map = model.DataArray(numpy.empty((2, 3) + data.shape, dtype=data.dtype), data.metadata)
+        for i, j in numpy.ndindex(ar_map.shape[:2]):
+            ar_map[i, j] = data * (i * 3 + j + 1)
+
+        result = angleres.AngleResolvedMap2Polar(ar_map, 201)
+        self.assertEqual(result.shape, (2, 3, 201, 201))
+        for i, j in numpy.ndindex(ar_map.shape[:2]):
+            desired_output = angleres.AngleResolved2Polar(ar_map[i, j], 201)
+            numpy.testing.assert_allclose(result[i, j], desired_output, rtol=1e-10)
+
+        result = angleres.AngleResolvedMap2Rectangular(ar_map, (90, 360))
+        self.assertEqual(result.shape, (2, 3, 90, 360))
+        desired_output = angleres.AngleResolved2Rectangular(ar_map[1, 2], (90, 360))
+        numpy.testing.assert_allclose(result[1, 2], desired_output, rtol=1e-10)
+
+    def test_operator_cache(self):
+        """
+        Tests the resampling operator is computed only once for the same geometry.
+        """
+        data = self.white_data_512
+        angleres._operator_cache.clear()
+        result = angleres.AngleResolved2Polar(data, 201)
+
+        # Same geometry, different data => same operator
+        data2 = model.DataArray(data / 2, data.metadata)
+        result2 = angleres.AngleResolved2Polar(data2, 201)
+        numpy.testing.assert_allclose(result2 * 2, result, rtol=1e-3)
+        self.assertEqual(len(angleres._operator_cache), 1)
+
+        # Different geometry => new operator
+        data3 = model.DataArray(data, data.metadata.copy())
+        data3.metadata[model.MD_AR_POLE] = (290, 259)
+        angleres.AngleResolved2Polar(data3, 201)
+        self.assertEqual(len(angleres._operator_cache), 2)
+
 
 if __name__ == "__main__":
     # for debug:
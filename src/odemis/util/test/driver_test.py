@@ -60,11 +60,30 @@ class TestDriver(unittest.TestCase):
             logging.error(str(exp))
             raise
 
-        model._components._microscope = None # force reset of the microscope for next connection
+        model._core._microscope = None # force reset of the microscope for next connection
+
+        microscope = model.getMicroscope()
+        tstart = time.time()
+        fs = speedUpPyroConnect(microscope)
+        for f in fs:
+            f.result(timeout=10)
+        logging.info("Connected to %d objects in %g s", len(fs), time.time() - tstart)
+
+        # The tree should match the actual hierarchy, and reuse the same proxies
+        tree = model.getComponentsTree()
+        mmodel = microscope.model
+        self.assertEqual(set(tree.keys()), model.getComponents())
+        self.assertIn(microscope, tree)
+        for c, children in tree.items():
+            if c is microscope:
+                exp_children = c.children.value
+            else:
+                # Only the components created by delegation are known
+                exp_children = {cc for cc in c.children.value
+                                if mmodel.get(cc.name, {}).get("creator") == c.name}
+            self.assertEqual({cc.name for cc in children}, {cc.name for cc in exp_children})
+        self.assertTrue(all(any(c is tc for tc in tree) for c in model.getComponents()))
 
-        speedUpPyroConnect(model.getMicroscope())
-
-        time.sleep(2)
         if need_stop:
             test.stop_backend()
 
@@ -288,6 +288,108 @@ class TestHistogram(unittest.TestCase):
         hist_forced, edges = img.histogram(grey_img, edges)
         numpy.testing.assert_array_equal(hist, hist_forced)
 
+    def test_signed(self):
+        for dtype in ("int8", "int16"):
+            idt = numpy.iinfo(dtype)
+            size = (512, 300)
+            grey_img = numpy.zeros(size, dtype=dtype) - 3
+            grey_img[0, 0] = idt.min
+            grey_img[0, 1] = idt.max
+            grey_img[0, 2] = 0
+            hist, edges = img.histogram(grey_img, (-100, 99))
+            self.assertEqual(len(hist), 200)
+            self.assertEqual(edges, (-100, 99))
+            self.assertEqual(hist[100 - 3], grey_img.size - 3)
+            self.assertEqual(hist[100], 1)
+            self.assertEqual(numpy.sum(hist), grey_img.size - 2)  # min & max are outside
+
+            hist_auto, edges = img.histogram(grey_img)
+            self.assertEqual(edges, (idt.min, idt.max))
+            self.assertEqual(numpy.sum(hist_auto), grey_img.size)
+            self.assertEqual(hist_auto[0], 1)
+            self.assertEqual(hist_auto[-1], 1)
+
+    def test_same_as_numpy(self):
+        """
+        The histogram has the same bins as numpy.histogram()
+        """
+        size = (1024, 1000)
+        for dtype, irange in (("uint16", (100, 30000)), ("int16", (-30000, 20000)),
+                              ("uint16", (3, 1000)), ("float32", (-1.5, 1000.5)),
+                              ("float64", (0, 1))):
+            grey_img = (numpy.random.random(size) * 3000 - 500).astype(dtype)
+            grey_img[0, 0] = irange[0]
+            grey_img[0, 1] = irange[1]
+            hist, edges = img.histogram(grey_img, irange)
+            self.assertEqual(edges, irange)
+            hist_np, _ = numpy.histogram(grey_img, bins=len(hist), range=irange)
+            numpy.testing.assert_array_equal(hist, hist_np)
+
+    def test_nan(self):
+        grey_img = numpy.zeros((100, 100), dtype="float32") + 3
+        grey_img[0, 0] = numpy.nan
+        grey_img[0, 1] = 2
+        hist, edges = img.histogram(grey_img, (0, 10))
+        self.assertEqual(numpy.sum(hist), grey_img.size - 1)
+
+    def test_chunks(self):
+        """
+        The result doesn't depend on how the data is split
+        """
+        size = (2048, 1000)
+        for dtype, irange in (("uint16", (0, 4095)), ("int16", (-10, 4095)),
+                              ("uint32", (0, 2 ** 20)), ("float32", (0, 4096))):
+            grey_img = (numpy.random.random(size) * 4096).astype(dtype)
+            hist, edges = img.histogram(grey_img, irange)
+            prev_chunk_size = img.CHUNK_SIZE
+            try:
+                img.CHUNK_SIZE = 100 * 1000
+                hist_chunks, edges_chunks = img.histogram(grey_img, irange)
+            finally:
+                img.CHUNK_SIZE = prev_chunk_size
+            numpy.testing.assert_array_equal(hist, hist_chunks)
+            self.assertEqual(edges, edges_chunks)
+
+    def test_subsample(self):
+        size = (1024, 965)
+        grey_img = numpy.zeros(size, dtype="uint16") + 1500
+        grey_img[::4, ::4] = 10
+        hist, edges = img.histogram(grey_img, (0, 4095), subsample=4)
+        self.assertEqual(len(hist), 4096)
+        self.assertEqual(edges, (0, 4095))
+        self.assertEqual(numpy.sum(hist), grey_img[::4, ::4].size)
+        self.assertEqual(hist[10], grey_img[::4, ::4].size)
+
+    def test_speed(self):
+        """
+        Compare the histogram computation on typical frames with numpy.histogram()
+        """
+        for size in ((2048, 2048), (4096, 4096)):
+            for dtype, irange in (("uint16", (0, 4095)), ("int16", (-4096, 4095)),
+                                  ("uint32", (0, 2 ** 24)), ("float32", (0, 4096)),
+                                  ("float64", (0, 4096))):
+                grey_img = (numpy.random.random(size) * 4096).astype(dtype)
+                nbins = min(8192, irange[1] - irange[0] + 1) if dtype[0] in "iu" else 256
+
+                tstart = time.time()
+                for i in range(5):
+                    numpy.histogram(grey_img, bins=nbins, range=irange)
+                dur_np = (time.time() - tstart) / 5
+
+                tstart = time.time()
+                for i in range(5):
+                    hist, edges = img.histogram(grey_img, irange)
+                dur_hist = (time.time() - tstart) / 5
+
+                tstart = time.time()
+                for i in range(5):
+                    img.histogram(grey_img, irange, subsample=4)
+                dur_sub = (time.time() - tstart) / 5
+
+                logging.info("Histogram of %s %s took %g ms (subsampled: %g ms), numpy took %g ms",
+                             size, dtype, dur_hist * 1e3, dur_sub * 1e3, dur_np * 1e3)
+                self.assertEqual(numpy.sum(hist), grey_img.size)
+
     def test_compact(self):
         """
         test the compactHistogram()
@@ -312,6 +414,114 @@ class TestHistogram(unittest.TestCase):
         numpy.testing.assert_array_equal(hist, nchist)
 
 
+class TestRunningHistogram(unittest.TestCase):
+
+    def test_decay(self):
+        rh = img.RunningHistogram(decay=0.5)
+        self.assertIsNone(rh.hist)
+        with self.assertRaises(LookupError):
+            rh.findOptimalRange()
+
+        size = (512, 300)
+        grey_img = numpy.zeros(size, dtype="uint16") + 100
+        hist, edges = rh.update(grey_img, (0, 4095))
+        self.assertEqual(len(hist), 4096)
+        self.assertEqual(edges, (0, 4095))
+        self.assertEqual(hist[100], grey_img.size)
+        self.assertEqual(rh.findOptimalRange(), (100, 100))
+
+        # The previous image still counts, but less and less
+        grey_img[:] = 200
+        hist, edges = rh.update(grey_img, (0, 4095))
+        self.assertEqual(hist[100], grey_img.size // 2)
+        self.assertEqual(hist[200], grey_img.size // 2)
+        self.assertEqual(numpy.sum(hist), grey_img.size)
+        self.assertEqual(rh.findOptimalRange(), (100, 200))
+
+        for i in range(30):
+            hist, edges = rh.update(grey_img, (0, 4095))
+        self.assertEqual(hist[100], 0)
+        self.assertEqual(hist[200], grey_img.size)
+        self.assertEqual(rh.findOptimalRange(), (200, 200))
+
+        # New range => restart from scratch
+        grey_img[:] = 10
+        hist, edges = rh.update(grey_img, (0, 255))
+        self.assertEqual(len(hist), 256)
+        self.assertEqual(hist[10], grey_img.size)
+
+        rh.reset()
+        self.assertIsNone(rh.hist)
+
+    def test_interleave(self):
+        rh = img.RunningHistogram(decay=0, interleave=4)
+        size = (512, 300)
+        grey_img = numpy.zeros(size, dtype="float32") + 5
+        grey_img[1::4] = 15  # only seen every 4 images
+        for i in range(4):
+            hist, edges = rh.update(grey_img, (0, 20))
+            # Always extrapolated to the whole image
+            self.assertEqual(numpy.sum(hist), grey_img.size)
+            # The 256 bins are 20/256 wide
+            if i == 1:
+                self.assertEqual(hist[192], grey_img.size)
+            else:
+                self.assertEqual(hist[64], grey_img.size)
+
+    def test_outliers(self):
+        rh = img.RunningHistogram(decay=0.8)
+        size = (512, 300)
+        grey_img = numpy.random.randint(100, 1000, size).astype(numpy.uint16)
+        for i in range(5):
+            hist, edges = rh.update(grey_img, (0, 4095))
+            irange = rh.findOptimalRange(0.01)
+            self.assertEqual(irange, img.findOptimalRange(hist, edges, 0.01))
+            self.assertTrue(100 <= irange[0] < irange[1] <= 999)
+
+    def test_speed(self):
+        """
+        Compare the cost of a running histogram with the standard histogram
+        """
+        size = (2048, 2048)
+        grey_img = (numpy.random.random(size) * 4096).astype(numpy.uint16)
+        n = 20
+
+        tstart = time.time()
+        for i in range(n):
+            hist, edges = img.histogram(grey_img, (0, 4095))
+            img.findOptimalRange(hist, edges, 1 / 256)
+        dur_full = (time.time() - tstart) / n
+
+        rh = img.RunningHistogram(decay=0.5, interleave=4)
+        tstart = time.time()
+        for i in range(n):
+            rh.update(grey_img, (0, 4095))
+            rh.findOptimalRange(1 / 256)
+        dur_running = (time.time() - tstart) / n
+
+        logging.info("Histogram + range took %g ms, running version took %g ms",
+                     dur_full * 1e3, dur_running * 1e3)
+
+
+def DataArray2RGB_ref(data, irange, tint=(255, 255, 255)):
+    """
+    Reference (numpy-only) implementation of DataArray2RGB(), as it used to be
+    before the optimised version. Only supports irange[0] < irange[1].
+    """
+    data = data.view(numpy.ndarray)
+    irange = numpy.array(irange, data.dtype)
+    data = data.clip(*irange)
+    dshift = data - irange[0]
+    drescaled = numpy.empty(data.shape, dtype=numpy.uint8)
+    b = 255.99 / (irange[1] - irange[0])
+    numpy.multiply(dshift, b, out=drescaled, casting="unsafe")
+
+    rgb = numpy.empty(data.shape + (3,), dtype=numpy.uint8, order='C')
+    for i in range(3):
+        numpy.multiply(drescaled, tint[i] / 255, out=rgb[:, :, i], casting="unsafe")
+    return rgb
+
+
 class TestDataArray2RGB(unittest.TestCase):
     @staticmethod
     def CountValues(array):
@@ -450,34 +660,95 @@ class TestDataArray2RGB(unittest.TestCase):
         self.assertEqual(hist[-2], 0)
 
     def test_fast(self):
-        """Test the fast conversion"""
+        """Test the fast conversion gives the same result as the standard numpy one"""
         data = numpy.ones((251, 200), dtype="uint16")
         data[:, :] = numpy.arange(200)
         data[2, :] = 56
         data[200, 2] = 3
 
-        data_nc = data.swapaxes(0, 1) # non-contiguous cannot be treated by fast conversion
+        data_nc = data.swapaxes(0, 1) # non-contiguous, is handled differently
 
         # convert to RGB
         hist, edges = img.histogram(data)
         irange = img.findOptimalRange(hist, edges, 1 / 256)
-        tstart = time.time()
-        for i in range(10):
-            rgb = img.DataArray2RGB(data, irange)
-        fast_dur = time.time() - tstart
+        rgb = img.DataArray2RGB(data, irange)
+        rgb_nc = img.DataArray2RGB(data_nc, irange)
+        numpy.testing.assert_array_equal(rgb, rgb_nc.swapaxes(0, 1))
+
+        # ±1, because the tint look-up table rounds the colours, while the
+        # standard converter truncates them
+        for dtype in ("uint8", "uint16", "int16", "uint32", "float32", "float64"):
+            d = data.astype(dtype)
+            for tint in ((255, 255, 255), (0, 73, 255)):
+                rgb = img.DataArray2RGB(d, irange, tint)
+                rgb_ref = DataArray2RGB_ref(d, irange, tint)
+                numpy.testing.assert_allclose(rgb, rgb_ref, atol=1)
+
+    def test_colormap(self):
+        """Test conversion with a colour map, given as a LUT"""
+        size = (1024, 512)
+        grey_img = numpy.zeros(size, dtype="float32") + 0.5
+        grey_img[0, 0] = 0
+        grey_img[0, 1] = 1
+        lut = numpy.zeros((256, 3), dtype=numpy.uint8)
+        lut[:, 0] = numpy.arange(256)  # red increasing
+        lut[:, 2] = numpy.arange(255, -1, -1)  # blue decreasing
+        out = img.DataArray2RGB(grey_img, (0, 1), tint=lut)
+        self.assertEqual(out.shape, size + (3,))
+        numpy.testing.assert_array_equal(out[0, 0], [0, 0, 255])
+        numpy.testing.assert_array_equal(out[0, 1], [255, 0, 0])
+        numpy.testing.assert_array_equal(out[0, 2], lut[127])
 
-        hist_nc, edges_nc = img.histogram(data_nc)
-        irange_nc = img.findOptimalRange(hist_nc, edges_nc, 1 / 256)
-        tstart = time.time()
-        for i in range(10):
-            rgb_nc = img.DataArray2RGB(data_nc, irange_nc)
-        std_dur = time.time() - tstart
-        rgb_nc_back = rgb_nc.swapaxes(0, 1)
-
-        print("Time fast conversion = %g s, standard = %g s" % (fast_dur, std_dur))
-        self.assertLess(fast_dur, std_dur)
-        # ±1, to handle the value shifts by the standard converter to handle floats
-        numpy.testing.assert_almost_equal(rgb, rgb_nc_back, decimal=0)
+    def test_bgra(self):
+        """Test direct conversion to BGRA, compared to the conversion in two steps"""
+        size = (1024, 512)
+        lut = numpy.zeros((256, 3), dtype=numpy.uint8)
+        lut[:, 0] = numpy.arange(256)  # red increasing
+        lut[:, 2] = numpy.arange(255, -1, -1)  # blue decreasing
+        for dtype in ("uint8", "uint16", "int16", "float32", "float64"):
+            grey_img = (numpy.random.random(size) * 255).astype(dtype)
+            grey_img[0, 0] = 0
+            grey_img[0, 1] = 250
+            for tint in ((255, 255, 255), (0, 73, 255), lut):
+                for alpha in (255, 128, 0):
+                    out = img.DataArray2BGRA(grey_img, (0, 250), tint, alpha)
+                    self.assertEqual(out.shape, size + (4,))
+
+                    # Convert to RGB, then to BGRA with the colours scaled by the alpha
+                    rgb = img.DataArray2RGB(grey_img, (0, 250), tint)
+                    exp = numpy.empty(size + (4,), dtype=numpy.uint8)
+                    numpy.multiply(rgb[:, :, ::-1], alpha / 255, out=exp[:, :, :3], casting="unsafe")
+                    exp[:, :, 3] = alpha
+                    numpy.testing.assert_array_equal(out, exp)
+
+    def test_speed(self):
+        """
+        Compare the conversion speed with the standard numpy implementation
+        """
+        for shape in ((2048, 2048), (4096, 4096)):
+            for dtype, irange in (("uint8", (10, 200)), ("uint16", (100, 3000)),
+                                  ("int16", (-100, 3000)), ("uint32", (100, 3000)),
+                                  ("float32", (100, 3000)), ("float64", (100, 3000))):
+                data = (numpy.random.random(shape) * 4096).astype(dtype)
+                for tint in ((255, 255, 255), (0, 73, 255)):
+                    tstart = time.time()
+                    for i in range(3):
+                        DataArray2RGB_ref(data, irange, tint)
+                    dur_ref = (time.time() - tstart) / 3
+
+                    tstart = time.time()
+                    for i in range(3):
+                        img.DataArray2RGB(data, irange, tint)
+                    dur_rgb = (time.time() - tstart) / 3
+
+                    tstart = time.time()
+                    for i in range(3):
+                        img.DataArray2BGRA(data, irange, tint, alpha=200)
+                    dur_bgra = (time.time() - tstart) / 3
+
+                    logging.info("Conversion of %s %s with tint %s took %g ms (BGRA: %g ms), "
+                                 "standard took %g ms",
+                                 shape, dtype, tint, dur_rgb * 1e3, dur_bgra * 1e3, dur_ref * 1e3)
 
     def test_tint(self):
         """test with tint (on the fast path)"""
@@ -19,9 +19,11 @@ You should have received a copy of the GNU General Public License along with Ode
 from __future__ import division
 
 import logging
+import math
 import numpy
 from odemis import model
 from odemis.util import spectrum
+from scipy import ndimage
 import time
 import unittest
 from builtins import range
@@ -87,5 +89,114 @@ class TestCoefToDA(unittest.TestCase):
         numpy.testing.assert_equal(da[:, 0, 0, 0, 0], dcalib)
         numpy.testing.assert_equal(da.metadata[model.MD_WL_LIST], wl_calib * 1e-9)
 
+class TestSampling(unittest.TestCase):
+
+    def setUp(self):
+        self.data = numpy.random.randint(0, 4000, (251, 200, 300)).astype(numpy.uint16)
+
+    def test_line(self):
+        data = self.data
+        for start, end in (((3, 7), (3, 65)), ((30, 65), (1, 1)), ((50.5, 50.2), (200.3, 150.1))):
+            sampling = spectrum.get_line_sampling(data.shape, start, end)
+            spec1d, = spectrum.extract_samples(data, [sampling])
+            n = 1 + int(math.hypot(end[0] - start[0], end[1] - start[1]))
+            self.assertEqual(spec1d.shape, (n, data.shape[0]))
+
+            # Compare to a simple interpolation of the points along the line
+            coord = numpy.empty((3, n, data.shape[0]))
+            coord[0] = numpy.arange(data.shape[0])
+            coord[1] = numpy.linspace(start[1], end[1], n)[:, numpy.newaxis]
+            coord[2] = numpy.linspace(start[0], end[0], n)[:, numpy.newaxis]
+            spec1d_ex = ndimage.map_coordinates(data, coord, output=numpy.float64, order=1)
+            numpy.testing.assert_allclose(spec1d, spec1d_ex)
+
+        # Horizontal line, with width: it's just the mean of the rows
+        sampling = spectrum.get_line_sampling(data.shape, (10, 20), (100, 20), 5)
+        spec1d, = spectrum.extract_samples(data, [sampling])
+        spec1d_ex = data[:, 18:23, 10:101].mean(axis=1).T
+        numpy.testing.assert_allclose(spec1d, spec1d_ex)
+
+        # Line too short
+        with self.assertRaises(ValueError):
+            spectrum.get_line_sampling(data.shape, (10, 20), (10.5, 20))
+
+    def test_line_border(self):
+        """
+        The part of the line outside of the data should not count in the mean
+        """
+        data = self.data
+        # Along the top border: the 2 lines above are outside
+        sampling = spectrum.get_line_sampling(data.shape, (10, 0), (100, 0), 5)
+        spec1d, = spectrum.extract_samples(data, [sampling])
+        spec1d_ex = data[:, 0:3, 10:101].mean(axis=1).T
+        numpy.testing.assert_allclose(spec1d, spec1d_ex)
+
+        # Data of just one line, and an even width
+        data1l = data[:, 5:6, :]
+        sampling = spectrum.get_line_sampling(data1l.shape, (0, 0), (100, 0), 2)
+        spec1d, = spectrum.extract_samples(data1l, [sampling])
+        numpy.testing.assert_allclose(spec1d, data1l[:, 0, 0:101].T)
+
+    def test_point(self):
+        data = self.data
+        x, y = 55, 106
+        sampling = spectrum.get_point_sampling(data.shape, (x, y), 1)
+        spec, = spectrum.extract_samples(data, [sampling])
+        numpy.testing.assert_equal(spec[0], data[:, y, x])
+
+        # 3 px diameter => the 3x3 pixels around (the diagonals are at 1.41 px)
+        sampling = spectrum.get_point_sampling(data.shape, (x, y), 3)
+        spec, = spectrum.extract_samples(data, [sampling])
+        spec_ex = data[:, y - 1:y + 2, x - 1:x + 2].mean(axis=(1, 2))
+        numpy.testing.assert_allclose(spec[0], spec_ex)
+
+        # 2 px diameter => the 4 neighbours + the center
+        sampling = spectrum.get_point_sampling(data.shape, (x, y), 2)
+        spec, = spectrum.extract_samples(data, [sampling])
+        spec_ex = (data[:, y - 1:y + 2, x].sum(axis=1, dtype=numpy.float64) +
+                   data[:, y, x - 1] + data[:, y, x + 1]) / 5
+        numpy.testing.assert_allclose(spec[0], spec_ex)
+
+        # In the corner => only the pixels inside the data
+        sampling = spectrum.get_point_sampling(data.shape, (0, 0), 3)
+        spec, = spectrum.extract_samples(data, [sampling])
+        spec_ex = data[:, 0:2, 0:2].mean(axis=(1, 2))
+        numpy.testing.assert_allclose(spec[0], spec_ex)
+
+        # Extra dimensions (eg, CTYX)
+        data4d = numpy.random.random((20, 5, 30, 40))
+        sampling = spectrum.get_point_sampling(data4d.shape, (3, 4), 1)
+        spec, = spectrum.extract_samples(data4d, [sampling])
+        numpy.testing.assert_equal(spec[0], data4d[:, :, 4, 3])
+
+    def test_batch(self):
+        data = self.data
+        samplings = [spectrum.get_point_sampling(data.shape, (x, 10), 5) for x in range(0, 300, 3)]
+        samplings.append(spectrum.get_line_sampling(data.shape, (10, 20), (100, 20), 3))
+        specs = spectrum.extract_samples(data, samplings)
+        self.assertEqual(len(specs), len(samplings))
+        for sampling, spec in zip(samplings, specs):
+            spec_ex, = spectrum.extract_samples(data, [sampling])
+            numpy.testing.assert_allclose(spec, spec_ex)
+
+    def test_speed(self):
+        data = self.data
+        start, end, width = (10.5, 20.2), (250.3, 150.1), 30
+
+        tstart = time.time()
+        sampling = spectrum.get_line_sampling(data.shape, start, end, width)
+        spectrum.extract_samples(data, [sampling])
+        dur_first = time.time() - tstart
+
+        tstart = time.time()
+        for i in range(10):
+            sampling = spectrum.get_line_sampling(data.shape, start, end, width)
+            spectrum.extract_samples(data, [sampling])
+        dur_cached = (time.time() - tstart) / 10
+        logging.info("Line spectrum extracted in %g s the first time, and %g s when cached",
+                     dur_first, dur_cached)
+        self.assertLess(dur_cached, dur_first)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 16 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import json
+import logging
+from odemis.util import tracing
+import os
+import threading
+import time
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+FILENAME = "test-trace.json"
+
+
+class TestTracer(unittest.TestCase):
+
+    def tearDown(self):
+        try:
+            os.remove(FILENAME)
+        except Exception:
+            pass
+
+    def test_disabled(self):
+        tracer = tracing.Tracer()
+        self.assertFalse(tracer.enabled)
+        with tracer.span("nothing"):
+            pass
+        tracer.add("nothing either", time.time())
+        self.assertEqual(tracer.get_events(), [])
+        tracer.save(FILENAME)
+        self.assertFalse(os.path.exists(FILENAME))
+
+    def test_start_time(self):
+        tracer = tracing.Tracer()
+        # The process must have started before now, but not ages ago
+        self.assertLess(tracer.start_time, time.time())
+        self.assertGreater(tracer.start_time, time.time() - 24 * 3600)
+
+    def test_trace(self):
+        tracer = tracing.Tracer()
+        tracer.enable(FILENAME)
+        self.assertTrue(tracer.enabled)
+
+        tracer.add("imports", tracer.start_time, time.time())
+        with tracer.span("parse"):
+            time.sleep(0.1)
+
+        def instantiate(name):
+            with tracer.span(name, cat="component", result="started"):
+                time.sleep(0.05)
+
+        threads = [threading.Thread(target=instantiate, args=("comp%d" % i,), name="inst%d" % i)
+                   for i in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        tracer.add("done", time.time())
+
+        events = tracer.get_events()
+        self.assertEqual(len(events), 6)
+        self.assertEqual([e[0] for e in events[:2]], ["imports", "parse"])
+        self.assertAlmostEqual(events[1][3] - events[1][2], 0.1, delta=0.05)
+        self.assertEqual(events[-1][0], "done")
+        self.assertEqual(events[-1][2], events[-1][3])
+
+        summary = tracer.summary()
+        self.assertEqual(len(summary.split("\n")), 6)
+        self.assertIn("component:comp1", summary)
+
+        tracer.save()
+        with open(FILENAME) as f:
+            trace = json.load(f)
+        tevents = [e for e in trace["traceEvents"] if e["ph"] != "M"]
+        self.assertEqual(len(tevents), 6)
+        comp_events = [e for e in tevents if e["cat"] == "component"]
+        self.assertEqual(len(comp_events), 3)
+        # Each component was instantiated in a different thread
+        self.assertEqual(len(set(e["tid"] for e in comp_events)), 3)
+        for e in comp_events:
+            self.assertEqual(e["ph"], "X")
+            self.assertGreater(e["dur"], 40e3)  # µs
+            self.assertEqual(e["args"], {"result": "started"})
+        thread_names = [e["args"]["name"] for e in trace["traceEvents"] if e["ph"] == "M"]
+        self.assertIn("inst0", thread_names)
+
+
+if __name__ == "__main__":
+    unittest.main()
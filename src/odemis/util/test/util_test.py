@@ -117,6 +117,46 @@ class TestExectuteTask(unittest.TestCase):
         return -1
 
 
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_count(self):
+        cache = util.LRUCache(3)
+        for i in range(3):
+            cache[i] = str(i)
+        self.assertEqual(len(cache), 3)
+
+        # Access 0 => 1 is the least recently used
+        self.assertEqual(cache[0], "0")
+        cache[3] = "3"
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn(1, cache)
+        self.assertIn(0, cache)
+        self.assertIsNone(cache.get(1))
+        with self.assertRaises(KeyError):
+            cache[1]
+
+        del cache[0]
+        self.assertEqual(len(cache), 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_size(self):
+        cache = util.LRUCache(100, sizeof=len)
+        cache["a"] = "x" * 60
+        cache["b"] = "x" * 30
+        self.assertEqual(cache.size, 90)
+        cache["b"] = "x" * 40  # replace => same number of entries
+        self.assertEqual(cache.size, 100)
+        cache["c"] = "x" * 10
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.size, 50)
+
+        # Too big to be stored
+        cache["d"] = "x" * 200
+        self.assertNotIn("d", cache)
+        self.assertEqual(cache.size, 50)
+
+
 class SortedAccordingTestCase(unittest.TestCase):
 
     def test_simple(self):
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 16 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+# Startup tracer: records when the main phases of the program (imports, model
+# parsing, instantiation of each component, creation of the GUI tabs...) start
+# and end, to find out where the time is spent.
+# It's disabled by default. It's enabled by setting the environment variable
+# ODEMIS_TRACE to the directory where the traces should be written (one file per
+# program), or by calling tracer.enable(). The trace is written in the Chrome
+# trace event format (JSON), which can be opened with chrome://tracing or
+# https://ui.perfetto.dev .
+
+from __future__ import division
+
+from contextlib import contextmanager
+import json
+import logging
+import os
+import threading
+import time
+
+TRACE_ENV = "ODEMIS_TRACE"
+
+
+def _getProcessStartTime():
+    """
+    return (float): the time at which the current process was started (in s,
+      since epoch). If it cannot be found, the current time is returned.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # The process name (2nd field) is in parentheses, and may contain spaces
+            stat = f.read().rsplit(")", 1)[1].split()
+        start_ticks = int(stat[19])  # 22nd field
+        with open("/proc/stat") as f:
+            for l in f:
+                if l.startswith("btime "):
+                    boot_time = int(l.split()[1])
+                    break
+            else:
+                raise ValueError("No boot time found")
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except Exception:
+        logging.debug("Failed to find process start time", exc_info=True)
+        return time.time()
+
+
+class Tracer(object):
+    """
+    Records the phases of the start-up. Each phase is a "span", with a name,
+    a category, a start and end time. It's thread-safe.
+    When disabled, nothing is recorded.
+    """
+
+    def __init__(self):
+        self.filename = None  # None or str: where the trace will be saved
+        self.start_time = _getProcessStartTime()
+        # list of (str, str, float, float, str, dict): name, category, start,
+        # end (same as start for an instantaneous event), thread name, arguments
+        self._events = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.filename is not None
+
+    def enable(self, filename):
+        """
+        Start recording the events
+        filename (str): name of the file where the trace will be saved
+        """
+        self.filename = filename
+
+    def enable_from_env(self, prog):
+        """
+        Start recording the events if the environment variable is set
+        prog (str): name of the program, used to name the trace file
+        """
+        dirname = os.environ.get(TRACE_ENV)
+        if dirname:
+            self.enable(os.path.join(dirname, "%s-%d-trace.json" % (prog, os.getpid())))
+
+    def add(self, name, start, end=None, cat="startup", **kwargs):
+        """
+        Record a phase which has already happened
+        name (str): name of the phase
+        start (float): start time (in s, since epoch)
+        end (None or float): end time. If None, the event is instantaneous.
+        cat (str): category of the phase, for instance "component"
+        kwargs: extra information to store with the phase
+        """
+        if not self.enabled:
+            return
+        if end is None:
+            end = start
+        with self._lock:
+            self._events.append((name, cat, start, end,
+                                 threading.current_thread().name, kwargs))
+
+    @contextmanager
+    def span(self, name, cat="startup", **kwargs):
+        """
+        Context manager to record the duration of a phase
+        name (str): name of the phase
+        cat (str): category of the phase
+        kwargs: extra information to store with the phase
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.time(), cat, **kwargs)
+
+    def get_events(self):
+        """
+        return (list of tuples): all the events recorded, ordered by start time.
+          See ._events for the format.
+        """
+        with self._lock:
+            return sorted(self._events, key=lambda e: e[2])
+
+    def to_chrome_trace(self):
+        """
+        return (dict): the trace in Chrome trace event format
+        """
+        pid = os.getpid()
+        tids = {}  # thread name -> int
+        events = []
+        for name, cat, start, end, tname, args in self.get_events():
+            tid = tids.setdefault(tname, len(tids))
+            ev = {"name": name, "cat": cat, "pid": pid, "tid": tid,
+                  "ts": (start - self.start_time) * 1e6,  # µs
+                  "args": args}
+            if end > start:
+                ev["ph"] = "X"  # complete event
+                ev["dur"] = (end - start) * 1e6
+            else:
+                ev["ph"] = "i"  # instant event
+                ev["s"] = "t"
+            events.append(ev)
+
+        # Also give names to the threads
+        for tname, tid in tids.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": tname}})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, filename=None):
+        """
+        Write the trace in Chrome trace event format
+        filename (None or str): name of the file. If None, the file passed to
+          enable() is used.
+        """
+        if not self.enabled:
+            return
+        filename = filename or self.filename
+        with open(filename, "w") as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+        logging.info("Startup trace saved to %s", filename)
+
+    def summary(self):
+        """
+        return (str): a human-readable description of the phases, one per line,
+          as "name<tab>start<tab>duration"
+        """
+        lines = []
+        for name, cat, start, end, tname, args in self.get_events():
+            if cat != "startup":
+                name = "%s:%s" % (cat, name)
+            lines.append(u"%s\tat %.3f s\ttook %.3f s" %
+                         (name, start - self.start_time, end - start))
+        return u"\n".join(lines)
+
+
+# The tracer of the process
+tracer = Tracer()